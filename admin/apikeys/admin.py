@@ -4,6 +4,7 @@ from django.contrib import admin, messages
 from django.http import HttpRequest
 from django.utils.html import format_html
 
+from . import cache
 from .models import APIKey
 
 
@@ -68,6 +69,7 @@ class APIKeyAdmin(admin.ModelAdmin):
     def revoke_keys(self, request: HttpRequest, queryset) -> None:
         """Revoke (deactivate) selected API keys."""
         count = queryset.update(is_active=False)
+        cache.invalidate()
         self.message_user(
             request,
             f"Successfully revoked {count} API key(s).",
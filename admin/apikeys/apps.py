@@ -1,6 +1,17 @@
+import atexit
+
 from django.apps import AppConfig
+from django.core.signals import request_finished
 
 
 class ApikeysConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apikeys"
+
+    def ready(self):
+        from . import cache
+
+        request_finished.connect(
+            cache.flush_due_last_used, dispatch_uid="apikeys.flush_due_last_used"
+        )
+        atexit.register(cache.flush_at_exit)
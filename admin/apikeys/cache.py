@@ -0,0 +1,181 @@
+"""In-process cache for API key authentication.
+
+Every request authenticated with ``X-API-Key`` used to run a
+``select_related("user")`` query followed by an UPDATE of ``last_used_at``.
+This module keeps a small LRU of recently authenticated keys (keyed by the
+SHA-256 key hash) and coalesces the ``last_used_at`` writes. Pending writes
+are flushed once the oldest of them is an interval old, by the next use of any
+key or the end of the next request, and when the process exits.
+
+Cache entries are invalidated across all worker processes through a Redis
+generation counter: any change to an API key bumps ``inmor:apikeys:generation``
+and every cached entry tagged with an older generation is discarded on its
+next lookup. When Redis is not reachable the cache is bypassed entirely, so
+revocation is never delayed by a stale entry.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+if TYPE_CHECKING:
+    from .models import APIKey
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "inmor:apikeys:generation"
+
+_lock = threading.Lock()
+# key_hash -> (expires_at monotonic, generation, APIKey with user loaded)
+_entries: OrderedDict[str, tuple[float, int, APIKey]] = OrderedDict()
+# APIKey.pk -> newest unflushed last_used_at
+_pending_last_used: dict[int, datetime] = {}
+# When the oldest entry of _pending_last_used was recorded
+_pending_since: datetime | None = None
+
+
+def _ttl() -> float:
+    return float(getattr(settings, "APIKEY_CACHE_TTL", 30))
+
+
+def _max_size() -> int:
+    return int(getattr(settings, "APIKEY_CACHE_MAX_SIZE", 1024))
+
+
+def _last_used_interval() -> timedelta:
+    return timedelta(seconds=getattr(settings, "APIKEY_LAST_USED_INTERVAL", 60))
+
+
+def current_generation() -> int | None:
+    """Returns the current cache generation, or None if Redis is unavailable."""
+    try:
+        value = get_redis_connection("default").get(GENERATION_KEY)
+    except RedisError as e:
+        logger.warning(f"API key cache disabled, could not read generation: {e}")
+        return None
+    return int(value) if value else 0
+
+
+def invalidate() -> None:
+    """Invalidates cached API keys in every process.
+
+    Must be called whenever an API key is revoked, deleted or otherwise changed.
+    """
+    with _lock:
+        _entries.clear()
+    try:
+        _ = get_redis_connection("default").incr(GENERATION_KEY)
+    except RedisError as e:
+        logger.warning(f"Could not bump API key cache generation: {e}")
+
+
+def get(key_hash: str, generation: int | None) -> APIKey | None:
+    """Returns the cached APIKey for the given hash if it is still fresh."""
+    if generation is None:
+        return None
+    with _lock:
+        entry = _entries.get(key_hash)
+        if entry is None:
+            return None
+        expires_at, entry_generation, api_key = entry
+        if entry_generation != generation or expires_at < time.monotonic():
+            del _entries[key_hash]
+            return None
+        _entries.move_to_end(key_hash)
+        return api_key
+
+
+def put(key_hash: str, generation: int | None, api_key: APIKey) -> None:
+    """Stores a successfully authenticated APIKey in the cache."""
+    if generation is None:
+        return
+    with _lock:
+        _entries[key_hash] = (time.monotonic() + _ttl(), generation, api_key)
+        _entries.move_to_end(key_hash)
+        while len(_entries) > _max_size():
+            _ = _entries.popitem(last=False)
+
+
+def record_use(api_key: APIKey) -> None:
+    """Records that the key was used now, writing to the database at most once per interval.
+
+    Uses of a key in between are kept in memory. Whenever any key is due for a
+    write, or the oldest pending use is an interval old, all pending timestamps
+    are flushed together in a single batch.
+    """
+    global _pending_since
+    now = timezone.now()
+    interval = _last_used_interval()
+    with _lock:
+        _pending_last_used[api_key.pk] = now
+        if _pending_since is None:
+            _pending_since = now
+        due = (
+            api_key.last_used_at is None
+            or now - api_key.last_used_at >= interval
+            or now - _pending_since >= interval
+        )
+        if due:
+            api_key.last_used_at = now
+    if due:
+        flush_last_used()
+
+
+def flush_due_last_used(**kwargs: object) -> int:
+    """Flushes the pending timestamps if the oldest is an interval old.
+
+    Connected to ``request_finished``, so the last use of a key is written even
+    if no other key is used after it.
+
+    :returns: Number of API keys updated.
+    """
+    interval = _last_used_interval()
+    with _lock:
+        due = _pending_since is not None and timezone.now() - _pending_since >= interval
+    return flush_last_used() if due else 0
+
+
+def flush_at_exit() -> None:
+    """Flushes the pending timestamps when the process exits."""
+    try:
+        _ = flush_last_used()
+    except DatabaseError as e:
+        logger.warning(f"Could not write last_used_at of API keys at exit: {e}")
+
+
+def flush_last_used() -> int:
+    """Writes all pending ``last_used_at`` timestamps to the database.
+
+    :returns: Number of API keys updated.
+    """
+    from .models import APIKey
+
+    global _pending_since
+    with _lock:
+        pending = dict(_pending_last_used)
+        _pending_last_used.clear()
+        _pending_since = None
+    if not pending:
+        return 0
+    objs = [APIKey(pk=pk, last_used_at=last_used) for pk, last_used in pending.items()]
+    return APIKey.objects.bulk_update(objs, ["last_used_at"])
+
+
+def clear() -> None:
+    """Drops all local cache state without touching Redis (used by tests)."""
+    global _pending_since
+    with _lock:
+        _entries.clear()
+        _pending_last_used.clear()
+        _pending_since = None
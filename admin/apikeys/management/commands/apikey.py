@@ -10,6 +10,7 @@ Usage:
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand, CommandError
 
+from apikeys import cache
 from apikeys.models import APIKey
 
 
@@ -146,4 +147,6 @@ class Command(BaseCommand):
             raise CommandError(f"No active API key named '{key_name}' found for user '{username}'")
 
         keys.update(is_active=False)
+        # queryset.update() bypasses APIKey.save(), so drop cached keys explicitly.
+        cache.invalidate()
         self.stdout.write(f"Revoked {count} key(s) named '{key_name}' for user '{username}'.")
@@ -7,6 +7,8 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
 
+from . import cache
+
 
 def generate_api_key() -> tuple[str, str, str]:
     """Generate a new API key.
@@ -92,6 +94,19 @@ class APIKey(models.Model):
             return False
         return True
 
+    def save(self, *args, **kwargs) -> None:
+        """Saves the key and invalidates cached authentications for existing keys."""
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding and kwargs.get("update_fields") != ["last_used_at"]:
+            cache.invalidate()
+
+    def delete(self, *args, **kwargs):
+        """Deletes the key and invalidates cached authentications."""
+        result = super().delete(*args, **kwargs)
+        cache.invalidate()
+        return result
+
     def update_last_used(self) -> None:
         """Update the last_used_at timestamp."""
         self.last_used_at = timezone.now()
@@ -128,6 +143,10 @@ class APIKey(models.Model):
     def authenticate(cls, key: str) -> tuple[User, "APIKey"] | None:
         """Authenticate using an API key.
 
+        Recently authenticated keys are served from an in-process cache and
+        ``last_used_at`` is written at most once per ``APIKEY_LAST_USED_INTERVAL``,
+        see ``apikeys.cache``.
+
         Args:
             key: The plaintext API key
 
@@ -135,11 +154,16 @@ class APIKey(models.Model):
             (User, APIKey) tuple if authentication succeeds, None otherwise
         """
         key_hash = hash_api_key(key)
-        try:
-            api_key = cls.objects.select_related("user").get(key_hash=key_hash)
+        generation = cache.current_generation()
+        api_key = cache.get(key_hash, generation)
+        if api_key is None:
+            try:
+                api_key = cls.objects.select_related("user").get(key_hash=key_hash)
+            except cls.DoesNotExist:
+                return None
             if api_key.is_valid:
-                api_key.update_last_used()
-                return api_key.user, api_key
-        except cls.DoesNotExist:
-            pass
+                cache.put(key_hash, generation, api_key)
+        if api_key.is_valid:
+            cache.record_use(api_key)
+            return api_key.user, api_key
         return None
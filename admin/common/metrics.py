@@ -0,0 +1,278 @@
+"""Prometheus metrics for the admin, shared between worker processes.
+
+The admin runs as several granian worker processes, so in-process counters
+would only show the numbers of whichever worker answers the scrape. Instead,
+all counters and histogram buckets live in the ``inmor:metrics`` Redis hash
+and are incremented with ``HINCRBYFLOAT``. Inside a request (or a
+``batch()`` block) updates are buffered and written with a single pipeline at
+the end, so instrumenting a request costs one Redis round trip.
+
+Metrics are declared once at import time with ``counter()`` or
+``histogram()`` and updated with ``inc()`` / ``observe()``. ``render()``
+produces the text exposition format served by ``/api/v1/metrics``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.http import HttpRequest, HttpResponse
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "inmor:metrics"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """A counter, gauge or histogram with a fixed set of label names."""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+
+    def _labels(self, labels: dict[str, str]) -> list[tuple[str, str]]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return [(name, str(labels[name])) for name in self.labelnames]
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increments a counter."""
+        _record(_field(self.name, self._labels(labels)), amount)
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Records one observation of a histogram."""
+        pairs = self._labels(labels)
+        # Empty buckets are written too, so that every series has all buckets.
+        for bound in self.buckets:
+            hit = 1 if value <= bound else 0
+            _record(_field(f"{self.name}_bucket", pairs + [("le", _format(bound))]), hit)
+        _record(_field(f"{self.name}_bucket", pairs + [("le", "+Inf")]), 1)
+        _record(_field(f"{self.name}_sum", pairs), value)
+        _record(_field(f"{self.name}_count", pairs), 1)
+
+
+_registry: dict[str, Metric] = {}
+
+
+def _register(metric: Metric) -> Metric:
+    if metric.name in _registry:
+        raise ValueError(f"Metric {metric.name} is already registered")
+    _registry[metric.name] = metric
+    return metric
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Metric:
+    return _register(Metric(name, "counter", documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Metric:
+    """Declares a gauge. Gauge values are computed at scrape time and passed to ``render()``."""
+    return _register(Metric(name, "gauge", documentation, labelnames))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+) -> Metric:
+    return _register(Metric(name, "histogram", documentation, labelnames, buckets))
+
+
+# Metrics used across the admin.
+REQUESTS = counter(
+    "inmor_admin_requests_total",
+    "API requests by operation and status code.",
+    ("method", "route", "status"),
+)
+REQUEST_DURATION = histogram(
+    "inmor_admin_request_duration_seconds",
+    "API request latency by operation.",
+    ("method", "route"),
+)
+STAGE_DURATION = histogram(
+    "inmor_admin_stage_duration_seconds",
+    "Latency of individual database queries, Redis writes, fetches, verifications, "
+    "policy operations and signatures made by API requests and batched commands.",
+    ("stage",),
+)
+FETCH_DURATION = histogram(
+    "inmor_admin_fetch_duration_seconds",
+    "Latency of outbound HTTP fetches by host.",
+    ("host",),
+)
+FETCH_ERRORS = counter(
+    "inmor_admin_fetch_errors_total",
+    "Outbound HTTP fetches that failed or returned an error status, by host.",
+    ("host",),
+)
+SIGNATURES = counter(
+    "inmor_admin_signatures_total",
+    "JWTs signed, by algorithm.",
+    ("alg",),
+)
+RENEWALS = counter(
+    "inmor_admin_renewals_total",
+    "Subordinate and trust mark renewals by outcome.",
+    ("resource", "outcome"),
+)
+
+
+# Buffered updates of the current request or batch, field -> amount.
+_pending: ContextVar[dict[str, float] | None] = ContextVar("inmor_metrics", default=None)
+
+
+def _format(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _field(name: str, pairs: list[tuple[str, str]]) -> str:
+    return json.dumps([name, pairs], separators=(",", ":"))
+
+
+def _record(field: str, amount: float) -> None:
+    pending = _pending.get()
+    if pending is not None:
+        pending[field] = pending.get(field, 0.0) + amount
+        return
+    _write({field: amount})
+
+
+def _write(updates: dict[str, float]) -> None:
+    if not updates:
+        return
+    try:
+        con = get_redis_connection("default")
+        pipe = con.pipeline(transaction=False)
+        for field, amount in updates.items():
+            _ = pipe.hincrbyfloat(METRICS_KEY, field, amount)
+        _ = pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not write metrics: {e}")
+
+
+def batching() -> bool:
+    """Returns True inside a request or ``batch()`` block."""
+    return _pending.get() is not None
+
+
+@contextmanager
+def batch() -> Iterator[None]:
+    """Buffers metric updates and writes them with one pipeline on exit."""
+    if _pending.get() is not None:
+        yield
+        return
+    token = _pending.set({})
+    try:
+        yield
+    finally:
+        pending = _pending.get() or {}
+        _pending.reset(token)
+        _write(pending)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name: str, pairs: Iterable[tuple[str, str]], value: float) -> str:
+    labels = ",".join(f'{key}="{_escape(val)}"' for key, val in pairs)
+    if labels:
+        return f"{name}{{{labels}}} {_format(value)}"
+    return f"{name} {_format(value)}"
+
+
+def _base_name(name: str) -> str:
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in _registry:
+            return name[: -len(suffix)]
+    return name
+
+
+def _sort_key(item: tuple[str, list[tuple[str, str]], float]):
+    name, pairs, _ = item
+    le = [float(val) for key, val in pairs if key == "le"]
+    rest = [pair for pair in pairs if pair[0] != "le"]
+    return (rest, name, le)
+
+
+def render(extra: Iterable[tuple[Metric, dict[str, str], float]] = ()) -> str:
+    """Renders all stored metrics (plus ``extra`` samples) in text exposition format.
+
+    :args extra: Samples computed at scrape time, as (metric, labels, value).
+    """
+    samples: dict[str, list[tuple[str, list[tuple[str, str]], float]]] = {}
+    con = get_redis_connection("default")
+    for raw_field, raw_value in con.hgetall(METRICS_KEY).items():
+        name, pairs = json.loads(raw_field)
+        pairs = [tuple(pair) for pair in pairs]
+        samples.setdefault(_base_name(name), []).append((name, pairs, float(raw_value)))
+    for metric, labels, value in extra:
+        samples.setdefault(metric.name, []).append((metric.name, metric._labels(labels), value))
+
+    lines: list[str] = []
+    for name in sorted(_registry):
+        metric = _registry[name]
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for series_name, pairs, value in sorted(samples.get(name, []), key=_sort_key):
+            lines.append(_series(series_name, pairs, value))
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """Deletes all stored metrics."""
+    _ = get_redis_connection("default").delete(METRICS_KEY)
+
+
+class MetricsMiddleware:
+    """Counts requests and records their latency per operation.
+
+    The operation is identified by the HTTP method and the URL route pattern
+    (for example ``POST api/v1/trustmarks/<int:tmid>/renew``), which keeps
+    the label cardinality bounded. All metric updates made while handling
+    the request are written together when it finishes.
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        with batch():
+            start = time.perf_counter()
+            response = self.get_response(request)
+            duration = time.perf_counter() - start
+
+            # Requests that did not reach a view (static files, 404s) are not counted.
+            match = getattr(request, "resolver_match", None)
+            if match is not None:
+                method = request.method or ""
+                REQUESTS.inc(method=method, route=match.route, status=str(response.status_code))
+                REQUEST_DURATION.observe(duration, method=method, route=match.route)
+        return response
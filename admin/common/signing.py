@@ -5,7 +5,11 @@ from typing import Any
 from jwcrypto import jwt
 from jwcrypto.jwk import JWK
 
+from common import metrics
+from common.timing import SIGN, timed
 
+
+@timed(SIGN)
 def create_signed_jwt(
     claims: dict[str, Any],
     key: JWK,
@@ -40,4 +44,5 @@ def create_signed_jwt(
     # Create and sign the token
     token = jwt.JWT(header=header, claims=claims)
     token.make_signed_token(key)
+    metrics.SIGNATURES.inc(alg=key.get("alg") or "RS256")
     return token.serialize()
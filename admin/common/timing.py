@@ -0,0 +1,160 @@
+"""Per-stage latency instrumentation for the admin API.
+
+A request handled by ``ServerTimingMiddleware`` gets a collector stored in a
+context variable. Code on the request path marks the expensive parts with
+``stage()`` (or the ``timed()`` decorator), for example::
+
+    with stage("fetch"):
+        resp = httpx.get(url)
+
+Durations of all stages with the same name are summed. Database queries are
+timed automatically as the ``db`` stage. When the response is ready, the
+middleware adds a ``Server-Timing`` header and logs one structured line on the
+``inmor.timing`` logger.
+
+Each stage is also observed in the ``inmor_admin_stage_duration_seconds``
+histogram (see ``common.metrics``) for every request, sampled or not.
+Outside of a request, ``stage()`` is a no-op, so library code and management
+commands can use it freely.
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import random
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+
+from common import metrics
+
+logger = logging.getLogger("inmor.timing")
+
+# Stage names used across the code base. Server-Timing metric names must be tokens.
+FETCH = "fetch"
+VERIFY = "verify"
+POLICY = "policy"
+SIGN = "sign"
+DB = "db"
+REDIS = "redis"
+
+
+class Timings:
+    """Accumulated durations (in seconds) and call counts per stage."""
+
+    def __init__(self):
+        self.durations: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+
+    def add(self, name: str, duration: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def server_timing(self, total: float) -> str:
+        """Formats the timings as a ``Server-Timing`` header value (milliseconds)."""
+        parts = [f"{name};dur={duration * 1000:.1f}" for name, duration in self.durations.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Timings | None] = ContextVar("inmor_timings", default=None)
+
+
+def current() -> Timings | None:
+    """Returns the collector of the current request, if it is being timed."""
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times the enclosed block as stage ``name`` of the current request."""
+    timings = _current.get()
+    observe = metrics.batching()
+    if timings is None and not observe:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        if timings is not None:
+            timings.add(name, duration)
+        if observe:
+            metrics.STAGE_DURATION.observe(duration, stage=name)
+
+
+def timed(name: str) -> Callable:
+    """Decorator version of ``stage()``."""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    with stage(DB):
+        return execute(sql, params, many, context)
+
+
+def _sampled() -> bool:
+    rate = getattr(settings, "REQUEST_TIMING_SAMPLE_RATE", 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+class ServerTimingMiddleware:
+    """Times API requests and reports per-stage durations.
+
+    Only paths below ``REQUEST_TIMING_PATH_PREFIX`` are instrumented. Database
+    queries are timed on all of them, the header and log line are produced for
+    a ``REQUEST_TIMING_SAMPLE_RATE`` fraction.
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        prefix = getattr(settings, "REQUEST_TIMING_PATH_PREFIX", "/api/")
+        if not request.path.startswith(prefix):
+            return self.get_response(request)
+        if not _sampled():
+            with connection.execute_wrapper(_db_wrapper):
+                return self.get_response(request)
+
+        timings = Timings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_db_wrapper):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        response["Server-Timing"] = timings.server_timing(total)
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "total_ms": round(total * 1000, 1),
+                    "stages_ms": {k: round(v * 1000, 1) for k, v in timings.durations.items()},
+                    "stage_counts": timings.counts,
+                }
+            )
+        )
+        return response
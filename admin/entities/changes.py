@@ -0,0 +1,124 @@
+"""Reading the stream of Redis changes made by the admin.
+
+Every write of the admin to the keys read by the TA also appends an event to
+the capped ``inmor:changes`` stream (see ``entities.lib.record_change``). An
+event names the key family that changed (``subordinates``, ``trust_marks``,
+``entity_configuration`` or ``historical_keys``), the operation, the entity
+and the new version of the family, so a consumer can update its own copy of
+one entity instead of rescanning Redis. The event of an issued trust mark also
+holds the SHA-256 of its JWT::
+
+    for change in follow(con, last_id):
+        refresh(change.family, change.entity)
+        last_id = change.id
+
+The stream is capped at about ``CHANGES_MAXLEN`` events. A consumer that falls
+further behind sees a gap in the versions of a family (``Change.version``
+grows by exactly one per change) and has to resynchronize that family.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import cast
+
+from redis import Redis
+
+from entities.lib import CHANGES_STREAM
+
+# Stream IDs to read from: all retained events, or only those added later.
+FIRST = "0-0"
+LATEST = "$"
+
+# A stream entry as parsed by redis-py, which gives (None, None) for an entry
+# that was deleted while it was read.
+_Entry = tuple[bytes | None, dict[bytes, bytes] | None]
+
+
+@dataclass(frozen=True)
+class Change:
+    """One event of the change stream."""
+
+    id: str
+    family: str
+    op: str
+    entity: str
+    version: int
+    mark: str = ""
+
+    @classmethod
+    def from_entry(cls, entry_id: bytes | str, fields: dict[bytes, bytes]) -> Change:
+        values = {_text(key): _text(value) for key, value in fields.items()}
+        return cls(
+            id=_text(entry_id),
+            family=values.get("family", ""),
+            op=values.get("op", ""),
+            entity=values.get("entity", ""),
+            version=int(values.get("version", 0)),
+            mark=values.get("mark", ""),
+        )
+
+
+def _text(value: bytes | str) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _changes(entries: list[_Entry]) -> list[Change]:
+    return [
+        Change.from_entry(entry_id, fields)
+        for entry_id, fields in entries
+        if entry_id is not None and fields is not None
+    ]
+
+
+def read_changes(
+    con: Redis, after: str = FIRST, count: int = 100, block: int | None = None
+) -> list[Change]:
+    """Returns the changes recorded after a stream ID, oldest first.
+
+    :args con: Redis connection
+    :args after: Stream ID of the last change already seen, FIRST or LATEST
+    :args count: The maximum number of changes to return
+    :args block: Milliseconds to wait for a change if there is none, None to not wait
+    """
+    response = cast(
+        list[tuple[bytes, list[_Entry]]] | None,
+        con.xread({CHANGES_STREAM: after}, count=count, block=block),
+    )
+    changes: list[Change] = []
+    for _stream, entries in response or []:
+        changes.extend(_changes(entries))
+    return changes
+
+
+def recent_changes(con: Redis, count: int = 10) -> list[Change]:
+    """Returns the last recorded changes, oldest first."""
+    entries = cast(list[_Entry], con.xrevrange(CHANGES_STREAM, count=count))
+    return _changes(entries[::-1])
+
+
+def latest_id(con: Redis) -> str:
+    """Returns the stream ID of the newest change, or FIRST if there is none.
+
+    Unlike LATEST, the returned ID can be stored and used to resume later.
+    """
+    entries = cast(list[_Entry], con.xrevrange(CHANGES_STREAM, count=1))
+    if not entries or (entry_id := entries[0][0]) is None:
+        return FIRST
+    return _text(entry_id)
+
+
+def follow(con: Redis, after: str = FIRST, block: int = 5000) -> Iterator[Change]:
+    """Yields the changes after a stream ID, and then new changes as they are recorded.
+
+    :args con: Redis connection
+    :args after: Stream ID of the last change already seen, FIRST or LATEST
+    :args block: Milliseconds each XREAD waits for new changes
+    """
+    if after == LATEST:
+        after = latest_id(con)
+    while True:
+        for change in read_changes(con, after, block=block):
+            after = change.id
+            yield change
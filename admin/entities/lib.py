@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Any, cast
 from urllib.parse import urlparse
@@ -8,19 +9,112 @@ from urllib.parse import urlparse
 import httpx
 from django.conf import settings
 from jwcrypto import jwk, jwt
+from jwcrypto.common import base64url_decode, json_decode
 from jwcrypto.jwk import JWK, JWKSet
 from jwcrypto.jwt import JWT
 from oidfpolicy import apply_policy, merge_policies
 from pydantic import BaseModel
 from redis import Redis
 
+from common import metrics
 from common.signing import create_signed_jwt
+from common.timing import FETCH, POLICY, REDIS, VERIFY, stage, timed
 
 INSIDE_CONTAINER = os.environ.get("INSIDE_CONTAINER")
 
+# Index sets read by the TA's /list endpoint, kept in sync by update_redis_with_subordinate.
+# Sorted set (all scores 0, so ordered by entity_id) of all listable subordinates.
+SUBORDINATE_INDEX = "inmor:subordinates:index"
+# Sets of subordinates by entity type (metadata key).
+SUBORDINATE_BY_TYPE = "inmor:subordinates:by_type:{}"
+# Subordinates whose entity configuration carries at least one trust mark.
+SUBORDINATE_TRUST_MARKED = "inmor:subordinates:trust_marked"
+# Intermediates (federation_entity without openid_provider/openid_relying_party) and the rest.
+SUBORDINATE_INTERMEDIATE = "inmor:subordinates:intermediate"
+SUBORDINATE_LEAF = "inmor:subordinates:leaf"
+
+# Resolve responses cached by the TA: a hash per subject, and per entity in a cached
+# trust chain the set of subjects whose cached responses depend on it.
+RESOLVE_CACHE = "inmor:resolve:sub:{}"
+RESOLVE_CACHE_CHAIN = "inmor:resolve:chain:{}"
+
+# Pre-resolved trust chains of direct subordinates, read by the TA's /resolve:
+# entity_id -> JSON {"entity_configuration", "subordinate_statement", "exp"}.
+CHAIN_BUNDLES = "inmor:chain_bundles"
+
+# Pub/sub channel on which the TA listens to drop its in-memory copies of
+# /.well-known/openid-federation, /historical_keys and /fetch responses.
+RESPONSE_CACHE_CHANNEL = "inmor:response_cache"
+# Messages on RESPONSE_CACHE_CHANNEL.
+RESPONSE_ENTITY_CONFIGURATION = "entity_configuration"
+RESPONSE_HISTORICAL_KEYS = "historical_keys"
+RESPONSE_FETCH = "fetch:{}"
+# Drops the cached /trust_mark_status verdicts of all trust marks of an entity.
+RESPONSE_TRUST_MARK = "trust_mark:{}"
+RESPONSE_ALL = "*"
+
+# Hash of version counters from which the TA builds the ETags of /list and
+# /trust_mark_list. A field is bumped after every change of the data behind it.
+LISTING_VERSIONS = "inmor:versions"
+VERSION_SUBORDINATES = "subordinates"
+VERSION_TRUST_MARKS = "trust_marks"
+VERSION_ENTITY_CONFIGURATION = "entity_configuration"
+VERSION_HISTORICAL_KEYS = "historical_keys"
+# Written by inmor-collection after each walk of the federation.
+VERSION_COLLECTION = "collection"
+
+# Capped stream with one event per change recorded by record_change(), read with
+# entities.changes. Each entry has the fields family (a VERSION_* field), op,
+# entity and version.
+CHANGES_STREAM = "inmor:changes"
+CHANGES_MAXLEN = 10000
+# Operations recorded on CHANGES_STREAM.
+CHANGE_UPDATE = "update"
+CHANGE_ISSUE = "issue"
+CHANGE_REVOKE = "revoke"
+CHANGE_REBUILD = "rebuild"
+CHANGE_CLEAR = "clear"
+CHANGE_RESTORE = "restore"
+
+# Bumps the version and appends the event in one step, so that the versions on
+# the stream are in order.
+_RECORD_CHANGE = """
+local version = redis.call("HINCRBY", KEYS[1], ARGV[1], 1)
+if ARGV[5] == "" then
+    redis.call("XADD", KEYS[2], "MAXLEN", "~", ARGV[4], "*",
+        "family", ARGV[1], "op", ARGV[2], "entity", ARGV[3], "version", version)
+else
+    redis.call("XADD", KEYS[2], "MAXLEN", "~", ARGV[4], "*",
+        "family", ARGV[1], "op", ARGV[2], "entity", ARGV[3], "version", version,
+        "mark", ARGV[5])
+end
+return version
+"""
+
 logger = logging.getLogger(__name__)
 
 
+def http_get(url: str, **kwargs: Any) -> httpx.Response:
+    """Performs a GET request, recording its latency and errors per host.
+
+    :args url: The URL to fetch
+    :returns: The httpx response
+    """
+    host = urlparse(url).hostname or "unknown"
+    start = time.perf_counter()
+    try:
+        with stage(FETCH):
+            resp = httpx.get(url, **kwargs)
+    except Exception:
+        metrics.FETCH_ERRORS.inc(host=host)
+        raise
+    finally:
+        metrics.FETCH_DURATION.observe(time.perf_counter() - start, host=host)
+    if resp.status_code >= 400:
+        metrics.FETCH_ERRORS.inc(host=host)
+    return resp
+
+
 class SubordinateRequest(BaseModel):
     entity: str
 
@@ -41,12 +135,14 @@ def fetch_entity_configuration(
         keyset = jwk.JWKSet.from_json(keys_str)
     else:
         raise ValueError("Missing JWKS")
-    resp = httpx.get(f"{entityid}/.well-known/openid-federation")
+    resp = http_get(f"{entityid}/.well-known/openid-federation")
     text = resp.text
-    jwt_net: JWT = jwt.JWT(jwt=text, key=keyset)
+    with stage(VERIFY):
+        jwt_net: JWT = jwt.JWT(jwt=text, key=keyset)
     return jwt_net, keyset, text
 
 
+@timed(POLICY)
 def merge_our_policy_ontop_subpolicy(subpolicy: dict[Any, Any]) -> str | None:
     "To verify that we can succesfully merge policies."
     if settings.POLICY_DOCUMENT.get("metadata_policy", {}):
@@ -57,6 +153,7 @@ def merge_our_policy_ontop_subpolicy(subpolicy: dict[Any, Any]) -> str | None:
     return None
 
 
+@timed(POLICY)
 def apply_server_policy(metadata: str):
     "Verifies that we can apply our policy on the metadata."
     m = apply_policy(json.dumps(settings.POLICY_DOCUMENT.get("metadata_policy", {})), metadata)
@@ -233,6 +330,162 @@ def create_subordinate_statement(
     return token_data
 
 
+def subordinate_index_keys(jwt_text: str) -> set[str] | None:
+    """Returns the /list index sets a subordinate belongs to.
+
+    :args jwt_text: The entity configuration of the subordinate, already verified.
+
+    :returns: The set of index keys, or None if the entity configuration has no
+    metadata object (such subordinates are not listed).
+    """
+    try:
+        # IndexError without a payload, ValueError for bad base64, UTF-8 or JSON.
+        claims = json_decode(base64url_decode(jwt_text.split(".")[1]))
+    except (IndexError, ValueError) as e:
+        logger.warning(f"Could not decode entity configuration for the index: {e}")
+        return None
+    if not isinstance(claims, dict):
+        return None
+    metadata = claims.get("metadata")
+    if not isinstance(metadata, dict):
+        return None
+
+    keys = {SUBORDINATE_BY_TYPE.format(etype) for etype in metadata}
+    if (
+        "federation_entity" in metadata
+        and "openid_provider" not in metadata
+        and "openid_relying_party" not in metadata
+    ):
+        keys.add(SUBORDINATE_INTERMEDIATE)
+    else:
+        keys.add(SUBORDINATE_LEAF)
+
+    # https://openid.net/specs/openid-federation-1_0.html#section-7.4
+    trust_marks = claims.get("trust_marks")
+    if isinstance(trust_marks, list) and any(
+        isinstance(tm, dict) and isinstance(tm.get("trust_mark_type"), str) for tm in trust_marks
+    ):
+        keys.add(SUBORDINATE_TRUST_MARKED)
+    return keys
+
+
+def index_subordinate(
+    pipe: Any, entity_id: str, jwt_text: str, previous_jwt: str | None = None
+) -> None:
+    """Queues the commands updating the /list index sets for one subordinate.
+
+    :args pipe: Redis pipeline to queue the commands on
+    :args entity_id: The entity_id of the subordinate
+    :args jwt_text: The new entity configuration of the subordinate
+    :args previous_jwt: The entity configuration currently stored, if any
+    """
+    keys = subordinate_index_keys(jwt_text) or set()
+    if previous_jwt:
+        for key in (subordinate_index_keys(previous_jwt) or set()) - keys:
+            _ = pipe.srem(key, entity_id)
+    for key in keys:
+        _ = pipe.sadd(key, entity_id)
+    if keys:
+        _ = pipe.zadd(SUBORDINATE_INDEX, {entity_id: 0})
+    else:
+        _ = pipe.zrem(SUBORDINATE_INDEX, entity_id)
+
+
+def chain_bundle(jwt_text: str, signed_statement: str) -> str | None:
+    """Returns the pre-resolved trust chain of a subordinate for the TA's /resolve.
+
+    :args jwt_text: The entity configuration of the subordinate, already verified.
+    :args signed_statement: Our subordinate statement about the subordinate.
+
+    :returns: The JSON bundle, valid until the earlier exp of the two, or None if
+    either statement does not decode or has no exp.
+    """
+    expiries: list[int] = []
+    for token in (jwt_text, signed_statement):
+        try:
+            # IndexError without a payload, ValueError for bad base64, UTF-8 or JSON.
+            claims = json_decode(base64url_decode(token.split(".")[1]))
+        except (IndexError, ValueError) as e:
+            logger.warning(f"Not bundling the chain, a statement does not decode: {e}")
+            return None
+        exp = claims.get("exp") if isinstance(claims, dict) else None
+        if not isinstance(exp, (int, float)):
+            logger.warning("Not bundling the chain, a statement has no exp")
+            return None
+        expiries.append(int(exp))
+    return json.dumps(
+        {
+            "entity_configuration": jwt_text,
+            "subordinate_statement": signed_statement,
+            "exp": min(expiries),
+        }
+    )
+
+
+def resolve_cache_keys(entity_id: str, r: Redis) -> list[str]:
+    """Returns the keys of all cached /resolve responses that depend on an entity.
+
+    These are the responses for the entity itself and for every subject whose
+    cached trust chain passes through it.
+
+    :args entity_id: The entity_id that changed
+    :args r: Redis class from Django
+    """
+    subjects = cast(set[bytes], r.smembers(RESOLVE_CACHE_CHAIN.format(entity_id)))
+    keys = [RESOLVE_CACHE.format(sub.decode("utf-8")) for sub in subjects]
+    keys.append(RESOLVE_CACHE.format(entity_id))
+    keys.append(RESOLVE_CACHE_CHAIN.format(entity_id))
+    return keys
+
+
+@timed(REDIS)
+def invalidate_resolve_cache(entity_id: str, r: Redis) -> None:
+    """Drops the cached /resolve responses that depend on an entity."""
+    _ = r.delete(*resolve_cache_keys(entity_id, r))
+
+
+@timed(REDIS)
+def clear_resolve_cache(r: Redis) -> None:
+    """Drops all cached /resolve responses, e.g. after the TA's entity configuration changed."""
+    keys = list(r.scan_iter(match="inmor:resolve:*", count=1000))
+    if keys:
+        _ = r.delete(*keys)
+
+
+def publish_response_change(r: Redis, message: str) -> None:
+    """Tells the TA to drop its cached copy of a changed response.
+
+    :args r: Redis class from Django, or a pipeline to publish when it executes
+    :args message: One of the RESPONSE_* messages
+    """
+    _ = r.publish(RESPONSE_CACHE_CHANNEL, message)
+
+
+def record_change(r: Redis, family: str, operation: str, entity: str = "", mark: str = "") -> None:
+    """Bumps the version of a key family and appends the change to CHANGES_STREAM.
+
+    A new version also gives the TA listings built from the family a new ETag.
+
+    :args r: Redis class from Django, or a pipeline to record when it executes
+    :args family: One of the VERSION_* fields
+    :args operation: One of the CHANGE_* operations
+    :args entity: The changed entity_id, empty for changes of the whole family
+    :args mark: SHA-256 of an issued trust mark, which mirrors add to inmor:tm:alltime
+    """
+    _ = r.eval(
+        _RECORD_CHANGE,
+        2,
+        LISTING_VERSIONS,
+        CHANGES_STREAM,
+        family,
+        operation,
+        entity,
+        CHANGES_MAXLEN,
+        mark,
+    )
+
+
+@timed(REDIS)
 def update_redis_with_subordinate(
     entity_id: str, jwt_text: str, sub_metadata: dict[str, Any], signed_statement: str, r: Redis
 ) -> None:
@@ -274,16 +527,35 @@ def update_redis_with_subordinate(
     # if trust_marks:
     # sub_data["trust_marks"] = trust_marks
 
-    # Now we should set it in the redis
-    _ = r.hset("inmor:subordinates", entity_id, signed_statement)
-    _ = r.hset("inmor:subordinates:jwt", entity_id, jwt_text)
+    previous_jwt = r.hget("inmor:subordinates:jwt", entity_id)
+    if isinstance(previous_jwt, bytes):
+        previous_jwt = previous_jwt.decode("utf-8")
+    stale_resolves = resolve_cache_keys(entity_id, r)
+
+    # Now we should set it in the redis, together with the /list index sets, in
+    # one transaction so that /list never sees a half updated subordinate.
+    pipe = r.pipeline()
+    _ = pipe.hset("inmor:subordinates", entity_id, signed_statement)
+    _ = pipe.hset("inmor:subordinates:jwt", entity_id, jwt_text)
+    index_subordinate(pipe, entity_id, jwt_text, previous_jwt)
+    record_change(pipe, VERSION_SUBORDINATES, CHANGE_UPDATE, entity_id)
+    # The TA answers /resolve for the subordinate from this bundle until it expires.
+    bundle = chain_bundle(jwt_text, signed_statement)
+    if bundle:
+        _ = pipe.hset(CHAIN_BUNDLES, entity_id, bundle)
+    else:
+        _ = pipe.hdel(CHAIN_BUNDLES, entity_id)
+    # Cached /resolve responses carry the old subordinate statement.
+    _ = pipe.delete(*stale_resolves)
+    publish_response_change(pipe, RESPONSE_FETCH.format(entity_id))
     # Add the entity in the queue for walking the tree (if any)
-    _ = r.lpush("inmor:newsubordinate", entity_id)
+    _ = pipe.lpush("inmor:newsubordinate", entity_id)
+    _ = pipe.execute()
 
 
 def fetch_jwks_from_uri(uri: str) -> JWKSet:
     """Fetch a JWKS from a remote jwks_uri endpoint."""
-    resp = httpx.get(uri, timeout=10)
+    resp = http_get(uri, timeout=10)
     resp.raise_for_status()
     return JWKSet.from_json(resp.text)
 
@@ -301,12 +573,14 @@ def self_validate(token: jwt.JWT) -> dict[str, Any]:
             jwks_set = JWKSet()
             for key in jwks_data.get("keys", []):
                 jwks_set.add(JWK(**key))
-            token.validate(jwks_set)
+            with stage(VERIFY):
+                token.validate(jwks_set)
         elif payload.get("jwks_uri"):
             # Fallback: fetch keys from jwks_uri
             logger.info("No inline jwks, fetching from jwks_uri: %s", payload["jwks_uri"])
             jwks_set = fetch_jwks_from_uri(payload["jwks_uri"])
-            token.validate(jwks_set)
+            with stage(VERIFY):
+                token.validate(jwks_set)
         else:
             raise ValueError("No jwks or jwks_uri found in payload")
         return payload
@@ -316,7 +590,7 @@ def self_validate(token: jwt.JWT) -> dict[str, Any]:
 
 def fetch_payload(entity_id: str):
     """Fetches entity and validates and returns payload and JWT token as string"""
-    resp = httpx.get(f"{entity_id}/.well-known/openid-federation")
+    resp = http_get(f"{entity_id}/.well-known/openid-federation")
     if resp.status_code != 200:
         raise Exception(f"Fetching payload returns {resp.status_code} for {entity_id}")
     text = resp.text
@@ -334,8 +608,7 @@ def fetch_subordinate_statements(authority_hints: list[str], entity_id: str, r:
     :args entity_id: str value of the entity.
     :args r: Redis client instance.
     """
-    print(authority_hints)
-    print(f"Entity is: {entity_id}")
+    logger.debug(f"Fetching subordinate statements for {entity_id} from {authority_hints}")
     for ahint in authority_hints:
         # HACK: To enable fetching from TA container.
         # Special code to identify if we running inside of the container
@@ -367,7 +640,7 @@ def fetch_subordinate_statements(authority_hints: list[str], entity_id: str, r:
             # We have a fetch endpoint
             url = f"{fetch_endpoint}/?sub={entity_id}"
             logger.info(f"Fetching subordinate statement: {url}")
-            resp = httpx.get(url)
+            resp = http_get(url)
             if resp.status_code != 200:
                 logger.warning(
                     f"Fetching subordinate statement returns {resp.status_code} for {entity_id}"
@@ -419,7 +692,7 @@ def tree_walking(entity_id: str, r: Redis, visited: set[str] | None = None):
         if not list_endpoint:
             logger.warning(f"{entity_id} does not have a list endpoint")
             return visited
-        resp = httpx.get(list_endpoint)
+        resp = http_get(list_endpoint)
         subordinates = json.loads(resp.text)
         for subordinate in subordinates:
             if subordinate in visited:
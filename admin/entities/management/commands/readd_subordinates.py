@@ -1,6 +1,14 @@
 import djclick as click
 from django_redis import get_redis_connection
 
+from entities.lib import (
+    CHAIN_BUNDLES,
+    CHANGE_CLEAR,
+    RESPONSE_ALL,
+    VERSION_SUBORDINATES,
+    publish_response_change,
+    record_change,
+)
 from entities.models import Subordinate
 
 
@@ -9,7 +17,9 @@ def command():
     "Readds all subordinates from the Database."
     con = get_redis_connection("default")
     # First clean up the existing HashMap in redis
-    con.delete("inmor:subordinates")
+    con.delete("inmor:subordinates", CHAIN_BUNDLES)
+    record_change(con, VERSION_SUBORDINATES, CHANGE_CLEAR)
+    publish_response_change(con, RESPONSE_ALL)
     subs = Subordinate.objects.all()
     for sub in subs:
         # Means we can reissue this one
@@ -0,0 +1,36 @@
+from typing import cast
+
+import djclick as click
+from django_redis import get_redis_connection
+
+from entities.lib import (
+    CHANGE_REBUILD,
+    SUBORDINATE_BY_TYPE,
+    SUBORDINATE_INDEX,
+    SUBORDINATE_INTERMEDIATE,
+    SUBORDINATE_LEAF,
+    SUBORDINATE_TRUST_MARKED,
+    VERSION_SUBORDINATES,
+    index_subordinate,
+    record_change,
+)
+
+
+@click.command()
+def command():
+    "Rebuilds the /list index sets from the entity configurations stored in Redis."
+    con = get_redis_connection("default")
+    entities = cast(dict[bytes, bytes], con.hgetall("inmor:subordinates:jwt"))
+
+    old_keys = [SUBORDINATE_INDEX, SUBORDINATE_INTERMEDIATE, SUBORDINATE_LEAF]
+    old_keys.append(SUBORDINATE_TRUST_MARKED)
+    old_keys.extend(con.scan_iter(match=SUBORDINATE_BY_TYPE.format("*")))
+
+    # Replace all index sets in one transaction, so the TA never lists a partial index.
+    pipe = con.pipeline()
+    _ = pipe.delete(*old_keys)
+    for entity_id, jwt_text in entities.items():
+        index_subordinate(pipe, entity_id.decode("utf-8"), jwt_text.decode("utf-8"))
+    record_change(pipe, VERSION_SUBORDINATES, CHANGE_REBUILD)
+    _ = pipe.execute()
+    click.secho(f"Indexed {len(entities)} subordinates.", fg="green")
@@ -1,7 +1,16 @@
 import djclick as click
+from django.conf import settings
 from django_redis import get_redis_connection
 
-from entities.lib import create_server_statement
+from entities.lib import (
+    CHANGE_UPDATE,
+    RESPONSE_ENTITY_CONFIGURATION,
+    VERSION_ENTITY_CONFIGURATION,
+    clear_resolve_cache,
+    create_server_statement,
+    publish_response_change,
+    record_change,
+)
 
 
 @click.command()
@@ -10,4 +19,7 @@ def command():
     token = create_server_statement()
     con = get_redis_connection("default")
     con.set("inmor:entity_id", token)
+    record_change(con, VERSION_ENTITY_CONFIGURATION, CHANGE_UPDATE, settings.TA_DOMAIN)
+    publish_response_change(con, RESPONSE_ENTITY_CONFIGURATION)
+    clear_resolve_cache(con)
     click.secho("Entity configuration regenerated.", fg="green")
@@ -5,7 +5,9 @@ from typing import Any
 import djclick as click
 from django.conf import settings
 from django_redis import get_redis_connection
+from redis import Redis
 
+from common import metrics
 from entities.lib import (
     apply_server_policy,
     create_subordinate_statement,
@@ -16,6 +18,82 @@ from entities.lib import (
 from entities.models import Subordinate
 
 
+def renew(sub: Subordinate, con: Redis) -> str:
+    """Renews one subordinate and prints the result.
+
+    :returns: The outcome, "renewed", "rejected" or "error"
+    """
+    click.secho(f"Renewing {sub.entityid} ... ", nl=False)
+
+    # Use stored JWKS to verify the entity's current configuration
+    keys: dict[str, Any] | None = None
+    if sub.jwks:
+        keys = json.loads(sub.jwks) if isinstance(sub.jwks, str) else sub.jwks
+
+    try:
+        entity_jwt, keyset, entity_jwt_str = fetch_entity_configuration(sub.entityid, keys)
+    except Exception as e:
+        click.secho(f"FAILED (fetch: {e})", fg="red")
+        return "rejected"
+
+    claims: dict[str, Any] = json.loads(entity_jwt.claims)
+
+    # Verify that our TA_DOMAIN is in the authority_hints
+    authority_hints = claims.get("authority_hints", [])
+    if settings.TA_DOMAIN not in authority_hints:
+        click.secho(
+            f"FAILED (TA domain {settings.TA_DOMAIN} not in authority_hints)",
+            fg="red",
+        )
+        return "rejected"
+
+    # Verify metadata policy merge if present
+    if "metadata_policy" in claims:
+        sub_policy = claims.get("metadata_policy", {})
+        try:
+            merge_our_policy_ontop_subpolicy(sub_policy)
+        except Exception as e:
+            click.secho(f"FAILED (policy merge: {e})", fg="red")
+            return "rejected"
+
+    metadata: dict[str, Any] = claims["metadata"]
+    try:
+        apply_server_policy(json.dumps(metadata))
+    except Exception as e:
+        click.secho(f"FAILED (policy apply: {e})", fg="red")
+        return "rejected"
+
+    expiry = sub.valid_for or settings.SUBORDINATE_DEFAULT_VALID_FOR
+
+    now = datetime.now()
+    exp = now + timedelta(hours=expiry)
+    signed_statement = create_subordinate_statement(
+        sub.entityid,
+        keyset,
+        now,
+        exp,
+        sub.forced_metadata,
+        additional_claims=sub.additional_claims,
+    )
+
+    # Update database
+    fresh_jwks = claims.get("jwks", None)
+    try:
+        sub.metadata = metadata
+        if fresh_jwks:
+            sub.jwks = json.dumps(fresh_jwks)
+        sub.statement = signed_statement
+        sub.save()
+    except Exception as e:
+        click.secho(f"FAILED (db save: {e})", fg="red")
+        return "error"
+
+    # Update Redis
+    update_redis_with_subordinate(sub.entityid, entity_jwt_str, metadata, signed_statement, con)
+    click.secho("OK", fg="green")
+    return "renewed"
+
+
 @click.command()
 def command():
     "Renews all active subordinates by re-fetching and verifying their entity configurations."
@@ -25,81 +103,15 @@ def command():
     renewed = 0
     failed = 0
 
-    for sub in subs:
-        click.secho(f"Renewing {sub.entityid} ... ", nl=False)
-
-        # Use stored JWKS to verify the entity's current configuration
-        keys: dict[str, Any] | None = None
-        if sub.jwks:
-            keys = json.loads(sub.jwks) if isinstance(sub.jwks, str) else sub.jwks
-
-        try:
-            entity_jwt, keyset, entity_jwt_str = fetch_entity_configuration(sub.entityid, keys)
-        except Exception as e:
-            click.secho(f"FAILED (fetch: {e})", fg="red")
-            failed += 1
-            continue
-
-        claims: dict[str, Any] = json.loads(entity_jwt.claims)
-
-        # Verify that our TA_DOMAIN is in the authority_hints
-        authority_hints = claims.get("authority_hints", [])
-        if settings.TA_DOMAIN not in authority_hints:
-            click.secho(
-                f"FAILED (TA domain {settings.TA_DOMAIN} not in authority_hints)",
-                fg="red",
-            )
-            failed += 1
-            continue
-
-        # Verify metadata policy merge if present
-        if "metadata_policy" in claims:
-            sub_policy = claims.get("metadata_policy", {})
-            try:
-                merge_our_policy_ontop_subpolicy(sub_policy)
-            except Exception as e:
-                click.secho(f"FAILED (policy merge: {e})", fg="red")
+    # Metrics of the whole run are written to Redis once at the end.
+    with metrics.batch():
+        for sub in subs:
+            outcome = renew(sub, con)
+            metrics.RENEWALS.inc(resource="subordinate", outcome=outcome)
+            if outcome == "renewed":
+                renewed += 1
+            else:
                 failed += 1
-                continue
-
-        metadata: dict[str, Any] = claims["metadata"]
-        try:
-            apply_server_policy(json.dumps(metadata))
-        except Exception as e:
-            click.secho(f"FAILED (policy apply: {e})", fg="red")
-            failed += 1
-            continue
-
-        expiry = sub.valid_for or settings.SUBORDINATE_DEFAULT_VALID_FOR
-
-        now = datetime.now()
-        exp = now + timedelta(hours=expiry)
-        signed_statement = create_subordinate_statement(
-            sub.entityid,
-            keyset,
-            now,
-            exp,
-            sub.forced_metadata,
-            additional_claims=sub.additional_claims,
-        )
-
-        # Update database
-        fresh_jwks = claims.get("jwks", None)
-        try:
-            sub.metadata = metadata
-            if fresh_jwks:
-                sub.jwks = json.dumps(fresh_jwks)
-            sub.statement = signed_statement
-            sub.save()
-        except Exception as e:
-            click.secho(f"FAILED (db save: {e})", fg="red")
-            failed += 1
-            continue
-
-        # Update Redis
-        update_redis_with_subordinate(sub.entityid, entity_jwt_str, metadata, signed_statement, con)
-        renewed += 1
-        click.secho("OK", fg="green")
 
     click.secho(
         f"\nDone: {renewed}/{total} renewed, {failed} failed.",
@@ -0,0 +1,29 @@
+import time
+
+import djclick as click
+from django_redis import get_redis_connection
+
+from entities.snapshot import restore_snapshot
+
+
+@click.command()
+@click.argument("path")
+@click.option(
+    "--staging",
+    is_flag=True,
+    help="Restore under a staging prefix and swap all keys in at once.",
+)
+def command(path: str, staging: bool):
+    "Replaces the inmor:* keys served by the TA with the keys of a snapshot file."
+    con = get_redis_connection("default")
+    start = time.perf_counter()
+    try:
+        manifest = restore_snapshot(con, path, staging=staging)
+    except ValueError as e:
+        click.secho(str(e), fg="red")
+        raise click.Abort() from e
+    elapsed = time.perf_counter() - start
+    click.secho(
+        f"Restored {manifest.keys} keys of the snapshot from {manifest.created} in {elapsed:.2f}s.",
+        fg="green",
+    )
@@ -0,0 +1,27 @@
+import time
+
+import djclick as click
+from django_redis import get_redis_connection
+
+from entities.snapshot import CODEC_ZLIB, CODEC_ZSTD, DEFAULT_CODEC, take_snapshot
+
+
+@click.command()
+@click.argument("path")
+@click.option(
+    "--codec",
+    type=click.Choice([CODEC_ZSTD, CODEC_ZLIB]),
+    default=DEFAULT_CODEC,
+    help="Compression of the snapshot, zstd needs Python 3.14.",
+)
+def command(path: str, codec: str):
+    "Writes the inmor:* keys served by the TA to a compressed snapshot file."
+    con = get_redis_connection("default")
+    start = time.perf_counter()
+    try:
+        manifest = take_snapshot(con, path, codec)
+    except ValueError as e:
+        click.secho(str(e), fg="red")
+        raise click.Abort() from e
+    elapsed = time.perf_counter() - start
+    click.secho(f"Wrote {manifest.keys} keys to {path} in {elapsed:.2f}s.", fg="green")
@@ -0,0 +1,42 @@
+import json
+from dataclasses import asdict
+
+import djclick as click
+from django_redis import get_redis_connection
+
+from entities.changes import LATEST, Change, follow, read_changes, recent_changes
+
+
+def show(change: Change, as_json: bool) -> None:
+    if as_json:
+        click.echo(json.dumps(asdict(change)))
+    else:
+        entity = change.entity or "-"
+        click.echo(f"{change.id} {change.family} {change.op} {entity} v{change.version}")
+
+
+@click.command()
+@click.option("-n", "--lines", default=10, help="Number of recent changes to show.")
+@click.option("--after", default=None, help="Show all changes after this stream ID instead.")
+@click.option("-f", "--follow", "keep_following", is_flag=True, help="Wait for new changes.")
+@click.option("--json", "as_json", is_flag=True, help="Print one JSON object per change.")
+def command(lines: int, after: str | None, keep_following: bool, as_json: bool):
+    "Shows the latest changes on the inmor:changes stream, like tail."
+    con = get_redis_connection("default")
+    if after is None:
+        changes = recent_changes(con, lines) if lines > 0 else []
+        for change in changes:
+            show(change, as_json)
+        after = changes[-1].id if changes else LATEST
+    elif not keep_following:
+        while changes := read_changes(con, after):
+            for change in changes:
+                show(change, as_json)
+            after = changes[-1].id
+
+    if keep_following:
+        try:
+            for change in follow(con, after):
+                show(change, as_json)
+        except KeyboardInterrupt:
+            pass
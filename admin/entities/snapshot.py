@@ -0,0 +1,355 @@
+"""Compact binary snapshots of the Redis state served by the TA.
+
+A snapshot stores every ``inmor:*`` key in the output format of the Redis DUMP
+command, so loading it is one pipelined RESTORE per key instead of replaying
+every HSET and SADD. The file is::
+
+    MAGIC
+    manifest length  4 bytes, big endian
+    manifest         JSON, see Manifest
+    records          compressed with the codec named in the manifest
+
+and each record is the key, its remaining time to live in milliseconds (-1 for
+none) and the DUMP payload, where the key and the payload are prefixed with
+their length. The manifest holds the size and SHA-256 of the uncompressed
+records, and RESTORE also checks the CRC64 Redis appends to every payload.
+
+SCAN does not see the keyspace at one moment, so a snapshot taken while the
+admin writes may hold some keys from before and some from after a change. The
+keys are copied whole, so every single key is consistent.
+
+The TA's own caches, the change stream, the metrics and the version counters
+are not part of a snapshot. After a restore the version of every key family is
+bumped instead, so the ETags of the TA never repeat and mirrors copy the
+restored keys.
+
+DUMP payloads can only be restored by the same or a newer Redis version.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import sys
+import zlib
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from typing import BinaryIO, cast
+
+from redis import Redis
+
+from entities.lib import (
+    CHANGE_RESTORE,
+    CHANGES_STREAM,
+    LISTING_VERSIONS,
+    RESPONSE_ALL,
+    VERSION_COLLECTION,
+    VERSION_ENTITY_CONFIGURATION,
+    VERSION_HISTORICAL_KEYS,
+    VERSION_SUBORDINATES,
+    VERSION_TRUST_MARKS,
+    clear_resolve_cache,
+    publish_response_change,
+    record_change,
+)
+
+if sys.version_info >= (3, 14):
+    from compression import zstd
+else:
+    zstd = None
+
+MAGIC = b"INMORSNP"
+FORMAT = 1
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+# zstd when the Python running the admin has it, zlib otherwise.
+DEFAULT_CODEC = CODEC_ZSTD if zstd is not None else CODEC_ZLIB
+
+# Prefix of the keys a staged restore writes before swapping them in.
+STAGING_PREFIX = "inmor:snapshot:staging:"
+
+# Keys asked for per SCAN call, and dumped or restored per pipeline.
+BATCH_SIZE = 1000
+# Bytes of the file read at once while restoring.
+CHUNK_SIZE = 1 << 20
+
+# Keys written by the TA itself, and keys that are written by collection walks
+# and restores while they run.
+_SKIPPED_PREFIXES = (
+    "inmor:resolve:",
+    "inmor:jwks_cache:",
+    "inmor:signed_jwks_cache:",
+    "inmor:collection:staging:",
+    STAGING_PREFIX,
+)
+_SKIPPED_KEYS = {CHANGES_STREAM, LISTING_VERSIONS, "inmor:metrics"}
+
+_FAMILIES = (
+    VERSION_SUBORDINATES,
+    VERSION_TRUST_MARKS,
+    VERSION_ENTITY_CONFIGURATION,
+    VERSION_HISTORICAL_KEYS,
+    VERSION_COLLECTION,
+)
+
+_LENGTH = struct.Struct(">I")
+_TTL = struct.Struct(">q")
+
+
+@dataclass(frozen=True)
+class Manifest:
+    """The header of a snapshot file."""
+
+    format: int
+    codec: str
+    created: str
+    redis_version: str
+    keys: int
+    size: int
+    sha256: str
+
+
+def is_snapshotted(key: str) -> bool:
+    """Returns if a key is part of a snapshot."""
+    return (
+        key.startswith("inmor:")
+        and key not in _SKIPPED_KEYS
+        and not key.startswith(_SKIPPED_PREFIXES)
+    )
+
+
+def _snapshotted_keys(con: Redis, match: str = "inmor:*") -> Iterator[bytes]:
+    for key in cast(Iterator[bytes], con.scan_iter(match=match, count=BATCH_SIZE)):
+        if is_snapshotted(key.decode("utf-8")):
+            yield key
+
+
+def _batches(keys: Iterator[bytes]) -> Iterator[list[bytes]]:
+    batch: list[bytes] = []
+    for key in keys:
+        batch.append(key)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _compressor(codec: str):
+    if codec == CODEC_ZSTD and zstd is not None:
+        return zstd.ZstdCompressor()
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(1)
+    raise ValueError(f"The compression codec {codec} is not available.")
+
+
+def _decompressed(f: BinaryIO, codec: str) -> Iterator[bytes]:
+    if codec == CODEC_ZSTD and zstd is not None:
+        decompressor = zstd.ZstdDecompressor()
+    elif codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj()
+    else:
+        raise ValueError(f"The snapshot is compressed with {codec}, which is not available.")
+    while chunk := f.read(CHUNK_SIZE):
+        yield decompressor.decompress(chunk)
+    if codec == CODEC_ZLIB:
+        yield decompressor.flush()
+
+
+def take_snapshot(con: Redis, path: str, codec: str = DEFAULT_CODEC) -> Manifest:
+    """Writes all keys served by the TA to a snapshot file.
+
+    The file is written next to path first and then renamed, so path never holds
+    a partial snapshot.
+
+    :args con: Redis connection
+    :args path: The snapshot file to write
+    :args codec: CODEC_ZSTD or CODEC_ZLIB
+    """
+    compressor = _compressor(codec)
+    chunks: list[bytes] = []
+    digest = hashlib.sha256()
+    keys = size = 0
+    for batch in _batches(_snapshotted_keys(con)):
+        pipe = con.pipeline(transaction=False)
+        for key in batch:
+            _ = pipe.dump(key)
+            _ = pipe.pttl(key)
+        replies = pipe.execute()
+        records: list[bytes] = []
+        for key, payload, ttl in zip(batch, replies[::2], replies[1::2], strict=True):
+            if payload is None:
+                # Deleted since SCAN returned it.
+                continue
+            records += [_LENGTH.pack(len(key)), key, _TTL.pack(max(ttl, -1))]
+            records += [_LENGTH.pack(len(payload)), payload]
+            keys += 1
+        data = b"".join(records)
+        digest.update(data)
+        size += len(data)
+        chunks.append(compressor.compress(data))
+    chunks.append(compressor.flush())
+
+    server = cast(dict[str, str], con.info("server"))
+    manifest = Manifest(
+        format=FORMAT,
+        codec=codec,
+        created=datetime.now(UTC).isoformat(timespec="seconds"),
+        redis_version=str(server.get("redis_version", "")),
+        keys=keys,
+        size=size,
+        sha256=digest.hexdigest(),
+    )
+    header = json.dumps(asdict(manifest)).encode("utf-8")
+    partial = f"{path}.partial"
+    with open(partial, "wb") as f:
+        _ = f.write(MAGIC)
+        _ = f.write(_LENGTH.pack(len(header)))
+        _ = f.write(header)
+        for chunk in chunks:
+            _ = f.write(chunk)
+    os.replace(partial, path)
+    return manifest
+
+
+def _read_manifest(f: BinaryIO) -> Manifest:
+    head = f.read(len(MAGIC) + _LENGTH.size)
+    if len(head) != len(MAGIC) + _LENGTH.size or not head.startswith(MAGIC):
+        raise ValueError("Not an inmor snapshot file.")
+    (length,) = _LENGTH.unpack(head[len(MAGIC) :])
+    try:
+        manifest = Manifest(**json.loads(f.read(length)))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"The snapshot manifest is invalid: {e}") from e
+    if manifest.format != FORMAT:
+        raise ValueError(f"Snapshot format {manifest.format} is not supported.")
+    return manifest
+
+
+def read_manifest(path: str) -> Manifest:
+    """Returns the manifest of a snapshot file."""
+    with open(path, "rb") as f:
+        return _read_manifest(f)
+
+
+class _Records:
+    """Reads the records of a snapshot file and checks them against the manifest."""
+
+    def __init__(self, f: BinaryIO, manifest: Manifest):
+        self.manifest = manifest
+        self._chunks = _decompressed(f, manifest.codec)
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._buffer = b""
+        self._offset = 0
+
+    def _fill(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self._digest.update(chunk)
+        self._size += len(chunk)
+        self._buffer = self._buffer[self._offset :] + chunk
+        self._offset = 0
+        return True
+
+    def _read(self, size: int) -> bytes:
+        while len(self._buffer) - self._offset < size:
+            if not self._fill():
+                raise ValueError("The snapshot is truncated.")
+        data = self._buffer[self._offset : self._offset + size]
+        self._offset += size
+        return data
+
+    def _at_end(self) -> bool:
+        while self._offset == len(self._buffer):
+            if not self._fill():
+                return True
+        return False
+
+    def __iter__(self) -> Iterator[tuple[bytes, int, bytes]]:
+        keys = 0
+        while not self._at_end():
+            (length,) = _LENGTH.unpack(self._read(_LENGTH.size))
+            key = self._read(length)
+            (ttl,) = _TTL.unpack(self._read(_TTL.size))
+            (length,) = _LENGTH.unpack(self._read(_LENGTH.size))
+            yield key, ttl, self._read(length)
+            keys += 1
+        if (
+            keys != self.manifest.keys
+            or self._size != self.manifest.size
+            or self._digest.hexdigest() != self.manifest.sha256
+        ):
+            raise ValueError("The snapshot does not match the checksum of its manifest.")
+
+
+def _load(con: Redis, path: str, prefix: bytes = b"") -> set[bytes]:
+    """RESTOREs the keys of a snapshot under a prefix, and returns their names."""
+    keys: set[bytes] = set()
+    with open(path, "rb") as f:
+        pipe = con.pipeline(transaction=False)
+        for key, ttl, payload in _Records(f, _read_manifest(f)):
+            _ = pipe.restore(prefix + key, max(ttl, 0), payload, replace=True)
+            keys.add(key)
+            if len(pipe) == BATCH_SIZE:
+                _ = pipe.execute()
+        _ = pipe.execute()
+    return keys
+
+
+def _verify(path: str) -> set[bytes]:
+    """Reads a whole snapshot to check it, and returns the names of its keys."""
+    with open(path, "rb") as f:
+        return {key for key, _ttl, _payload in _Records(f, _read_manifest(f))}
+
+
+def restore_snapshot(con: Redis, path: str, staging: bool = False) -> Manifest:
+    """Replaces the keys served by the TA with the keys of a snapshot.
+
+    Keys that are not in the snapshot are deleted. The file is checked against
+    its manifest before any served key is changed.
+
+    :args con: Redis connection
+    :args path: The snapshot file to read
+    :args staging: Restore under STAGING_PREFIX first and then rename all keys
+                   in one transaction, so the TA never serves a partial restore.
+    """
+    manifest = read_manifest(path)
+    prefix = STAGING_PREFIX.encode("utf-8")
+    # Keys left behind by a failed staged restore.
+    leftovers = list(con.scan_iter(match=f"{STAGING_PREFIX}*", count=BATCH_SIZE))
+    if leftovers:
+        _ = con.delete(*leftovers)
+
+    if staging:
+        try:
+            keys = _load(con, path, prefix)
+        except Exception:
+            staged = list(con.scan_iter(match=f"{STAGING_PREFIX}*", count=BATCH_SIZE))
+            if staged:
+                _ = con.delete(*staged)
+            raise
+    else:
+        keys = _verify(path)
+        _ = _load(con, path)
+
+    # Swap in the staged keys, drop the keys missing from the snapshot and bump
+    # the versions in one transaction.
+    stale = [key for key in _snapshotted_keys(con) if key not in keys]
+    pipe = con.pipeline()
+    if stale:
+        _ = pipe.delete(*stale)
+    if staging:
+        for key in keys:
+            _ = pipe.rename(prefix + key, key)
+    for family in _FAMILIES:
+        record_change(pipe, family, CHANGE_RESTORE)
+    publish_response_change(pipe, RESPONSE_ALL)
+    _ = pipe.execute()
+    clear_resolve_cache(con)
+    return manifest
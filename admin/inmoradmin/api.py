@@ -1,4 +1,6 @@
+import functools
 import json
+import logging
 import os
 from datetime import datetime, timedelta
 from typing import Annotated, Any
@@ -6,22 +8,39 @@ from typing import Annotated, Any
 import httpx
 import pytz
 from django.conf import settings
-from django.http import HttpRequest
+from django.db.models import Count, Min
+from django.http import HttpRequest, HttpResponse
 from django_redis import get_redis_connection
 from ninja import NinjaAPI, Router, Schema
+from ninja.decorators import decorate_view
 from ninja.pagination import LimitOffsetPagination, paginate
 from pydantic import BaseModel, BeforeValidator, Field
 from redis.client import Redis
+from redis.exceptions import RedisError
 
+from common import metrics
 from common.signing import create_signed_jwt
+from common.timing import REDIS, stage
 from entities.lib import (
+    CHANGE_REVOKE,
+    CHANGE_UPDATE,
+    RESPONSE_ENTITY_CONFIGURATION,
+    RESPONSE_HISTORICAL_KEYS,
+    RESPONSE_TRUST_MARK,
+    VERSION_ENTITY_CONFIGURATION,
+    VERSION_HISTORICAL_KEYS,
+    VERSION_TRUST_MARKS,
     apply_server_policy,
+    clear_resolve_cache,
     create_server_statement,
     create_subordinate_statement,
     fetch_entity_configuration,
     fetch_jwks_from_uri,
     fetch_payload,
+    invalidate_resolve_cache,
     merge_our_policy_ontop_subpolicy,
+    publish_response_change,
+    record_change,
     update_redis_with_subordinate,
 )
 from entities.models import Subordinate
@@ -32,6 +51,8 @@ from auditlog.diff import model_to_dict
 from auditlog.helpers import log_create, log_update
 
 from .auth import auth_router, combined_auth
+from .idempotency import idempotent
+from .ratelimit import RateLimitExceeded, get_stats, rate_limit
 
 api = NinjaAPI(
     title="Inmor Admin API",
@@ -39,6 +60,41 @@ api = NinjaAPI(
     description="Admin API for managing Trust Anchor entities, subordinates, and trust marks.",
 )
 
+
+@api.exception_handler(RateLimitExceeded)
+def rate_limit_exceeded(request: HttpRequest, exc: RateLimitExceeded):
+    "Returns 429 with Retry-After when a client exceeds ADMIN_RATE_LIMITS."
+    response = api.create_response(request, {"message": str(exc)}, status=429)
+    response["Retry-After"] = str(exc.retry_after)
+    return response
+
+
+logger = logging.getLogger(__name__)
+
+
+def count_renewals(resource: str):
+    """Records the outcome of a renew endpoint in ``inmor_admin_renewals_total``."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(request: HttpRequest, *args, **kwargs):
+            status, body = func(request, *args, **kwargs)
+            if status == 200:
+                outcome = "renewed"
+            elif status == 404:
+                outcome = "not_found"
+            elif status >= 500:
+                outcome = "error"
+            else:
+                outcome = "rejected"
+            metrics.RENEWALS.inc(resource=resource, outcome=outcome)
+            return status, body
+
+        return wrapper
+
+    return decorator
+
+
 # Protected router - requires authentication (session or API key)
 router = Router(auth=combined_auth)
 
@@ -255,8 +311,8 @@ def create_trust_mark_type(request: HttpRequest, data: TrustMarkTypeSchema):
             return 201, tmt
         else:
             return 403, tmt
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Error while creating a new TrustMarkType")
         return 500, {"message": "Error while creating a new TrustMarkType"}
 
 
@@ -281,8 +337,8 @@ def get_trustmarktype_byid(request: HttpRequest, tmtid: int):
         return tmt
     except TrustMarkType.DoesNotExist:
         return 404, {"message": "TrustMarkType could not be found.", "id": tmtid}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Failed to get TrustMarkType.")
         return 500, {"message": "Failed to get TrustMarkType.", "id": tmtid}
 
 
@@ -298,8 +354,8 @@ def get_trustmarktype_bytype(request: HttpRequest, data: TrustMarkTypeGetSchema)
         return tmt
     except TrustMarkType.DoesNotExist:
         return 404, {"message": "TrustMarkType could not be found."}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Failed to get TrustMarkType.")
         return 500, {"message": "Failed to get TrustMarkType."}
 
 
@@ -333,8 +389,8 @@ def update_trust_mark_type(request: HttpRequest, tmtid: int, data: TrustMarkType
         return tmt
     except TrustMarkType.DoesNotExist:
         return 404, {"message": "TrustMarkType could not be found.", "id": tmtid}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Failed to update TrustMarkType.")
         return 500, {"message": "Failed to update TrustMarkType.", "id": tmtid}
 
 
@@ -346,6 +402,8 @@ def update_trust_mark_type(request: HttpRequest, tmtid: int, data: TrustMarkType
     response={201: TrustMarkOutSchema, 403: TrustMarkOutSchema, 404: Message, 500: Message},
     tags=["TrustMarks"],
 )
+@decorate_view(idempotent)
+@rate_limit("TrustMarks")
 def create_trust_mark(request: HttpRequest, data: TrustMarkSchema):
     """Creates a new TrustMark for a given domain and TrustMarkType ID."""
     # First get the TrustMarkType
@@ -408,8 +466,8 @@ def create_trust_mark(request: HttpRequest, data: TrustMarkSchema):
             tm.save()
             log_create(request, "TrustMark", tm)
             return 201, tm
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Error while creating a new TrustMark.")
         return 500, {"message": "Error while creating a new TrustMark."}
 
 
@@ -442,6 +500,9 @@ def get_trustmark_list(request: HttpRequest):
     response={200: TrustMarkOutSchema, 404: Message, 500: Message},
     tags=["TrustMarks"],
 )
+@decorate_view(idempotent)
+@rate_limit("TrustMarks")
+@count_renewals("trustmark")
 def renew_trustmark(request: HttpRequest, tmid: int):
     """Renews a TrustMark"""
     try:
@@ -458,8 +519,8 @@ def renew_trustmark(request: HttpRequest, tmid: int):
         return 200, tm
     except TrustMark.DoesNotExist:
         return 404, {"message": "TrustMark does not exist.", "id": tmid}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Error while creating a new TrustMark.")
         return 500, {"message": "Error while creating a new TrustMark."}
 
 
@@ -468,6 +529,7 @@ def renew_trustmark(request: HttpRequest, tmid: int):
     response={200: TrustMarkOutSchema, 404: Message, 500: Message},
     tags=["TrustMarks"],
 )
+@rate_limit("TrustMarks")
 def update_trustmark(request: HttpRequest, tmid: int, data: TrustMarkUpdateSchema):
     """Update a TrustMark"""
     should_mark_redis_revoked = False
@@ -492,14 +554,19 @@ def update_trustmark(request: HttpRequest, tmid: int, data: TrustMarkUpdateSchem
             tm.expire_at = expiry
         tm.save()
         if should_mark_redis_revoked:
-            _ = con.hset(f"inmor:tm:{tm.domain}", tm.tmt.tmtype, "revoked")
-            _ = con.srem(f"inmor:tmtype:{tm.tmt.tmtype}", tm.domain)
+            with stage(REDIS):
+                _ = con.hset(f"inmor:tm:{tm.domain}", tm.tmt.tmtype, "revoked")
+                _ = con.srem(f"inmor:tmtype:{tm.tmt.tmtype}", tm.domain)
+                _ = con.zrem(f"inmor:tmtype_sorted:{tm.tmt.tmtype}", tm.domain)
+                record_change(con, VERSION_TRUST_MARKS, CHANGE_REVOKE, tm.domain)
+                publish_response_change(con, RESPONSE_TRUST_MARK.format(tm.domain))
+            invalidate_resolve_cache(tm.domain, con)
         log_update(request, "TrustMark", tm, snapshot_before=before)
         return 200, tm
     except TrustMark.DoesNotExist:
         return 404, {"message": "TrustMark does not exist.", "id": tmid}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Error while creating a new TrustMark.")
         return 500, {"message": "Error while creating a new TrustMark."}
 
 
@@ -511,6 +578,8 @@ def update_trustmark(request: HttpRequest, tmid: int, data: TrustMarkUpdateSchem
     response={201: EntityOutSchema, 403: EntityOutSchema, 400: Message, 500: Message},
     tags=["Subordinates"],
 )
+@decorate_view(idempotent)
+@rate_limit("Subordinates")
 def create_subordinate(request: HttpRequest, data: EntityTypeSchema):
     "Adds a new subordinate."
     # First get verified JWT from entity configuration with the keys we provided
@@ -533,7 +602,7 @@ def create_subordinate(request: HttpRequest, data: EntityTypeSchema):
             _resp = merge_our_policy_ontop_subpolicy(sub_policy)
 
         except Exception as e:
-            print(e)
+            logger.warning(f"Could not merge TA/IA policy on the subordinate policy: {e}")
             return 400, {
                 "message": f"Could not succesfully merge TA/IA POLICY on the policy of the subordinate. {e}"
             }
@@ -543,7 +612,7 @@ def create_subordinate(request: HttpRequest, data: EntityTypeSchema):
         _ = apply_server_policy(json.dumps(metadata))
 
     except Exception as e:
-        print(e)
+        logger.warning(f"Could not apply policy on the metadata: {e}")
         return 400, {"message": f"Could not succesfully apply POLICY on the metadata. {e}"}
     if data.valid_for:
         if data.valid_for > settings.SUBORDINATE_DEFAULT_VALID_FOR:  # Oops, we can not allow that.
@@ -585,7 +654,7 @@ def create_subordinate(request: HttpRequest, data: EntityTypeSchema):
             additional_claims=data.additional_claims,
         )
     except Exception as e:
-        print(e)
+        logger.warning(f"Could not add subordinate {data.entityid}: {e}")
         if "unique constraint" in e.args[0]:
             sub_statement = Subordinate.objects.get(entityid=data.entityid)
             return 403, sub_statement
@@ -623,8 +692,8 @@ def get_subordinate_byid(request: HttpRequest, subid: int):
         return tmt
     except Subordinate.DoesNotExist:
         return 404, {"message": "Subordinate could not be found.", "id": subid}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Failed to get Subordinate.")
         return 500, {"message": "Failed to get Subordinate.", "id": subid}
 
 
@@ -633,6 +702,7 @@ def get_subordinate_byid(request: HttpRequest, subid: int):
     response={200: EntityOutSchema, 403: EntityOutSchema, 400: Message, 500: Message},
     tags=["Subordinates"],
 )
+@rate_limit("Subordinates")
 def update_subordinate(request: HttpRequest, subid: int, data: EntityTypeUpdateSchema):
     "Updates a subordinate."
 
@@ -641,8 +711,8 @@ def update_subordinate(request: HttpRequest, subid: int, data: EntityTypeUpdateS
         before = model_to_dict(sub)
     except Subordinate.DoesNotExist:
         return 404, {"message": "Subordinate could not be found.", "id": subid}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Failed to get Subordinate.")
         return 500, {"message": "Failed to get Subordinate.", "id": subid}
 
     # First get verified JWT from entity configuration with the keys we provided
@@ -667,7 +737,7 @@ def update_subordinate(request: HttpRequest, subid: int, data: EntityTypeUpdateS
             _resp = merge_our_policy_ontop_subpolicy(sub_policy)
 
         except Exception as e:
-            print(e)
+            logger.warning(f"Could not merge TA/IA policy on the subordinate policy: {e}")
             return 400, {
                 "message": f"Could not succesfully merge TA/IA POLICY on the policy of the subordinate. {e}"
             }
@@ -677,7 +747,7 @@ def update_subordinate(request: HttpRequest, subid: int, data: EntityTypeUpdateS
         _ = apply_server_policy(json.dumps(metadata))
 
     except Exception as e:
-        print(e)
+        logger.warning(f"Could not apply policy on the metadata: {e}")
         return 400, {"message": f"Could not succesfully apply POLICY on the metadata. {e}"}
     if data.valid_for:
         if data.valid_for > settings.SUBORDINATE_DEFAULT_VALID_FOR:  # Oops, we can not allow that.
@@ -717,8 +787,8 @@ def update_subordinate(request: HttpRequest, subid: int, data: EntityTypeUpdateS
         sub.additional_claims = data.additional_claims
         sub.statement = signed_statement
         sub.save()
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Error while updating the subordinate")
         return 500, {"message": "Error while updating the subordinate", id: subid}
     # All good so far, we will update all related redis entries now.
     con: Redis = get_redis_connection("default")
@@ -734,6 +804,9 @@ def update_subordinate(request: HttpRequest, subid: int, data: EntityTypeUpdateS
     response={200: EntityOutSchema, 404: Message, 400: Message, 500: Message},
     tags=["Subordinates"],
 )
+@decorate_view(idempotent)
+@rate_limit("Subordinates")
+@count_renewals("subordinate")
 def renew_subordinate(request: HttpRequest, subid: int):
     """Renews a subordinate by re-fetching and verifying its entity configuration."""
 
@@ -741,8 +814,8 @@ def renew_subordinate(request: HttpRequest, subid: int):
         sub = Subordinate.objects.get(id=subid)
     except Subordinate.DoesNotExist:
         return 404, {"message": "Subordinate could not be found.", "id": subid}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Failed to get Subordinate.")
         return 500, {"message": "Failed to get Subordinate.", "id": subid}
 
     if not sub.active:
@@ -758,7 +831,7 @@ def renew_subordinate(request: HttpRequest, subid: int):
     except ValueError as e:
         return 400, {"message": f"Failed to verify entity configuration: {e}"}
     except Exception as e:
-        print(e)
+        logger.warning(f"Failed to fetch entity configuration of {sub.entityid}: {e}")
         return 400, {"message": f"Failed to fetch entity configuration: {e}"}
 
     claims: dict[str, Any] = json.loads(entity_jwt.claims)
@@ -774,7 +847,7 @@ def renew_subordinate(request: HttpRequest, subid: int):
         try:
             _resp = merge_our_policy_ontop_subpolicy(sub_policy)
         except Exception as e:
-            print(e)
+            logger.warning(f"Could not merge TA/IA policy on the subordinate policy: {e}")
             return 400, {
                 "message": f"Could not succesfully merge TA/IA POLICY on the policy of the subordinate. {e}"
             }
@@ -783,7 +856,7 @@ def renew_subordinate(request: HttpRequest, subid: int):
     try:
         _ = apply_server_policy(json.dumps(metadata))
     except Exception as e:
-        print(e)
+        logger.warning(f"Could not apply policy on the metadata: {e}")
         return 400, {"message": f"Could not succesfully apply POLICY on the metadata. {e}"}
 
     expiry = sub.valid_for or settings.SUBORDINATE_DEFAULT_VALID_FOR
@@ -808,8 +881,8 @@ def renew_subordinate(request: HttpRequest, subid: int):
             sub.jwks = json.dumps(fresh_jwks)
         sub.statement = signed_statement
         sub.save()
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Error while renewing the subordinate.")
         return 500, {"message": "Error while renewing the subordinate.", "id": subid}
 
     # Update Redis
@@ -845,6 +918,7 @@ class FetchConfigOutSchema(Schema):
     response={200: FetchConfigOutSchema, 400: Message, 500: Message},
     tags=["Subordinates"],
 )
+@rate_limit("Subordinates")
 def fetch_entity_config(request: HttpRequest, data: FetchConfigSchema):
     """Fetches and self-validates an entity configuration from the given URL.
 
@@ -900,7 +974,11 @@ def create_server_entity(request: HttpRequest):
     "Creates server's entity configuration"
     token = create_server_statement()
     con: Redis = get_redis_connection("default")
-    _ = con.set("inmor:entity_id", token)
+    with stage(REDIS):
+        _ = con.set("inmor:entity_id", token)
+        record_change(con, VERSION_ENTITY_CONFIGURATION, CHANGE_UPDATE, settings.TA_DOMAIN)
+        publish_response_change(con, RESPONSE_ENTITY_CONFIGURATION)
+    clear_resolve_cache(con)
     return 201, {"entity_statement": token}
 
 
@@ -947,7 +1025,10 @@ def create_historical_keys(request: HttpRequest):
 
     # Store in Redis
     con: Redis = get_redis_connection("default")
-    _ = con.set("inmor:historical_keys", token)
+    with stage(REDIS):
+        _ = con.set("inmor:historical_keys", token)
+        record_change(con, VERSION_HISTORICAL_KEYS, CHANGE_UPDATE, settings.TA_DOMAIN)
+        publish_response_change(con, RESPONSE_HISTORICAL_KEYS)
 
     return 201, {"message": f"Historical keys JWT created with {len(keys)} keys"}
 
@@ -1024,6 +1105,49 @@ class AuditLogDetailOutSchema(AuditLogEntryOutSchema):
     snapshot_after: dict[str, Any] | None
 
 
+# Metrics
+
+AUDITLOG_ENTRIES = metrics.gauge(
+    "inmor_admin_auditlog_entries",
+    "Audit log entries stored in the database, by success of the logged operation.",
+    ("success",),
+)
+AUDITLOG_OLDEST = metrics.gauge(
+    "inmor_admin_auditlog_oldest_entry_timestamp_seconds",
+    "Timestamp of the oldest audit log entry still stored.",
+)
+RATELIMIT_DECISIONS = metrics.counter(
+    "inmor_admin_ratelimit_decisions_total",
+    "Rate limiter decisions by endpoint tag and outcome (allowed, throttled, concurrency).",
+    ("tag", "outcome"),
+)
+
+
+def _scrape_time_samples():
+    """Yields the samples computed when /metrics is scraped."""
+    from auditlog.models import AuditLogEntry
+
+    for row in AuditLogEntry.objects.values("success").annotate(count=Count("id")):
+        yield AUDITLOG_ENTRIES, {"success": str(row["success"]).lower()}, row["count"]
+    oldest = AuditLogEntry.objects.aggregate(oldest=Min("timestamp"))["oldest"]
+    if oldest is not None:
+        yield AUDITLOG_OLDEST, {}, oldest.timestamp()
+    for field, count in get_stats().items():
+        tag, _, outcome = field.rpartition(":")
+        yield RATELIMIT_DECISIONS, {"tag": tag, "outcome": outcome}, count
+
+
+@router.get("/metrics", response={503: Message}, tags=["Metrics"])
+def get_metrics(request: HttpRequest):
+    """Returns the admin metrics in the Prometheus text exposition format."""
+    try:
+        body = metrics.render(_scrape_time_samples())
+    except RedisError as e:
+        logger.warning(f"Could not read metrics: {e}")
+        return 503, {"message": "Metrics are not available."}
+    return HttpResponse(body, content_type=metrics.CONTENT_TYPE)
+
+
 # Add routers to API
 api.add_router("/auth", auth_router)  # Auth endpoints (no auth required)
 api.add_router("", router)  # Main API (auth required)
@@ -35,6 +35,7 @@ class AuthResult:
     user: User
     auth_method: str  # "session", "api_key", or future plugin names
     api_key_name: str | None = None  # Name of the API key used (None for session)
+    api_key_id: int | None = None  # Primary key of the API key used (None for session)
     tenant: str = "default"  # Tenant identifier
 
 
@@ -71,6 +72,7 @@ class APIKeyAuthBackend(AuthBackend):
             user=user,
             auth_method="api_key",
             api_key_name=api_key.name,
+            api_key_id=api_key.pk,
             tenant=api_key.tenant,
         )
 
@@ -0,0 +1,155 @@
+"""Support for the ``Idempotency-Key`` header on mutating admin API calls.
+
+Retrying ``POST /subordinates``, ``POST /trustmarks`` or a ``/renew`` call
+after a network error would otherwise repeat the whole fetch, verify, sign
+and write cycle and add a second audit log entry. With ``idempotent`` applied
+(through ``ninja.decorators.decorate_view``), the first response for a given
+key is stored in Redis for ``IDEMPOTENCY_KEY_TTL`` seconds and replayed for
+retries carrying the same key and the same request body.
+
+Concurrent requests with the same key are serialized with a Redis lock, so
+only one of them does the work and the others replay its response.
+
+``decorate_view`` wraps the whole operation, so the decorator runs before
+ninja authenticates the request. It therefore authenticates the request itself
+with the backends of ``CombinedAuthentication`` and scopes keys to the verified
+API key or session user, so one client can never see a response stored for
+another, and a revoked API key gets no stored responses. Requests that do not
+authenticate are passed on for ninja to reject.
+
+Only successful responses and validation errors (422) are stored. Other client
+errors may come from a transient failure, such as an entity configuration that
+could not be fetched, and are run again on a retry.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import logging
+from collections.abc import Callable
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django_redis import get_redis_connection
+from ninja.errors import HttpError
+from redis.exceptions import LockError, RedisError
+
+from .auth import CombinedAuthentication
+
+logger = logging.getLogger(__name__)
+
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+
+# How long (seconds) a request may hold the lock for a key, and how long a
+# concurrent duplicate waits for it before giving up with 409.
+LOCK_TIMEOUT = 120
+LOCK_WAIT = 60
+
+# Error responses with these status codes are stored besides the 2xx ones, as
+# the same request always gets them again.
+_STORED_ERRORS = {422}
+
+
+def _scope(request: HttpRequest) -> str | None:
+    """Returns the verified credential scope for the request, or None if unauthenticated."""
+    for backend in CombinedAuthentication.backends:
+        try:
+            result = backend.authenticate(request)
+        except HttpError:
+            return None
+        if result is not None:
+            if result.api_key_id is not None:
+                return f"key:{result.api_key_id}"
+            return f"user:{result.user.pk}"
+    return None
+
+
+def _stored(status: int) -> bool:
+    return 200 <= status < 300 or status in _STORED_ERRORS
+
+
+def _fingerprint(request: HttpRequest) -> str:
+    h = hashlib.sha256()
+    h.update(f"{request.method} {request.path}\n".encode())
+    h.update(request.body)
+    return h.hexdigest()
+
+
+def _replay(stored: dict) -> HttpResponse:
+    response = HttpResponse(
+        stored["content"].encode("utf-8"),
+        status=stored["status"],
+        content_type=stored["content_type"],
+    )
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _mismatch() -> JsonResponse:
+    return JsonResponse(
+        {"message": "Idempotency-Key was already used with a different request."}, status=422
+    )
+
+
+def idempotent(run: Callable) -> Callable:
+    """View decorator implementing ``Idempotency-Key`` replay.
+
+    Use as ``@decorate_view(idempotent)`` below the router decorator.
+    Requests without the header are passed through unchanged.
+    """
+
+    @functools.wraps(run)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        idempotency_key = request.META.get(HEADER)
+        if not idempotency_key:
+            return run(request, *args, **kwargs)
+        scope = _scope(request)
+        if scope is None:
+            return run(request, *args, **kwargs)
+        if len(idempotency_key) > 255:
+            return JsonResponse({"message": "Idempotency-Key is too long."}, status=400)
+
+        key_digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        redis_key = f"inmor:idempotency:{scope}:{key_digest}"
+        fingerprint = _fingerprint(request)
+        try:
+            con = get_redis_connection("default")
+            lock = con.lock(f"{redis_key}:lock", timeout=LOCK_TIMEOUT, blocking_timeout=LOCK_WAIT)
+            acquired = lock.acquire()
+        except RedisError as e:
+            logger.warning(f"Idempotency store unavailable, running request: {e}")
+            return run(request, *args, **kwargs)
+        if not acquired:
+            return JsonResponse(
+                {"message": "A request with this Idempotency-Key is still in progress."},
+                status=409,
+            )
+
+        try:
+            raw = con.get(redis_key)
+            if raw is not None:
+                stored = json.loads(raw)
+                if stored["fingerprint"] != fingerprint:
+                    return _mismatch()
+                return _replay(stored)
+
+            response = run(request, *args, **kwargs)
+            if _stored(response.status_code):
+                stored = {
+                    "fingerprint": fingerprint,
+                    "status": response.status_code,
+                    "content_type": response.get("Content-Type", "application/json"),
+                    "content": response.content.decode("utf-8"),
+                }
+                ttl = getattr(settings, "IDEMPOTENCY_KEY_TTL", 86400)
+                _ = con.set(redis_key, json.dumps(stored), ex=ttl)
+            return response
+        finally:
+            try:
+                lock.release()
+            except (LockError, RedisError) as e:
+                logger.warning(f"Could not release idempotency lock for {redis_key}: {e}")
+
+    return wrapper
@@ -0,0 +1,197 @@
+"""Per-client rate limiting and concurrency caps for expensive admin endpoints.
+
+Endpoints that fetch remote entity configurations or sign JWTs are wrapped
+with ``rate_limit(tag)``. Limits are configured per endpoint tag in
+``settings.ADMIN_RATE_LIMITS`` and are enforced per client identity, taken
+from the ``AuthResult`` set by ``CombinedAuthentication``:
+
+- a token bucket (``rate`` tokens per second, up to ``burst``), and
+- a cap on the number of requests in flight at the same time (``concurrency``).
+
+All state lives in Redis so the limits hold across every granian worker.
+If Redis is unavailable the limiter fails open and only logs a warning.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+from collections.abc import Callable
+from typing import Any, cast
+
+from django.conf import settings
+from django.http import HttpRequest
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "inmor:ratelimit:stats"
+
+# Safety expiry for in-flight counters, so a crashed worker can not hold a slot forever.
+INFLIGHT_TTL = 300
+
+# KEYS[1] = bucket key, ARGV[1] = rate (tokens/sec), ARGV[2] = burst
+# Returns {allowed (0/1), seconds until the next token as string}
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+# KEYS[1] = in-flight counter, ARGV[1] = limit, ARGV[2] = ttl
+_ACQUIRE_LUA = """
+local n = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if n > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return 0
+end
+return 1
+"""
+
+# KEYS[1] = in-flight counter
+# Only decrements a counter that still exists, so a counter that expired while
+# the request ran is not recreated at -1 without a TTL.
+_RELEASE_LUA = """
+local n = tonumber(redis.call('GET', KEYS[1]))
+if n and n > 0 then
+    redis.call('DECR', KEYS[1])
+end
+return 1
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a client exceeds the limits for an endpoint tag.
+
+    Turned into a ``429 Too Many Requests`` response with ``Retry-After`` by
+    the exception handler registered in ``inmoradmin.api``.
+    """
+
+    def __init__(self, tag: str, reason: str, retry_after: int):
+        self.tag = tag
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"Rate limit exceeded for {tag}: {reason}")
+
+
+def client_identity(request: HttpRequest) -> str:
+    """Returns the identity the limits are applied to.
+
+    API key requests are limited per tenant and key name, session requests
+    per tenant and username.
+    """
+    auth_result = getattr(request, "auth_result", None)
+    if auth_result is None:
+        return "anonymous"
+    if auth_result.api_key_name is not None:
+        return f"{auth_result.tenant}:key:{auth_result.api_key_name}"
+    return f"{auth_result.tenant}:user:{auth_result.user.username}"
+
+
+def _record(con: Any, tag: str, outcome: str) -> None:
+    try:
+        _ = con.hincrby(STATS_KEY, f"{tag}:{outcome}", 1)
+    except RedisError:
+        pass
+
+
+def get_stats() -> dict[str, int]:
+    """Returns limiter counters as ``{"<tag>:<outcome>": count}``.
+
+    Outcomes are ``allowed``, ``throttled`` (token bucket empty) and
+    ``concurrency`` (too many requests in flight).
+    """
+    con = get_redis_connection("default")
+    raw = cast(dict[bytes, bytes], con.hgetall(STATS_KEY))
+    return {k.decode("utf-8"): int(v) for k, v in raw.items()}
+
+
+def _release(con: Any, inflight_key: str) -> None:
+    _ = con.eval(_RELEASE_LUA, 1, inflight_key)
+
+
+def _acquire(con: Any, tag: str, identity: str, limits: dict[str, Any]) -> str | None:
+    """Takes an in-flight slot and a token.
+
+    The slot is taken first, so a request rejected for concurrency does not use
+    up a token, and the slot is given back if the token bucket is empty.
+
+    :returns: The in-flight counter key to release afterwards, if any.
+    :raises RateLimitExceeded: If either limit is exhausted.
+    """
+    inflight_key = None
+    concurrency = limits.get("concurrency")
+    if concurrency:
+        inflight_key = f"inmor:ratelimit:inflight:{tag}:{identity}"
+        if not con.eval(_ACQUIRE_LUA, 1, inflight_key, concurrency, INFLIGHT_TTL):
+            _record(con, tag, "concurrency")
+            raise RateLimitExceeded(tag, "too many concurrent requests", 1)
+
+    rate = limits.get("rate")
+    burst = limits.get("burst", max(1, rate or 0))
+    if rate:
+        allowed, retry_after = con.eval(
+            _TOKEN_BUCKET_LUA, 1, f"inmor:ratelimit:bucket:{tag}:{identity}", rate, burst
+        )
+        if not allowed:
+            if inflight_key is not None:
+                _release(con, inflight_key)
+            _record(con, tag, "throttled")
+            raise RateLimitExceeded(tag, "too many requests", max(1, round(float(retry_after))))
+    return inflight_key
+
+
+def rate_limit(tag: str) -> Callable:
+    """Decorator enforcing ``settings.ADMIN_RATE_LIMITS[tag]`` on a ninja view.
+
+    Must be placed below the router decorator so that it runs after
+    authentication. Tags without configured limits are not limited.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(request: HttpRequest, *args, **kwargs):
+            limits = getattr(settings, "ADMIN_RATE_LIMITS", {}).get(tag)
+            if not limits:
+                return func(request, *args, **kwargs)
+
+            identity = client_identity(request)
+            inflight_key = None
+            try:
+                con = get_redis_connection("default")
+                inflight_key = _acquire(con, tag, identity, limits)
+                _record(con, tag, "allowed")
+            except RedisError as e:
+                logger.warning(f"Rate limiter unavailable for {tag}, allowing request: {e}")
+                return func(request, *args, **kwargs)
+
+            try:
+                return func(request, *args, **kwargs)
+            finally:
+                if inflight_key is not None:
+                    try:
+                        _release(con, inflight_key)
+                    except RedisError as e:
+                        logger.warning(f"Could not release in-flight slot {inflight_key}: {e}")
+
+        return wrapper
+
+    return decorator
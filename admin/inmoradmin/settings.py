@@ -60,6 +60,8 @@ SITE_ID = 1
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "common.metrics.MetricsMiddleware",
+    "common.timing.ServerTimingMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # Serve static files efficiently
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -201,6 +203,35 @@ CACHES = {
     }
 }
 
+# API key authentication cache, see apikeys/cache.py
+# How long (in seconds) an authenticated API key is served from the in-process cache.
+APIKEY_CACHE_TTL = 30
+# Maximum number of API keys cached per process.
+APIKEY_CACHE_MAX_SIZE = 1024
+# last_used_at of an API key is written to the database at most once per this many seconds,
+# and at most this many seconds late.
+APIKEY_LAST_USED_INTERVAL = 60
+
+# Per client (API key or user) limits for the expensive admin endpoints, keyed by
+# the endpoint tag, see inmoradmin/ratelimit.py.
+#   rate: tokens added to the bucket per second, burst: size of the bucket,
+#   concurrency: maximum number of requests in flight at the same time.
+# Remove a tag (or set it to {}) to disable limiting for it.
+ADMIN_RATE_LIMITS: dict[str, dict[str, float]] = {
+    "Subordinates": {"rate": 1, "burst": 30, "concurrency": 4},
+    "TrustMarks": {"rate": 5, "burst": 100, "concurrency": 8},
+}
+
+# How long (in seconds) responses for requests with an Idempotency-Key header are
+# kept for replay, see inmoradmin/idempotency.py.
+IDEMPOTENCY_KEY_TTL = 86400
+
+# Per-stage latency instrumentation of the admin API, see common/timing.py.
+# Fraction (0.0 - 1.0) of requests below REQUEST_TIMING_PATH_PREFIX that get a
+# Server-Timing header and a log line on the "inmor.timing" logger.
+REQUEST_TIMING_SAMPLE_RATE = 1.0
+REQUEST_TIMING_PATH_PREFIX = "/api/"
+
 
 # LOGGING = {
 # "version": 1,
@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import json
 import os
 from typing import Any
@@ -8,6 +9,7 @@ from django.test import Client
 from jwcrypto import jwt
 from jwcrypto.common import json_decode
 
+from entities.changes import recent_changes
 from entities.lib import self_validate
 
 # from pprint import pprint
@@ -212,6 +214,10 @@ def test_trustmark_create(auth_client: Client, loadredis):
     assert redis_data is not None
     # Also this should be the same we received via response
     assert redis_data.decode("utf-8") == jwt_token
+    # The change tells mirrors the hash of the issued mark.
+    change = recent_changes(loadredis, 1)[0]
+    assert (change.op, change.entity) == ("issue", domain)
+    assert change.mark == hashlib.sha256(jwt_token.encode("utf-8")).hexdigest()
     # The following is to test #51
     iat = datetime.datetime.fromtimestamp(payload.get("iat"), datetime.timezone.utc)
     exp = datetime.datetime.fromtimestamp(payload.get("exp"), datetime.timezone.utc)
@@ -455,6 +461,12 @@ def test_trustmark_update(auth_client: Client, loadredis):
     # Here data is signed JWT
     redis_data = loadredis.hget(f"inmor:tm:{domain0}", payload["trust_mark_type"])
     assert redis_data is not None
+    index = f"inmor:tmtype_sorted:{payload['trust_mark_type']}"
+    assert loadredis.zscore(index, domain0) == 0
+    version = int(loadredis.hget("inmor:versions", "trust_marks"))
+    pubsub = loadredis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe("inmor:response_cache")
+    _ = pubsub.get_message(timeout=1)
     update_data = {"autorenew": False, "active": False}
     response = auth_client.put(
         f"/api/v1/trustmarks/{resp['id']}",
@@ -463,11 +475,19 @@ def test_trustmark_update(auth_client: Client, loadredis):
     )
     assert response.status_code == 200
     resp = response.json()
+    # The TA is told to drop its cached /trust_mark_status verdicts.
+    message = pubsub.get_message(timeout=1)
+    pubsub.close()
+    assert message is not None
+    assert message["data"] == f"trust_mark:{domain0}".encode()
     # The response itself should have JWT anymore.
     assert not resp["mark"]
     # Here data is signed JWT
     redis_data = loadredis.hget(f"inmor:tm:{domain0}", payload["trust_mark_type"])
     assert redis_data == b"revoked"
+    assert loadredis.zscore(index, domain0) is None
+    # /trust_mark_list gets a new ETag.
+    assert int(loadredis.hget("inmor:versions", "trust_marks")) == version + 1
     assert resp.get("autorenew") is False
     assert resp.get("active") is False
 
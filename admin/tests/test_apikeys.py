@@ -1,12 +1,15 @@
 """Tests for API Key authentication."""
 
 import json
+import time
 from datetime import timedelta
 
 import pytest
+from django.core.signals import request_finished
 from django.test import Client
 from django.utils import timezone
 
+from apikeys import cache
 from apikeys.models import APIKey, generate_api_key, hash_api_key
 
 
@@ -232,6 +235,109 @@ class TestAPIKeyAuthentication:
         assert response.status_code == 200
 
 
+class TestAPIKeyCache:
+    """Tests for the in-process API key cache and coalesced last_used_at writes."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        cache.clear()
+        yield
+        cache.clear()
+
+    @pytest.mark.django_db
+    def test_cached_authentication_skips_database(self, user, loadredis, django_assert_num_queries):
+        """A second authentication within the TTL does not touch the database."""
+        _, plaintext = APIKey.create_key(name="Cached Key", user=user)
+
+        assert APIKey.authenticate(plaintext) is not None
+        with django_assert_num_queries(0):
+            result = APIKey.authenticate(plaintext)
+        assert result is not None
+        assert result[0] == user
+
+    @pytest.mark.django_db
+    def test_last_used_written_once_per_interval(self, user, loadredis):
+        """Repeated uses within the interval are kept in memory and flushed together."""
+        api_key, plaintext = APIKey.create_key(name="Coalesced Key", user=user)
+
+        APIKey.authenticate(plaintext)
+        api_key.refresh_from_db()
+        first_used = api_key.last_used_at
+        assert first_used is not None
+
+        APIKey.authenticate(plaintext)
+        api_key.refresh_from_db()
+        assert api_key.last_used_at == first_used
+
+        assert cache.flush_last_used() == 1
+        api_key.refresh_from_db()
+        assert api_key.last_used_at is not None
+        assert api_key.last_used_at > first_used
+
+    @pytest.mark.django_db
+    def test_trailing_use_is_flushed(self, user, loadredis, settings):
+        """The last use of a key is written once it is an interval old."""
+        settings.APIKEY_LAST_USED_INTERVAL = 0.2
+        api_key, plaintext = APIKey.create_key(name="Trailing Key", user=user)
+        _, other = APIKey.create_key(name="Other Key", user=user)
+
+        APIKey.authenticate(plaintext)
+        APIKey.authenticate(plaintext)
+        api_key.refresh_from_db()
+        first_used = api_key.last_used_at
+        assert first_used is not None
+        assert cache.flush_due_last_used() == 0
+
+        # The trailing use is written by the next use of any other key.
+        time.sleep(0.3)
+        APIKey.authenticate(other)
+        api_key.refresh_from_db()
+        assert api_key.last_used_at is not None
+        assert api_key.last_used_at > first_used
+        second_used = api_key.last_used_at
+
+        # Or at the end of the next request, whichever key it used.
+        APIKey.authenticate(plaintext)
+        time.sleep(0.3)
+        request_finished.send(sender=None)
+        api_key.refresh_from_db()
+        assert api_key.last_used_at is not None
+        assert api_key.last_used_at > second_used
+
+    @pytest.mark.django_db
+    def test_revoke_invalidates_cache(self, user, loadredis):
+        """Revoking via queryset update (as the admin action does) drops cached keys."""
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        _, plaintext = APIKey.create_key(name="revoke-cached", user=user)
+        assert APIKey.authenticate(plaintext) is not None
+
+        call_command(
+            "apikey",
+            "revoke",
+            "--username",
+            "testuser",
+            "--key-name",
+            "revoke-cached",
+            stdout=StringIO(),
+        )
+
+        assert APIKey.authenticate(plaintext) is None
+
+    @pytest.mark.django_db
+    def test_save_invalidates_cache(self, user, loadredis):
+        """Deactivating a key through save() drops it from the cache."""
+        api_key, plaintext = APIKey.create_key(name="Saved Key", user=user)
+        assert APIKey.authenticate(plaintext) is not None
+
+        api_key.is_active = False
+        api_key.save()
+
+        assert APIKey.authenticate(plaintext) is None
+
+
 class TestAPIKeyManagementCommand:
     """Tests for the apikey management command."""
 
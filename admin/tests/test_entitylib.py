@@ -1,11 +1,12 @@
 import json
+import logging
 import os
 from typing import Any
 
 import pytest
 from django.test import TestCase
 from jwcrypto import jwt
-from jwcrypto.common import json_decode
+from jwcrypto.common import base64url_encode, json_decode
 
 from entities import lib
 
@@ -201,3 +202,220 @@ def test_create_server_statement_rejects_malformed_owner(db_with_fixtures, setti
     settings.TA_TRUST_MARK_OWNERS = broken
     with pytest.raises(ValueError):
         lib.create_server_statement()
+
+
+def make_entity_configuration(claims: dict[str, Any]) -> str:
+    "Helper to build an unsigned entity configuration for the /list index tests."
+    header = base64url_encode(json.dumps({"alg": "none"}))
+    return f"{header}.{base64url_encode(json.dumps(claims))}."
+
+
+def members(r, key: str) -> set[str]:
+    return {m.decode("utf-8") for m in r.smembers(key)}
+
+
+def test_update_redis_with_subordinate_maintains_list_index(loadredis):
+    "The /list index sets follow the entity types and trust marks of a subordinate."
+    rp = "https://rp.index.example.com"
+    rp_config = make_entity_configuration(
+        {
+            "metadata": {"openid_relying_party": {}, "federation_entity": {}},
+            "trust_marks": [{"trust_mark_type": "https://tm.example.com", "trust_mark": "x"}],
+        }
+    )
+    ia = "https://ia.index.example.com"
+    ia_config = make_entity_configuration({"metadata": {"federation_entity": {}}})
+
+    lib.update_redis_with_subordinate(rp, rp_config, {}, "statement", loadredis)
+    lib.update_redis_with_subordinate(ia, ia_config, {}, "statement", loadredis)
+
+    assert loadredis.zrange(lib.SUBORDINATE_INDEX, 0, -1) == [ia.encode(), rp.encode()]
+    assert members(loadredis, lib.SUBORDINATE_BY_TYPE.format("federation_entity")) == {rp, ia}
+    assert members(loadredis, lib.SUBORDINATE_BY_TYPE.format("openid_relying_party")) == {rp}
+    assert members(loadredis, lib.SUBORDINATE_INTERMEDIATE) == {ia}
+    assert members(loadredis, lib.SUBORDINATE_LEAF) == {rp}
+    assert members(loadredis, lib.SUBORDINATE_TRUST_MARKED) == {rp}
+
+    # The RP drops its trust mark and becomes an OP.
+    op_config = make_entity_configuration({"metadata": {"openid_provider": {}}})
+    lib.update_redis_with_subordinate(rp, op_config, {}, "statement", loadredis)
+
+    assert members(loadredis, lib.SUBORDINATE_BY_TYPE.format("openid_relying_party")) == set()
+    assert members(loadredis, lib.SUBORDINATE_BY_TYPE.format("openid_provider")) == {rp}
+    assert members(loadredis, lib.SUBORDINATE_BY_TYPE.format("federation_entity")) == {ia}
+    assert members(loadredis, lib.SUBORDINATE_TRUST_MARKED) == set()
+    assert loadredis.zcard(lib.SUBORDINATE_INDEX) == 2
+
+
+def test_rebuild_subordinate_index(loadredis):
+    "rebuild_subordinate_index recreates the index from inmor:subordinates:jwt."
+    from django.core.management import call_command
+
+    op = "https://op.index.example.com"
+    loadredis.hset(
+        "inmor:subordinates:jwt",
+        op,
+        make_entity_configuration({"metadata": {"openid_provider": {}}}),
+    )
+    loadredis.hset("inmor:subordinates:jwt", "https://broken.example.com", "not-a-jwt")
+    loadredis.sadd(
+        lib.SUBORDINATE_BY_TYPE.format("openid_relying_party"), "https://gone.example.com"
+    )
+
+    call_command("rebuild_subordinate_index")
+
+    assert loadredis.zrange(lib.SUBORDINATE_INDEX, 0, -1) == [op.encode()]
+    assert members(loadredis, lib.SUBORDINATE_BY_TYPE.format("openid_provider")) == {op}
+    assert not loadredis.exists(lib.SUBORDINATE_BY_TYPE.format("openid_relying_party"))
+    assert members(loadredis, lib.SUBORDINATE_LEAF) == {op}
+
+
+def test_subordinate_index_keys_of_malformed_configuration():
+    "An entity configuration that does not decode is not indexed."
+    assert lib.subordinate_index_keys("not-a-jwt") is None
+    assert lib.subordinate_index_keys("a.!!!.c") is None
+    assert lib.subordinate_index_keys("a.WzFd.c") is None  # [1]
+
+
+def test_rebuild_trustmark_index(loadredis):
+    "rebuild_trustmark_index recreates the sorted holders of every trust mark type."
+    from django.core.management import call_command
+
+    tmtype = "https://index.example.com/tmt"
+    loadredis.sadd("inmor:tmtypes", tmtype)
+    loadredis.sadd(f"inmor:tmtype:{tmtype}", "https://b.example.com", "https://a.example.com")
+    loadredis.zadd("inmor:tmtype_sorted:https://gone.example.com/tmt", {"https://c.example.com": 0})
+
+    call_command("rebuild_trustmark_index")
+
+    assert loadredis.zrange(f"inmor:tmtype_sorted:{tmtype}", 0, -1) == [
+        b"https://a.example.com",
+        b"https://b.example.com",
+    ]
+    assert not loadredis.exists("inmor:tmtype_sorted:https://gone.example.com/tmt")
+
+
+def test_listing_versions_are_bumped(loadredis):
+    "Subordinate changes and index rebuilds give /list and /trust_mark_list new ETags."
+    from django.core.management import call_command
+
+    def version(field: str) -> int:
+        return int(loadredis.hget(lib.LISTING_VERSIONS, field) or 0)
+
+    subordinates = version(lib.VERSION_SUBORDINATES)
+    config = make_entity_configuration({"metadata": {"openid_provider": {}}})
+    lib.update_redis_with_subordinate("https://op.version.example.com", config, {}, "s", loadredis)
+    assert version(lib.VERSION_SUBORDINATES) == subordinates + 1
+
+    call_command("rebuild_subordinate_index")
+    assert version(lib.VERSION_SUBORDINATES) == subordinates + 2
+
+    trust_marks = version(lib.VERSION_TRUST_MARKS)
+    call_command("rebuild_trustmark_index")
+    assert version(lib.VERSION_TRUST_MARKS) == trust_marks + 1
+
+
+def test_update_redis_with_subordinate_stores_chain_bundle(loadredis):
+    "The pre-resolved chain of a subordinate expires with the earlier of its statements."
+    entity_id = "https://rp.bundle.example.com"
+    config = make_entity_configuration({"metadata": {"openid_relying_party": {}}, "exp": 2000})
+    statement = make_entity_configuration({"sub": entity_id, "exp": 1500})
+
+    lib.update_redis_with_subordinate(entity_id, config, {}, statement, loadredis)
+    bundle = json.loads(loadredis.hget(lib.CHAIN_BUNDLES, entity_id))
+    assert bundle == {
+        "entity_configuration": config,
+        "subordinate_statement": statement,
+        "exp": 1500,
+    }
+
+    # A statement without exp can not be bundled, the TA walks the chain instead.
+    lib.update_redis_with_subordinate(entity_id, config, {}, "statement", loadredis)
+    assert not loadredis.hexists(lib.CHAIN_BUNDLES, entity_id)
+
+
+def test_chain_bundle_of_malformed_statements(caplog):
+    "Statements that do not decode or have no exp are not bundled, with a warning."
+    config = make_entity_configuration({"exp": 2000})
+    for statement in ("statement", "a.!!!.c", "a.WzFd.c", make_entity_configuration({})):
+        caplog.clear()
+        with caplog.at_level(logging.WARNING, logger="entities.lib"):
+            assert lib.chain_bundle(config, statement) is None
+        assert "Not bundling the chain" in caplog.text
+
+
+def test_changes_are_recorded_on_stream(loadredis, capsys):
+    "Every change appends the family, operation, entity and new version to inmor:changes."
+    from django.core.management import call_command
+
+    from entities.changes import FIRST, latest_id, read_changes
+
+    start = latest_id(loadredis)
+    config = make_entity_configuration({"metadata": {"openid_provider": {}}})
+    lib.update_redis_with_subordinate("https://op.stream.example.com", config, {}, "s", loadredis)
+    call_command("rebuild_subordinate_index")
+
+    changes = read_changes(loadredis, start)
+    assert [(c.family, c.op, c.entity) for c in changes] == [
+        ("subordinates", "update", "https://op.stream.example.com"),
+        ("subordinates", "rebuild", ""),
+    ]
+    assert changes[1].version == changes[0].version + 1
+    assert changes[1].version == int(loadredis.hget(lib.LISTING_VERSIONS, "subordinates"))
+    assert read_changes(loadredis, changes[-1].id) == []
+    assert len(read_changes(loadredis, FIRST, count=1)) == 1
+
+    _ = capsys.readouterr()
+    call_command("tail_changes", "--json", "-n", "1")
+    assert json.loads(capsys.readouterr().out) == {
+        "id": changes[1].id,
+        "family": "subordinates",
+        "op": "rebuild",
+        "entity": "",
+        "version": changes[1].version,
+        "mark": "",
+    }
+    call_command("tail_changes", "--after", start)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].endswith(
+        f"subordinates update https://op.stream.example.com v{changes[0].version}"
+    )
+    assert lines[1].endswith(f"subordinates rebuild - v{changes[1].version}")
+
+
+def test_update_redis_with_subordinate_invalidates_resolve_cache(loadredis):
+    "Cached /resolve responses through a changed subordinate are dropped."
+    ia = "https://ia.resolve.example.com"
+    leaf = "https://leaf.resolve.example.com"
+    other = "https://other.resolve.example.com"
+    for sub in (ia, leaf, other):
+        loadredis.hset(lib.RESOLVE_CACHE.format(sub), "https://localhost:8080|", "cached")
+    loadredis.sadd(lib.RESOLVE_CACHE_CHAIN.format(ia), ia, leaf)
+    loadredis.sadd(lib.RESOLVE_CACHE_CHAIN.format(other), other)
+
+    ia_config = make_entity_configuration({"metadata": {"federation_entity": {}}})
+    lib.update_redis_with_subordinate(ia, ia_config, {}, "statement", loadredis)
+
+    assert not loadredis.exists(lib.RESOLVE_CACHE.format(ia))
+    assert not loadredis.exists(lib.RESOLVE_CACHE.format(leaf))
+    assert not loadredis.exists(lib.RESOLVE_CACHE_CHAIN.format(ia))
+    assert loadredis.exists(lib.RESOLVE_CACHE.format(other))
+
+    lib.clear_resolve_cache(loadredis)
+    assert not loadredis.keys("inmor:resolve:*")
+
+
+def test_update_redis_with_subordinate_publishes_response_change(loadredis):
+    "The TA is told to drop its cached /fetch response of a changed subordinate."
+    pubsub = loadredis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(lib.RESPONSE_CACHE_CHANNEL)
+    _ = pubsub.get_message(timeout=1)
+
+    entity_id = "https://rp.publish.example.com"
+    config = make_entity_configuration({"metadata": {"openid_relying_party": {}}})
+    lib.update_redis_with_subordinate(entity_id, config, {}, "statement", loadredis)
+
+    message = pubsub.get_message(timeout=1)
+    pubsub.close()
+    assert message is not None
+    assert message["data"] == f"fetch:{entity_id}".encode()
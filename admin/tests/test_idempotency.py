@@ -0,0 +1,118 @@
+"""Tests for Idempotency-Key support on mutating admin API calls."""
+
+import json
+
+import pytest
+from django.test import Client
+
+from apikeys.models import APIKey
+from auditlog.models import AuditLogEntry
+from trustmarks.models import TrustMark
+
+
+def post_trustmark(client: Client, data: dict, **headers):
+    return client.post(
+        "/api/v1/trustmarks",
+        data=json.dumps(data),
+        content_type="application/json",
+        **headers,
+    )
+
+
+@pytest.mark.django_db
+def test_retry_is_replayed(auth_client: Client, loadredis):
+    """A retry with the same key and body replays the first response."""
+    data = {"tmt": 2, "domain": "https://idempotent.test.example.com", "valid_for": 24}
+
+    first = post_trustmark(auth_client, data, HTTP_IDEMPOTENCY_KEY="create-1")
+    assert first.status_code == 201
+    assert "Idempotent-Replayed" not in first
+
+    second = post_trustmark(auth_client, data, HTTP_IDEMPOTENCY_KEY="create-1")
+    assert second.status_code == 201
+    assert second["Idempotent-Replayed"] == "true"
+    assert second.json() == first.json()
+
+    assert TrustMark.objects.filter(domain=data["domain"]).count() == 1
+    assert AuditLogEntry.objects.filter(resource_type="TrustMark").count() == 1
+
+
+@pytest.mark.django_db
+def test_without_key_is_not_replayed(auth_client: Client, loadredis):
+    """Without the header the second request is handled normally."""
+    data = {"tmt": 2, "domain": "https://not-idempotent.test.example.com", "valid_for": 24}
+
+    assert post_trustmark(auth_client, data).status_code == 201
+    # TrustMark already exists
+    assert post_trustmark(auth_client, data).status_code == 403
+
+
+@pytest.mark.django_db
+def test_key_reused_with_different_body(auth_client: Client, loadredis):
+    """Reusing a key for a different request is rejected with 422."""
+    data = {"tmt": 2, "domain": "https://reused.test.example.com", "valid_for": 24}
+    assert post_trustmark(auth_client, data, HTTP_IDEMPOTENCY_KEY="create-2").status_code == 201
+
+    data["domain"] = "https://other.test.example.com"
+    response = post_trustmark(auth_client, data, HTTP_IDEMPOTENCY_KEY="create-2")
+    assert response.status_code == 422
+    assert not TrustMark.objects.filter(domain=data["domain"]).exists()
+
+
+@pytest.mark.django_db
+def test_keys_are_scoped_per_client(user, loadredis):
+    """The same Idempotency-Key used by two API keys does not share responses."""
+    _, first_key = APIKey.create_key(name="First", user=user)
+    _, second_key = APIKey.create_key(name="Second", user=user)
+    client = Client()
+    data = {"tmt": 2, "domain": "https://scoped.test.example.com", "valid_for": 24}
+
+    first = post_trustmark(client, data, HTTP_X_API_KEY=first_key, HTTP_IDEMPOTENCY_KEY="same-key")
+    second = post_trustmark(
+        client, data, HTTP_X_API_KEY=second_key, HTTP_IDEMPOTENCY_KEY="same-key"
+    )
+    assert first.status_code == 201
+    # Not a replay: the TrustMark already exists for the second client.
+    assert second.status_code == 403
+    assert "Idempotent-Replayed" not in second
+
+
+@pytest.mark.django_db
+def test_revoked_key_gets_no_replay(user, loadredis):
+    """A stored response is not replayed once the API key that made it is revoked."""
+    api_key, plaintext = APIKey.create_key(name="Revoked", user=user)
+    client = Client()
+    data = {"tmt": 2, "domain": "https://revoked.test.example.com", "valid_for": 24}
+    headers = {"HTTP_X_API_KEY": plaintext, "HTTP_IDEMPOTENCY_KEY": "revoked"}
+    assert post_trustmark(client, data, **headers).status_code == 201
+
+    api_key.is_active = False
+    api_key.save()
+    response = post_trustmark(client, data, **headers)
+    assert response.status_code == 401
+    assert "Idempotent-Replayed" not in response
+
+
+@pytest.mark.django_db
+def test_client_errors_are_not_stored(auth_client: Client, loadredis):
+    """A 4xx answer other than 422 is run again on a retry."""
+    data = {"tmt": 2, "domain": "https://conflict.test.example.com", "valid_for": 24}
+    assert post_trustmark(auth_client, data).status_code == 201
+
+    # The TrustMark already exists.
+    assert post_trustmark(auth_client, data, HTTP_IDEMPOTENCY_KEY="create-3").status_code == 403
+    assert not list(loadredis.scan_iter("inmor:idempotency:*"))
+
+    TrustMark.objects.filter(domain=data["domain"]).delete()
+    response = post_trustmark(auth_client, data, HTTP_IDEMPOTENCY_KEY="create-3")
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response
+
+
+def test_unauthenticated_request_is_not_stored(db, loadredis):
+    """Unauthenticated requests are rejected and nothing is stored."""
+    client = Client()
+    data = {"tmt": 2, "domain": "https://anon.test.example.com"}
+    response = post_trustmark(client, data, HTTP_IDEMPOTENCY_KEY="anon")
+    assert response.status_code == 401
+    assert not list(loadredis.scan_iter("inmor:idempotency:*"))
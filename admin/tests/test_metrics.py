@@ -0,0 +1,97 @@
+"""Tests for the Prometheus metrics of the admin."""
+
+import json
+
+import pytest
+from django.test import Client
+
+from common import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics(loadredis):
+    """Removes metrics written by earlier tests."""
+    metrics.reset()
+
+
+def sample(body: str, series: str) -> float:
+    """Returns the value of one series from a text exposition body."""
+    for line in body.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{series} not found in metrics")
+
+
+class TestRender:
+    """Tests for storage and text rendering."""
+
+    def test_counter_and_histogram(self, loadredis):
+        metrics.SIGNATURES.inc(alg="ES256")
+        metrics.SIGNATURES.inc(alg="ES256")
+        metrics.FETCH_DURATION.observe(0.2, host="rp.example.com")
+        metrics.FETCH_DURATION.observe(3.0, host="rp.example.com")
+
+        body = metrics.render()
+        assert "# TYPE inmor_admin_signatures_total counter" in body
+        assert sample(body, 'inmor_admin_signatures_total{alg="ES256"}') == 2
+
+        host = 'host="rp.example.com"'
+        assert sample(body, f'inmor_admin_fetch_duration_seconds_bucket{{{host},le="0.1"}}') == 0
+        assert sample(body, f'inmor_admin_fetch_duration_seconds_bucket{{{host},le="0.25"}}') == 1
+        assert sample(body, f'inmor_admin_fetch_duration_seconds_bucket{{{host},le="+Inf"}}') == 2
+        assert sample(body, f"inmor_admin_fetch_duration_seconds_count{{{host}}}") == 2
+        assert sample(body, f"inmor_admin_fetch_duration_seconds_sum{{{host}}}") == 3.2
+
+        # Buckets are rendered in increasing order of le.
+        buckets = [line for line in body.splitlines() if line.startswith("inmor_admin_fetch_")]
+        assert buckets[0].startswith(
+            'inmor_admin_fetch_duration_seconds_bucket{host="rp.example.com",le="0.005"}'
+        )
+
+    def test_batch_is_written_on_exit(self, loadredis):
+        with metrics.batch():
+            metrics.SIGNATURES.inc(alg="RS256")
+            assert not loadredis.exists(metrics.METRICS_KEY)
+        assert sample(metrics.render(), 'inmor_admin_signatures_total{alg="RS256"}') == 1
+
+    def test_label_values_are_escaped(self, loadredis):
+        metrics.FETCH_ERRORS.inc(host='a"b')
+        assert 'inmor_admin_fetch_errors_total{host="a\\"b"} 1' in metrics.render()
+
+    def test_wrong_labels(self):
+        with pytest.raises(ValueError):
+            metrics.SIGNATURES.inc(algorithm="ES256")
+
+
+class TestMetricsEndpoint:
+    """Tests for /api/v1/metrics."""
+
+    def test_requires_authentication(self, db, loadredis):
+        response = Client().get("/api/v1/metrics")
+        assert response.status_code == 401
+
+    @pytest.mark.django_db
+    def test_api_requests_are_counted(self, auth_client: Client, loadredis):
+        data = {"tmt": 2, "domain": "https://metrics.test.example.com", "valid_for": 24}
+        response = auth_client.post(
+            "/api/v1/trustmarks", data=json.dumps(data), content_type="application/json"
+        )
+        assert response.status_code == 201
+        assert auth_client.post("/api/v1/trustmarks/99999/renew").status_code == 404
+
+        response = auth_client.get("/api/v1/metrics")
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+        body = response.content.decode()
+
+        route = 'method="POST",route="api/v1/trustmarks"'
+        assert sample(body, f'inmor_admin_requests_total{{{route},status="201"}}') == 1
+        assert sample(body, f"inmor_admin_request_duration_seconds_count{{{route}}}") == 1
+        assert sample(body, 'inmor_admin_stage_duration_seconds_count{stage="sign"}') == 1
+        assert sample(body, 'inmor_admin_stage_duration_seconds_count{stage="db"}') >= 1
+        assert sample(body, 'inmor_admin_stage_duration_seconds_count{stage="redis"}') >= 1
+        assert (
+            sample(body, 'inmor_admin_renewals_total{resource="trustmark",outcome="not_found"}')
+            == 1
+        )
+        assert sample(body, 'inmor_admin_auditlog_entries{success="true"}') >= 1
@@ -0,0 +1,151 @@
+"""Tests for per-client rate limiting of expensive admin endpoints."""
+
+import pytest
+from django.test import Client
+
+from apikeys.models import APIKey
+from inmoradmin.ratelimit import (
+    RateLimitExceeded,
+    _acquire,
+    _release,
+    client_identity,
+    get_stats,
+)
+
+
+@pytest.fixture
+def strict_limits(settings):
+    settings.ADMIN_RATE_LIMITS = {"TrustMarks": {"rate": 0.01, "burst": 2}}
+
+
+class TestTokenBucket:
+    """Tests for the token bucket applied through the API."""
+
+    @pytest.mark.django_db
+    def test_throttled_after_burst(self, user, loadredis, strict_limits):
+        """Requests beyond the burst get 429 with Retry-After."""
+        _, plaintext = APIKey.create_key(name="Throttled Key", user=user)
+        client = Client()
+
+        codes = [
+            client.post("/api/v1/trustmarks/99999/renew", HTTP_X_API_KEY=plaintext).status_code
+            for _ in range(3)
+        ]
+        assert codes == [404, 404, 429]
+
+        response = client.post("/api/v1/trustmarks/99999/renew", HTTP_X_API_KEY=plaintext)
+        assert response.status_code == 429
+        assert int(response["Retry-After"]) >= 1
+
+        stats = get_stats()
+        assert stats["TrustMarks:allowed"] == 2
+        assert stats["TrustMarks:throttled"] == 2
+
+    @pytest.mark.django_db
+    def test_limits_are_per_api_key(self, user, loadredis, strict_limits):
+        """A throttled key does not affect other keys."""
+        _, first = APIKey.create_key(name="First Key", user=user)
+        _, second = APIKey.create_key(name="Second Key", user=user)
+        client = Client()
+
+        for _ in range(3):
+            client.post("/api/v1/trustmarks/99999/renew", HTTP_X_API_KEY=first)
+
+        response = client.post("/api/v1/trustmarks/99999/renew", HTTP_X_API_KEY=second)
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_unlimited_tag(self, user, loadredis, strict_limits):
+        """Endpoints whose tag has no configured limits are not throttled."""
+        _, plaintext = APIKey.create_key(name="Unlimited Key", user=user)
+        client = Client()
+
+        for _ in range(5):
+            response = client.post("/api/v1/subordinates/99999/renew", HTTP_X_API_KEY=plaintext)
+            assert response.status_code == 404
+
+
+class TestConcurrencyCap:
+    """Tests for the in-flight concurrency cap."""
+
+    def test_concurrency_cap(self, loadredis):
+        """Only `concurrency` slots can be held at the same time."""
+        limits = {"concurrency": 1}
+        key = _acquire(loadredis, "Subordinates", "default:key:ci", limits)
+        assert key is not None
+
+        with pytest.raises(RateLimitExceeded) as excinfo:
+            _acquire(loadredis, "Subordinates", "default:key:ci", limits)
+        assert excinfo.value.retry_after == 1
+
+        # Releasing the slot lets the next request in.
+        loadredis.decr(key)
+        assert _acquire(loadredis, "Subordinates", "default:key:ci", limits) == key
+
+    def test_rejected_requests_keep_their_token_and_slot(self, loadredis):
+        """A request rejected by one limit does not use up the other."""
+        limits = {"concurrency": 1, "rate": 0.01, "burst": 1}
+        key = _acquire(loadredis, "Subordinates", "default:key:ci", limits)
+        assert key is not None
+
+        with pytest.raises(RateLimitExceeded) as excinfo:
+            _acquire(loadredis, "Subordinates", "default:key:ci", limits)
+        assert excinfo.value.reason == "too many concurrent requests"
+
+        # The bucket is empty now, and the throttled request gives its slot back.
+        loadredis.decr(key)
+        with pytest.raises(RateLimitExceeded) as excinfo:
+            _acquire(loadredis, "Subordinates", "default:key:ci", limits)
+        assert excinfo.value.reason == "too many requests"
+        assert int(loadredis.get(key)) == 0
+
+        limits = {"concurrency": 1, "rate": 0.01, "burst": 2}
+        assert _acquire(loadredis, "Subordinates", "default:key:other", limits) is not None
+        with pytest.raises(RateLimitExceeded):
+            _acquire(loadredis, "Subordinates", "default:key:other", limits)
+        # The second token is still there for the next request.
+        loadredis.decr(key.replace(":ci", ":other"))
+        assert _acquire(loadredis, "Subordinates", "default:key:other", limits) is not None
+
+    def test_release_of_expired_slot(self, loadredis):
+        """Releasing a slot whose counter expired does not create a negative counter."""
+        limits = {"concurrency": 1}
+        key = _acquire(loadredis, "Subordinates", "default:key:slow", limits)
+        assert key is not None
+        loadredis.delete(key)
+
+        _release(loadredis, key)
+        assert not loadredis.exists(key)
+        # Once the slot is taken again the cap still holds.
+        assert _acquire(loadredis, "Subordinates", "default:key:slow", limits) == key
+        with pytest.raises(RateLimitExceeded):
+            _acquire(loadredis, "Subordinates", "default:key:slow", limits)
+        _release(loadredis, key)
+        _release(loadredis, key)
+        assert int(loadredis.get(key)) == 0
+
+
+class TestClientIdentity:
+    """Tests for the identity used as limiter key."""
+
+    def test_anonymous(self, rf):
+        request = rf.get("/")
+        assert client_identity(request) == "anonymous"
+
+    @pytest.mark.django_db
+    def test_api_key_identity(self, rf, user):
+        from inmoradmin.auth import AuthResult
+
+        request = rf.get("/")
+        request.auth_result = AuthResult(
+            user=user, auth_method="api_key", api_key_name="ci", tenant="acme"
+        )
+        assert client_identity(request) == "acme:key:ci"
+
+    @pytest.mark.django_db
+    def test_session_identity(self, rf, user):
+        from inmoradmin.auth import AuthResult
+
+        request = rf.get("/")
+        request.auth_result = AuthResult(user=user, auth_method="session")
+        assert client_identity(request) == "default:user:testuser"
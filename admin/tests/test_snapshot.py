@@ -0,0 +1,104 @@
+"""Tests for the snapshot and restore of the Redis state."""
+
+import pytest
+from django.core.management import call_command
+from redis import Redis
+
+from entities import lib
+from entities.changes import recent_changes
+from entities.snapshot import (
+    CODEC_ZLIB,
+    MAGIC,
+    STAGING_PREFIX,
+    read_manifest,
+    restore_snapshot,
+    take_snapshot,
+)
+
+SUB = "https://rp.snapshot.example.com"
+
+
+def fill(con: Redis) -> None:
+    """Writes keys of every kind the TA reads, and some it writes itself."""
+    con.hset("inmor:subordinates", SUB, "statement")
+    con.hset("inmor:subordinates:jwt", SUB, "configuration")
+    con.sadd(lib.SUBORDINATE_INDEX, SUB)
+    con.zadd("inmor:tmtype:sorted:https://tm.example.com", {SUB: 1})
+    con.set("inmor:entity_id", "entity statement", px=3_600_000)
+    con.hset(lib.RESOLVE_CACHE.format(SUB), "https://localhost:8080|", "cached")
+    lib.record_change(con, lib.VERSION_SUBORDINATES, lib.CHANGE_UPDATE, SUB)
+
+
+def served(con: Redis) -> dict[bytes, object]:
+    """Returns the values of the keys that go into a snapshot."""
+    return {
+        b"inmor:subordinates": con.hgetall("inmor:subordinates"),
+        b"inmor:subordinates:jwt": con.hgetall("inmor:subordinates:jwt"),
+        lib.SUBORDINATE_INDEX.encode(): con.smembers(lib.SUBORDINATE_INDEX),
+        b"inmor:tmtype:sorted": con.zrange(
+            "inmor:tmtype:sorted:https://tm.example.com", 0, -1, withscores=True
+        ),
+        b"inmor:entity_id": con.get("inmor:entity_id"),
+    }
+
+
+@pytest.mark.parametrize("staging", [False, True])
+def test_snapshot_and_restore(loadredis, tmp_path, staging):
+    "A restore brings back the snapshotted keys and drops keys added since."
+    fill(loadredis)
+    expected = served(loadredis)
+    path = str(tmp_path / "inmor.snapshot")
+
+    manifest = take_snapshot(loadredis, path, CODEC_ZLIB)
+    assert manifest.keys == 5
+    assert read_manifest(path) == manifest
+
+    loadredis.hset("inmor:subordinates", SUB, "changed")
+    loadredis.delete(lib.SUBORDINATE_INDEX)
+    loadredis.sadd("inmor:subordinates:by_type:openid_provider", SUB)
+    versions = loadredis.hgetall(lib.LISTING_VERSIONS)
+
+    assert restore_snapshot(loadredis, path, staging=staging) == manifest
+    assert served(loadredis) == expected
+    assert 0 < loadredis.pttl("inmor:entity_id") <= 3_600_000
+    assert not loadredis.exists("inmor:subordinates:by_type:openid_provider")
+    assert not loadredis.keys(f"{STAGING_PREFIX}*")
+    # The TA's caches are dropped, and every family gets a new version.
+    assert not loadredis.keys("inmor:resolve:*")
+    new_versions = loadredis.hgetall(lib.LISTING_VERSIONS)
+    assert int(new_versions[b"subordinates"]) == int(versions[b"subordinates"]) + 1
+    assert int(new_versions[b"collection"]) == 1
+    assert recent_changes(loadredis, 1)[0].op == lib.CHANGE_RESTORE
+
+
+@pytest.mark.parametrize("staging", [False, True])
+def test_restore_rejects_corrupt_snapshot(loadredis, tmp_path, staging):
+    "A snapshot that does not match its manifest changes no served key."
+    fill(loadredis)
+    path = tmp_path / "inmor.snapshot"
+    _ = take_snapshot(loadredis, str(path), CODEC_ZLIB)
+    data = path.read_bytes()
+    path.write_bytes(data[:-8])
+
+    loadredis.hset("inmor:subordinates", SUB, "changed")
+    with pytest.raises(ValueError):
+        _ = restore_snapshot(loadredis, str(path), staging=staging)
+    assert loadredis.hget("inmor:subordinates", SUB) == b"changed"
+    assert not loadredis.keys(f"{STAGING_PREFIX}*")
+
+    path.write_bytes(b"NOTASNAP" + data[len(MAGIC) :])
+    with pytest.raises(ValueError, match="Not an inmor snapshot"):
+        _ = restore_snapshot(loadredis, str(path), staging=staging)
+
+
+def test_snapshot_commands(loadredis, tmp_path, capsys):
+    "The snapshot and restore management commands."
+    fill(loadredis)
+    path = str(tmp_path / "inmor.snapshot")
+    call_command("snapshot", path, "--codec", CODEC_ZLIB)
+    assert "Wrote 5 keys" in capsys.readouterr().out
+
+    loadredis.delete("inmor:subordinates")
+    call_command("restore", path, "--staging")
+    assert "Restored 5 keys" in capsys.readouterr().out
+    assert loadredis.hget("inmor:subordinates", SUB) == b"statement"
@@ -0,0 +1,66 @@
+"""Tests for Server-Timing instrumentation of the admin API."""
+
+import json
+import logging
+
+import pytest
+from django.test import Client
+
+from common.timing import Timings, current, stage
+
+
+def parse_server_timing(value: str) -> dict[str, float]:
+    result = {}
+    for part in value.split(","):
+        name, dur = part.strip().split(";dur=")
+        result[name] = float(dur)
+    return result
+
+
+class TestTimings:
+    """Unit tests for the stage collector."""
+
+    def test_server_timing_format(self):
+        timings = Timings()
+        timings.add("fetch", 0.25)
+        timings.add("fetch", 0.25)
+        timings.add("sign", 0.002)
+        assert timings.server_timing(1.0) == "fetch;dur=500.0, sign;dur=2.0, total;dur=1000.0"
+        assert timings.counts == {"fetch": 2, "sign": 1}
+
+    def test_stage_outside_request_is_noop(self):
+        assert current() is None
+        with stage("fetch"):
+            pass
+        assert current() is None
+
+
+class TestServerTimingMiddleware:
+    """Tests for the middleware on real API requests."""
+
+    @pytest.mark.django_db
+    def test_header_on_api_request(self, auth_client: Client, loadredis, caplog):
+        data = {"tmt": 2, "domain": "https://timing.test.example.com", "valid_for": 24}
+        with caplog.at_level(logging.INFO, logger="inmor.timing"):
+            response = auth_client.post(
+                "/api/v1/trustmarks",
+                data=json.dumps(data),
+                content_type="application/json",
+            )
+        assert response.status_code == 201
+
+        timings = parse_server_timing(response["Server-Timing"])
+        assert {"db", "sign", "redis", "total"} <= timings.keys()
+        assert timings["total"] >= timings["sign"]
+
+        record = json.loads(caplog.records[-1].getMessage())
+        assert record["path"] == "/api/v1/trustmarks"
+        assert record["status"] == 201
+        assert record["stage_counts"]["sign"] == 1
+
+    @pytest.mark.django_db
+    def test_not_sampled(self, auth_client: Client, settings):
+        settings.REQUEST_TIMING_SAMPLE_RATE = 0.0
+        response = auth_client.get("/api/v1/trustmarktypes")
+        assert response.status_code == 200
+        assert "Server-Timing" not in response
@@ -9,6 +9,14 @@ from jwcrypto.common import json_decode
 from pydantic import BaseModel
 
 from common.signing import create_signed_jwt
+from common.timing import REDIS, stage
+from entities.lib import (
+    CHANGE_ISSUE,
+    RESPONSE_TRUST_MARK,
+    VERSION_TRUST_MARKS,
+    publish_response_change,
+    record_change,
+)
 
 
 class TrustMarkRequest(BaseModel):
@@ -52,16 +60,22 @@ def add_trustmark(
     key = settings.SIGNING_PRIVATE_KEY
     token_data = create_signed_jwt(sub_data, key, "trust-mark+jwt")
     # Now we should set it in the redis
-    # First, the trustmark for the entity and that trustmarktype
-    _ = r.hset(f"inmor:tm:{entity}", trustmarktype, token_data)
-    # second, add to the set of trust_mark_type
-    _ = r.sadd(f"inmor:tmtype:{trustmarktype}", entity)
-    # third, add to the index of all trust mark types (used by /status)
-    _ = r.sadd("inmor:tmtypes", trustmarktype)
-    # fourth, add to the list of all trustmarks generated
-    h = hashlib.new("sha256")
-    h.update(token_data.encode("utf-8"))
-    _ = r.sadd("inmor:tm:alltime", h.hexdigest())
+    with stage(REDIS):
+        # First, the trustmark for the entity and that trustmarktype
+        _ = r.hset(f"inmor:tm:{entity}", trustmarktype, token_data)
+        # second, add to the set of trust_mark_type
+        _ = r.sadd(f"inmor:tmtype:{trustmarktype}", entity)
+        # and to its sorted index (all scores 0), which /trust_mark_list pages through
+        _ = r.zadd(f"inmor:tmtype_sorted:{trustmarktype}", {entity: 0})
+        # third, add to the index of all trust mark types (used by /status)
+        _ = r.sadd("inmor:tmtypes", trustmarktype)
+        # fourth, add to the list of all trustmarks generated
+        h = hashlib.new("sha256")
+        h.update(token_data.encode("utf-8"))
+        _ = r.sadd("inmor:tm:alltime", h.hexdigest())
+        record_change(r, VERSION_TRUST_MARKS, CHANGE_ISSUE, entity, mark=h.hexdigest())
+        # A re-issued mark is no longer revoked, also for its older JWTs.
+        publish_response_change(r, RESPONSE_TRUST_MARK.format(entity))
     return token_data
 
 
@@ -74,7 +88,8 @@ def get_trustmark(entity: str, trustmarktype: str, r: redis.Redis) -> str | None
 
     :returns: JWT as str.
     """
-    token = r.hget(f"inmor:tm:{entity}", trustmarktype)
+    with stage(REDIS):
+        token = r.hget(f"inmor:tm:{entity}", trustmarktype)
     if isinstance(token, bytes):
         return token.decode("utf-8")
     return
@@ -0,0 +1,29 @@
+from typing import cast
+
+import djclick as click
+from django_redis import get_redis_connection
+
+from entities.lib import CHANGE_REBUILD, VERSION_TRUST_MARKS, record_change
+
+
+@click.command()
+def command():
+    "Rebuilds the sorted /trust_mark_list indexes from the trust mark type sets in Redis."
+    con = get_redis_connection("default")
+    tmtypes = cast(set[bytes], con.smembers("inmor:tmtypes"))
+
+    old_keys = list(con.scan_iter(match="inmor:tmtype_sorted:*"))
+
+    # Replace all indexes in one transaction, so the TA never pages a partial index.
+    pipe = con.pipeline()
+    if old_keys:
+        _ = pipe.delete(*old_keys)
+    holders = 0
+    for tmtype in tmtypes:
+        entities = cast(set[bytes], con.smembers(b"inmor:tmtype:" + tmtype))
+        if entities:
+            _ = pipe.zadd(b"inmor:tmtype_sorted:" + tmtype, {entity: 0 for entity in entities})
+            holders += len(entities)
+    record_change(pipe, VERSION_TRUST_MARKS, CHANGE_REBUILD)
+    _ = pipe.execute()
+    click.secho(f"Indexed {holders} holders of {len(tmtypes)} trust mark types.", fg="green")
@@ -1,8 +1,7 @@
 use clap::Parser;
-use inmor::ServerConfiguration;
-use inmor::tree::run_collection_walk;
+use inmor::tree::{WalkOptions, run_collection_walk};
+use inmor::{RedisConnection, ServerConfiguration};
 use std::io;
-use std::time::Instant;
 
 #[derive(Parser, Debug)]
 #[command(
@@ -21,6 +20,26 @@ struct Cli {
 
     #[arg(help = "Entity ID of the trust anchor to walk (e.g. https://ta.example.org)")]
     trust_anchor: String,
+
+    #[arg(
+        long,
+        default_value_t = 8,
+        help = "Maximum number of entities processed at the same time"
+    )]
+    concurrency: usize,
+
+    #[arg(
+        long,
+        default_value_t = 2,
+        help = "Maximum number of concurrent requests to a single host"
+    )]
+    per_host: usize,
+
+    #[arg(
+        long,
+        help = "Reuse the previous walk's data of entities whose entity configuration did not change"
+    )]
+    incremental: bool,
 }
 
 #[tokio::main]
@@ -45,23 +64,32 @@ async fn main() -> io::Result<()> {
     let redis =
         redis::Client::open(server_config.redis_uri.as_str()).expect("Failed to connect to Redis");
 
-    let mut conn = redis
+    let mut conn: RedisConnection = redis
         .get_connection_manager()
         .await
-        .expect("Failed to get Redis connection manager");
+        .expect("Failed to get Redis connection manager")
+        .into();
 
     eprintln!("Redis connected");
 
-    let start = Instant::now();
+    let options = WalkOptions {
+        concurrency: args.concurrency,
+        per_host: args.per_host,
+        incremental: args.incremental,
+    };
     eprintln!("Starting collection walk from {}", &args.trust_anchor);
 
-    match run_collection_walk(&args.trust_anchor, &mut conn).await {
-        Ok(count) => {
-            let elapsed = start.elapsed();
+    match run_collection_walk(&args.trust_anchor, &mut conn, &options).await {
+        Ok(stats) => {
+            eprintln!(
+                "Collection walk complete: {} entities discovered in {:.1}s ({:.1} entities/s)",
+                stats.entities,
+                stats.elapsed.as_secs_f64(),
+                stats.entities_per_sec()
+            );
             eprintln!(
-                "Collection walk complete: {} entities discovered in {:.1}s",
-                count,
-                elapsed.as_secs_f64()
+                "Refreshed: {}, unchanged (skipped): {}, failed: {}",
+                stats.refreshed, stats.skipped, stats.failed
             );
         }
         Err(e) => {
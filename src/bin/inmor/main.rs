@@ -1,15 +1,15 @@
-use actix_web::{App, HttpResponse, HttpServer, Responder, error, get, middleware, web};
+use actix_web::{
+    App, HttpRequest, HttpResponse, HttpServer, Responder, error, get, middleware, web,
+};
 use lazy_static::lazy_static;
-use log::info;
+use log::{info, warn};
 use std::fs;
-use std::sync::Mutex;
 use std::{env, io};
 
 use clap::Parser;
 use inmor::*;
 use rustls::ServerConfig;
 use rustls_pemfile::{certs, pkcs8_private_keys};
-use std::collections::HashMap;
 
 lazy_static! {
     static ref TERA: tera::Tera = {
@@ -21,13 +21,10 @@ lazy_static! {
 
 #[get("/")]
 async fn index(
-    redis: web::Data<redis::Client>,
+    redis: web::Data<RedisPool>,
     app_state: web::Data<AppState>,
 ) -> actix_web::Result<impl Responder> {
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    let mut conn = redis.get();
 
     // Fetch entity configuration JWT
     let entity_jwt: Option<String> = redis::Cmd::get("inmor:entity_id")
@@ -103,20 +100,25 @@ async fn index(
 
 /// https://openid.net/specs/openid-federation-1_0.html#name-entity-statement
 #[get("/.well-known/openid-federation")]
-async fn openid_federation(redis: web::Data<redis::Client>) -> actix_web::Result<impl Responder> {
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+async fn openid_federation(
+    req: HttpRequest,
+    redis: web::Data<RedisPool>,
+    cache: web::Data<ResponseCache>,
+) -> actix_web::Result<impl Responder> {
+    if let Some(cached) = cache.get("entity_configuration") {
+        return Ok(cached.respond(&req, "application/entity-statement+jwt"));
+    }
+    let generation = cache.generation();
+
+    let mut conn = redis.get();
 
     let res = redis::Cmd::get("inmor:entity_id")
         .query_async::<String>(&mut conn)
         .await
         .map_err(error::ErrorInternalServerError)?;
 
-    Ok(HttpResponse::Ok()
-        .content_type("application/entity-statement+jwt")
-        .body(res))
+    let cached = cache.insert("entity_configuration", res, generation);
+    Ok(cached.respond(&req, "application/entity-statement+jwt"))
 }
 
 #[derive(Parser, Debug)]
@@ -153,6 +155,12 @@ async fn main() -> io::Result<()> {
         server_config.allow_http.unwrap_or(false),
         std::sync::atomic::Ordering::Relaxed,
     );
+    COMPRESS_MIN_BYTES.store(
+        server_config
+            .compress_min_bytes
+            .unwrap_or(DEFAULT_COMPRESS_MIN_BYTES),
+        std::sync::atomic::Ordering::Relaxed,
+    );
 
     // Now the normal web app flow
     //
@@ -166,12 +174,48 @@ async fn main() -> io::Result<()> {
     let redis =
         redis::Client::open(server_config.redis_uri.as_str()).expect("Failed to connect to Redis");
 
-    let federation = Federation {
-        entities: Mutex::new(HashMap::new()),
+    // A mirror node serves from its own Redis, kept in sync with the one the
+    // admin writes to.
+    if let Some(ref source_uri) = server_config.mirror_redis_uri {
+        let source = redis::Client::open(source_uri.as_str())
+            .expect("Failed to connect to the mirrored Redis");
+        info!("Running as a read-only mirror of the admin's Redis");
+        actix_web::rt::spawn(mirror::run_mirror(source, redis.clone()));
+    }
+
+    // Open the shared Redis connections once, waiting a little for Redis to
+    // come up when both are started together.
+    let workers = server_config.worker_count();
+    let pool_size = server_config.redis_pool_size();
+    let mut attempt = 0;
+    let redis_pool = loop {
+        match RedisPool::new(&redis, pool_size).await {
+            Ok(pool) => break web::Data::new(pool),
+            Err(e) if attempt < 30 => {
+                attempt += 1;
+                warn!("Redis is not reachable yet ({e}), retrying.");
+                tokio::time::sleep(std::time::Duration::from_secs(1)).await;
+            }
+            Err(e) => return Err(io::Error::other(format!("Failed to connect to Redis: {e}"))),
+        }
     };
+    info!("Starting {workers} workers with {pool_size} Redis connections");
+
+    let federation = server_config.federation();
 
     let fed_app_data = web::Data::new(federation);
 
+    // In-memory copies of the hottest responses, dropped when the admin
+    // publishes a change.
+    let response_cache = web::Data::new(ResponseCache::new());
+    actix_web::rt::spawn(listen_for_response_changes(
+        redis.clone(),
+        response_cache.clone(),
+    ));
+
+    // Per-endpoint in-flight limits, shared by all workers.
+    let load_shedder = web::Data::new(server_config.load_shedder());
+
     // Check if TLS configuration is available
     let has_tls = server_config.tls_cert.is_some() && server_config.tls_key.is_some();
 
@@ -184,8 +228,10 @@ async fn main() -> io::Result<()> {
                 entity_id: server_config.domain.to_string(),
                 public_keyset: jwks,
             }))
-            .app_data(web::Data::new(redis.clone()))
+            .app_data(redis_pool.clone())
             .app_data(fed_app_data.clone())
+            .app_data(response_cache.clone())
+            .app_data(load_shedder.clone())
             .service(index)
             .service(openid_federation)
             .service(list_subordinates)
@@ -198,6 +244,12 @@ async fn main() -> io::Result<()> {
             .service(federation_historical_keys)
             .service(health)
             .service(server_status)
+            .service(prometheus_metrics)
+            .wrap(middleware::from_fn(skip_small_compression))
+            .wrap(middleware::Compress::default())
+            .wrap(middleware::from_fn(strip_identity_encoding))
+            .wrap(middleware::from_fn(shed_load))
+            .wrap(middleware::from_fn(metrics::record_request))
             .wrap(
                 middleware::DefaultHeaders::new()
                     .add(("X-Content-Type-Options", "nosniff"))
@@ -206,7 +258,7 @@ async fn main() -> io::Result<()> {
             .wrap(middleware::NormalizePath::trim())
             .wrap(middleware::Logger::default())
     })
-    .workers(2);
+    .workers(workers);
 
     // If TLS is configured, bind HTTPS on the specified port
     if has_tls {
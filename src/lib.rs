@@ -1,3 +1,5 @@
+pub mod metrics;
+pub mod mirror;
 pub mod tree;
 use anyhow::{Result, anyhow, bail};
 
@@ -6,11 +8,16 @@ use log::{debug, warn};
 use sha2::{Digest, Sha256};
 use std::fmt::Display;
 use std::net::IpAddr;
-use std::sync::atomic::AtomicBool;
+use std::sync::Arc;
+use std::sync::atomic::{AtomicBool, AtomicU64, AtomicUsize};
 
-use actix_web::{HttpRequest, HttpResponse, Responder, error, get, post, web};
+use actix_web::body::{BodySize, BoxBody, MessageBody};
+use actix_web::dev::{ServiceRequest, ServiceResponse};
+use actix_web::middleware::Next;
+use actix_web::{HttpRequest, HttpResponse, HttpResponseBuilder, Responder, error, get, post, web};
 use actix_web_lab::extract::Query;
 use base64::Engine;
+use futures_util::{StreamExt, stream::FuturesUnordered};
 use josekit::{
     JoseError,
     jwk::{Jwk, JwkSet},
@@ -21,11 +28,11 @@ use oidfed_metadata_policy::*;
 use serde::Deserialize;
 use serde::Serialize;
 use serde_json::{Map, Value, json};
-use std::collections::{HashMap, HashSet};
+use std::collections::{BTreeSet, HashMap, HashSet};
 use std::error::Error as StdError;
 use std::ops::Deref;
 use std::sync::Mutex;
-use std::time::{Duration, SystemTime};
+use std::time::{Duration, Instant, SystemTime};
 use std::{env, fs};
 
 lazy_static! {
@@ -51,13 +58,32 @@ lazy_static! {
     /// Shared HTTP client for all outbound federation requests.
     /// Configured with timeouts and connection limits.
     static ref HTTP_CLIENT: reqwest::Client = reqwest::Client::builder()
+        .dns_resolver(Arc::new(PinnedResolver))
         .connect_timeout(Duration::from_secs(5))
         .timeout(Duration::from_secs(10))
         .pool_max_idle_per_host(10)
         .redirect(reqwest::redirect::Policy::limited(5))
         .build()
         .expect("Failed to build HTTP client");
+    /// Parsed key sets in front of the Redis JWKS caches, keyed by Redis
+    /// key, with the time after which they must not be used.
+    static ref JWKS_MEMORY: Mutex<HashMap<String, (JwkSet, SystemTime)>> =
+        Mutex::new(HashMap::new());
+    /// DNS answers shared by the SSRF check and `HTTP_CLIENT`, keyed by
+    /// host, with the time until which they are reused.
+    static ref DNS_CACHE: Mutex<HashMap<String, (DnsAnswer, Instant)>> =
+        Mutex::new(HashMap::new());
 }
+
+/// Addresses of a host, or the error message of its failed lookup.
+type DnsAnswer = std::result::Result<Vec<IpAddr>, String>;
+/// Maximum number of hosts held by `DNS_CACHE`.
+const DNS_CACHE_SIZE: usize = 4096;
+/// Resolved addresses are reused this long. The system resolver does not
+/// report record TTLs, so this stays below the usual ones.
+const DNS_CACHE_TTL_SECS: u64 = 60;
+/// Failed lookups are remembered this long.
+const DNS_NEGATIVE_TTL_SECS: u64 = 30;
 pub const WELL_KNOWN: &str = ".well-known/openid-federation";
 
 /// Claim names this codebase parses or otherwise acts on.
@@ -187,6 +213,587 @@ pub struct AppState {
     pub public_keyset: JwkSet,
 }
 
+/// Long-lived Redis connections shared by all handlers through `web::Data`.
+///
+/// A `ConnectionManager` multiplexes concurrent commands over one connection
+/// and reconnects by itself, so the managers are created once at startup
+/// instead of on every request. They are handed out round robin, so a large
+/// reply on one connection does not hold up the requests on the others.
+#[derive(Clone)]
+pub struct RedisPool {
+    managers: Arc<Vec<redis::aio::ConnectionManager>>,
+    next: Arc<AtomicUsize>,
+}
+
+impl RedisPool {
+    /// Opens `size` (at least one) connection managers.
+    pub async fn new(client: &redis::Client, size: usize) -> redis::RedisResult<Self> {
+        let mut managers = Vec::with_capacity(size.max(1));
+        for _ in 0..size.max(1) {
+            managers.push(client.get_connection_manager().await?);
+        }
+        Ok(RedisPool {
+            managers: Arc::new(managers),
+            next: Arc::new(AtomicUsize::new(0)),
+        })
+    }
+
+    /// Returns a connection for one request. Cloning a manager is cheap,
+    /// the clone shares the underlying connection.
+    pub fn get(&self) -> RedisConnection {
+        let i = self.next.fetch_add(1, std::sync::atomic::Ordering::Relaxed) % self.managers.len();
+        RedisConnection(self.managers[i].clone())
+    }
+}
+
+/// A `ConnectionManager` that records the latency of every command and
+/// pipeline in `metrics::REDIS_DURATION`, labelled with the command name.
+#[derive(Clone)]
+pub struct RedisConnection(redis::aio::ConnectionManager);
+
+impl From<redis::aio::ConnectionManager> for RedisConnection {
+    fn from(manager: redis::aio::ConnectionManager) -> Self {
+        RedisConnection(manager)
+    }
+}
+
+/// Upper-case name of a command, the label of its latency.
+fn redis_command_name(cmd: &redis::Cmd) -> String {
+    match cmd.args_iter().next() {
+        Some(redis::Arg::Simple(name)) => String::from_utf8_lossy(name).to_ascii_uppercase(),
+        _ => "UNKNOWN".to_string(),
+    }
+}
+
+impl redis::aio::ConnectionLike for RedisConnection {
+    fn req_packed_command<'a>(
+        &'a mut self,
+        cmd: &'a redis::Cmd,
+    ) -> redis::RedisFuture<'a, redis::Value> {
+        Box::pin(async move {
+            let start = Instant::now();
+            let res = redis::aio::ConnectionLike::req_packed_command(&mut self.0, cmd).await;
+            metrics::REDIS_DURATION.observe_duration(start.elapsed(), &[&redis_command_name(cmd)]);
+            res
+        })
+    }
+
+    fn req_packed_commands<'a>(
+        &'a mut self,
+        cmd: &'a redis::Pipeline,
+        offset: usize,
+        count: usize,
+    ) -> redis::RedisFuture<'a, Vec<redis::Value>> {
+        Box::pin(async move {
+            let start = Instant::now();
+            let res =
+                redis::aio::ConnectionLike::req_packed_commands(&mut self.0, cmd, offset, count)
+                    .await;
+            metrics::REDIS_DURATION.observe_duration(start.elapsed(), &["PIPELINE"]);
+            res
+        })
+    }
+
+    fn get_db(&self) -> i64 {
+        redis::aio::ConnectionLike::get_db(&self.0)
+    }
+}
+
+/// Redis pub/sub channel on which the admin announces changed responses.
+/// Messages are `entity_configuration`, `historical_keys`, `fetch:{sub}`,
+/// `trust_mark:{sub}`, or `*` to drop everything.
+pub const RESPONSE_CACHE_CHANNEL: &str = "inmor:response_cache";
+
+/// Cached responses are kept, and may be cached by clients, at most this
+/// long even if the JWT's `exp` is later. Bounds staleness should an
+/// invalidation message be lost.
+const RESPONSE_CACHE_MAX_AGE_SECS: u64 = 300;
+
+/// Maximum number of responses held by the `ResponseCache`.
+const RESPONSE_CACHE_CAPACITY: usize = 10000;
+
+/// `/trust_mark_status` verdicts are reused at most this long, and never
+/// past the mark's `exp`.
+const TRUST_MARK_VERDICT_MAX_TTL_SECS: u64 = 60;
+
+/// Maximum number of `/trust_mark_status` verdicts held by the `ResponseCache`.
+const TRUST_MARK_VERDICT_CAPACITY: usize = 10000;
+
+/// A memoized `/trust_mark_status` verdict.
+#[derive(Debug)]
+struct TrustMarkVerdict {
+    status: &'static str,
+    /// The mark's `sub`, empty for invalid marks.
+    sub: String,
+    until: u64,
+    /// Tick of the last lookup, for least recently used eviction.
+    last_used: u64,
+}
+
+/// A response body held by the `ResponseCache`, with its ETag.
+#[derive(Debug)]
+pub struct CachedResponse {
+    /// Cloning `Bytes` only bumps a reference count.
+    pub body: web::Bytes,
+    /// Weak, as `middleware::Compress` sends the same body in several
+    /// content codings under this one ETag.
+    pub etag: String,
+    /// Unix time after which the response is not served.
+    pub until: u64,
+}
+
+impl CachedResponse {
+    /// Builds the response for a request: 304 if the client already has
+    /// this version, the body otherwise.
+    pub fn respond(&self, req: &HttpRequest, content_type: &str) -> HttpResponse {
+        let max_age = self.until.saturating_sub(unix_now());
+        let cache_control = format!("max-age={max_age}");
+        if etag_matches(req, &self.etag) {
+            return HttpResponse::NotModified()
+                .insert_header(("ETag", self.etag.as_str()))
+                .insert_header(("Cache-Control", cache_control))
+                .finish();
+        }
+        HttpResponse::Ok()
+            .content_type(content_type)
+            .insert_header(("ETag", self.etag.as_str()))
+            .insert_header(("Cache-Control", cache_control))
+            .body(self.body.clone())
+    }
+}
+
+/// Returns true if the request's `If-None-Match` header names `etag`,
+/// using the weak comparison of RFC 9110 §8.8.3.2.
+fn etag_matches(req: &HttpRequest, etag: &str) -> bool {
+    let opaque = |tag: &str| tag.strip_prefix("W/").unwrap_or(tag).to_string();
+    let etag = opaque(etag);
+    req.headers()
+        .get(actix_web::http::header::IF_NONE_MATCH)
+        .and_then(|v| v.to_str().ok())
+        .is_some_and(|tags| {
+            tags.split(',')
+                .map(str::trim)
+                .any(|tag| tag == "*" || opaque(tag) == etag)
+        })
+}
+
+/// Process-local copies of the TA's entity configuration, historical keys
+/// and subordinate statements, shared by all workers through `web::Data`.
+///
+/// Serving these from memory saves a Redis round trip per request, and
+/// conditional GETs are answered with 304 without touching Redis at all.
+/// The cache also memoizes `/trust_mark_status` verdicts by mark hash, so
+/// a popular mark is verified once per `TRUST_MARK_VERDICT_MAX_TTL_SECS`.
+/// The admin publishes on `RESPONSE_CACHE_CHANNEL` when it changes one of
+/// them (see `listen_for_response_changes`). The cache is only used while
+/// that subscription is up, as messages sent without it would be lost.
+pub struct ResponseCache {
+    entries: std::sync::RwLock<HashMap<String, Arc<CachedResponse>>>,
+    /// Trust mark hash → verdict, with the tick counter of the LRU.
+    verdicts: Mutex<(HashMap<String, TrustMarkVerdict>, u64)>,
+    /// Bumped on every invalidation, so a response read from Redis before
+    /// an invalidation is not stored after it.
+    generation: AtomicU64,
+    subscribed: AtomicBool,
+}
+
+impl Default for ResponseCache {
+    fn default() -> Self {
+        Self::new()
+    }
+}
+
+impl ResponseCache {
+    pub fn new() -> Self {
+        ResponseCache {
+            entries: std::sync::RwLock::new(HashMap::new()),
+            verdicts: Mutex::new((HashMap::new(), 0)),
+            generation: AtomicU64::new(0),
+            subscribed: AtomicBool::new(false),
+        }
+    }
+
+    /// Returns the cached response for `key`, if it is still valid.
+    pub fn get(&self, key: &str) -> Option<Arc<CachedResponse>> {
+        if !self.subscribed.load(std::sync::atomic::Ordering::Acquire) {
+            return None;
+        }
+        let entries = self.entries.read().unwrap();
+        entries
+            .get(key)
+            .filter(|entry| entry.until > unix_now())
+            .cloned()
+    }
+
+    /// Returns the current generation, to be passed to `insert`.
+    pub fn generation(&self) -> u64 {
+        self.generation.load(std::sync::atomic::Ordering::Acquire)
+    }
+
+    /// Wraps a JWT read from Redis, and stores it unless the cache was
+    /// invalidated since `generation`. The response is kept until the JWT's
+    /// `exp`, but at most `RESPONSE_CACHE_MAX_AGE_SECS`.
+    pub fn insert(&self, key: &str, jwt: String, generation: u64) -> Arc<CachedResponse> {
+        let now = unix_now();
+        let cap = now + RESPONSE_CACHE_MAX_AGE_SECS;
+        let until = get_unverified_payload_header(&jwt)
+            .ok()
+            .and_then(|(payload, _)| payload.expires_at())
+            .and_then(|exp| exp.duration_since(SystemTime::UNIX_EPOCH).ok())
+            .map_or(cap, |exp| exp.as_secs().min(cap));
+        let hash = Sha256::digest(jwt.as_bytes());
+        let entry = Arc::new(CachedResponse {
+            etag: format!("W/\"{:x}\"", hash),
+            body: web::Bytes::from(jwt),
+            until,
+        });
+
+        let mut entries = self.entries.write().unwrap();
+        if self.subscribed.load(std::sync::atomic::Ordering::Acquire)
+            && self.generation() == generation
+        {
+            if entries.len() >= RESPONSE_CACHE_CAPACITY {
+                entries.retain(|_, entry| entry.until > now);
+                if entries.len() >= RESPONSE_CACHE_CAPACITY {
+                    entries.clear();
+                }
+            }
+            entries.insert(key.to_string(), entry.clone());
+        }
+        entry
+    }
+
+    /// Returns the memoized `/trust_mark_status` verdict of a mark.
+    pub fn trust_mark_verdict(&self, hash: &str) -> Option<&'static str> {
+        if !self.subscribed.load(std::sync::atomic::Ordering::Acquire) {
+            return None;
+        }
+        let mut guard = self.verdicts.lock().unwrap();
+        let (verdicts, tick) = &mut *guard;
+        *tick += 1;
+        let verdict = verdicts.get_mut(hash)?;
+        if verdict.until <= unix_now() {
+            verdicts.remove(hash);
+            return None;
+        }
+        verdict.last_used = *tick;
+        Some(verdict.status)
+    }
+
+    /// Memoizes a `/trust_mark_status` verdict, unless the cache was
+    /// invalidated since `generation`. Active marks are kept until their
+    /// `exp`, all verdicts at most `TRUST_MARK_VERDICT_MAX_TTL_SECS`.
+    pub fn store_trust_mark_verdict(
+        &self,
+        hash: &str,
+        status: &'static str,
+        sub: &str,
+        exp: Option<SystemTime>,
+        generation: u64,
+    ) {
+        let now = unix_now();
+        let cap = now + TRUST_MARK_VERDICT_MAX_TTL_SECS;
+        let until = exp
+            .and_then(|exp| exp.duration_since(SystemTime::UNIX_EPOCH).ok())
+            .map_or(cap, |exp| exp.as_secs().min(cap));
+
+        let mut guard = self.verdicts.lock().unwrap();
+        if !self.subscribed.load(std::sync::atomic::Ordering::Acquire)
+            || self.generation() != generation
+        {
+            return;
+        }
+        let (verdicts, tick) = &mut *guard;
+        *tick += 1;
+        if verdicts.len() >= TRUST_MARK_VERDICT_CAPACITY && !verdicts.contains_key(hash) {
+            verdicts.retain(|_, verdict| verdict.until > now);
+            if verdicts.len() >= TRUST_MARK_VERDICT_CAPACITY
+                && let Some(lru) = verdicts
+                    .iter()
+                    .min_by_key(|(_, verdict)| verdict.last_used)
+                    .map(|(key, _)| key.clone())
+            {
+                verdicts.remove(&lru);
+            }
+        }
+        verdicts.insert(
+            hash.to_string(),
+            TrustMarkVerdict {
+                status,
+                sub: sub.to_string(),
+                until,
+                last_used: *tick,
+            },
+        );
+    }
+
+    /// Drops the responses named by an invalidation message. A
+    /// `trust_mark:{sub}` message drops the verdicts of all marks of `sub`.
+    pub fn invalidate(&self, message: &str) {
+        let mut entries = self.entries.write().unwrap();
+        let mut verdicts = self.verdicts.lock().unwrap();
+        self.generation
+            .fetch_add(1, std::sync::atomic::Ordering::AcqRel);
+        if message == "*" {
+            entries.clear();
+            verdicts.0.clear();
+        } else if let Some(sub) = message.strip_prefix("trust_mark:") {
+            verdicts.0.retain(|_, verdict| verdict.sub != sub);
+        } else {
+            entries.remove(message);
+        }
+    }
+
+    /// Marks the invalidation subscription as up or down. Either way the
+    /// cache starts over, as messages may have been missed in between.
+    fn set_subscribed(&self, subscribed: bool) {
+        self.invalidate("*");
+        self.subscribed
+            .store(subscribed, std::sync::atomic::Ordering::Release);
+    }
+}
+
+/// Subscribes to `RESPONSE_CACHE_CHANNEL` and applies the admin's
+/// invalidation messages to the cache. Runs for the life of the server,
+/// resubscribing after a second if the connection is lost.
+pub async fn listen_for_response_changes(client: redis::Client, cache: web::Data<ResponseCache>) {
+    loop {
+        match client.get_async_pubsub().await {
+            Ok(mut pubsub) => match pubsub.subscribe(RESPONSE_CACHE_CHANNEL).await {
+                Ok(()) => {
+                    cache.set_subscribed(true);
+                    let mut messages = pubsub.on_message();
+                    while let Some(msg) = messages.next().await {
+                        match msg.get_payload::<String>() {
+                            Ok(message) => cache.invalidate(&message),
+                            Err(e) => warn!("Invalid response cache message: {e}"),
+                        }
+                    }
+                    warn!("Lost the {RESPONSE_CACHE_CHANNEL} subscription");
+                }
+                Err(e) => warn!("Failed to subscribe to {RESPONSE_CACHE_CHANNEL}: {e}"),
+            },
+            Err(e) => warn!("Failed to open a pub/sub connection: {e}"),
+        }
+        cache.set_subscribed(false);
+        tokio::time::sleep(Duration::from_secs(1)).await;
+    }
+}
+
+/// Endpoints with their own in-flight limit, as (path, default limit).
+/// Requests to all other paths share the `default` lane, so a flood of
+/// `/resolve` requests cannot take the capacity that entity configurations,
+/// `/fetch` and `/list` need.
+pub const LOAD_SHED_LANES: [(&str, usize); 3] = [
+    ("/resolve", 16),
+    ("/collection", 32),
+    ("/trust_mark_status", 64),
+];
+/// Name and default in-flight limit of the lane of all other endpoints.
+pub const DEFAULT_LANE: (&str, usize) = ("default", 1024);
+/// Default number of milliseconds a request waits for a free slot.
+pub const DEFAULT_QUEUE_TIMEOUT_MS: u64 = 1000;
+
+/// In-flight limit and bounded wait queue of one group of endpoints.
+pub struct Lane {
+    pub name: String,
+    pub limit: usize,
+    permits: Arc<tokio::sync::Semaphore>,
+    /// Requests waiting for a permit, at most `limit` of them.
+    queued: AtomicUsize,
+    /// Requests answered with 503, for the metrics.
+    pub shed: AtomicU64,
+}
+
+impl Lane {
+    fn new(name: &str, limit: usize) -> Self {
+        let limit = limit.max(1);
+        Lane {
+            name: name.to_string(),
+            limit,
+            permits: Arc::new(tokio::sync::Semaphore::new(limit)),
+            queued: AtomicUsize::new(0),
+            shed: AtomicU64::new(0),
+        }
+    }
+
+    /// Requests currently being handled.
+    pub fn in_flight(&self) -> usize {
+        self.limit - self.permits.available_permits()
+    }
+
+    /// Requests currently waiting for a slot.
+    pub fn queued(&self) -> usize {
+        self.queued.load(std::sync::atomic::Ordering::Relaxed)
+    }
+}
+
+/// Per-endpoint concurrency limits of the TA, shared by all workers through
+/// `web::Data` and applied by the `shed_load` middleware.
+///
+/// A request first tries to take a slot in its lane. When all are taken it
+/// waits, in arrival order, for up to the queue timeout; when as many
+/// requests are already waiting as the lane has slots, or the wait times out,
+/// it is answered with 503 and a `Retry-After` header.
+pub struct LoadShedder {
+    lanes: Vec<(String, Lane)>,
+    default: Lane,
+    queue_timeout: Duration,
+}
+
+impl LoadShedder {
+    /// Creates the lanes, with the limits from `max_in_flight` (keyed by lane
+    /// name, `resolve`, `collection`, `trust_mark_status` or `default`)
+    /// overriding the defaults.
+    pub fn new(max_in_flight: &HashMap<String, usize>, queue_timeout: Duration) -> Self {
+        let limit = |name: &str, default: usize| *max_in_flight.get(name).unwrap_or(&default);
+        let lanes = LOAD_SHED_LANES
+            .iter()
+            .map(|(path, default)| {
+                let name = path.trim_start_matches('/');
+                (path.to_string(), Lane::new(name, limit(name, *default)))
+            })
+            .collect();
+        LoadShedder {
+            lanes,
+            default: Lane::new(DEFAULT_LANE.0, limit(DEFAULT_LANE.0, DEFAULT_LANE.1)),
+            queue_timeout,
+        }
+    }
+
+    /// Returns the lane a request path belongs to.
+    pub fn lane(&self, path: &str) -> &Lane {
+        self.lanes
+            .iter()
+            .find(|(lane_path, _)| lane_path == path)
+            .map_or(&self.default, |(_, lane)| lane)
+    }
+
+    /// All lanes, the `default` one last.
+    pub fn lanes(&self) -> impl Iterator<Item = &Lane> {
+        self.lanes
+            .iter()
+            .map(|(_, lane)| lane)
+            .chain(std::iter::once(&self.default))
+    }
+
+    /// Waits for a slot in the lane. The slot is freed when the returned
+    /// permit is dropped; `None` means the request is to be shed.
+    pub async fn admit(&self, lane: &Lane) -> Option<tokio::sync::OwnedSemaphorePermit> {
+        if let Ok(permit) = lane.permits.clone().try_acquire_owned() {
+            return Some(permit);
+        }
+        if lane
+            .queued
+            .fetch_add(1, std::sync::atomic::Ordering::AcqRel)
+            >= lane.limit
+        {
+            lane.queued
+                .fetch_sub(1, std::sync::atomic::Ordering::AcqRel);
+            lane.shed.fetch_add(1, std::sync::atomic::Ordering::Relaxed);
+            return None;
+        }
+        let permit =
+            tokio::time::timeout(self.queue_timeout, lane.permits.clone().acquire_owned()).await;
+        lane.queued
+            .fetch_sub(1, std::sync::atomic::Ordering::AcqRel);
+        match permit {
+            Ok(Ok(permit)) => Some(permit),
+            _ => {
+                lane.shed.fetch_add(1, std::sync::atomic::Ordering::Relaxed);
+                None
+            }
+        }
+    }
+
+    /// Seconds a shed client is asked to wait before retrying.
+    pub fn retry_after(&self) -> u64 {
+        self.queue_timeout.as_secs_f64().ceil().max(1.0) as u64
+    }
+}
+
+/// Middleware applying the `LoadShedder` in the app data to every request.
+pub async fn shed_load(
+    req: ServiceRequest,
+    next: Next<impl MessageBody + 'static>,
+) -> actix_web::Result<ServiceResponse<BoxBody>> {
+    let Some(shedder) = req.app_data::<web::Data<LoadShedder>>().cloned() else {
+        return Ok(next.call(req).await?.map_into_boxed_body());
+    };
+    let lane = shedder.lane(req.path());
+    match shedder.admit(lane).await {
+        Some(_permit) => Ok(next.call(req).await?.map_into_boxed_body()),
+        None => {
+            warn!(
+                "Shedding {} request, lane {} is full",
+                req.path(),
+                lane.name
+            );
+            let response = HttpResponse::ServiceUnavailable()
+                .insert_header(("Retry-After", shedder.retry_after().to_string()))
+                .json(json!({
+                    "error": "temporarily_unavailable",
+                    "error_description": "The server is overloaded, retry later."
+                }));
+            Ok(req.into_response(response))
+        }
+    }
+}
+
+/// Default of `compress_min_bytes`.
+pub const DEFAULT_COMPRESS_MIN_BYTES: usize = 1024;
+
+/// Responses smaller than this are sent uncompressed. Set from
+/// `compress_min_bytes` in `taconfig.toml`.
+pub static COMPRESS_MIN_BYTES: AtomicUsize = AtomicUsize::new(DEFAULT_COMPRESS_MIN_BYTES);
+
+/// Middleware, wrapped inside `middleware::Compress`, that keeps responses
+/// below `COMPRESS_MIN_BYTES` uncompressed. Entity statements and error
+/// responses gain little from compression, so only large listings and
+/// `/resolve` responses pay for it. `Compress` leaves responses that already
+/// have a `Content-Encoding` alone, so they are marked `identity`, which
+/// `strip_identity_encoding` removes again outside `Compress`.
+pub async fn skip_small_compression(
+    req: ServiceRequest,
+    next: Next<impl MessageBody + 'static>,
+) -> actix_web::Result<ServiceResponse<BoxBody>> {
+    let mut res = next.call(req).await?;
+    let min = COMPRESS_MIN_BYTES.load(std::sync::atomic::Ordering::Relaxed) as u64;
+    if let BodySize::Sized(size) = res.response().body().size()
+        && size > 0
+        && size < min
+        && !res
+            .headers()
+            .contains_key(actix_web::http::header::CONTENT_ENCODING)
+    {
+        res.headers_mut().insert(
+            actix_web::http::header::CONTENT_ENCODING,
+            actix_web::http::header::HeaderValue::from_static("identity"),
+        );
+    }
+    Ok(res.map_into_boxed_body())
+}
+
+/// Middleware, wrapped outside `middleware::Compress`, that removes the
+/// `Content-Encoding: identity` marker of `skip_small_compression`.
+/// `identity` only has a meaning in `Accept-Encoding` (RFC 9110 §8.4), so
+/// clients must not see it.
+pub async fn strip_identity_encoding(
+    req: ServiceRequest,
+    next: Next<impl MessageBody + 'static>,
+) -> actix_web::Result<ServiceResponse<impl MessageBody>> {
+    let mut res = next.call(req).await?;
+    if res
+        .headers()
+        .get(actix_web::http::header::CONTENT_ENCODING)
+        .is_some_and(|value| value == "identity")
+    {
+        res.headers_mut()
+            .remove(actix_web::http::header::CONTENT_ENCODING);
+    }
+    Ok(res)
+}
+
 // To represent the entities in the federation.
 // FIXME: add all different data as proper part of the structure.
 #[derive(Debug, Clone, Deserialize)]
@@ -232,10 +839,157 @@ impl EntityDetails {
     }
 }
 
-// This will be shared about threads via AppData
-#[derive(Debug, Deserialize)]
+/// Number of independently locked shards of the `Federation` cache.
+const FEDERATION_CACHE_SHARDS: usize = 16;
+
+/// A statement held by the `Federation` cache.
+#[derive(Debug)]
+pub struct CachedStatement {
+    pub jwt: String,
+    /// Self-verified for entity configurations, unverified for subordinate
+    /// statements (those are verified against the authority's keys on use).
+    pub payload: JwtPayload,
+    /// The statement is not served after this time.
+    pub until: SystemTime,
+}
+
+/// A cache slot. Concurrent requests for the same URL wait for the first
+/// fetch instead of starting their own.
+type CacheSlot = Arc<tokio::sync::OnceCell<Arc<CachedStatement>>>;
+
+/// Verified entity configurations and fetched subordinate statements of
+/// other entities, shared by all /resolve requests via AppData.
+///
+/// Entries are keyed by URL and kept until `min(exp, max_ttl)`, so popular
+/// intermediates are fetched and verified once per TTL instead of once per
+/// request. The map is split into shards so that requests for different
+/// URLs rarely contend on a lock, and each shard is bounded. Statements
+/// under our own entity_id are never cached: they change with the admin
+/// and are read from our own Redis anyway.
 pub struct Federation {
-    pub entities: Mutex<HashMap<String, EntityDetails>>,
+    entity_id_prefix: String,
+    shards: Vec<Mutex<HashMap<String, CacheSlot>>>,
+    shard_capacity: usize,
+    max_ttl: Duration,
+}
+
+impl Federation {
+    pub fn new(entity_id: &str, capacity: usize, max_ttl: Duration) -> Self {
+        Federation {
+            entity_id_prefix: format!("{}/", entity_id.trim_end_matches('/')),
+            shards: (0..FEDERATION_CACHE_SHARDS)
+                .map(|_| Mutex::new(HashMap::new()))
+                .collect(),
+            shard_capacity: capacity.div_ceil(FEDERATION_CACHE_SHARDS).max(1),
+            max_ttl,
+        }
+    }
+
+    fn shard(&self, key: &str) -> &Mutex<HashMap<String, CacheSlot>> {
+        use std::hash::{Hash, Hasher};
+        let mut hasher = std::collections::hash_map::DefaultHasher::new();
+        key.hash(&mut hasher);
+        &self.shards[hasher.finish() as usize % self.shards.len()]
+    }
+
+    /// Returns the cached statement for `key`, or calls `fetch` once for all
+    /// concurrent callers. Errors are not cached.
+    async fn get_or_fetch<F, Fut>(&self, key: &str, fetch: F) -> Result<Arc<CachedStatement>>
+    where
+        F: FnOnce() -> Fut,
+        Fut: Future<Output = Result<(String, JwtPayload)>>,
+    {
+        if key.starts_with(&self.entity_id_prefix) || self.max_ttl.is_zero() {
+            let (jwt, payload) = fetch().await?;
+            return Ok(Arc::new(CachedStatement {
+                jwt,
+                payload,
+                until: SystemTime::now(),
+            }));
+        }
+
+        let slot = {
+            let mut shard = self
+                .shard(key)
+                .lock()
+                .expect("federation cache lock poisoned");
+            let now = SystemTime::now();
+            match shard.get(key) {
+                Some(slot) if slot.get().is_none_or(|entry| entry.until > now) => slot.clone(),
+                _ => {
+                    if shard.len() >= self.shard_capacity {
+                        evict_cache_slots(&mut shard, self.shard_capacity, now);
+                    }
+                    let slot = CacheSlot::default();
+                    shard.insert(key.to_string(), slot.clone());
+                    slot
+                }
+            }
+        };
+
+        let max_ttl = self.max_ttl;
+        let entry = slot
+            .get_or_try_init(|| async move {
+                let (jwt, payload) = fetch().await?;
+                let cap = SystemTime::now() + max_ttl;
+                let until = payload.expires_at().map_or(cap, |exp| exp.min(cap));
+                Ok::<_, anyhow::Error>(Arc::new(CachedStatement {
+                    jwt,
+                    payload,
+                    until,
+                }))
+            })
+            .await?;
+        Ok(entry.clone())
+    }
+
+    /// Fetches and self-verifies the entity configuration of `entity_id`.
+    pub async fn entity_configuration(&self, entity_id: &str) -> Result<Arc<CachedStatement>> {
+        let url = format!("{entity_id}/{WELL_KNOWN}");
+        self.get_or_fetch(&url, || async {
+            let jwt = get_entity_configruation_as_jwt(entity_id).await?;
+            let (payload, _) = self_verify_jwt(&jwt)?;
+            Ok((jwt, payload))
+        })
+        .await
+    }
+
+    /// Fetches the subordinate statement about `sub` from `fetch_url`.
+    pub async fn subordinate_statement(
+        &self,
+        fetch_url: &str,
+        sub: &str,
+    ) -> Result<Arc<CachedStatement>> {
+        let url = format!("{fetch_url}?sub={sub}");
+        self.get_or_fetch(&url, || async {
+            let jwt = fetch_subordinate_statement(fetch_url, sub).await?;
+            let (payload, _) = get_unverified_payload_header(&jwt)?;
+            Ok((jwt, payload))
+        })
+        .await
+    }
+}
+
+/// Makes room in a full cache shard: drops expired entries and the empty
+/// slots of failed fetches, then the entries that expire first. Slots whose
+/// fetch is still in flight are kept, as other requests wait on them.
+fn evict_cache_slots(shard: &mut HashMap<String, CacheSlot>, capacity: usize, now: SystemTime) {
+    shard.retain(|_, slot| match slot.get() {
+        Some(entry) => entry.until > now,
+        // Only the shard holds the slot of a fetch that failed.
+        None => Arc::strong_count(slot) > 1,
+    });
+    while shard.len() >= capacity {
+        let Some(oldest) = shard
+            .iter()
+            .filter_map(|(key, slot)| slot.get().map(|entry| (entry.until, key)))
+            .min()
+            .map(|(_, key)| key.clone())
+        else {
+            break;
+        };
+        shard.remove(&oldest);
+    }
 }
 
 // SECTION FOR WEB QUERY PARAMETERS
@@ -262,6 +1016,9 @@ pub struct TrustMarkParams {
 pub struct TrustMarkListParams {
     trust_mark_type: String,
     sub: Option<String>,
+    /// First entity_id of the page, as given in the previous page's `Link` header.
+    from: Option<String>,
+    limit: Option<usize>,
 }
 
 #[derive(Debug, Deserialize)]
@@ -277,6 +1034,9 @@ pub struct SubListingParams {
     trust_marked: Option<bool>,
     trust_mark_type: Option<String>,
     intermediate: Option<bool>,
+    /// First entity_id of the page, as given in the previous page's `Link` header.
+    from: Option<String>,
+    limit: Option<usize>,
 }
 
 // QUERY PARAMETERS ENDS
@@ -313,6 +1073,30 @@ impl EntityCollectionResponse {
             trust_marks: None,
         }
     }
+
+    /// Returns the normalized search tokens of the display names and
+    /// descriptions in `ui_infos`, as stored in the `/collection` search index.
+    pub fn search_tokens(&self) -> BTreeSet<String> {
+        let mut tokens = BTreeSet::new();
+        for ui in self.ui_infos.iter().flat_map(|infos| infos.values()) {
+            for text in [&ui.display_name, &ui.description].into_iter().flatten() {
+                tokens.extend(search_tokens(text));
+            }
+        }
+        tokens
+    }
+}
+
+/// Tokens longer than this are not indexed for `/collection?query=`.
+const MAX_SEARCH_TOKEN_LEN: usize = 64;
+
+/// Splits text into the lowercase alphanumeric tokens used by the
+/// `/collection` search index. The same function normalizes the index at
+/// walk time and the `query` parameter, so both always agree.
+pub fn search_tokens(text: &str) -> impl Iterator<Item = String> + '_ {
+    text.split(|c: char| !c.is_alphanumeric())
+        .filter(|word| !word.is_empty() && word.chars().count() <= MAX_SEARCH_TOKEN_LEN)
+        .map(|word| word.to_lowercase())
 }
 
 /// To store each JWT and verified payload from it
@@ -365,15 +1149,47 @@ pub struct ServerConfiguration {
     pub tls_key: Option<String>,
     /// Allow HTTP scheme and private IPs in outbound federation requests (development only).
     pub allow_http: Option<bool>,
+    /// Number of HTTP worker threads. Defaults to the number of available cores.
+    pub workers: Option<usize>,
+    /// Number of shared Redis connections. Defaults to the number of workers.
+    pub redis_pool_size: Option<usize>,
+    /// Maximum number of entity configurations and subordinate statements of
+    /// other entities cached in memory. Defaults to 10000.
+    pub entity_cache_size: Option<usize>,
+    /// Maximum seconds a cached statement is used, even if its `exp` is
+    /// later. Defaults to 300, 0 disables the cache.
+    pub entity_cache_ttl: Option<u64>,
+    /// Maximum concurrent requests per lane (`resolve`, `collection`,
+    /// `trust_mark_status` and `default`), see `LoadShedder`.
+    pub max_in_flight: Option<HashMap<String, usize>>,
+    /// Milliseconds a request waits for a free slot before it gets a 503.
+    /// Defaults to 1000.
+    pub queue_timeout_ms: Option<u64>,
+    /// Responses smaller than this many bytes are not compressed. Defaults
+    /// to 1024.
+    pub compress_min_bytes: Option<usize>,
+    /// Redis written by the admin. If set, this TA is a read-only mirror:
+    /// it copies the `inmor:*` keys from there into `redis_uri` and serves
+    /// from that copy, see `mirror`.
+    pub mirror_redis_uri: Option<String>,
 }
 
 impl ServerConfiguration {
+    #[allow(clippy::too_many_arguments)]
     pub fn new(
         domain: String,
         redis_uri: String,
         tls_cert: Option<String>,
         tls_key: Option<String>,
         allow_http: Option<bool>,
+        workers: Option<usize>,
+        redis_pool_size: Option<usize>,
+        entity_cache_size: Option<usize>,
+        entity_cache_ttl: Option<u64>,
+        max_in_flight: Option<HashMap<String, usize>>,
+        queue_timeout_ms: Option<u64>,
+        compress_min_bytes: Option<usize>,
+        mirror_redis_uri: Option<String>,
     ) -> ServerConfiguration {
         ServerConfiguration {
             domain: URL(domain),
@@ -381,6 +1197,14 @@ impl ServerConfiguration {
             tls_cert,
             tls_key,
             allow_http,
+            workers,
+            redis_pool_size,
+            entity_cache_size,
+            entity_cache_ttl,
+            max_in_flight,
+            queue_timeout_ms,
+            compress_min_bytes,
+            mirror_redis_uri,
         }
     }
 
@@ -399,7 +1223,76 @@ impl ServerConfiguration {
         let allow_http = env::var("TA_ALLOW_HTTP")
             .ok()
             .map(|v| v == "true" || v == "1");
-        ServerConfiguration::new(domain, redis, tls_cert, tls_key, allow_http)
+        let workers = env::var("TA_WORKERS").ok().and_then(|v| v.parse().ok());
+        let redis_pool_size = env::var("TA_REDIS_POOL_SIZE")
+            .ok()
+            .and_then(|v| v.parse().ok());
+        let entity_cache_size = env::var("TA_ENTITY_CACHE_SIZE")
+            .ok()
+            .and_then(|v| v.parse().ok());
+        let entity_cache_ttl = env::var("TA_ENTITY_CACHE_TTL")
+            .ok()
+            .and_then(|v| v.parse().ok());
+        // For example TA_MAX_IN_FLIGHT=resolve=8,default=512
+        let max_in_flight = env::var("TA_MAX_IN_FLIGHT").ok().map(|v| {
+            v.split(',')
+                .filter_map(|pair| pair.split_once('='))
+                .filter_map(|(lane, n)| Some((lane.trim().to_string(), n.trim().parse().ok()?)))
+                .collect()
+        });
+        let queue_timeout_ms = env::var("TA_QUEUE_TIMEOUT_MS")
+            .ok()
+            .and_then(|v| v.parse().ok());
+        let compress_min_bytes = env::var("TA_COMPRESS_MIN_BYTES")
+            .ok()
+            .and_then(|v| v.parse().ok());
+        let mirror_redis_uri = env::var("TA_MIRROR_REDIS").ok();
+        ServerConfiguration::new(
+            domain,
+            redis,
+            tls_cert,
+            tls_key,
+            allow_http,
+            workers,
+            redis_pool_size,
+            entity_cache_size,
+            entity_cache_ttl,
+            max_in_flight,
+            queue_timeout_ms,
+            compress_min_bytes,
+            mirror_redis_uri,
+        )
+    }
+
+    /// Builds the shared cache of other entities' statements.
+    pub fn federation(&self) -> Federation {
+        Federation::new(
+            &self.domain,
+            self.entity_cache_size.unwrap_or(10_000),
+            Duration::from_secs(self.entity_cache_ttl.unwrap_or(300)),
+        )
+    }
+
+    /// Builds the per-endpoint concurrency limits.
+    pub fn load_shedder(&self) -> LoadShedder {
+        LoadShedder::new(
+            &self.max_in_flight.clone().unwrap_or_default(),
+            Duration::from_millis(self.queue_timeout_ms.unwrap_or(DEFAULT_QUEUE_TIMEOUT_MS)),
+        )
+    }
+
+    /// Number of HTTP workers to start, `workers` or the number of available cores.
+    pub fn worker_count(&self) -> usize {
+        self.workers
+            .filter(|&n| n > 0)
+            .unwrap_or_else(|| std::thread::available_parallelism().map_or(1, |n| n.get()))
+    }
+
+    /// Number of shared Redis connections, `redis_pool_size` or the worker count.
+    pub fn redis_pool_size(&self) -> usize {
+        self.redis_pool_size
+            .filter(|&n| n > 0)
+            .unwrap_or_else(|| self.worker_count())
     }
 }
 
@@ -515,77 +1408,365 @@ pub fn create_signed_jwt_with_header(
     Ok(jwt)
 }
 
-/// Returns entities from the collection data populated by inmor-collection.
-/// If entity_type filter is given, reads from `inmor:collection:by_type:{type}` sets,
-/// otherwise reads all from `inmor:collection:entities` hash.
+/// Number of entity_ids fetched with one HMGET from `inmor:collection:entities`.
+const COLLECTION_FETCH_CHUNK: usize = 500;
+
+/// Returns one sorted page of entity_ids from an index, starting at `from`
+/// (inclusive). Reads one more id than `limit` so the caller knows the next
+/// page's first entity. The indexes are sorted sets with all scores 0, so
+/// ZRANGE BYLEX costs O(log(N) + page).
+async fn sorted_index_page(
+    conn: &mut RedisConnection,
+    key: &str,
+    from: Option<&str>,
+    limit: Option<usize>,
+) -> Result<Vec<String>> {
+    let min = match from {
+        Some(from) => format!("[{from}"),
+        None => "-".to_string(),
+    };
+    let mut cmd = redis::cmd("ZRANGE");
+    cmd.arg(key).arg(min).arg("+").arg("BYLEX");
+    if let Some(limit) = limit {
+        cmd.arg("LIMIT").arg(0).arg(limit + 1);
+    }
+    Ok(cmd.query_async(conn).await?)
+}
+
+/// Splits ids read with [`sorted_index_page`] (at most `limit + 1` of them)
+/// into the page and the entity_id the next page starts from.
+fn split_page(mut ids: Vec<String>, limit: Option<usize>) -> (Vec<String>, Option<String>) {
+    match limit {
+        Some(limit) if ids.len() > limit => {
+            ids.truncate(limit + 1);
+            let next = ids.pop();
+            (ids, next)
+        }
+        _ => (ids, None),
+    }
+}
+
+/// Cuts one page out of a sorted list of entity_ids, for the queries that are
+/// not answered by a single sorted index.
+fn page_of(
+    mut ids: Vec<String>,
+    from: Option<&str>,
+    limit: Option<usize>,
+) -> (Vec<String>, Option<String>) {
+    if let Some(from) = from {
+        let start = ids.partition_point(|id| id.as_str() < from);
+        ids.drain(..start);
+    }
+    split_page(ids, limit)
+}
+
+/// Returns the `Link` header value pointing to the next page: the request's
+/// own query with `from` replaced.
+fn next_page_link(req: &HttpRequest, next: &str) -> String {
+    let mut query = url::form_urlencoded::Serializer::new(String::new());
+    for (key, value) in url::form_urlencoded::parse(req.query_string().as_bytes()) {
+        if key != "from" {
+            query.append_pair(&key, &value);
+        }
+    }
+    query.append_pair("from", next);
+    format!("<{}?{}>; rel=\"next\"", req.path(), query.finish())
+}
+
+/// Redis hash of version counters, one field per kind of listed data. The
+/// admin and inmor-collection bump a field with HINCRBY after, or in the same
+/// transaction as, every change of that data. `/list`, `/trust_mark_list` and
+/// `/collection` read the counters before the data and send them as the
+/// response's ETag, so a response never carries a newer version than its data,
+/// and a conditional GET of an unchanged listing costs a single HMGET.
+pub const LISTING_VERSIONS: &str = "inmor:versions";
+/// Bumped on changes of the subordinates and their `/list` index sets.
+pub const VERSION_SUBORDINATES: &str = "subordinates";
+/// Bumped on changes of the trust mark holder sets.
+pub const VERSION_TRUST_MARKS: &str = "trust_marks";
+/// Bumped by inmor-collection when it swaps in a finished walk.
+pub const VERSION_COLLECTION: &str = "collection";
+/// Bumped on changes of the TA's own entity configuration.
+pub const VERSION_ENTITY_CONFIGURATION: &str = "entity_configuration";
+/// Bumped on changes of the signed historical keys.
+pub const VERSION_HISTORICAL_KEYS: &str = "historical_keys";
+
+/// Capped Redis stream with one entry per change of the data served by the
+/// TA, written by the admin (`record_change` in `admin/entities/lib.py`) and
+/// inmor-collection. An entry has the fields `family` (a field of
+/// `LISTING_VERSIONS`), `op`, `entity` (empty for changes of the whole
+/// family) and the family's new `version`. Read by mirror nodes, see `mirror`.
+pub const CHANGES_STREAM: &str = "inmor:changes";
+/// Approximate number of entries kept in `CHANGES_STREAM`.
+pub const CHANGES_MAXLEN: usize = 10000;
+/// `op` of a change that replaced the whole family.
+pub const CHANGE_REBUILD: &str = "rebuild";
+
+/// Bumps a version counter and appends the change to `CHANGES_STREAM` in one
+/// step, so that the versions on the stream are in order. The same script as
+/// the admin's `record_change`.
+const RECORD_CHANGE_SCRIPT: &str = r#"
+local version = redis.call("HINCRBY", KEYS[1], ARGV[1], 1)
+redis.call("XADD", KEYS[2], "MAXLEN", "~", ARGV[4], "*",
+    "family", ARGV[1], "op", ARGV[2], "entity", ARGV[3], "version", version)
+return version
+"#;
+
+/// Adds the recording of a change to `pipe`, see `RECORD_CHANGE_SCRIPT`.
+pub fn record_change(pipe: &mut redis::Pipeline, family: &str, op: &str, entity: &str) {
+    pipe.cmd("EVAL")
+        .arg(RECORD_CHANGE_SCRIPT)
+        .arg(2)
+        .arg(LISTING_VERSIONS)
+        .arg(CHANGES_STREAM)
+        .arg(family)
+        .arg(op)
+        .arg(entity)
+        .arg(CHANGES_MAXLEN)
+        .ignore();
+}
+
+/// Returns the weak ETag of a listing made of the given version counters,
+/// or None while any of them is unset, as data written before the counters
+/// existed cannot be validated. It is weak because `middleware::Compress`
+/// sends the listing in several content codings under the same ETag.
+async fn listing_etag(
+    conn: &mut RedisConnection,
+    listing: &str,
+    fields: &[&str],
+) -> Option<String> {
+    let versions: Vec<Option<u64>> = redis::cmd("HMGET")
+        .arg(LISTING_VERSIONS)
+        .arg(fields)
+        .query_async(conn)
+        .await
+        .ok()?;
+    let versions: Vec<String> = versions
+        .into_iter()
+        .map(|v| v.map(|v| v.to_string()))
+        .collect::<Option<_>>()?;
+    Some(format!("W/\"{listing}-{}\"", versions.join("-")))
+}
+
+/// Returns the 304 response for a conditional GET of a listing the client
+/// already has.
+fn listing_not_modified(req: &HttpRequest, etag: Option<&str>) -> Option<HttpResponse> {
+    let etag = etag.filter(|etag| etag_matches(req, etag))?;
+    Some(
+        HttpResponse::NotModified()
+            .insert_header(("ETag", etag))
+            .insert_header(("Cache-Control", "no-cache"))
+            .finish(),
+    )
+}
+
+/// Adds the ETag of a listing to its response, with `no-cache` so that
+/// caches revalidate the listing before every reuse.
+fn insert_listing_etag(response: &mut HttpResponseBuilder, etag: Option<&str>) {
+    if let Some(etag) = etag {
+        response
+            .insert_header(("ETag", etag))
+            .insert_header(("Cache-Control", "no-cache"));
+    }
+}
+
+/// Returns the entity_ids matching all search tokens, restricted to the given
+/// entity types, from `from` on and at most `limit + 1` of them. Each token
+/// is a set in the search index written at walk time, so the cost depends on
+/// the number of matches, not on the size of the federation.
+async fn search_collection(
+    conn: &mut RedisConnection,
+    tokens: &BTreeSet<String>,
+    entity_types: &[String],
+    from: Option<&str>,
+    limit: Option<usize>,
+) -> Result<Vec<String>> {
+    let keys: Vec<String> = tokens
+        .iter()
+        .map(|token| format!("inmor:collection:search:{token}"))
+        .collect();
+    let matches: Vec<String> = redis::Cmd::sinter(&keys).query_async(conn).await?;
+    let mut ids: Vec<String> = matches
+        .into_iter()
+        .filter(|id| from.is_none_or(|from| id.as_str() >= from))
+        .collect::<BTreeSet<_>>()
+        .into_iter()
+        .collect();
+
+    if !entity_types.is_empty() && !ids.is_empty() {
+        let mut wanted = vec![false; ids.len()];
+        for etype in entity_types {
+            validate_entity_type(etype)
+                .map_err(|e| anyhow!("invalid entity_type '{}': {}", etype, e))?;
+            let members: Vec<bool> = redis::cmd("SMISMEMBER")
+                .arg(format!("inmor:collection:by_type:{etype}"))
+                .arg(&ids)
+                .query_async(conn)
+                .await?;
+            for (w, m) in wanted.iter_mut().zip(members) {
+                *w |= m;
+            }
+        }
+        let mut wanted = wanted.into_iter();
+        ids.retain(|_| wanted.next().unwrap_or(false));
+    }
+
+    if let Some(limit) = limit {
+        ids.truncate(limit + 1);
+    }
+    Ok(ids)
+}
+
+/// Returns entities from the collection data populated by inmor-collection,
+/// ordered by entity_id, and the entity_id the next page starts from.
+///
+/// The ids come from the sorted indexes written at walk time,
+/// `inmor:collection:all_sorted` or `inmor:collection:by_type_sorted:{type}`,
+/// so a page costs O(page) no matter how large the federation is. Collection
+/// data written before the per-type indexes existed falls back to the
+/// `inmor:collection:by_type:{type}` sets. A search `query` is answered from
+/// the `inmor:collection:search:{token}` sets instead. The entries are then
+/// read from the `inmor:collection:entities` hash with chunked HMGETs.
 async fn get_collection_entities(
-    conn: &mut redis::aio::ConnectionManager,
+    conn: &mut RedisConnection,
     entity_types: &[String],
-) -> Result<Vec<EntityCollectionResponse>> {
-    let entity_ids: Vec<String> = if entity_types.is_empty() {
-        // No filter: get all entity_ids from the hash
-        redis::Cmd::hkeys("inmor:collection:entities")
-            .query_async(conn)
-            .await
-            .unwrap_or_default()
+    query: &BTreeSet<String>,
+    from: Option<&str>,
+    limit: Option<usize>,
+) -> Result<(Vec<EntityCollectionResponse>, Option<String>)> {
+    let entity_ids: Vec<String> = if !query.is_empty() {
+        search_collection(conn, query, entity_types, from, limit).await?
+    } else if entity_types.is_empty() {
+        sorted_index_page(conn, "inmor:collection:all_sorted", from, limit).await?
     } else {
-        // Get union of entity_ids across requested types
-        let mut ids = HashSet::new();
+        // Union of the pages of every requested type; each holds enough ids
+        // for the merged page.
+        let mut ids = BTreeSet::new();
         for etype in entity_types {
             validate_entity_type(etype)
                 .map_err(|e| anyhow!("invalid entity_type '{}': {}", etype, e))?;
-            let type_ids: Vec<String> =
-                redis::Cmd::smembers(format!("inmor:collection:by_type:{etype}"))
-                    .query_async(conn)
-                    .await
-                    .unwrap_or_default();
-            ids.extend(type_ids);
+            let index = format!("inmor:collection:by_type_sorted:{etype}");
+            let exists: bool = redis::Cmd::exists(&index).query_async(conn).await?;
+            if exists {
+                ids.extend(sorted_index_page(conn, &index, from, limit).await?);
+            } else {
+                let type_ids: Vec<String> =
+                    redis::Cmd::smembers(format!("inmor:collection:by_type:{etype}"))
+                        .query_async(conn)
+                        .await
+                        .unwrap_or_default();
+                ids.extend(
+                    type_ids
+                        .into_iter()
+                        .filter(|id| from.is_none_or(|from| id.as_str() >= from)),
+                );
+            }
         }
         ids.into_iter().collect()
     };
 
-    let mut result = Vec::new();
-    for eid in &entity_ids {
-        let json_str: Option<String> = redis::Cmd::hget("inmor:collection:entities", eid)
+    let (entity_ids, next) = split_page(entity_ids, limit);
+
+    let mut result = Vec::with_capacity(entity_ids.len());
+    for chunk in entity_ids.chunks(COLLECTION_FETCH_CHUNK) {
+        let entries: Vec<Option<String>> = redis::cmd("HMGET")
+            .arg("inmor:collection:entities")
+            .arg(chunk)
             .query_async(conn)
-            .await
-            .ok();
-        if let Some(json_str) = json_str
-            && let Ok(entry) = serde_json::from_str::<EntityCollectionResponse>(&json_str)
-        {
-            result.push(entry);
-        }
+            .await?;
+        result.extend(
+            entries
+                .into_iter()
+                .flatten()
+                .filter_map(|json_str| serde_json::from_str(&json_str).ok()),
+        );
     }
+    Ok((result, next))
+}
 
-    // Sort by entity_id for consistent ordering
-    result.sort_by(|a, b| a.entity_id.cmp(&b.entity_id));
-    Ok(result)
+/// Redis keys of the `/list` index sets. They are maintained by the admin
+/// (`update_redis_with_subordinate` in `admin/entities/lib.py`), so that
+/// `/list` does not have to decode every subordinate's entity configuration.
+///
+/// Sorted set (all scores 0, so ordered by entity_id) of all listable subordinates.
+pub(crate) const SUBORDINATE_INDEX: &str = "inmor:subordinates:index";
+/// Subordinates whose entity configuration carries at least one trust mark.
+pub(crate) const SUBORDINATE_TRUST_MARKED: &str = "inmor:subordinates:trust_marked";
+/// Subordinates with `federation_entity` but without `openid_provider` or
+/// `openid_relying_party` metadata.
+pub(crate) const SUBORDINATE_INTERMEDIATE: &str = "inmor:subordinates:intermediate";
+/// All other subordinates.
+pub(crate) const SUBORDINATE_LEAF: &str = "inmor:subordinates:leaf";
+
+/// Redis key of the index set of subordinates with the given entity type.
+pub(crate) fn subordinate_by_type_key(entity_type: &str) -> String {
+    format!("inmor:subordinates:by_type:{entity_type}")
 }
 
-/// TODO: We need to deal with query parameters in future
-/// https://openid.net/specs/openid-federation-1_0.html#section-8.2.1
-#[get("/list")]
-async fn list_subordinates(
-    info: Query<SubListingParams>,
-    redis: web::Data<redis::Client>,
-) -> actix_web::Result<impl Responder> {
-    let SubListingParams {
-        entity_type,
-        trust_marked,
-        trust_mark_type,
-        intermediate,
-    } = info.into_inner();
+/// Answers a `/list` query from the index sets, in entity_id order.
+///
+/// All filters are ANDed with ZINTER over the sorted index and the filter
+/// sets. Plain sets count as sorted sets with score 1, so every member of the
+/// result has the same score and ZINTER returns them ordered by entity_id.
+/// Multiple `entity_type` values are ORed, their SUNION is applied last.
+async fn list_subordinates_from_index(
+    conn: &mut RedisConnection,
+    params: &SubListingParams,
+) -> Result<(Vec<String>, Option<String>)> {
+    let mut keys: Vec<String> = vec![SUBORDINATE_INDEX.to_string()];
+    if let Some(true) = params.trust_marked {
+        keys.push(SUBORDINATE_TRUST_MARKED.to_string());
+    }
+    match params.intermediate {
+        Some(true) => keys.push(SUBORDINATE_INTERMEDIATE.to_string()),
+        Some(false) => keys.push(SUBORDINATE_LEAF.to_string()),
+        None => {}
+    }
+    if let Some(ref trust_mark_type) = params.trust_mark_type {
+        keys.push(format!("inmor:tmtype:{trust_mark_type}"));
+    }
+    let mut type_union: Vec<String> = Vec::new();
+    match params.entity_type.as_deref() {
+        Some([etype]) => keys.push(subordinate_by_type_key(etype)),
+        Some(etypes) => {
+            type_union = etypes.iter().map(|t| subordinate_by_type_key(t)).collect();
+        }
+        None => {}
+    }
 
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    let from = params.from.as_deref();
+    if keys.len() == 1 && type_union.is_empty() {
+        // Unfiltered listings are paged straight from the sorted index.
+        let res = sorted_index_page(conn, SUBORDINATE_INDEX, from, params.limit).await?;
+        return Ok(split_page(res, params.limit));
+    }
 
+    let mut res: Vec<String> = redis::cmd("ZINTER")
+        .arg(keys.len())
+        .arg(&keys)
+        .query_async(conn)
+        .await?;
+
+    if !type_union.is_empty() {
+        let wanted: HashSet<String> = redis::Cmd::sunion(&type_union).query_async(conn).await?;
+        res.retain(|x| wanted.contains(x));
+    }
+    Ok(page_of(res, from, params.limit))
+}
+
+/// Answers a `/list` query by decoding every subordinate's entity configuration.
+///
+/// Only used until the admin has built the index sets (see
+/// `rebuild_subordinate_index`), as this costs one JWT decode per subordinate.
+async fn list_subordinates_by_scan(
+    conn: &mut RedisConnection,
+    params: &SubListingParams,
+) -> Vec<String> {
     // This will contain all subordinates without filtering
     let mut results: Vec<EntityDetails> = Vec::new();
     {
         let entities = (redis::Cmd::hgetall("inmor:subordinates:jwt")
-            .query_async::<HashMap<String, String>>(&mut conn)
+            .query_async::<HashMap<String, String>>(conn)
             .await)
             .unwrap_or_default();
 
@@ -614,13 +1795,13 @@ async fn list_subordinates(
         }
     }
     // Now let us go through the list if we need to filter based on the query parameter.
-    if let Some(etype) = entity_type {
+    if let Some(ref etype) = params.entity_type {
         // Means one or more entity_type params were passed.
         // Keep entities that have at least one of the requested types.
         results.retain(|x| x.entity_types.iter().any(|t| etype.contains(t)));
     }
 
-    if let Some(inter) = intermediate {
+    if let Some(inter) = params.intermediate {
         // An intermediate is an entity with federation_entity metadata that also
         // has a federation_list_endpoint (i.e., it has subordinates). For simplicity
         // we filter on whether federation_entity is the *only* protocol type present
@@ -637,26 +1818,101 @@ async fn list_subordinates(
         });
     }
 
-    if let Some(true) = trust_marked {
+    if let Some(true) = params.trust_marked {
         // Means check if at least one trustmark exists
         results.retain(|x| x.has_trustmark);
     }
-    if let Some(trust_mark_type) = trust_mark_type {
-        // Means filter based on trustmark type
-        if let Err(e) = validate_redis_key_input(&trust_mark_type) {
-            return error_response_400("invalid_request", &format!("invalid trust_mark_type: {e}"));
-        }
-
+    if let Some(ref trust_mark_type) = params.trust_mark_type {
+        // Means filter based on trustmark type
         let query = format!("inmor:tmtype:{trust_mark_type}");
         let valid_entities: HashSet<String> = redis::Cmd::smembers(query)
-            .query_async::<HashSet<String>>(&mut conn)
+            .query_async::<HashSet<String>>(conn)
             .await
             .unwrap_or_default();
         results.retain(|x| valid_entities.contains(&x.entity_id));
     }
 
-    let res: Vec<String> = results.iter().map(|x| x.entity_id.clone()).collect();
-    Ok(HttpResponse::Ok().json(res))
+    let mut res: Vec<String> = results.iter().map(|x| x.entity_id.clone()).collect();
+    res.sort();
+    res
+}
+
+/// Returns the `/list` or `/trust_mark_list` response for one page, with a
+/// `Link` header to the next page if there is one, and the listing's ETag.
+fn entity_id_page_response(
+    req: &HttpRequest,
+    entity_ids: &[String],
+    next: Option<String>,
+    etag: Option<&str>,
+) -> HttpResponse {
+    let mut response = HttpResponse::Ok();
+    insert_listing_etag(&mut response, etag);
+    if let Some(next) = next {
+        response.insert_header(("link", next_page_link(req, &next)));
+    }
+    response.json(entity_ids)
+}
+
+/// https://openid.net/specs/openid-federation-1_0.html#section-8.2.1
+///
+/// With `limit`, the entity_ids are returned in pages of at most that many,
+/// and the `Link` header of every page but the last points to the next one
+/// (`from` set to its first entity_id).
+#[get("/list")]
+async fn list_subordinates(
+    req: HttpRequest,
+    info: Query<SubListingParams>,
+    redis: web::Data<RedisPool>,
+) -> actix_web::Result<impl Responder> {
+    let params = info.into_inner();
+
+    // Values used as part of Redis keys
+    if let Some(ref trust_mark_type) = params.trust_mark_type
+        && let Err(e) = validate_redis_key_input(trust_mark_type)
+    {
+        return error_response_400("invalid_request", &format!("invalid trust_mark_type: {e}"));
+    }
+    for etype in params.entity_type.iter().flatten() {
+        if let Err(e) = validate_redis_key_input(etype) {
+            return error_response_400("invalid_request", &format!("invalid entity_type: {e}"));
+        }
+    }
+    if params.limit == Some(0) {
+        return error_response_400("invalid_request", "limit must be a positive integer");
+    }
+
+    let mut conn = redis.get();
+
+    let etag = listing_etag(
+        &mut conn,
+        "list",
+        &[VERSION_SUBORDINATES, VERSION_TRUST_MARKS],
+    )
+    .await;
+    if let Some(response) = listing_not_modified(&req, etag.as_deref()) {
+        return Ok(response);
+    }
+
+    let indexed: usize = redis::Cmd::zcard(SUBORDINATE_INDEX)
+        .query_async(&mut conn)
+        .await
+        .map_err(error::ErrorInternalServerError)?;
+
+    let (res, next) = if indexed > 0 {
+        list_subordinates_from_index(&mut conn, &params)
+            .await
+            .map_err(error::ErrorInternalServerError)?
+    } else {
+        let res = list_subordinates_by_scan(&mut conn, &params).await;
+        if !res.is_empty() {
+            warn!(
+                "Subordinate index {} is empty, run the admin's rebuild_subordinate_index command",
+                SUBORDINATE_INDEX
+            );
+        }
+        page_of(res, params.from.as_deref(), params.limit)
+    };
+    Ok(entity_id_page_response(&req, &res, next, etag.as_deref()))
 }
 
 /// https://zachmann.github.io/openid-federation-entity-collection/main.html
@@ -664,7 +1920,7 @@ async fn list_subordinates(
 #[get("/collection")]
 pub async fn fetch_collections(
     req: HttpRequest,
-    redis: web::Data<redis::Client>,
+    redis: web::Data<RedisPool>,
 ) -> actix_web::Result<impl Responder> {
     let params: Vec<(String, String)> =
         match web::Query::<Vec<(String, String)>>::from_query(req.query_string()) {
@@ -672,12 +1928,12 @@ pub async fn fetch_collections(
             Err(_) => Vec::new(),
         };
 
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    let mut conn = redis.get();
 
     let mut entity_types: Vec<String> = Vec::new();
+    let mut from: Option<String> = None;
+    let mut limit: Option<usize> = None;
+    let mut query: BTreeSet<String> = BTreeSet::new();
 
     // Parse query parameters
     for (q, p) in params.iter() {
@@ -685,15 +1941,39 @@ pub async fn fetch_collections(
             "entity_type" => {
                 entity_types.push(p.clone());
             }
+            "from" => {
+                from = Some(p.clone());
+            }
+            "query" => {
+                query.extend(search_tokens(p));
+                if query.is_empty() {
+                    return error_response_400("invalid_request", "query has no searchable words");
+                }
+            }
+            "limit" => match p.parse::<usize>() {
+                Ok(n) if n > 0 => limit = Some(n),
+                _ => {
+                    return error_response_400(
+                        "invalid_request",
+                        "limit must be a positive integer",
+                    );
+                }
+            },
             _ => {
                 return error_response_400("unsupported_parameter", q);
             }
         }
     }
 
-    let result = get_collection_entities(&mut conn, &entity_types)
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    let etag = listing_etag(&mut conn, "collection", &[VERSION_COLLECTION]).await;
+    if let Some(response) = listing_not_modified(&req, etag.as_deref()) {
+        return Ok(response);
+    }
+
+    let (result, next) =
+        get_collection_entities(&mut conn, &entity_types, &query, from.as_deref(), limit)
+            .await
+            .map_err(error::ErrorInternalServerError)?;
 
     // Get last_updated timestamp
     let last_updated: Option<u64> = redis::Cmd::get("inmor:collection:last_updated")
@@ -701,12 +1981,17 @@ pub async fn fetch_collections(
         .await
         .ok();
 
-    let response = json!({
+    let mut response = json!({
         "entities": result,
         "last_updated": last_updated,
     });
+    if let Some(next) = next {
+        response["next"] = json!(next);
+    }
 
-    Ok(HttpResponse::Ok()
+    let mut builder = HttpResponse::Ok();
+    insert_listing_etag(&mut builder, etag.as_deref());
+    Ok(builder
         .content_type("application/json")
         .body(response.to_string()))
 }
@@ -716,7 +2001,8 @@ pub async fn fetch_collections(
 #[get("/fetch")]
 pub async fn fetch_subordinates(
     req: HttpRequest,
-    redis: web::Data<redis::Client>,
+    redis: web::Data<RedisPool>,
+    cache: web::Data<ResponseCache>,
 ) -> actix_web::Result<impl Responder> {
     let params = match web::Query::<HashMap<String, String>>::from_query(req.query_string()) {
         Ok(data) => data,
@@ -727,11 +2013,14 @@ pub async fn fetch_subordinates(
         None => return error_response_400("invalid_request", "Missing required parameter: sub"),
     };
 
+    let key = format!("fetch:{sub}");
+    if let Some(cached) = cache.get(&key) {
+        return Ok(cached.respond(&req, "application/entity-statement+jwt"));
+    }
+    let generation = cache.generation();
+
     // After we have the query
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    let mut conn = redis.get();
 
     let res = match redis::Cmd::hget("inmor:subordinates", sub)
         .query_async::<String>(&mut conn)
@@ -744,9 +2033,8 @@ pub async fn fetch_subordinates(
         }
     };
 
-    Ok(HttpResponse::Ok()
-        .content_type("application/entity-statement+jwt")
-        .body(res))
+    let cached = cache.insert(&key, res, generation);
+    Ok(cached.respond(&req, "application/entity-statement+jwt"))
 }
 
 /// Get JWK Set from the given payload
@@ -782,37 +2070,172 @@ pub async fn fetch_jwks_from_uri(uri: &str) -> Result<JwkSet> {
     parse_jwks_json(&body).map_err(|e| anyhow!("Failed to parse JWKS from {}: {}", uri, e))
 }
 
-/// Fetch a JWKS from a URI with Redis caching.
+/// Redis key prefix of cached `jwks_uri` key sets.
+const JWKS_CACHE: &str = "inmor:jwks_cache:";
+
+/// Redis key prefix of cached, verified `signed_jwks_uri` key sets.
+const SIGNED_JWKS_CACHE: &str = "inmor:signed_jwks_cache:";
+
+/// Longest time a fetched JWKS is cached. A signed JWKS is cached until its
+/// `exp` if that comes earlier.
+const JWKS_CACHE_TTL_SECS: u64 = 3600;
+
+/// How long a failed JWKS fetch is remembered, so that a broken endpoint is
+/// not fetched again by every resolve.
+const JWKS_NEGATIVE_TTL_SECS: u64 = 60;
+
+/// Maximum number of parsed key sets kept in process memory.
+const JWKS_MEMORY_CAPACITY: usize = 1024;
+
+/// Returns a parsed key set from process memory, if it has not expired.
+fn jwks_memory_get(cache_key: &str) -> Option<JwkSet> {
+    let memory = JWKS_MEMORY.lock().expect("JWKS memory lock poisoned");
+    let (keyset, until) = memory.get(cache_key)?;
+    (*until > SystemTime::now()).then(|| keyset.clone())
+}
+
+/// Keeps a parsed key set in process memory until `until`. When full,
+/// expired entries are dropped first, then the ones that expire soonest.
+fn jwks_memory_put(cache_key: &str, keyset: &JwkSet, until: SystemTime) {
+    let mut memory = JWKS_MEMORY.lock().expect("JWKS memory lock poisoned");
+    if memory.len() >= JWKS_MEMORY_CAPACITY && !memory.contains_key(cache_key) {
+        let now = SystemTime::now();
+        memory.retain(|_, (_, until)| *until > now);
+        while memory.len() >= JWKS_MEMORY_CAPACITY {
+            let Some(oldest) = memory
+                .iter()
+                .min_by_key(|(_, (_, until))| *until)
+                .map(|(key, _)| key.clone())
+            else {
+                break;
+            };
+            memory.remove(&oldest);
+        }
+    }
+    memory.insert(cache_key.to_string(), (keyset.clone(), until));
+}
+
+/// Fetch the JWKS at `uri` through the caches stored under `prefix`.
 ///
-/// Checks Redis for a cached copy first. On cache miss, fetches from the URI,
-/// stores in Redis with a 1-hour TTL, and returns the key set.
-pub async fn get_jwks_from_uri_cached(
+/// The lookup order is process memory, then Redis, then `fetch`. `fetch`
+/// returns the verified key set, its JSON form for Redis and the number of
+/// seconds it may be cached. A failed fetch is remembered for
+/// `JWKS_NEGATIVE_TTL_SECS`, during which the error is returned without
+/// contacting the endpoint again.
+async fn get_jwks_cached<F, Fut>(
     uri: &str,
-    conn: &mut redis::aio::ConnectionManager,
-) -> Result<JwkSet> {
+    prefix: &str,
+    conn: &mut RedisConnection,
+    fetch: F,
+) -> Result<JwkSet>
+where
+    F: FnOnce() -> Fut,
+    Fut: Future<Output = Result<(JwkSet, String, u64)>>,
+{
     let hash = Sha256::digest(uri);
-    let cache_key = format!("inmor:jwks_cache:{:x}", hash);
+    let cache_key = format!("{prefix}{hash:x}");
+    let failed_key = format!("{prefix}failed:{hash:x}");
+    let cache = if prefix == JWKS_CACHE {
+        "jwks"
+    } else {
+        "signed_jwks"
+    };
+
+    if let Some(keyset) = jwks_memory_get(&cache_key) {
+        metrics::JWKS_CACHE.inc(&[cache, "memory"]);
+        return Ok(keyset);
+    }
 
-    // Try cache first
-    let cached: Option<String> = redis::Cmd::get(&cache_key)
+    // One round trip for the cached JWKS, its remaining TTL and a recent failure.
+    let (cached, ttl, failed): (Option<String>, i64, Option<String>) = redis::pipe()
+        .get(&cache_key)
+        .ttl(&cache_key)
+        .get(&failed_key)
         .query_async(conn)
         .await
-        .unwrap_or(None);
+        .unwrap_or((None, -2, None));
 
-    if let Some(ref cached_json) = cached {
-        return parse_jwks_json(cached_json);
+    if let Some(cached_json) = cached
+        && let Ok(keyset) = parse_jwks_json(&cached_json)
+    {
+        if ttl > 0 {
+            let until = SystemTime::now() + Duration::from_secs(ttl as u64);
+            jwks_memory_put(&cache_key, &keyset, until);
+        }
+        metrics::JWKS_CACHE.inc(&[cache, "redis"]);
+        return Ok(keyset);
+    }
+    if let Some(message) = failed {
+        metrics::JWKS_CACHE.inc(&[cache, "negative"]);
+        bail!("{uri} failed within the last {JWKS_NEGATIVE_TTL_SECS}s: {message}");
     }
 
-    // Cache miss — fetch from URI
-    let body = get_query(uri).await?;
-    let keyset = parse_jwks_json(&body)?;
+    metrics::JWKS_CACHE.inc(&[cache, "fetch"]);
+    match fetch().await {
+        Ok((keyset, json, ttl)) => {
+            if ttl > 0 {
+                let _: Result<(), _> = redis::Cmd::set_ex(&cache_key, json, ttl)
+                    .query_async(conn)
+                    .await;
+                jwks_memory_put(
+                    &cache_key,
+                    &keyset,
+                    SystemTime::now() + Duration::from_secs(ttl),
+                );
+            }
+            Ok(keyset)
+        }
+        Err(e) => {
+            let _: Result<(), _> =
+                redis::Cmd::set_ex(&failed_key, e.to_string(), JWKS_NEGATIVE_TTL_SECS)
+                    .query_async(conn)
+                    .await;
+            Err(e)
+        }
+    }
+}
 
-    // Store raw JSON in Redis with 1-hour TTL
-    let _: Result<(), _> = redis::Cmd::set_ex(&cache_key, &body, 3600)
-        .query_async(conn)
-        .await;
+/// Fetch a JWKS from a URI with caching.
+///
+/// Checks process memory and Redis for a cached copy first. On cache miss,
+/// fetches from the URI and caches the JSON in Redis for
+/// `JWKS_CACHE_TTL_SECS`. Failures are negatively cached for a short time.
+pub async fn get_jwks_from_uri_cached(uri: &str, conn: &mut RedisConnection) -> Result<JwkSet> {
+    get_jwks_cached(uri, JWKS_CACHE, conn, || async {
+        let body = get_query(uri).await?;
+        let keyset = parse_jwks_json(&body)?;
+        Ok((keyset, body, JWKS_CACHE_TTL_SECS))
+    })
+    .await
+}
 
-    Ok(keyset)
+/// Fetch and verify a signed JWKS from a `signed_jwks_uri` with caching.
+///
+/// Only verified key sets are cached: the inner JWKS is stored in Redis
+/// until the JWT's `exp`, but at most `JWKS_CACHE_TTL_SECS`. Failed fetches
+/// and verifications are negatively cached for a short time.
+pub async fn get_signed_jwks_from_uri_cached(
+    uri: &str,
+    conn: &mut RedisConnection,
+) -> Result<JwkSet> {
+    get_jwks_cached(uri, SIGNED_JWKS_CACHE, conn, || async {
+        let body = get_query(uri).await?;
+        let keyset =
+            verify_signed_jwks_body(&body).map_err(|e| anyhow!("signed_jwks_uri {uri}: {e}"))?;
+        let (payload, _) = get_unverified_payload_header(&body)?;
+        let json = payload
+            .claim("jwks")
+            .map(|jwks| jwks.to_string())
+            .unwrap_or_default();
+        let ttl = payload
+            .expires_at()
+            .and_then(|exp| exp.duration_since(SystemTime::now()).ok())
+            .map_or(JWKS_CACHE_TTL_SECS, |left| {
+                left.as_secs().min(JWKS_CACHE_TTL_SECS)
+            });
+        Ok((keyset, json, ttl))
+    })
+    .await
 }
 
 /// Fetch a JWKS from a remote `signed_jwks_uri` endpoint.
@@ -830,9 +2253,7 @@ pub async fn get_jwks_from_uri_cached(
 /// 4. Verify the JWT against the inner JWKS using `verify_jwt_with_jwks`
 ///    (signature + temporal validation + `crit` check).
 ///
-/// Caching is intentionally NOT performed yet — a Redis cache parallel to
-/// the existing `inmor:jwks_cache:*` entries is planned. The HTML coverage
-/// page records this as future work.
+/// This function does not cache, see `get_signed_jwks_from_uri_cached`.
 pub async fn fetch_signed_jwks_from_uri(uri: &str) -> Result<JwkSet> {
     let body = get_query(uri).await?;
     verify_signed_jwks_body(&body).map_err(|e| anyhow!("signed_jwks_uri {uri}: {e}"))
@@ -881,7 +2302,7 @@ fn parse_jwks_json(json_str: &str) -> Result<JwkSet> {
 /// plain `jwks_uri` alongside `signed_jwks_uri`.
 pub async fn get_jwks_from_payload_or_uri(
     payload: &JwtPayload,
-    conn: &mut redis::aio::ConnectionManager,
+    conn: &mut RedisConnection,
 ) -> Result<JwkSet> {
     // Try inline jwks first.
     if let Ok(keyset) = get_jwks_from_payload(payload) {
@@ -893,7 +2314,7 @@ pub async fn get_jwks_from_payload_or_uri(
         && let Some(uri) = uri_value.as_str()
     {
         debug!("No inline jwks, fetching from signed_jwks_uri: {}", uri);
-        match fetch_signed_jwks_from_uri(uri).await {
+        match get_signed_jwks_from_uri_cached(uri, conn).await {
             Ok(keyset) => return Ok(keyset),
             Err(e) => {
                 warn!("signed_jwks_uri {uri} failed: {e}; falling back to jwks_uri if present");
@@ -1447,6 +2868,219 @@ const MAX_TRUST_MARKS_PER_RESOLVE: usize = 32;
 /// (~20s) so a single slow issuer doesn't starve the rest.
 const TRUST_MARK_VERIFICATION_BUDGET_SECS: u64 = 30;
 
+/// Cached /resolve responses, one hash per subject. The field is the
+/// normalized query (trust anchors and entity types), the value a
+/// `ResolveCacheEntry`. The admin deletes the hash when the subject changes.
+pub(crate) const RESOLVE_CACHE: &str = "inmor:resolve:sub:";
+
+/// For every entity in a cached trust chain, the set of subjects whose cached
+/// responses contain it. Lets the admin invalidate all responses that depend
+/// on an intermediate when its subordinate statement changes.
+pub(crate) const RESOLVE_CACHE_CHAIN: &str = "inmor:resolve:chain:";
+
+/// Upper bound for how long a resolve response is served from the cache,
+/// regardless of the chain's `exp`. Bounds staleness for changes the admin
+/// can not see, e.g. a trust mark revoked by an external issuer.
+const RESOLVE_CACHE_MAX_TTL_SECS: u64 = 300;
+
+/// Resolve cache lookups answered from Redis, reported by `/status`.
+pub static RESOLVE_CACHE_HITS: AtomicU64 = AtomicU64::new(0);
+/// Resolve cache lookups that had to build the trust chain.
+pub static RESOLVE_CACHE_MISSES: AtomicU64 = AtomicU64::new(0);
+
+#[derive(Debug, Serialize, Deserialize)]
+struct ResolveCacheEntry {
+    /// Unix time after which the entry must not be served.
+    until: u64,
+    jwt: String,
+}
+
+/// Returns the cache field for a resolve query. Trust anchors and entity
+/// types are sorted and deduplicated, as their order does not change the
+/// response.
+fn resolve_cache_field(trust_anchors: &[String], entity_type: Option<&Vec<String>>) -> String {
+    let mut tas: Vec<&str> = trust_anchors.iter().map(|s| s.as_str()).collect();
+    tas.sort_unstable();
+    tas.dedup();
+    let mut types: Vec<&str> = entity_type
+        .map(|v| v.iter().map(|s| s.as_str()).collect())
+        .unwrap_or_default();
+    types.sort_unstable();
+    types.dedup();
+    format!("{}|{}", tas.join(" "), types.join(" "))
+}
+
+fn unix_now() -> u64 {
+    SystemTime::now()
+        .duration_since(SystemTime::UNIX_EPOCH)
+        .map_or(0, |d| d.as_secs())
+}
+
+/// Returns a cached resolve response, if there is one that is still valid.
+async fn get_cached_resolve(conn: &mut RedisConnection, sub: &str, field: &str) -> Option<String> {
+    let raw: Option<String> = match redis::Cmd::hget(format!("{RESOLVE_CACHE}{sub}"), field)
+        .query_async(conn)
+        .await
+    {
+        Ok(raw) => raw,
+        Err(e) => {
+            warn!("resolve cache: failed to read entry for {sub}: {e}");
+            return None;
+        }
+    };
+    let entry: ResolveCacheEntry = serde_json::from_str(&raw?).ok()?;
+    (entry.until > unix_now()).then_some(entry.jwt)
+}
+
+/// Stores a resolve response until the minimum `exp` of its trust chain and
+/// trust marks (the response's own `exp`), capped at
+/// `RESOLVE_CACHE_MAX_TTL_SECS`. Failures are logged and otherwise ignored.
+async fn store_cached_resolve(
+    conn: &mut RedisConnection,
+    sub: &str,
+    field: &str,
+    chain: &[VerifiedJWT],
+    resp: &str,
+) {
+    let now = unix_now();
+    let exp = get_unverified_payload_header(resp)
+        .ok()
+        .and_then(|(payload, _)| payload.expires_at())
+        .and_then(|t| t.duration_since(SystemTime::UNIX_EPOCH).ok())
+        .map_or(now, |d| d.as_secs());
+    let until = exp.min(now + RESOLVE_CACHE_MAX_TTL_SECS);
+    if until <= now {
+        return;
+    }
+    let entry = ResolveCacheEntry {
+        until,
+        jwt: resp.to_string(),
+    };
+    let Ok(value) = serde_json::to_string(&entry) else {
+        return;
+    };
+
+    let mut members: HashSet<&str> = HashSet::new();
+    for vjwt in chain {
+        members.extend(vjwt.payload.issuer());
+        members.extend(vjwt.payload.subject());
+    }
+    let ttl = RESOLVE_CACHE_MAX_TTL_SECS as i64;
+    let key = format!("{RESOLVE_CACHE}{sub}");
+    let mut pipe = redis::pipe();
+    pipe.hset(&key, field, value).ignore();
+    pipe.expire(&key, ttl).ignore();
+    for member in members {
+        let chain_key = format!("{RESOLVE_CACHE_CHAIN}{member}");
+        pipe.sadd(&chain_key, sub).ignore();
+        pipe.expire(&chain_key, ttl).ignore();
+    }
+    if let Err(e) = pipe.query_async::<()>(conn).await {
+        warn!("resolve cache: failed to store entry for {sub}: {e}");
+    }
+}
+
+/// Redis hash of the pre-resolved trust chains of the TA's direct
+/// subordinates, entity_id → JSON [`ChainBundle`]. The admin writes a bundle
+/// whenever it registers or renews a subordinate, see
+/// `update_redis_with_subordinate` in `admin/entities/lib.py`.
+pub(crate) const CHAIN_BUNDLES: &str = "inmor:chain_bundles";
+
+/// A direct subordinate's entity configuration, as fetched and verified by
+/// the admin, with the subordinate statement the TA issued about it.
+#[derive(Debug, Deserialize)]
+struct ChainBundle {
+    entity_configuration: String,
+    subordinate_statement: String,
+    /// The earlier `exp` of the two statements.
+    exp: u64,
+}
+
+/// Returns the trust chain of a direct subordinate up to this TA from its
+/// bundle, without any outbound fetch. Returns None, so that the chain is
+/// walked remotely, when there is no bundle, when it has expired or when one
+/// of its links does not verify.
+async fn chain_from_bundle(
+    conn: &mut RedisConnection,
+    sub: &str,
+    ta_entity_id: &str,
+) -> Option<Vec<VerifiedJWT>> {
+    let (raw, ta_ec): (Option<String>, Option<String>) = match redis::pipe()
+        .hget(CHAIN_BUNDLES, sub)
+        .get("inmor:entity_id")
+        .query_async(conn)
+        .await
+    {
+        Ok(res) => res,
+        Err(e) => {
+            warn!("chain bundle: failed to read bundle for {sub}: {e}");
+            return None;
+        }
+    };
+    let bundle: ChainBundle = serde_json::from_str(&raw?).ok()?;
+    if bundle.exp <= unix_now() {
+        metrics::RESOLVE_CHAIN_BUNDLES.inc(&["stale"]);
+        return None;
+    }
+    match verify_chain_bundle(sub, bundle, ta_entity_id, ta_ec?) {
+        Ok(chain) => {
+            metrics::RESOLVE_CHAIN_BUNDLES.inc(&["used"]);
+            Some(chain)
+        }
+        Err(e) => {
+            warn!("chain bundle: ignoring bundle of {sub}: {e}");
+            metrics::RESOLVE_CHAIN_BUNDLES.inc(&["invalid"]);
+            None
+        }
+    }
+}
+
+/// Verifies the links of a chain bundle the same way the walker verifies a
+/// fetched chain, and returns the chain subject → TA.
+fn verify_chain_bundle(
+    sub: &str,
+    bundle: ChainBundle,
+    ta_entity_id: &str,
+    ta_ec: String,
+) -> Result<Vec<VerifiedJWT>> {
+    let (ec_payload, _) = self_verify_jwt(&bundle.entity_configuration)?;
+    if ec_payload.subject() != Some(sub) {
+        bail!("entity configuration is about {:?}", ec_payload.subject());
+    }
+    let names_ta = ec_payload
+        .claim("authority_hints")
+        .and_then(|hints| hints.as_array())
+        .is_some_and(|hints| hints.iter().any(|h| h.as_str() == Some(ta_entity_id)));
+    if !names_ta {
+        bail!("{ta_entity_id} is not in the authority_hints");
+    }
+
+    let (ta_payload, _) = self_verify_jwt(&ta_ec)?;
+    let ta_jwks = get_jwks_from_payload(&ta_payload)?;
+    let (ss_payload, _) = verify_jwt_with_jwks(&bundle.subordinate_statement, Some(ta_jwks))?;
+    if ss_payload.issuer() != Some(ta_entity_id) || ss_payload.subject() != Some(sub) {
+        bail!("subordinate statement is not issued by {ta_entity_id} about {sub}");
+    }
+    // Spec §3.2: the subject's entity configuration must be signed by a key
+    // in the subordinate statement's jwks.
+    let ss_jwks = get_jwks_from_payload(&ss_payload)?;
+    verify_jwt_with_jwks(&bundle.entity_configuration, Some(ss_jwks))?;
+    // Spec §6.2: the subject is the leaf, directly below the statement.
+    let ctx = WalkContext::from_subject_payload(sub, &ec_payload);
+    Constraints::from_payload(&ss_payload)?.check_subject(
+        &ctx.original_subject,
+        &ctx.original_subject_entity_types,
+        true,
+        0,
+    )?;
+
+    Ok(vec![
+        VerifiedJWT::new(bundle.entity_configuration, &ec_payload, false, false),
+        VerifiedJWT::new(bundle.subordinate_statement, &ss_payload, true, false),
+        VerifiedJWT::new(ta_ec, &ta_payload, false, true),
+    ])
+}
+
 /// Build the trust chain for `sub` up to one of `trust_anchors`.
 ///
 /// **Return contract**: `Ok(vec)` does NOT mean the chain reached a trust
@@ -1460,16 +3094,21 @@ const TRUST_MARK_VERIFICATION_BUDGET_SECS: u64 = 30;
 ///    requested trust anchor.
 ///
 /// `/resolve` (see `resolve_entity` below) enforces both checks and returns
-/// 400 `invalid_trust_chain` otherwise. The recursive caller inside this
-/// function continues to the next authority hint on a partial result via the
-/// `r_result.is_empty()` check below.
+/// 400 `invalid_trust_chain` otherwise. The recursive caller in
+/// `explore_authority_hint` gives up on an authority hint on a partial
+/// result via the `r_result.is_empty()` check, while the other hints are
+/// still explored.
+///
+/// `visited` is shared by all concurrently explored branches of one walk.
+#[allow(clippy::too_many_arguments)]
 pub async fn resolve_entity_to_trustanchor(
     sub: &str,
     trust_anchors: Vec<&str>,
     start: bool,
-    visited: &mut HashSet<String>,
+    visited: &Mutex<HashSet<String>>,
     depth: u8,
-    redis_conn: &mut redis::aio::ConnectionManager,
+    redis_conn: &mut RedisConnection,
+    federation: &Federation,
     ctx: Option<&WalkContext>,
 ) -> Result<Vec<VerifiedJWT>> {
     if depth > MAX_RESOLVE_DEPTH {
@@ -1494,15 +3133,27 @@ pub async fn resolve_entity_to_trustanchor(
     let mut result = Vec::new();
 
     // to stop infinite loop
-    // First get the entity configuration and self verify
-    let original_ec = match get_entity_configruation_as_jwt(sub).await {
+    // First get the entity configuration and self verify. The entity
+    // configurations of intermediates come verified from the shared cache.
+    let fetched = if start {
+        get_entity_configruation_as_jwt(sub)
+            .await
+            .map(|jwt| (jwt, None))
+    } else {
+        federation
+            .entity_configuration(sub)
+            .await
+            .map(|ec| (ec.jwt.clone(), Some(ec.payload.clone())))
+    };
+    let (original_ec, verified_payload) = match fetched {
         Ok(res) => res,
         Err(e) => {
-            warn!("Failed to fetch entity configuration for {}: {}", sub, e);
-            // Transient fetch failures bubble up so /resolve can emit 503.
-            // Permanent failures keep the legacy partial-chain behaviour
-            // (callers inspect `found_ta`).
-            if e.downcast_ref::<FetchError>().is_some_and(|f| f.transient) {
+            warn!("Failed to get entity configuration for {}: {}", sub, e);
+            // Transient fetch failures bubble up so /resolve can emit 503,
+            // as do verification failures of a cached intermediate.
+            // Permanent fetch failures keep the legacy partial-chain
+            // behaviour (callers inspect `found_ta`).
+            if e.downcast_ref::<FetchError>().is_none_or(|f| f.transient) {
                 return Err(e);
             }
             return Ok(result); // Read FOUND_TA section in code to find why it is okay to
@@ -1510,9 +3161,15 @@ pub async fn resolve_entity_to_trustanchor(
         }
     };
     // Add it already visited
-    visited.insert(sub.to_string());
-
-    let (opayload, _oheader) = self_verify_jwt(&original_ec)?;
+    visited
+        .lock()
+        .expect("visited lock poisoned")
+        .insert(sub.to_string());
+
+    let opayload = match verified_payload {
+        Some(payload) => payload,
+        None => self_verify_jwt(&original_ec)?.0,
+    };
 
     if start {
         let vjwt = VerifiedJWT::new(original_ec.clone(), &opayload, false, false);
@@ -1544,195 +3201,254 @@ pub async fn resolve_entity_to_trustanchor(
     let Some(ah_array) = authority_hints.as_array() else {
         return Ok(result); // Return if not an array
     };
-    for ah in ah_array {
-        // Flag to mark if we found the trust anchor
-        let mut ta_flag = false;
-        // Get the str from the JSON value
-        let Some(ah_entity) = ah.as_str() else {
-            continue; // Skip if not a string
-        };
-        // If we already visited the authority then continue
-        if visited.contains(ah_entity) {
-            continue;
-        }
-        // If this is one of the trust anchor, then we are done
-        if trust_anchors.contains(&ah_entity) {
-            // Means we found our trust anchor
-            ta_flag = true;
+    // Explore the authority hints concurrently, at most
+    // MAX_AUTHORITY_HINT_FANOUT at a time. The first hint that leads to a
+    // requested trust anchor wins; returning drops `pending`, which cancels
+    // the fetches still in flight.
+    let original_ec = original_ec.as_str();
+    let tas = trust_anchors.as_slice();
+    let mut hints = ah_array.iter().filter_map(|ah| ah.as_str());
+    let mut pending = FuturesUnordered::new();
+    let mut first_error: Option<anyhow::Error> = None;
+    loop {
+        while pending.len() < MAX_AUTHORITY_HINT_FANOUT {
+            let Some(ah_entity) = hints.next() else {
+                break;
+            };
+            // If we already visited the authority then skip it. An
+            // authority only becomes visited when the walk enters it, after
+            // its subordinate statement about `sub` has verified, so a
+            // branch that fails on a shared intermediate does not block the
+            // sibling branches that reach it.
+            if visited
+                .lock()
+                .expect("visited lock poisoned")
+                .contains(ah_entity)
+            {
+                continue;
+            }
+            // If this is one of the trust anchor, then the chain ends there
+            let ta_flag = tas.contains(&ah_entity);
+            let mut conn = redis_conn.clone();
+            pending.push(async move {
+                explore_authority_hint(
+                    sub,
+                    ah_entity,
+                    ta_flag,
+                    original_ec,
+                    tas,
+                    visited,
+                    depth,
+                    &mut conn,
+                    federation,
+                    walk_ctx,
+                )
+                .await
+            });
         }
-        // §10.5 — re-check budget before each outbound fetch in the loop.
-        check_chain_fetch_budget(Some(walk_ctx), sub)?;
-        // Fetch the authority's entity configuration
-        let ah_jwt = match get_entity_configruation_as_jwt(ah_entity).await {
-            Ok(res) => res,
+        let Some(outcome) = pending.next().await else {
+            break;
+        };
+        match outcome {
+            Ok(Some(chain)) => {
+                result.extend(chain);
+                return Ok(result);
+            }
+            Ok(None) => {}
+            // Keep going, another hint may still reach a trust anchor.
             Err(e) => {
-                warn!(
-                    "Failed to fetch authority entity configuration for {}: {}",
-                    ah_entity, e
-                );
-                if e.downcast_ref::<FetchError>().is_some_and(|f| f.transient) {
-                    return Err(e);
-                }
-                return Ok(result); // Read FOUND_TA section in code to find why it is okay to
-                // result a half done list back.
+                first_error.get_or_insert(e);
             }
-        };
+        }
+    }
+    // Transient failures surface as 503 from /resolve when no hint succeeded.
+    if let Some(e) = first_error {
+        return Err(e);
+    }
+    Ok(vec![])
+}
 
-        // Verify and get the payload
-        let jwt_result = self_verify_jwt(&ah_jwt);
-        if jwt_result.is_err() {
+/// Maximum number of authority hints of one entity that are explored
+/// concurrently. Bounds the outbound fan-out of a single /resolve per level
+/// of the chain.
+const MAX_AUTHORITY_HINT_FANOUT: usize = 4;
+
+/// Explore one authority hint of `sub`: fetch the authority's entity
+/// configuration and its subordinate statement about `sub`, verify both and
+/// continue upwards unless the authority is a requested trust anchor.
+///
+/// Returns the chain from the subordinate statement up to the trust anchor,
+/// `None` when this authority does not lead to one, and `Err` on transient
+/// fetch failures or when the fetch budget or maximum depth is exceeded.
+#[allow(clippy::too_many_arguments)]
+async fn explore_authority_hint(
+    sub: &str,
+    ah_entity: &str,
+    ta_flag: bool,
+    original_ec: &str,
+    trust_anchors: &[&str],
+    visited: &Mutex<HashSet<String>>,
+    depth: u8,
+    redis_conn: &mut RedisConnection,
+    federation: &Federation,
+    walk_ctx: &WalkContext,
+) -> Result<Option<Vec<VerifiedJWT>>> {
+    // §10.5 — re-check budget before each outbound fetch.
+    check_chain_fetch_budget(Some(walk_ctx), sub)?;
+    // Fetch and verify the authority's entity configuration
+    let ah_ec = match federation.entity_configuration(ah_entity).await {
+        Ok(res) => res,
+        Err(e) => {
             warn!(
-                "Failed to verify authority JWT for {}: {:?}",
-                ah_entity,
-                jwt_result.err()
+                "Failed to get authority entity configuration for {}: {}",
+                ah_entity, e
             );
-            continue;
+            if e.downcast_ref::<FetchError>().is_some_and(|f| f.transient) {
+                return Err(e);
+            }
+            return Ok(None);
         }
-
-        let (ah_payload, _) = jwt_result.expect("This can not be error here.");
-        let Some(ah_metadata) = ah_payload.claim("metadata") else {
-            warn!("Missing metadata in authority payload for: {}", ah_entity);
-            continue;
-        };
-        let Some(federation_entity) = ah_metadata.get("federation_entity") else {
-            warn!("Missing federation_entity in metadata for: {}", ah_entity);
-            continue;
-        };
-        let Some(fetch_endpoint) = federation_entity.get("federation_fetch_endpoint") else {
-            warn!("Missing federation_fetch_endpoint for: {}", ah_entity);
-            continue;
-        };
-        let Some(fetch_endpoint_str) = fetch_endpoint.as_str() else {
+    };
+    let ah_payload = &ah_ec.payload;
+    let Some(ah_metadata) = ah_payload.claim("metadata") else {
+        warn!("Missing metadata in authority payload for: {}", ah_entity);
+        return Ok(None);
+    };
+    let Some(federation_entity) = ah_metadata.get("federation_entity") else {
+        warn!("Missing federation_entity in metadata for: {}", ah_entity);
+        return Ok(None);
+    };
+    let Some(fetch_endpoint) = federation_entity.get("federation_fetch_endpoint") else {
+        warn!("Missing federation_fetch_endpoint for: {}", ah_entity);
+        return Ok(None);
+    };
+    let Some(fetch_endpoint_str) = fetch_endpoint.as_str() else {
+        warn!(
+            "federation_fetch_endpoint is not a string for: {}",
+            ah_entity
+        );
+        return Ok(None);
+    };
+    // §10.5 — re-check budget before each outbound fetch.
+    check_chain_fetch_budget(Some(walk_ctx), sub)?;
+    // Fetch the entity statement/ subordinate statement
+    let sub_statement = match federation
+        .subordinate_statement(fetch_endpoint_str, sub)
+        .await
+    {
+        Ok(res) => res.jwt.clone(),
+        Err(e) => {
             warn!(
-                "federation_fetch_endpoint is not a string for: {}",
-                ah_entity
+                "Failed to fetch subordinate statement for {} from {}: {}",
+                sub, ah_entity, e
             );
-            continue;
-        };
-        // §10.5 — re-check budget before each outbound fetch.
-        check_chain_fetch_budget(Some(walk_ctx), sub)?;
-        // Fetch the entity statement/ subordinate statement
-        let sub_statement = match fetch_subordinate_statement(fetch_endpoint_str, sub).await {
-            Ok(res) => res,
-            Err(e) => {
-                warn!(
-                    "Failed to fetch subordinate statement for {} from {}: {}",
-                    sub, ah_entity, e
-                );
-                if e.downcast_ref::<FetchError>().is_some_and(|f| f.transient) {
-                    return Err(e);
-                }
-                return Ok(result); // Read FOUND_TA section in code to find why it is okay to
-                // result a half done list back.
-            }
-        };
-        // Get the authority's JWKS (inline, or via jwks_uri fallback) and verify the subordinate statement.
-        let ah_jwks = match get_jwks_from_payload_or_uri(&ah_payload, redis_conn).await {
-            Ok(result) => result,
-            Err(e) => {
-                warn!(
-                    "Failed to get JWKS from authority payload for {}: {}",
-                    ah_entity, e
-                );
-                continue;
-            }
-        };
-        let (subs_payload, _) = match verify_jwt_with_jwks(&sub_statement, Some(ah_jwks)) {
-            Ok(value) => value,
-            Err(e) => {
-                warn!(
-                    "Failed to verify subordinate statement for {} from {}: {}",
-                    sub, ah_entity, e
-                );
-                continue;
-            }
-        };
-
-        // Spec §3.2: ES[j] MUST be signed by a key in ES[j+1].jwks. We bind by
-        // key material, not by `kid`: re-verify the subject's self-EC against
-        // the subordinate statement's authoritative `jwks`. A successful
-        // signature check proves the actual signing key is present in that
-        // JWKS. Matching on `kid` strings alone would let an authority list a
-        // different key under the same `kid` and bypass the chain-link check.
-        let ss_jwks = match get_jwks_from_payload(&subs_payload) {
-            Ok(j) => j,
-            Err(e) => {
-                warn!(
-                    "trust chain: subordinate statement from {ah_entity} for {sub} has no usable jwks ({e}); skipping authority"
-                );
-                continue;
+            if e.downcast_ref::<FetchError>().is_some_and(|f| f.transient) {
+                return Err(e);
             }
-        };
-        if let Err(e) = verify_jwt_with_jwks(&original_ec, Some(ss_jwks)) {
+            return Ok(None);
+        }
+    };
+    // Get the authority's JWKS (inline, or via jwks_uri fallback) and verify the subordinate statement.
+    let ah_jwks = match get_jwks_from_payload_or_uri(ah_payload, redis_conn).await {
+        Ok(result) => result,
+        Err(e) => {
             warn!(
-                "trust chain: {sub} EC not signed by any key in subordinate statement jwks from {ah_entity} ({e}); skipping authority"
+                "Failed to get JWKS from authority payload for {}: {}",
+                ah_entity, e
             );
-            continue;
+            return Ok(None);
         }
-
-        // Spec §6.2: enforce the Subordinate Statement's `constraints`
-        // (max_path_length, permitted/excluded_subtrees, allowed entity
-        // types) against the resolve subject. `depth` at this point is the
-        // number of entities below `sub` in the chain (depth=0 means `sub`
-        // is the leaf and the SS is directly about it).
-        let ss_constraints = match Constraints::from_payload(&subs_payload) {
-            Ok(c) => c,
-            Err(e) => {
-                // Malformed `constraints` is a verification failure for
-                // this SS — refuse to silently disable enforcement.
-                warn!(
-                    "trust chain: malformed constraints in subordinate statement from {ah_entity} ({e}); skipping authority"
-                );
-                continue;
-            }
-        };
-        let is_leaf = depth == 0;
-        if let Err(e) = ss_constraints.check_subject(
-            &walk_ctx.original_subject,
-            &walk_ctx.original_subject_entity_types,
-            is_leaf,
-            depth,
-        ) {
+    };
+    let (subs_payload, _) = match verify_jwt_with_jwks(&sub_statement, Some(ah_jwks)) {
+        Ok(value) => value,
+        Err(e) => {
+            warn!(
+                "Failed to verify subordinate statement for {} from {}: {}",
+                sub, ah_entity, e
+            );
+            return Ok(None);
+        }
+    };
+
+    // Spec §3.2: ES[j] MUST be signed by a key in ES[j+1].jwks. We bind by
+    // key material, not by `kid`: re-verify the subject's self-EC against
+    // the subordinate statement's authoritative `jwks`. A successful
+    // signature check proves the actual signing key is present in that
+    // JWKS. Matching on `kid` strings alone would let an authority list a
+    // different key under the same `kid` and bypass the chain-link check.
+    let ss_jwks = match get_jwks_from_payload(&subs_payload) {
+        Ok(j) => j,
+        Err(e) => {
             warn!(
-                "trust chain: constraints in subordinate statement from {ah_entity} reject {sub} ({e}); skipping authority"
+                "trust chain: subordinate statement from {ah_entity} for {sub} has no usable jwks ({e}); skipping authority"
             );
-            continue;
+            return Ok(None);
         }
+    };
+    if let Err(e) = verify_jwt_with_jwks(&original_ec, Some(ss_jwks)) {
+        warn!(
+            "trust chain: {sub} EC not signed by any key in subordinate statement jwks from {ah_entity} ({e}); skipping authority"
+        );
+        return Ok(None);
+    }
 
-        if ta_flag {
-            // Means this is the end of resolving
-            let vjwt = VerifiedJWT::new(sub_statement, &subs_payload, true, false);
-            result.push(vjwt);
-            let ajwt = VerifiedJWT::new(ah_jwt.clone(), &ah_payload, false, true);
-            result.push(ajwt);
-            return Ok(result);
-        } else {
-            // §10.5 — budget check before descending one more level so a
-            // pathological intermediate can't burn the whole budget on
-            // recursive fetches before bailing out.
-            check_chain_fetch_budget(Some(walk_ctx), sub)?;
-            // Now do a recursive query
-            let r_result = Box::pin(resolve_entity_to_trustanchor(
-                ah_entity,
-                trust_anchors.clone(),
-                false,
-                visited,
-                depth + 1,
-                redis_conn,
-                Some(walk_ctx),
-            ))
-            .await?;
-            if r_result.is_empty() {
-                continue;
-            } else {
-                let vjwt = VerifiedJWT::new(sub_statement, &subs_payload, true, false);
-                result.push(vjwt);
-                result.extend(r_result);
-            }
-            return Ok(result);
+    // Spec §6.2: enforce the Subordinate Statement's `constraints`
+    // (max_path_length, permitted/excluded_subtrees, allowed entity
+    // types) against the resolve subject. `depth` at this point is the
+    // number of entities below `sub` in the chain (depth=0 means `sub`
+    // is the leaf and the SS is directly about it).
+    let ss_constraints = match Constraints::from_payload(&subs_payload) {
+        Ok(c) => c,
+        Err(e) => {
+            // Malformed `constraints` is a verification failure for
+            // this SS — refuse to silently disable enforcement.
+            warn!(
+                "trust chain: malformed constraints in subordinate statement from {ah_entity} ({e}); skipping authority"
+            );
+            return Ok(None);
         }
+    };
+    let is_leaf = depth == 0;
+    if let Err(e) = ss_constraints.check_subject(
+        &walk_ctx.original_subject,
+        &walk_ctx.original_subject_entity_types,
+        is_leaf,
+        depth,
+    ) {
+        warn!(
+            "trust chain: constraints in subordinate statement from {ah_entity} reject {sub} ({e}); skipping authority"
+        );
+        return Ok(None);
+    }
+
+    let vjwt = VerifiedJWT::new(sub_statement, &subs_payload, true, false);
+    if ta_flag {
+        // Means this is the end of resolving
+        let ajwt = VerifiedJWT::new(ah_ec.jwt.clone(), ah_payload, false, true);
+        return Ok(Some(vec![vjwt, ajwt]));
+    }
+    // §10.5 — budget check before descending one more level so a
+    // pathological intermediate can't burn the whole budget on
+    // recursive fetches before bailing out.
+    check_chain_fetch_budget(Some(walk_ctx), sub)?;
+    // Now do a recursive query
+    let r_result = Box::pin(resolve_entity_to_trustanchor(
+        ah_entity,
+        trust_anchors.to_vec(),
+        false,
+        visited,
+        depth + 1,
+        redis_conn,
+        federation,
+        Some(walk_ctx),
+    ))
+    .await?;
+    if r_result.is_empty() {
+        return Ok(None);
     }
-    Ok(vec![])
+    let mut chain = vec![vjwt];
+    chain.extend(r_result);
+    Ok(Some(chain))
 }
 
 /// To create the signed JWT for resolve response
@@ -1810,7 +3526,7 @@ async fn verify_ta_issued_trust_mark(
     trust_mark_jwt: &str,
     ta_entity_id: &str,
     ta_public_keyset: &JwkSet,
-    conn: &mut redis::aio::ConnectionManager,
+    conn: &mut RedisConnection,
     trust_mark_owners: &TrustMarkOwners,
     trust_mark_type: &str,
 ) -> bool {
@@ -1942,10 +3658,7 @@ type IssuerInfoCache = HashMap<String, Option<IssuerInfo>>;
 ///
 /// Returns `None` (and logs at WARN) on any failure: fetch error, parse error,
 /// JWKS resolution failure, signature failure, or missing status endpoint.
-async fn resolve_external_issuer(
-    issuer: &str,
-    conn: &mut redis::aio::ConnectionManager,
-) -> Option<IssuerInfo> {
+async fn resolve_external_issuer(issuer: &str, conn: &mut RedisConnection) -> Option<IssuerInfo> {
     // 1. Fetch the issuer's entity configuration over the SSRF-safe path.
     let ec_jwt = match get_entity_configruation_as_jwt(issuer).await {
         Ok(s) => s,
@@ -2098,7 +3811,7 @@ async fn verify_single_trust_mark(
     issuer: &str,
     ta_entity_id: &str,
     ta_public_keyset: &JwkSet,
-    conn: &mut redis::aio::ConnectionManager,
+    conn: &mut RedisConnection,
     issuer_cache: &mut IssuerInfoCache,
     trust_mark_owners: &TrustMarkOwners,
     trust_mark_type: &str,
@@ -2271,7 +3984,7 @@ async fn verify_trust_marks_for_resolve(
     subject_payload: &JwtPayload,
     ta_entity_id: &str,
     ta_public_keyset: &JwkSet,
-    conn: &mut redis::aio::ConnectionManager,
+    conn: &mut RedisConnection,
 ) -> Vec<Value> {
     // 1. Subject's trust marks.
     let trust_marks = match subject_payload
@@ -2386,6 +4099,7 @@ async fn verify_trust_marks_for_resolve(
         let allowed = trust_mark_issuers.get(tm_type).and_then(|v| v.as_array());
         let owner = trust_mark_owners.get(tm_type);
         if allowed.is_none() && owner.is_none() {
+            metrics::TRUST_MARK_VERIFICATIONS.inc(&["unrecognized"]);
             continue;
         }
 
@@ -2393,6 +4107,7 @@ async fn verify_trust_marks_for_resolve(
             Ok(p) => p,
             Err(e) => {
                 warn!("trust mark resolve: failed to parse trust mark JWT: {e}");
+                metrics::TRUST_MARK_VERIFICATIONS.inc(&["malformed"]);
                 continue;
             }
         };
@@ -2411,6 +4126,7 @@ async fn verify_trust_marks_for_resolve(
             warn!(
                 "trust mark resolve: outer trust_mark_type {tm_type} != inner {inner_tm_type} (spec §7.4); skipping"
             );
+            metrics::TRUST_MARK_VERIFICATIONS.inc(&["malformed"]);
             continue;
         }
 
@@ -2422,12 +4138,14 @@ async fn verify_trust_marks_for_resolve(
             warn!(
                 "trust mark resolve: trust mark sub {mark_sub} != resolved subject {resolve_sub}; skipping"
             );
+            metrics::TRUST_MARK_VERIFICATIONS.inc(&["malformed"]);
             continue;
         }
 
         let issuer = unverified_payload.issuer().unwrap_or("").to_string();
         if issuer.is_empty() {
             warn!("trust mark resolve: trust mark JWT has empty `iss`");
+            metrics::TRUST_MARK_VERIFICATIONS.inc(&["malformed"]);
             continue;
         }
 
@@ -2446,6 +4164,7 @@ async fn verify_trust_marks_for_resolve(
                     warn!(
                         "trust mark resolve: issuer {issuer} not in allowed list for type {tm_type}; skipping"
                     );
+                    metrics::TRUST_MARK_VERIFICATIONS.inc(&["issuer_not_allowed"]);
                     continue;
                 }
             }
@@ -2463,7 +4182,10 @@ async fn verify_trust_marks_for_resolve(
         )
         .await
         {
+            metrics::TRUST_MARK_VERIFICATIONS.inc(&["verified"]);
             verified.push(tm.clone());
+        } else {
+            metrics::TRUST_MARK_VERIFICATIONS.inc(&["rejected"]);
         }
     }
 
@@ -2474,8 +4196,9 @@ async fn verify_trust_marks_for_resolve(
 #[get("/resolve")]
 pub async fn resolve_entity(
     info: Query<ResolveParams>,
-    redis: web::Data<redis::Client>,
+    redis: web::Data<RedisPool>,
     state: web::Data<AppState>,
+    federation: web::Data<Federation>,
 ) -> actix_web::Result<HttpResponse> {
     let mut found_ta = false;
     let ResolveParams {
@@ -2483,49 +4206,79 @@ pub async fn resolve_entity(
         trust_anchors,
         entity_type,
     } = info.into_inner();
-    let tas: Vec<&str> = trust_anchors.iter().map(|s| s as &str).collect();
-    let mut visisted: HashSet<String> = HashSet::new();
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
-    // Now loop over the trust_anchors
-    let result =
-        match resolve_entity_to_trustanchor(&sub, tas, true, &mut visisted, 0, &mut conn, None)
+    let mut conn = redis.get();
+
+    // Repeated queries for the same subject are answered from the cache,
+    // without fetching and verifying the chain again.
+    let cache_field = resolve_cache_field(&trust_anchors, entity_type.as_ref());
+    if let Some(cached) = get_cached_resolve(&mut conn, &sub, &cache_field).await {
+        RESOLVE_CACHE_HITS.fetch_add(1, std::sync::atomic::Ordering::Relaxed);
+        return Ok(HttpResponse::Ok()
+            .insert_header(("content-type", "application/resolve-response+jwt"))
+            .body(cached));
+    }
+    RESOLVE_CACHE_MISSES.fetch_add(1, std::sync::atomic::Ordering::Relaxed);
+
+    // Chains of our own direct subordinates are pre-resolved by the admin.
+    let bundled = if trust_anchors.contains(&state.entity_id) {
+        chain_from_bundle(&mut conn, &sub, &state.entity_id).await
+    } else {
+        None
+    };
+
+    let (walked, fetches) = match bundled {
+        Some(chain) => (Ok(chain), 0),
+        None => {
+            let tas: Vec<&str> = trust_anchors.iter().map(|s| s as &str).collect();
+            let visisted: Mutex<HashSet<String>> = Mutex::new(HashSet::new());
+            // Now loop over the trust_anchors
+            metrics::count_fetches(resolve_entity_to_trustanchor(
+                &sub,
+                tas,
+                true,
+                &visisted,
+                0,
+                &mut conn,
+                &federation,
+                None,
+            ))
             .await
-        {
-            Ok(res) => res,
-            Err(e) => {
-                warn!("Error resolving entity {} to trust anchors: {}", sub, e);
-                // Spec §10.5 — a transient fetch failure surfaces as
-                // HTTP 503 + `Retry-After` so the client can back off and
-                // retry. Permanent failures keep the existing 400
-                // `invalid_trust_chain` shape.
-                if let Some(fe) = e.downcast_ref::<FetchError>()
-                    && fe.transient
-                {
-                    let retry_after = fe.retry_after_seconds.unwrap_or(DEFAULT_RETRY_AFTER_SECS);
-                    return Ok(HttpResponse::ServiceUnavailable()
-                        .insert_header(("Retry-After", retry_after.to_string()))
-                        .json(json!({
-                            "error": "temporarily_unavailable",
-                            "error_description": fe.message,
-                        })));
-                }
-                // Surface the underlying error message. The early walker
-                // returns from this branch are dominated by leaf EC
-                // self-verification failures (bad signature, missing
-                // jwks, unknown critical claim per §3.1.1, iss != sub)
-                // -- exactly the cases where a precise reason helps the
-                // operator diagnose a federation misconfiguration. The
-                // messages come from internal verifier code, not user
-                // input, so echoing them is safe.
-                return error_response_400(
-                    "invalid_trust_chain",
-                    &format!("Failed to find trust chain: {e}"),
-                );
+        }
+    };
+    metrics::RESOLVE_FETCHES.observe(fetches as f64, &[]);
+    let result = match walked {
+        Ok(res) => res,
+        Err(e) => {
+            warn!("Error resolving entity {} to trust anchors: {}", sub, e);
+            // Spec §10.5 — a transient fetch failure surfaces as
+            // HTTP 503 + `Retry-After` so the client can back off and
+            // retry. Permanent failures keep the existing 400
+            // `invalid_trust_chain` shape.
+            if let Some(fe) = e.downcast_ref::<FetchError>()
+                && fe.transient
+            {
+                let retry_after = fe.retry_after_seconds.unwrap_or(DEFAULT_RETRY_AFTER_SECS);
+                return Ok(HttpResponse::ServiceUnavailable()
+                    .insert_header(("Retry-After", retry_after.to_string()))
+                    .json(json!({
+                        "error": "temporarily_unavailable",
+                        "error_description": fe.message,
+                    })));
             }
-        };
+            // Surface the underlying error message. The early walker
+            // returns from this branch are dominated by leaf EC
+            // self-verification failures (bad signature, missing
+            // jwks, unknown critical claim per §3.1.1, iss != sub)
+            // -- exactly the cases where a precise reason helps the
+            // operator diagnose a federation misconfiguration. The
+            // messages come from internal verifier code, not user
+            // input, so echoing them is safe.
+            return error_response_400(
+                "invalid_trust_chain",
+                &format!("Failed to find trust chain: {e}"),
+            );
+        }
+    };
 
     // Verify that the result is not empty and we actually found a TA
     if result.is_empty() {
@@ -2541,6 +4294,7 @@ pub async fn resolve_entity(
         warn!("No trust anchor found in chain for entity: {}", sub);
         return error_response_400("invalid_trust_chain", "Failed to find trust chain");
     }
+    metrics::RESOLVE_CHAIN_LENGTH.observe(result.len() as f64, &[]);
 
     // Per spec §8.3: "The resolver MUST verify that all present Trust Marks with
     // identifiers recognized within the Federation are active. The response set
@@ -2705,6 +4459,7 @@ pub async fn resolve_entity(
     // If we reach here means we have a list of JWTs and also verified metadata.
     let resp = create_resolve_response_jwt(&state, &sub, &result, filtered_metadata, trust_marks)
         .map_err(error::ErrorInternalServerError)?;
+    store_cached_resolve(&mut conn, &sub, &cache_field, &result, &resp).await;
     Ok(HttpResponse::Ok()
         .insert_header(("content-type", "application/resolve-response+jwt"))
         .body(resp))
@@ -2768,37 +4523,28 @@ fn create_trustmark_status_response_jwt(
     create_signed_jwt(&payload, &key, Some("trust-mark-status-response+jwt"))
 }
 
-/// https://openid.net/specs/openid-federation-1_0.html#section-8.4.1
-///
-/// Per spec §8.4.1, requests use `application/x-www-form-urlencoded`. Actix's
-/// `web::Form` extractor enforces this for us: a request with the wrong
-/// Content-Type fails extraction with `UrlencodedError::ContentType`, which
-/// actix renders as `415 Unsupported Media Type` before the handler runs.
-#[post("/trust_mark_status")]
-pub async fn trust_mark_status(
-    info: web::Form<TrustMarkStatusParams>,
-    redis: web::Data<redis::Client>,
-    state: web::Data<AppState>,
-) -> actix_web::Result<HttpResponse> {
-    let TrustMarkStatusParams { trust_mark } = info.into_inner();
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
-
-    // Create sha256sum of the trust_mark and see if it exists in `inmor:tm:alltime` set.
-    let mut hasher = Sha256::new();
-    hasher.update(trust_mark.as_bytes());
-    let trust_mark_hash = format!("{:x}", hasher.finalize());
+/// Works out the `/trust_mark_status` verdict of a mark: its status, `sub`
+/// and `exp`. Returns the error response instead for unknown marks and
+/// marks whose claims cannot be used as Redis keys.
+async fn trust_mark_status_verdict(
+    trust_mark: &str,
+    trust_mark_hash: &str,
+    redis: &RedisPool,
+    state: &AppState,
+) -> actix_web::Result<Result<(&'static str, String, Option<SystemTime>), HttpResponse>> {
+    let mut conn = redis.get();
 
-    let exists: bool = redis::Cmd::sismember("inmor:tm:alltime", &trust_mark_hash)
+    let exists: bool = redis::Cmd::sismember("inmor:tm:alltime", trust_mark_hash)
         .query_async::<bool>(&mut conn)
         .await
         .map_err(error::ErrorInternalServerError)?;
 
     if !exists {
         debug!("Trust mark not found in Redis: hash={}", trust_mark_hash);
-        return error_response_404("not_found", "Trust mark not found.");
+        return Ok(Err(error_response_404(
+            "not_found",
+            "Trust mark not found.",
+        )?));
     }
 
     // Verify the signature first (no temporal validation yet). This is the
@@ -2811,8 +4557,8 @@ pub async fn trust_mark_status(
     // signature, which let an attacker forge an "expired" classification by
     // submitting a JWT with any `exp` and a bad signature.
     let jwks = state.public_keyset.clone();
-    let status = match verify_jwt_signature_with_jwks(&trust_mark, Some(jwks)) {
-        Err(_) => "invalid",
+    let verdict = match verify_jwt_signature_with_jwks(trust_mark, Some(jwks)) {
+        Err(_) => ("invalid", String::new(), None),
         // Spec §3.1.1 — an unknown critical claim makes the mark
         // unprocessable. Classify it as "invalid" alongside bad-signature
         // failures rather than letting it through to the active/expired
@@ -2820,17 +4566,17 @@ pub async fn trust_mark_status(
         // does not interfere with the active-vs-expired distinction:
         // a signed-but-expired mark with a clean `crit` is still
         // classified as "expired".
-        Ok((payload, _)) if enforce_crit_claim(&payload).is_err() => "invalid",
+        Ok((payload, _)) if enforce_crit_claim(&payload).is_err() => {
+            ("invalid", String::new(), None)
+        }
         Ok((payload, _)) => {
-            let expired = payload
-                .expires_at()
-                .map(|exp| exp <= SystemTime::now())
-                .unwrap_or(false);
+            let sub = payload.subject().unwrap_or("").to_string();
+            let exp = payload.expires_at();
+            let expired = exp.map(|exp| exp <= SystemTime::now()).unwrap_or(false);
             if expired {
-                "expired"
+                ("expired", sub, None)
             } else {
                 let v = json!("");
-                let sub = payload.subject().unwrap_or("");
                 let claims = payload.claims_set();
                 let trustmarktype = claims
                     .get("trust_mark_type")
@@ -2838,17 +4584,17 @@ pub async fn trust_mark_status(
                     .as_str()
                     .unwrap_or("");
 
-                if let Err(e) = validate_redis_key_input(sub) {
-                    return error_response_400(
+                if let Err(e) = validate_redis_key_input(&sub) {
+                    return Ok(Err(error_response_400(
                         "invalid_request",
                         &format!("invalid sub in JWT: {e}"),
-                    );
+                    )?));
                 }
                 if let Err(e) = validate_redis_key_input(trustmarktype) {
-                    return error_response_400(
+                    return Ok(Err(error_response_400(
                         "invalid_request",
                         &format!("invalid trust_mark_type in JWT: {e}"),
-                    );
+                    )?));
                 }
 
                 let hkey = format!("inmor:tm:{sub}");
@@ -2858,13 +4604,55 @@ pub async fn trust_mark_status(
                     .map_err(error::ErrorInternalServerError)?;
 
                 if mark != "revoked" {
-                    "active"
+                    ("active", sub, exp)
                 } else {
-                    "revoked"
+                    ("revoked", sub, exp)
                 }
             }
         }
     };
+    Ok(Ok(verdict))
+}
+
+/// https://openid.net/specs/openid-federation-1_0.html#section-8.4.1
+///
+/// Per spec §8.4.1, requests use `application/x-www-form-urlencoded`. Actix's
+/// `web::Form` extractor enforces this for us: a request with the wrong
+/// Content-Type fails extraction with `UrlencodedError::ContentType`, which
+/// actix renders as `415 Unsupported Media Type` before the handler runs.
+#[post("/trust_mark_status")]
+pub async fn trust_mark_status(
+    info: web::Form<TrustMarkStatusParams>,
+    redis: web::Data<RedisPool>,
+    state: web::Data<AppState>,
+    cache: web::Data<ResponseCache>,
+) -> actix_web::Result<HttpResponse> {
+    let TrustMarkStatusParams { trust_mark } = info.into_inner();
+
+    // Create sha256sum of the trust_mark and see if it exists in `inmor:tm:alltime` set.
+    let mut hasher = Sha256::new();
+    hasher.update(trust_mark.as_bytes());
+    let trust_mark_hash = format!("{:x}", hasher.finalize());
+
+    let status = match cache.trust_mark_verdict(&trust_mark_hash) {
+        Some(status) => {
+            metrics::TRUST_MARK_STATUS.inc(&[status, "true"]);
+            status
+        }
+        None => {
+            let generation = cache.generation();
+            let (status, sub, exp) =
+                match trust_mark_status_verdict(&trust_mark, &trust_mark_hash, &redis, &state)
+                    .await?
+                {
+                    Ok(verdict) => verdict,
+                    Err(response) => return Ok(response),
+                };
+            cache.store_trust_mark_verdict(&trust_mark_hash, status, &sub, exp, generation);
+            metrics::TRUST_MARK_STATUS.inc(&[status, "false"]);
+            status
+        }
+    };
 
     let resp = match create_trustmark_status_response_jwt(&state, &trust_mark, status) {
         Ok(r) => r,
@@ -2885,12 +4673,16 @@ pub async fn trust_mark_status(
 /// Returns 404 if no historical keys are found.
 #[get("/historical_keys")]
 pub async fn federation_historical_keys(
-    redis: web::Data<redis::Client>,
+    req: HttpRequest,
+    redis: web::Data<RedisPool>,
+    cache: web::Data<ResponseCache>,
 ) -> actix_web::Result<HttpResponse> {
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    if let Some(cached) = cache.get("historical_keys") {
+        return Ok(cached.respond(&req, "application/jwk-set+jwt"));
+    }
+    let generation = cache.generation();
+
+    let mut conn = redis.get();
 
     let res: Option<String> = redis::Cmd::get("inmor:historical_keys")
         .query_async(&mut conn)
@@ -2898,60 +4690,101 @@ pub async fn federation_historical_keys(
         .map_err(error::ErrorInternalServerError)?;
 
     match res {
-        Some(token) => Ok(HttpResponse::Ok()
-            .insert_header(("content-type", "application/jwk-set+jwt"))
-            .body(token)),
+        Some(token) => Ok(cache
+            .insert("historical_keys", token, generation)
+            .respond(&req, "application/jwk-set+jwt")),
         None => error_response_404("not_found", "no historical keys found"),
     }
 }
 
+/// Returns one page of the holders of a trust mark type, ordered by entity_id.
+///
+/// The admin's `add_trustmark` keeps the holders in the sorted set
+/// `inmor:tmtype_sorted:{type}` next to the `inmor:tmtype:{type}` set, so a
+/// page costs O(log(N) + page). The sorted set is only used when it holds as
+/// many members as the set; trust marks issued before it existed are read
+/// from the set until the admin's `rebuild_trustmark_index` has run.
+async fn trust_mark_holders(
+    conn: &mut RedisConnection,
+    trust_mark_type: &str,
+    from: Option<&str>,
+    limit: Option<usize>,
+) -> Result<(Vec<String>, Option<String>)> {
+    let members = format!("inmor:tmtype:{trust_mark_type}");
+    let index = format!("inmor:tmtype_sorted:{trust_mark_type}");
+    let (indexed, total): (usize, usize) = redis::pipe()
+        .zcard(&index)
+        .scard(&members)
+        .query_async(conn)
+        .await?;
+    if indexed == total {
+        let res = sorted_index_page(conn, &index, from, limit).await?;
+        return Ok(split_page(res, limit));
+    }
+
+    let mut res: Vec<String> = redis::Cmd::smembers(&members).query_async(conn).await?;
+    res.sort();
+    Ok(page_of(res, from, limit))
+}
+
 /// https://openid.net/specs/openid-federation-1_0.html#section-8.5.1
+///
+/// Paginated with `limit` and `from` like `/list`.
 #[get("/trust_mark_list")]
 pub async fn trust_mark_list(
+    req: HttpRequest,
     info: Query<TrustMarkListParams>,
-    redis: web::Data<redis::Client>,
+    redis: web::Data<RedisPool>,
     _state: web::Data<AppState>,
 ) -> actix_web::Result<HttpResponse> {
     let TrustMarkListParams {
         trust_mark_type,
         sub,
+        from,
+        limit,
     } = info.into_inner();
 
     if let Err(e) = validate_redis_key_input(&trust_mark_type) {
         return error_response_400("invalid_request", &format!("invalid trust_mark_type: {e}"));
     }
+    if limit == Some(0) {
+        return error_response_400("invalid_request", "limit must be a positive integer");
+    }
 
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    let mut conn = redis.get();
 
-    let query = format!("inmor:tmtype:{trust_mark_type}");
+    let etag = listing_etag(&mut conn, "trust_mark_list", &[VERSION_TRUST_MARKS]).await;
+    if let Some(response) = listing_not_modified(&req, etag.as_deref()) {
+        return Ok(response);
+    }
 
-    let res = redis::Cmd::smembers(query)
-        .query_async::<Vec<String>>(&mut conn)
-        .await
-        .map_err(error::ErrorInternalServerError);
-    match res {
-        Ok(mut result) => {
-            if let Some(sub_entity) = sub {
-                // Per spec Section 8.5.1: filter to only the Entity matching sub
-                if result.contains(&sub_entity) {
-                    result = vec![sub_entity];
-                } else {
-                    // Filtering to nothing = empty array
-                    result = vec![];
-                }
-            }
+    if let Some(sub_entity) = sub {
+        // Per spec Section 8.5.1: filter to only the Entity matching sub,
+        // filtering to nothing gives an empty array.
+        let query = format!("inmor:tmtype:{trust_mark_type}");
+        let holds: bool = match redis::Cmd::sismember(query, &sub_entity)
+            .query_async(&mut conn)
+            .await
+        {
+            Ok(holds) => holds,
+            Err(_) => return error_response_404("not_found", "Trust mark type not found."),
+        };
+        let result = if holds { vec![sub_entity] } else { vec![] };
+        return Ok(entity_id_page_response(
+            &req,
+            &result,
+            None,
+            etag.as_deref(),
+        ));
+    }
 
-            let body = match serde_json::to_string(&result) {
-                Ok(d) => d,
-                Err(_) => return Err(error::ErrorInternalServerError("JSON error")),
-            };
-            Ok(HttpResponse::Ok()
-                .insert_header(("content-type", "application/json"))
-                .body(body))
-        }
+    match trust_mark_holders(&mut conn, &trust_mark_type, from.as_deref(), limit).await {
+        Ok((result, next)) => Ok(entity_id_page_response(
+            &req,
+            &result,
+            next,
+            etag.as_deref(),
+        )),
         Err(_) => error_response_404("not_found", "Trust mark type not found."),
     }
 }
@@ -2961,7 +4794,7 @@ pub async fn trust_mark_list(
 #[get("/trust_mark")]
 pub async fn trust_mark_query(
     info: Query<TrustMarkParams>,
-    redis: web::Data<redis::Client>,
+    redis: web::Data<RedisPool>,
     _state: web::Data<AppState>,
 ) -> actix_web::Result<HttpResponse> {
     let TrustMarkParams {
@@ -2976,10 +4809,7 @@ pub async fn trust_mark_query(
         return error_response_400("invalid_request", &format!("invalid trust_mark_type: {e}"));
     }
 
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    let mut conn = redis.get();
 
     let query = format!("inmor:tm:{sub}");
 
@@ -3111,44 +4941,119 @@ async fn validate_federation_url(url_str: &str, allow_http: bool) -> Result<()>
         )))
     })?;
 
-    // 3. Resolve DNS and check all IPs
-    let port = parsed.port_or_known_default().unwrap_or(443);
-    let addr = format!("{}:{}", host, port);
-    let resolved: Vec<std::net::SocketAddr> = tokio::net::lookup_host(&addr)
+    // 3. Resolve DNS and check all IPs. The answer is cached, so the
+    //    connect (through `PinnedResolver`) uses these same addresses.
+    resolve_public_host(host).await?;
+
+    Ok(())
+}
+
+/// Resolves `host` through the shared `DNS_CACHE` and returns its addresses,
+/// if none of them is private.
+///
+/// DNS failures (incl. SERVFAIL, timeout, no nameservers, no addresses)
+/// are transient per §10.5; a private address is permanent.
+async fn resolve_public_host(host: &str) -> Result<Vec<IpAddr>> {
+    // `Url::host_str` keeps the brackets of IPv6 literals.
+    let host = host.trim_start_matches('[').trim_end_matches(']');
+    let resolved = lookup_ip_cached(host).await.map_err(|e| {
+        anyhow::Error::new(FetchError::transient(
+            None,
+            format!("DNS resolution failed for '{host}': {e}"),
+        ))
+    })?;
+    check_public_addresses(host, &resolved)?;
+    Ok(resolved)
+}
+
+/// Resolves `host` with the system resolver, reusing an unexpired answer
+/// from `DNS_CACHE`. When the cache is full, expired answers are dropped
+/// first, then the one closest to expiry.
+async fn lookup_ip_cached(host: &str) -> std::io::Result<Vec<IpAddr>> {
+    let now = Instant::now();
+    if let Some((answer, until)) = DNS_CACHE.lock().unwrap().get(host)
+        && *until > now
+    {
+        return answer.clone().map_err(std::io::Error::other);
+    }
+    let answer = tokio::net::lookup_host((host, 0))
         .await
-        .map_err(|e| {
-            // DNS failures (incl. SERVFAIL, timeout, no nameservers) are
-            // transient per §10.5.
-            anyhow::Error::new(FetchError::transient(
-                None,
-                format!("DNS resolution failed for '{host}': {e}"),
-            ))
-        })?
-        .collect();
+        .map(|addrs| addrs.map(|addr| addr.ip()).collect::<Vec<_>>())
+        .map_err(|e| e.to_string());
+    let ttl = if answer.is_ok() {
+        DNS_CACHE_TTL_SECS
+    } else {
+        DNS_NEGATIVE_TTL_SECS
+    };
+    let mut cache = DNS_CACHE.lock().unwrap();
+    if cache.len() >= DNS_CACHE_SIZE && !cache.contains_key(host) {
+        cache.retain(|_, (_, until)| *until > now);
+        if cache.len() >= DNS_CACHE_SIZE
+            && let Some(oldest) = cache
+                .iter()
+                .min_by_key(|(_, (_, until))| *until)
+                .map(|(name, _)| name.clone())
+        {
+            cache.remove(&oldest);
+        }
+    }
+    cache.insert(
+        host.to_string(),
+        (answer.clone(), now + Duration::from_secs(ttl)),
+    );
+    answer.map_err(std::io::Error::other)
+}
 
-    if resolved.is_empty() {
+/// Fails if `addresses` is empty or contains a private/internal address.
+fn check_public_addresses(host: &str, addresses: &[IpAddr]) -> Result<()> {
+    if addresses.is_empty() {
         return Err(anyhow::Error::new(FetchError::transient(
             None,
             format!("DNS resolution returned no addresses for '{host}'"),
         )));
     }
-
-    for sock_addr in &resolved {
-        if is_private_ip(&sock_addr.ip()) {
-            return Err(anyhow::Error::new(FetchError::permanent(format!(
-                "Blocked request to private/internal IP {} (resolved from '{host}')",
-                sock_addr.ip()
-            ))));
-        }
+    if let Some(ip) = addresses.iter().find(|ip| is_private_ip(ip)) {
+        return Err(anyhow::Error::new(FetchError::permanent(format!(
+            "Blocked request to private/internal IP {ip} (resolved from '{host}')"
+        ))));
     }
-
     Ok(())
 }
 
+/// DNS resolver of `HTTP_CLIENT`. Connections go to the addresses that
+/// `validate_federation_url` checked, as both read the same `DNS_CACHE`, and the check is repeated here, so an answer that changed in
+/// between (DNS rebinding) or a redirect to another host cannot reach a
+/// private address.
+struct PinnedResolver;
+
+impl reqwest::dns::Resolve for PinnedResolver {
+    fn resolve(&self, name: reqwest::dns::Name) -> reqwest::dns::Resolving {
+        Box::pin(async move {
+            let host = name.as_str();
+            let addresses = if ALLOW_HTTP.load(std::sync::atomic::Ordering::Relaxed) {
+                // Development mode allows private addresses.
+                lookup_ip_cached(host).await?
+            } else {
+                resolve_public_host(host)
+                    .await
+                    .map_err(|e| -> Box<dyn StdError + Send + Sync> { e.into() })?
+            };
+            // The port is filled in by the connector.
+            let addrs: reqwest::dns::Addrs = Box::new(
+                addresses
+                    .into_iter()
+                    .map(|ip| std::net::SocketAddr::new(ip, 0)),
+            );
+            Ok(addrs)
+        })
+    }
+}
+
 /// To do a POST with `application/x-www-form-urlencoded` body. Uses the same SSRF gate,
 /// shared HTTP client (timeouts/redirect limit/pool), and `MAX_RESPONSE_BYTES` cap as
 /// `get_query`. Used to call external trust mark issuers' `/trust_mark_status` endpoint.
 pub async fn post_form_query(url: &str, form: &[(&str, &str)]) -> Result<String> {
+    metrics::fetch_started();
     validate_federation_url(url, ALLOW_HTTP.load(std::sync::atomic::Ordering::Relaxed)).await?;
     let response = HTTP_CLIENT.post(url).form(form).send().await?;
     if !response.status().is_success() {
@@ -3211,8 +5116,17 @@ pub async fn get_query(url: &str) -> Result<String> {
     let mut last_transient_msg = String::new();
     let mut last_retry_after: Option<u64> = None;
 
+    metrics::fetch_started();
     for attempt in 0..=FETCH_MAX_RETRIES {
-        match try_one_fetch(url).await {
+        let start = Instant::now();
+        let fetched = try_one_fetch(url).await;
+        let outcome = match &fetched {
+            Ok(_) => "ok",
+            Err(e) if e.downcast_ref::<FetchError>().is_some_and(|f| !f.transient) => "permanent",
+            Err(_) => "transient",
+        };
+        metrics::FETCH_DURATION.observe_duration(start.elapsed(), &[outcome]);
+        match fetched {
             Ok(body) => return Ok(body),
             Err(e) => {
                 let fe = e.downcast_ref::<FetchError>();
@@ -3235,6 +5149,7 @@ pub async fn get_query(url: &str) -> Result<String> {
                 if attempt >= FETCH_MAX_RETRIES {
                     break;
                 }
+                metrics::FETCH_RETRIES.inc(&[]);
                 let sleep_ms = compute_retry_sleep_ms(backoff_ms, last_retry_after);
                 tokio::time::sleep(Duration::from_millis(sleep_ms)).await;
                 backoff_ms = (backoff_ms.saturating_mul(2)).min(FETCH_BACKOFF_CAP_MS);
@@ -3254,8 +5169,15 @@ pub async fn get_query(url: &str) -> Result<String> {
 /// and DNS hiccups inside the SSRF gate both surface as transient and
 /// participate in the retry loop.
 async fn try_one_fetch(url: &str) -> Result<String> {
-    validate_federation_url(url, ALLOW_HTTP.load(std::sync::atomic::Ordering::Relaxed)).await?;
+    validate_federation_url(url, ALLOW_HTTP.load(std::sync::atomic::Ordering::Relaxed))
+        .await
+        .inspect_err(|_| metrics::FETCH_ERRORS.inc(&["url"]))?;
     let response = HTTP_CLIENT.get(url).send().await.map_err(|e| {
+        metrics::FETCH_ERRORS.inc(&[if e.is_timeout() {
+            "timeout"
+        } else {
+            "transport"
+        }]);
         anyhow::Error::new(FetchError::transient(
             None,
             format!("transport error fetching '{url}': {e}"),
@@ -3263,8 +5185,16 @@ async fn try_one_fetch(url: &str) -> Result<String> {
     })?;
     let status = response.status();
     if status.is_success() {
-        return read_response_body(url, response).await;
-    }
+        return read_response_body(url, response)
+            .await
+            .inspect_err(|_| metrics::FETCH_ERRORS.inc(&["body"]));
+    }
+    metrics::FETCH_ERRORS.inc(&[match status.as_u16() {
+        429 => "status_429",
+        500.. => "status_5xx",
+        400..=499 => "status_4xx",
+        _ => "status_other",
+    }]);
     if status.as_u16() == 429 || status.is_server_error() {
         let retry_after = response
             .headers()
@@ -3316,18 +5246,18 @@ async fn read_response_body(url: &str, response: reqwest::Response) -> Result<St
 /// Lightweight liveness check endpoint.
 /// Returns 200 with `{"status": "ok"}` if Redis is reachable,
 /// or 503 with `{"status": "error", "detail": "redis unavailable"}` if not.
+/// A mirror node also answers 503 until its first copy of the admin's Redis
+/// is complete.
 #[get("/health")]
-pub async fn health(redis: web::Data<redis::Client>) -> HttpResponse {
-    let conn_result = redis.get_connection_manager().await;
-    match conn_result {
-        Ok(mut conn) => {
-            let ping: Result<String, _> = redis::cmd("PING").query_async(&mut conn).await;
-            match ping {
-                Ok(_) => HttpResponse::Ok().json(json!({"status": "ok"})),
-                Err(_) => HttpResponse::ServiceUnavailable()
-                    .json(json!({"status": "error", "detail": "redis unavailable"})),
-            }
-        }
+pub async fn health(redis: web::Data<RedisPool>) -> HttpResponse {
+    if !mirror::is_ready() {
+        return HttpResponse::ServiceUnavailable()
+            .json(json!({"status": "error", "detail": "mirror not synchronized"}));
+    }
+    let mut conn = redis.get();
+    let ping: Result<String, _> = redis::cmd("PING").query_async(&mut conn).await;
+    match ping {
+        Ok(_) => HttpResponse::Ok().json(json!({"status": "ok"})),
         Err(_) => HttpResponse::ServiceUnavailable()
             .json(json!({"status": "error", "detail": "redis unavailable"})),
     }
@@ -3337,13 +5267,10 @@ pub async fn health(redis: web::Data<redis::Client>) -> HttpResponse {
 /// Returns counts of keys, subordinates, trust marks, and collection data.
 #[get("/status")]
 pub async fn server_status(
-    redis: web::Data<redis::Client>,
+    redis: web::Data<RedisPool>,
     state: web::Data<AppState>,
 ) -> actix_web::Result<HttpResponse> {
-    let mut conn = redis
-        .get_connection_manager()
-        .await
-        .map_err(error::ErrorInternalServerError)?;
+    let mut conn = redis.get();
 
     // Pipeline Redis queries for efficiency (single round-trip)
     let mut pipe = redis::pipe();
@@ -3408,11 +5335,81 @@ pub async fn server_status(
             "intermediates": results.6,
             "last_updated": results.7,
         },
+        "resolve_cache": {
+            "hits": RESOLVE_CACHE_HITS.load(std::sync::atomic::Ordering::Relaxed),
+            "misses": RESOLVE_CACHE_MISSES.load(std::sync::atomic::Ordering::Relaxed),
+        },
     });
 
     Ok(HttpResponse::Ok().json(response))
 }
 
+/// Prometheus metrics of this TA process in the text exposition format, see
+/// the `metrics` module. Load shedding lanes and the `/resolve` cache are
+/// read at scrape time.
+#[get("/metrics")]
+pub async fn prometheus_metrics(shedder: web::Data<LoadShedder>) -> HttpResponse {
+    let lanes: Vec<&Lane> = shedder.lanes().collect();
+    let per_lane = |value: &dyn Fn(&Lane) -> f64| -> Vec<metrics::Sample> {
+        lanes
+            .iter()
+            .map(|lane| (vec![("lane", lane.name.clone())], value(lane)))
+            .collect()
+    };
+    let computed = [
+        metrics::Computed {
+            name: "inmor_ta_lane_limit",
+            help: "Maximum concurrent requests per load shedding lane.",
+            kind: "gauge",
+            samples: per_lane(&|lane| lane.limit as f64),
+        },
+        metrics::Computed {
+            name: "inmor_ta_in_flight_requests",
+            help: "Requests being handled per load shedding lane.",
+            kind: "gauge",
+            samples: per_lane(&|lane| lane.in_flight() as f64),
+        },
+        metrics::Computed {
+            name: "inmor_ta_queued_requests",
+            help: "Requests waiting for a slot per load shedding lane.",
+            kind: "gauge",
+            samples: per_lane(&|lane| lane.queued() as f64),
+        },
+        metrics::Computed {
+            name: "inmor_ta_shed_requests_total",
+            help: "Requests answered with 503 per load shedding lane.",
+            kind: "counter",
+            samples: per_lane(&|lane| lane.shed.load(std::sync::atomic::Ordering::Relaxed) as f64),
+        },
+        metrics::Computed {
+            name: "inmor_ta_resolve_cache_lookups_total",
+            help: "/resolve responses answered from the cache (hit) or built (miss).",
+            kind: "counter",
+            samples: vec![
+                (
+                    vec![("result", "hit".to_string())],
+                    RESOLVE_CACHE_HITS.load(std::sync::atomic::Ordering::Relaxed) as f64,
+                ),
+                (
+                    vec![("result", "miss".to_string())],
+                    RESOLVE_CACHE_MISSES.load(std::sync::atomic::Ordering::Relaxed) as f64,
+                ),
+            ],
+        },
+        metrics::Computed {
+            name: "inmor_ta_mirror_lag_seconds",
+            help: "Seconds since a mirror node last had all changes of the admin's Redis.",
+            kind: "gauge",
+            samples: mirror::lag_seconds()
+                .map(|lag| vec![(vec![], lag)])
+                .unwrap_or_default(),
+        },
+    ];
+    HttpResponse::Ok()
+        .content_type(metrics::CONTENT_TYPE)
+        .body(metrics::render(&computed))
+}
+
 pub fn error_response_404(edetails: &str, message: &str) -> actix_web::Result<HttpResponse> {
     Ok(HttpResponse::NotFound().json(json!({
         "error": edetails,
@@ -4221,6 +6218,24 @@ mod tests {
         );
     }
 
+    #[test]
+    fn test_jwks_memory_layer_honours_expiry() {
+        let key = first_private_key();
+        let keyset = verify_signed_jwks_body(&build_signed_jwks_body(&key)).expect("verify");
+        let now = SystemTime::now();
+
+        jwks_memory_put("test:jwks:fresh", &keyset, now + Duration::from_secs(60));
+        jwks_memory_put("test:jwks:stale", &keyset, now - Duration::from_secs(1));
+
+        let cached = jwks_memory_get("test:jwks:fresh").expect("fresh entry is served");
+        assert_eq!(cached.keys().len(), keyset.keys().len());
+        assert!(
+            jwks_memory_get("test:jwks:stale").is_none(),
+            "expired entries must not be served"
+        );
+        assert!(jwks_memory_get("test:jwks:missing").is_none());
+    }
+
     #[test]
     fn test_fetch_error_transient_vs_permanent_display() {
         let t = FetchError::transient(Some(5), "5xx from upstream");
@@ -4582,6 +6597,118 @@ mod tests {
             .is_err()
         );
     }
+
+    fn cache_slot(until: Option<SystemTime>) -> CacheSlot {
+        let slot = CacheSlot::default();
+        if let Some(until) = until {
+            let entry = Arc::new(CachedStatement {
+                jwt: String::new(),
+                payload: JwtPayload::new(),
+                until,
+            });
+            slot.set(entry).expect("new slot is empty");
+        }
+        slot
+    }
+
+    #[test]
+    fn test_evict_cache_slots_keeps_fetches_in_flight() {
+        let now = SystemTime::now();
+        let in_flight = cache_slot(None);
+        let mut shard = HashMap::from([
+            ("in_flight".to_string(), in_flight.clone()),
+            ("failed".to_string(), cache_slot(None)),
+            (
+                "expired".to_string(),
+                cache_slot(Some(now - Duration::from_secs(1))),
+            ),
+            (
+                "soon".to_string(),
+                cache_slot(Some(now + Duration::from_secs(10))),
+            ),
+            (
+                "later".to_string(),
+                cache_slot(Some(now + Duration::from_secs(20))),
+            ),
+        ]);
+
+        evict_cache_slots(&mut shard, 3, now);
+        let mut keys: Vec<&str> = shard.keys().map(String::as_str).collect();
+        keys.sort_unstable();
+        assert_eq!(keys, ["in_flight", "later"]);
+
+        // A shard of fetches in flight only is left as it is.
+        evict_cache_slots(&mut shard, 1, now);
+        assert!(shard.contains_key("in_flight"));
+        drop(in_flight);
+    }
+
+    #[tokio::test]
+    async fn test_federation_cache_fetches_once() {
+        use std::sync::atomic::Ordering;
+
+        // One slot per shard, so every new key has to evict.
+        let federation = Federation::new(
+            "https://ta.example.com",
+            FEDERATION_CACHE_SHARDS,
+            Duration::from_secs(60),
+        );
+        let counter = AtomicUsize::new(0);
+        let fetches = &counter;
+        let fetch = move || async move {
+            fetches.fetch_add(1, Ordering::SeqCst);
+            tokio::time::sleep(Duration::from_millis(50)).await;
+            Ok((String::from("jwt"), JwtPayload::new()))
+        };
+        let url = "https://op.example.com/.well-known/openid-federation";
+
+        let (first, second) = tokio::join!(
+            federation.get_or_fetch(url, fetch),
+            federation.get_or_fetch(url, fetch),
+        );
+        assert_eq!(first.unwrap().jwt, "jwt");
+        assert_eq!(second.unwrap().jwt, "jwt");
+        assert_eq!(fetches.load(Ordering::SeqCst), 1);
+
+        // Cached until max_ttl, as the payload has no exp.
+        assert!(federation.get_or_fetch(url, fetch).await.is_ok());
+        assert_eq!(fetches.load(Ordering::SeqCst), 1);
+
+        // Statements under our own entity_id are never cached.
+        let own = "https://ta.example.com/fetch?sub=https://op.example.com";
+        assert!(federation.get_or_fetch(own, fetch).await.is_ok());
+        assert!(federation.get_or_fetch(own, fetch).await.is_ok());
+        assert_eq!(fetches.load(Ordering::SeqCst), 3);
+    }
+
+    #[actix_web::test]
+    async fn test_small_responses_carry_no_content_encoding() {
+        use actix_web::http::header::{ACCEPT_ENCODING, CONTENT_ENCODING};
+        let app = actix_web::test::init_service(
+            actix_web::App::new()
+                .route("/small", web::get().to(|| async { "small" }))
+                .route("/large", web::get().to(|| async { "x".repeat(4096) }))
+                .wrap(actix_web::middleware::from_fn(skip_small_compression))
+                .wrap(actix_web::middleware::Compress::default())
+                .wrap(actix_web::middleware::from_fn(strip_identity_encoding)),
+        )
+        .await;
+
+        let req = actix_web::test::TestRequest::get()
+            .uri("/small")
+            .insert_header((ACCEPT_ENCODING, "gzip"))
+            .to_request();
+        let res = actix_web::test::call_service(&app, req).await;
+        assert!(!res.headers().contains_key(CONTENT_ENCODING));
+        assert_eq!(actix_web::test::read_body(res).await, "small");
+
+        let req = actix_web::test::TestRequest::get()
+            .uri("/large")
+            .insert_header((ACCEPT_ENCODING, "gzip"))
+            .to_request();
+        let res = actix_web::test::call_service(&app, req).await;
+        assert_eq!(res.headers().get(CONTENT_ENCODING).unwrap(), "gzip");
+    }
 }
 
 #[cfg(test)]
@@ -4625,6 +6752,49 @@ mod ssrf_tests {
         assert!(!is_private_ip(&"2607:f8b0:4004:800::200e".parse().unwrap()));
     }
 
+    #[test]
+    fn test_check_public_addresses() {
+        let public: IpAddr = "93.184.216.34".parse().unwrap();
+        let private: IpAddr = "10.0.0.1".parse().unwrap();
+        assert!(check_public_addresses("example.com", &[public]).is_ok());
+
+        // One private address among public ones blocks the host, permanently.
+        let err = check_public_addresses("example.com", &[public, private]).unwrap_err();
+        assert!(!err.downcast_ref::<FetchError>().unwrap().transient);
+
+        // No addresses at all is a resolver problem, worth retrying.
+        let err = check_public_addresses("example.com", &[]).unwrap_err();
+        assert!(err.downcast_ref::<FetchError>().unwrap().transient);
+    }
+
+    #[tokio::test]
+    async fn test_lookup_ip_cached() {
+        let cached: IpAddr = "192.0.2.1".parse().unwrap();
+        let later = Instant::now() + Duration::from_secs(60);
+        DNS_CACHE.lock().unwrap().insert(
+            "cached.dns-test.invalid".to_string(),
+            (Ok(vec![cached]), later),
+        );
+        DNS_CACHE.lock().unwrap().insert(
+            "failed.dns-test.invalid".to_string(),
+            (Err("no such host".to_string()), later),
+        );
+        // Unexpired answers, and failures, are served without a lookup.
+        assert_eq!(
+            lookup_ip_cached("cached.dns-test.invalid").await.unwrap(),
+            vec![cached]
+        );
+        assert!(lookup_ip_cached("failed.dns-test.invalid").await.is_err());
+
+        // An expired answer is resolved again.
+        DNS_CACHE
+            .lock()
+            .unwrap()
+            .insert("localhost".to_string(), (Ok(vec![cached]), Instant::now()));
+        let addresses = lookup_ip_cached("localhost").await.unwrap();
+        assert!(addresses.iter().all(|ip| ip.is_loopback()));
+    }
+
     #[tokio::test]
     async fn test_validate_rejects_http() {
         let result = validate_federation_url("http://example.com/foo", false).await;
@@ -4799,4 +6969,96 @@ mod ssrf_tests {
         let result = get_jwks_from_payload(&payload);
         assert!(result.is_ok());
     }
+
+    #[test]
+    fn test_search_tokens_are_normalized() {
+        let tokens: Vec<String> = search_tokens("Sunet's  Wiki-Login, ÅBO 2").collect();
+        assert_eq!(tokens, vec!["sunet", "s", "wiki", "login", "åbo", "2"]);
+
+        let mut infos = HashMap::new();
+        infos.insert(
+            "openid_relying_party".to_string(),
+            UiInfo {
+                display_name: Some("Example Wiki".to_string()),
+                description: Some("A wiki for examples".to_string()),
+                logo_uri: None,
+                policy_uri: None,
+                information_uri: None,
+            },
+        );
+        let mut entry = EntityCollectionResponse::new("https://rp.example.com".to_string(), vec![]);
+        entry.ui_infos = Some(infos);
+        let tokens: Vec<String> = entry.search_tokens().into_iter().collect();
+        assert_eq!(tokens, vec!["a", "example", "examples", "for", "wiki"]);
+    }
+
+    #[tokio::test]
+    async fn test_load_shedder_lanes() {
+        let limits = HashMap::from([("resolve".to_string(), 1)]);
+        let shedder = LoadShedder::new(&limits, Duration::from_millis(50));
+        let resolve = shedder.lane("/resolve");
+        assert_eq!(resolve.name, "resolve");
+        assert_eq!(shedder.lane("/fetch").name, "default");
+        assert_eq!(shedder.lane("/collection").limit, 32);
+
+        // The slot is taken: one request waits in the queue and times out, the
+        // second finds the queue full. The default lane is not affected.
+        let permit = shedder.admit(resolve).await.unwrap();
+        assert_eq!(resolve.in_flight(), 1);
+        let (first, second) = tokio::join!(shedder.admit(resolve), shedder.admit(resolve));
+        assert!(first.is_none() && second.is_none());
+        assert_eq!(resolve.shed.load(std::sync::atomic::Ordering::Relaxed), 2);
+        assert_eq!(resolve.queued(), 0);
+        assert!(shedder.admit(shedder.lane("/fetch")).await.is_some());
+
+        // A waiting request gets the slot once it is freed.
+        let (waiting, ()) = tokio::join!(shedder.admit(resolve), async { drop(permit) });
+        assert!(waiting.is_some());
+        assert_eq!(shedder.retry_after(), 1);
+    }
+
+    #[test]
+    fn test_page_of_sorted_entity_ids() {
+        let ids: Vec<String> = ["https://a", "https://b", "https://c", "https://d"]
+            .iter()
+            .map(|id| id.to_string())
+            .collect();
+
+        let (page, next) = page_of(ids.clone(), None, Some(2));
+        assert_eq!(page, vec!["https://a", "https://b"]);
+        assert_eq!(next.as_deref(), Some("https://c"));
+
+        // `from` is inclusive and does not have to be a member.
+        let (page, next) = page_of(ids.clone(), Some("https://bb"), Some(2));
+        assert_eq!(page, vec!["https://c", "https://d"]);
+        assert_eq!(next, None);
+
+        let (page, next) = page_of(ids.clone(), Some("https://c"), None);
+        assert_eq!(page, vec!["https://c", "https://d"]);
+        assert_eq!(next, None);
+    }
+
+    #[test]
+    fn test_etag_matches_if_none_match() {
+        let etag = "W/\"list-3-7\"";
+        let req = actix_web::test::TestRequest::default()
+            .insert_header(("If-None-Match", "\"list-3-6\", W/\"list-3-7\""))
+            .to_http_request();
+        assert!(etag_matches(&req, etag));
+        // Weak comparison ignores the W/ prefix on either side.
+        let req = actix_web::test::TestRequest::default()
+            .insert_header(("If-None-Match", "\"list-3-7\""))
+            .to_http_request();
+        assert!(etag_matches(&req, etag));
+        assert!(listing_not_modified(&req, Some(etag)).is_some());
+        // Listings without version counters are never 304.
+        assert!(listing_not_modified(&req, None).is_none());
+
+        let req = actix_web::test::TestRequest::default()
+            .insert_header(("If-None-Match", "\"list-3-6\""))
+            .to_http_request();
+        assert!(!etag_matches(&req, etag));
+        let req = actix_web::test::TestRequest::default().to_http_request();
+        assert!(!etag_matches(&req, etag));
+    }
 }
@@ -0,0 +1,417 @@
+//! Prometheus metrics of the Trust Anchor, served by `/metrics`.
+//!
+//! The TA is a single process, so counters and histograms are kept in memory
+//! and shared by all workers. They are declared as statics below and updated
+//! with `inc()` / `observe()`. Label values must come from a bounded set
+//! (routes, Redis command names, error classes), never from request input
+//! such as entity_ids, so that the number of series stays small.
+//!
+//! Values only known at scrape time (load shedding lanes, cache counters kept
+//! elsewhere) are passed to `render()` as `Computed` metrics.
+
+use std::cell::Cell;
+use std::collections::BTreeMap;
+use std::fmt::Write;
+use std::future::Future;
+use std::sync::Mutex;
+use std::time::{Duration, Instant};
+
+use actix_web::body::MessageBody;
+use actix_web::dev::{ServiceRequest, ServiceResponse};
+use actix_web::middleware::Next;
+
+/// Content type of the text exposition format.
+pub const CONTENT_TYPE: &str = "text/plain; version=0.0.4; charset=utf-8";
+
+/// Latency buckets in seconds.
+pub const DEFAULT_BUCKETS: &[f64] = &[
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+];
+
+/// Buckets of small counts, such as statements per trust chain.
+pub const COUNT_BUCKETS: &[f64] = &[0.0, 1.0, 2.0, 3.0, 4.0, 6.0, 8.0, 12.0, 16.0, 32.0, 64.0];
+
+/// A monotonically increasing counter with a fixed set of label names.
+pub struct Counter {
+    name: &'static str,
+    help: &'static str,
+    labels: &'static [&'static str],
+    values: Mutex<BTreeMap<Vec<String>, f64>>,
+}
+
+impl Counter {
+    pub const fn new(
+        name: &'static str,
+        help: &'static str,
+        labels: &'static [&'static str],
+    ) -> Self {
+        Counter {
+            name,
+            help,
+            labels,
+            values: Mutex::new(BTreeMap::new()),
+        }
+    }
+
+    /// Adds one to the series with the given label values.
+    pub fn inc(&self, labels: &[&str]) {
+        self.inc_by(1.0, labels);
+    }
+
+    pub fn inc_by(&self, amount: f64, labels: &[&str]) {
+        debug_assert_eq!(labels.len(), self.labels.len(), "labels of {}", self.name);
+        let key = labels.iter().map(|l| l.to_string()).collect();
+        let mut values = self.values.lock().expect("metrics lock poisoned");
+        *values.entry(key).or_insert(0.0) += amount;
+    }
+
+    /// Current value of one series, 0 if it was never incremented.
+    pub fn get(&self, labels: &[&str]) -> f64 {
+        let key: Vec<String> = labels.iter().map(|l| l.to_string()).collect();
+        let values = self.values.lock().expect("metrics lock poisoned");
+        values.get(&key).copied().unwrap_or(0.0)
+    }
+
+    fn render(&self, out: &mut String) {
+        header(out, self.name, self.help, "counter");
+        let values = self.values.lock().expect("metrics lock poisoned");
+        for (key, value) in values.iter() {
+            series(out, self.name, &pairs(self.labels, key), *value);
+        }
+    }
+}
+
+#[derive(Default)]
+struct HistogramValues {
+    /// Cumulative count per bucket bound.
+    buckets: Vec<u64>,
+    sum: f64,
+    count: u64,
+}
+
+/// A histogram with fixed buckets and label names.
+pub struct Histogram {
+    name: &'static str,
+    help: &'static str,
+    labels: &'static [&'static str],
+    buckets: &'static [f64],
+    values: Mutex<BTreeMap<Vec<String>, HistogramValues>>,
+}
+
+impl Histogram {
+    pub const fn new(
+        name: &'static str,
+        help: &'static str,
+        labels: &'static [&'static str],
+        buckets: &'static [f64],
+    ) -> Self {
+        Histogram {
+            name,
+            help,
+            labels,
+            buckets,
+            values: Mutex::new(BTreeMap::new()),
+        }
+    }
+
+    /// Records one observation in the series with the given label values.
+    pub fn observe(&self, value: f64, labels: &[&str]) {
+        debug_assert_eq!(labels.len(), self.labels.len(), "labels of {}", self.name);
+        let key = labels.iter().map(|l| l.to_string()).collect();
+        let mut values = self.values.lock().expect("metrics lock poisoned");
+        let entry = values.entry(key).or_default();
+        if entry.buckets.is_empty() {
+            entry.buckets = vec![0; self.buckets.len()];
+        }
+        for (count, bound) in entry.buckets.iter_mut().zip(self.buckets) {
+            if value <= *bound {
+                *count += 1;
+            }
+        }
+        entry.sum += value;
+        entry.count += 1;
+    }
+
+    pub fn observe_duration(&self, duration: Duration, labels: &[&str]) {
+        self.observe(duration.as_secs_f64(), labels);
+    }
+
+    /// Number of observations of one series.
+    pub fn count(&self, labels: &[&str]) -> u64 {
+        let key: Vec<String> = labels.iter().map(|l| l.to_string()).collect();
+        let values = self.values.lock().expect("metrics lock poisoned");
+        values.get(&key).map_or(0, |v| v.count)
+    }
+
+    fn render(&self, out: &mut String) {
+        header(out, self.name, self.help, "histogram");
+        let bucket_name = format!("{}_bucket", self.name);
+        let values = self.values.lock().expect("metrics lock poisoned");
+        for (key, value) in values.iter() {
+            let labels = pairs(self.labels, key);
+            for (bound, count) in self.buckets.iter().zip(&value.buckets) {
+                let mut with_le = labels.clone();
+                with_le.push(("le", format_value(*bound)));
+                series(out, &bucket_name, &with_le, *count as f64);
+            }
+            let mut with_le = labels.clone();
+            with_le.push(("le", "+Inf".to_string()));
+            series(out, &bucket_name, &with_le, value.count as f64);
+            series(out, &format!("{}_sum", self.name), &labels, value.sum);
+            series(
+                out,
+                &format!("{}_count", self.name),
+                &labels,
+                value.count as f64,
+            );
+        }
+    }
+}
+
+/// A sample computed at scrape time: label pairs and value.
+pub type Sample = (Vec<(&'static str, String)>, f64);
+
+/// A metric whose samples are computed at scrape time, see `render`.
+pub struct Computed {
+    pub name: &'static str,
+    pub help: &'static str,
+    /// `counter` or `gauge`.
+    pub kind: &'static str,
+    pub samples: Vec<Sample>,
+}
+
+pub static REQUESTS: Counter = Counter::new(
+    "inmor_ta_requests_total",
+    "Requests by method, route and status code.",
+    &["method", "route", "status"],
+);
+pub static REQUEST_DURATION: Histogram = Histogram::new(
+    "inmor_ta_request_duration_seconds",
+    "Request latency by method and route.",
+    &["method", "route"],
+    DEFAULT_BUCKETS,
+);
+pub static FETCH_DURATION: Histogram = Histogram::new(
+    "inmor_ta_fetch_duration_seconds",
+    "Latency of single outbound HTTP fetch attempts, by outcome (ok, transient, permanent).",
+    &["outcome"],
+    DEFAULT_BUCKETS,
+);
+pub static FETCH_RETRIES: Counter = Counter::new(
+    "inmor_ta_fetch_retries_total",
+    "Outbound HTTP fetches retried after a transient error.",
+    &[],
+);
+pub static FETCH_ERRORS: Counter = Counter::new(
+    "inmor_ta_fetch_errors_total",
+    "Failed outbound HTTP fetch attempts by error class.",
+    &["class"],
+);
+pub static REDIS_DURATION: Histogram = Histogram::new(
+    "inmor_ta_redis_command_duration_seconds",
+    "Latency of Redis commands and pipelines sent by the TA.",
+    &["command"],
+    DEFAULT_BUCKETS,
+);
+pub static RESOLVE_CHAIN_LENGTH: Histogram = Histogram::new(
+    "inmor_ta_resolve_chain_length",
+    "Number of statements in the trust chains built by /resolve.",
+    &[],
+    COUNT_BUCKETS,
+);
+pub static RESOLVE_FETCHES: Histogram = Histogram::new(
+    "inmor_ta_resolve_fetches",
+    "Outbound HTTP fetches made to build the trust chain of one /resolve request.",
+    &[],
+    COUNT_BUCKETS,
+);
+pub static RESOLVE_CHAIN_BUNDLES: Counter = Counter::new(
+    "inmor_ta_resolve_chain_bundles_total",
+    "Pre-resolved chains of direct subordinates found by /resolve, by result \
+     (used, stale, invalid).",
+    &["result"],
+);
+pub static TRUST_MARK_VERIFICATIONS: Counter = Counter::new(
+    "inmor_ta_trust_mark_verifications_total",
+    "Trust marks checked by /resolve, by outcome.",
+    &["outcome"],
+);
+pub static TRUST_MARK_STATUS: Counter = Counter::new(
+    "inmor_ta_trust_mark_status_total",
+    "/trust_mark_status answers by status, and whether the verdict was memoized.",
+    &["status", "cached"],
+);
+pub static JWKS_CACHE: Counter = Counter::new(
+    "inmor_ta_jwks_cache_lookups_total",
+    "JWKS lookups by cache (jwks, signed_jwks) and where they were answered \
+     (memory, redis, negative, fetch).",
+    &["cache", "result"],
+);
+pub static MIRROR_CHANGES: Counter = Counter::new(
+    "inmor_ta_mirror_changes_total",
+    "Change stream entries read by a mirror node, by result (applied, skipped, resynced).",
+    &["result"],
+);
+pub static MIRROR_SNAPSHOTS: Counter = Counter::new(
+    "inmor_ta_mirror_snapshots_total",
+    "Copies of the whole keyspace (full) or of one key family (family) made by a mirror node.",
+    &["scope"],
+);
+
+tokio::task_local! {
+    /// Outbound fetches made by the current `/resolve` request.
+    static TASK_FETCHES: Cell<u64>;
+}
+
+/// Runs `future`, counting the outbound fetches it makes (see `fetch_started`).
+pub async fn count_fetches<F: Future>(future: F) -> (F::Output, u64) {
+    TASK_FETCHES
+        .scope(Cell::new(0), async {
+            let output = future.await;
+            (output, TASK_FETCHES.with(Cell::get))
+        })
+        .await
+}
+
+/// Counts one outbound fetch for the surrounding `count_fetches`, if any.
+pub fn fetch_started() {
+    let _ = TASK_FETCHES.try_with(|count| count.set(count.get() + 1));
+}
+
+/// Middleware counting requests and recording their latency per route.
+///
+/// The route is the resource pattern (for example `/resolve`), which keeps
+/// the label cardinality bounded. Requests to unknown paths are not counted.
+pub async fn record_request(
+    req: ServiceRequest,
+    next: Next<impl MessageBody + 'static>,
+) -> actix_web::Result<ServiceResponse<impl MessageBody>> {
+    let start = Instant::now();
+    let method = req.method().to_string();
+    let res = next.call(req).await?;
+    if let Some(route) = res.request().match_pattern() {
+        let status = res.status();
+        REQUESTS.inc(&[&method, &route, status.as_str()]);
+        REQUEST_DURATION.observe_duration(start.elapsed(), &[&method, &route]);
+    }
+    Ok(res)
+}
+
+/// Renders all metrics, plus the ones `computed` by the caller, in the text
+/// exposition format.
+pub fn render(computed: &[Computed]) -> String {
+    let mut out = String::new();
+    REQUESTS.render(&mut out);
+    REQUEST_DURATION.render(&mut out);
+    FETCH_DURATION.render(&mut out);
+    FETCH_RETRIES.render(&mut out);
+    FETCH_ERRORS.render(&mut out);
+    REDIS_DURATION.render(&mut out);
+    RESOLVE_CHAIN_LENGTH.render(&mut out);
+    RESOLVE_FETCHES.render(&mut out);
+    RESOLVE_CHAIN_BUNDLES.render(&mut out);
+    TRUST_MARK_VERIFICATIONS.render(&mut out);
+    TRUST_MARK_STATUS.render(&mut out);
+    JWKS_CACHE.render(&mut out);
+    MIRROR_CHANGES.render(&mut out);
+    MIRROR_SNAPSHOTS.render(&mut out);
+    for metric in computed {
+        header(&mut out, metric.name, metric.help, metric.kind);
+        for (labels, value) in &metric.samples {
+            series(&mut out, metric.name, labels, *value);
+        }
+    }
+    out
+}
+
+fn pairs(names: &'static [&'static str], values: &[String]) -> Vec<(&'static str, String)> {
+    names.iter().copied().zip(values.iter().cloned()).collect()
+}
+
+fn header(out: &mut String, name: &str, help: &str, kind: &str) {
+    let _ = writeln!(out, "# HELP {name} {help}");
+    let _ = writeln!(out, "# TYPE {name} {kind}");
+}
+
+fn escape(value: &str) -> String {
+    value
+        .replace('\\', "\\\\")
+        .replace('"', "\\\"")
+        .replace('\n', "\\n")
+}
+
+fn format_value(value: f64) -> String {
+    if value == f64::INFINITY {
+        "+Inf".to_string()
+    } else if value == f64::NEG_INFINITY {
+        "-Inf".to_string()
+    } else if value.fract() == 0.0 && value.abs() < 1e15 {
+        format!("{}", value as i64)
+    } else {
+        format!("{value}")
+    }
+}
+
+fn series(out: &mut String, name: &str, labels: &[(&str, String)], value: f64) {
+    if labels.is_empty() {
+        let _ = writeln!(out, "{name} {}", format_value(value));
+        return;
+    }
+    let labels: Vec<String> = labels
+        .iter()
+        .map(|(key, val)| format!("{key}=\"{}\"", escape(val)))
+        .collect();
+    let _ = writeln!(
+        out,
+        "{name}{{{}}} {}",
+        labels.join(","),
+        format_value(value)
+    );
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_counter_and_histogram_render() {
+        static COUNTER: Counter = Counter::new("test_total", "A test counter.", &["kind"]);
+        static HISTOGRAM: Histogram =
+            Histogram::new("test_seconds", "A test histogram.", &[], &[0.1, 1.0]);
+        COUNTER.inc(&["a\"b"]);
+        COUNTER.inc_by(2.0, &["a\"b"]);
+        HISTOGRAM.observe(0.0625, &[]);
+        HISTOGRAM.observe(0.5, &[]);
+        HISTOGRAM.observe(5.0, &[]);
+
+        let mut out = String::new();
+        COUNTER.render(&mut out);
+        HISTOGRAM.render(&mut out);
+        assert_eq!(
+            out,
+            "# HELP test_total A test counter.\n\
+             # TYPE test_total counter\n\
+             test_total{kind=\"a\\\"b\"} 3\n\
+             # HELP test_seconds A test histogram.\n\
+             # TYPE test_seconds histogram\n\
+             test_seconds_bucket{le=\"0.1\"} 1\n\
+             test_seconds_bucket{le=\"1\"} 2\n\
+             test_seconds_bucket{le=\"+Inf\"} 3\n\
+             test_seconds_sum 5.5625\n\
+             test_seconds_count 3\n"
+        );
+        assert_eq!(HISTOGRAM.count(&[]), 3);
+    }
+
+    #[tokio::test]
+    async fn test_count_fetches() {
+        let ((), fetches) = count_fetches(async {
+            fetch_started();
+            fetch_started();
+        })
+        .await;
+        assert_eq!(fetches, 2);
+        // Outside of count_fetches this is a no-op.
+        fetch_started();
+    }
+}
@@ -0,0 +1,721 @@
+//! Read-only mirror nodes.
+//!
+//! A TA configured with `mirror_redis_uri` serves from its own Redis at
+//! `redis_uri` (usually one on the same host), which this module keeps in
+//! sync with the Redis the admin and inmor-collection write to:
+//!
+//! 1. A snapshot copies every `inmor:*` key with SCAN, DUMP and RESTORE, and
+//!    deletes the local keys that no longer exist at the source. The version
+//!    counters and the position in `CHANGES_STREAM` are read atomically
+//!    before the copy starts.
+//! 2. Then the entries of `CHANGES_STREAM` after that position are applied in
+//!    order. For a change of one entity only the hash fields and set members
+//!    of that entity are copied; a change of a whole family (`rebuild`,
+//!    `clear`) copies all keys of the family again. The hash of an issued
+//!    trust mark comes with its change and is added to `inmor:tm:alltime`,
+//!    which keeps every mark ever issued and not only the current ones.
+//!
+//! A change always copies the current state at the source, so applying one
+//! twice, or one already contained in the snapshot, is harmless. A gap in the
+//! versions of a family (entries trimmed from the stream before they were
+//! read) makes the mirror copy that family again; losing its position in the
+//! stream altogether makes it take a new snapshot.
+//!
+//! After applying a change the mirror publishes the matching message on its
+//! own `RESPONSE_CACHE_CHANNEL` and drops the affected cached `/resolve`
+//! responses, as the admin does at the source.
+//!
+//! RESTORE does not accept DUMP payloads of newer Redis versions, so the
+//! local Redis must run the same or a newer version than the source.
+
+use anyhow::Result;
+use log::{debug, info, warn};
+use redis::aio::MultiplexedConnection;
+use redis::streams::{StreamId, StreamRangeReply, StreamReadReply};
+use std::collections::{HashMap, HashSet};
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::time::{Duration, Instant, SystemTime, UNIX_EPOCH};
+
+use crate::{
+    CHAIN_BUNDLES, CHANGES_STREAM, LISTING_VERSIONS, RESOLVE_CACHE, RESOLVE_CACHE_CHAIN,
+    RESPONSE_CACHE_CHANNEL, SUBORDINATE_INDEX, SUBORDINATE_INTERMEDIATE, SUBORDINATE_LEAF,
+    SUBORDINATE_TRUST_MARKED, VERSION_COLLECTION, VERSION_ENTITY_CONFIGURATION,
+    VERSION_HISTORICAL_KEYS, VERSION_SUBORDINATES, VERSION_TRUST_MARKS,
+    get_unverified_payload_header, metrics, subordinate_by_type_key,
+};
+
+/// Stream ID before all entries.
+const FIRST: &str = "0-0";
+
+/// Milliseconds each XREAD waits for new changes.
+const BLOCK_MS: u64 = 1000;
+
+/// Maximum number of changes read at once.
+const READ_COUNT: usize = 100;
+
+/// Keys asked for per SCAN call, and copied per pipeline.
+const SCAN_COUNT: usize = 1000;
+
+/// Longest wait for a reply of either Redis, longer than `BLOCK_MS`.
+const RESPONSE_TIMEOUT: Duration = Duration::from_secs(30);
+
+/// Keys the TA writes to its own Redis, which are never copied or deleted.
+const LOCAL_PREFIXES: &[&str] = &[
+    "inmor:resolve:",
+    "inmor:jwks_cache:",
+    "inmor:signed_jwks_cache:",
+];
+
+/// Source keys that are not copied: the change stream, the admin's metrics,
+/// and the version counters, which are set together with the data they
+/// version.
+const SKIPPED_KEYS: &[&str] = &[CHANGES_STREAM, "inmor:metrics", LISTING_VERSIONS];
+
+/// Staging keys of a collection walk or a restore that is still running.
+const SKIPPED_PREFIXES: &[&str] = &["inmor:collection:staging:", "inmor:snapshot:staging:"];
+
+/// Hashes with one field per subordinate.
+const SUBORDINATE_HASHES: [&str; 3] = [
+    "inmor:subordinates",
+    "inmor:subordinates:jwt",
+    CHAIN_BUNDLES,
+];
+
+/// `/list` index sets a subordinate may be a member of, besides the ones of
+/// its entity types.
+const SUBORDINATE_SETS: [&str; 3] = [
+    SUBORDINATE_TRUST_MARKED,
+    SUBORDINATE_INTERMEDIATE,
+    SUBORDINATE_LEAF,
+];
+
+/// Whether this TA is a mirror.
+static ENABLED: AtomicBool = AtomicBool::new(false);
+
+/// Unix time in milliseconds up to which all changes at the source are
+/// applied, 0 until the first snapshot is complete.
+static SYNCED_UNTIL_MS: AtomicU64 = AtomicU64::new(0);
+
+/// False while a mirror has not completed its first snapshot. Always true
+/// for a TA that is not a mirror.
+pub fn is_ready() -> bool {
+    !ENABLED.load(Ordering::Relaxed) || SYNCED_UNTIL_MS.load(Ordering::Relaxed) > 0
+}
+
+/// Replication lag: seconds since the moment up to which all changes at the
+/// source are applied. None if this TA is not a mirror or has not completed
+/// its first snapshot.
+pub fn lag_seconds() -> Option<f64> {
+    let synced = SYNCED_UNTIL_MS.load(Ordering::Relaxed);
+    if !ENABLED.load(Ordering::Relaxed) || synced == 0 {
+        return None;
+    }
+    Some(now_ms().saturating_sub(synced) as f64 / 1000.0)
+}
+
+fn now_ms() -> u64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .unwrap_or_default()
+        .as_millis() as u64
+}
+
+/// Parses a stream ID (`{milliseconds}-{sequence}`).
+fn parse_stream_id(id: &str) -> Option<(u64, u64)> {
+    let (ms, seq) = id.split_once('-')?;
+    Some((ms.parse().ok()?, seq.parse().ok()?))
+}
+
+/// Whether a key of the source is copied to the mirror.
+fn is_mirrored(key: &str) -> bool {
+    key.starts_with("inmor:")
+        && !SKIPPED_KEYS.contains(&key)
+        && !LOCAL_PREFIXES
+            .iter()
+            .chain(SKIPPED_PREFIXES)
+            .any(|prefix| key.starts_with(prefix))
+}
+
+/// SCAN patterns of the keys of a family, None for an unknown family.
+fn family_patterns(family: &str) -> Option<&'static [&'static str]> {
+    match family {
+        VERSION_SUBORDINATES => Some(&["inmor:subordinates*", CHAIN_BUNDLES]),
+        VERSION_TRUST_MARKS => Some(&[
+            "inmor:tm:*",
+            "inmor:tmtype:*",
+            "inmor:tmtype_sorted:*",
+            "inmor:tmtypes",
+        ]),
+        VERSION_COLLECTION => Some(&["inmor:collection:*"]),
+        VERSION_ENTITY_CONFIGURATION => Some(&["inmor:entity_id"]),
+        VERSION_HISTORICAL_KEYS => Some(&["inmor:historical_keys"]),
+        _ => None,
+    }
+}
+
+/// The `/list` entity type sets of a subordinate with this entity
+/// configuration.
+fn entity_type_keys(jwt: Option<&str>) -> Vec<String> {
+    let Some(Ok((payload, _))) = jwt.map(get_unverified_payload_header) else {
+        return Vec::new();
+    };
+    match payload.claim("metadata").and_then(|m| m.as_object()) {
+        Some(metadata) => metadata
+            .keys()
+            .map(|etype| subordinate_by_type_key(etype))
+            .collect(),
+        None => Vec::new(),
+    }
+}
+
+/// One entry of `CHANGES_STREAM`.
+#[derive(Debug)]
+struct Change {
+    family: String,
+    op: String,
+    entity: String,
+    version: i64,
+    /// SHA-256 of an issued trust mark, empty for other changes.
+    mark: String,
+}
+
+impl Change {
+    fn from_entry(entry: &StreamId) -> Self {
+        Change {
+            family: entry.get("family").unwrap_or_default(),
+            op: entry.get("op").unwrap_or_default(),
+            entity: entry.get("entity").unwrap_or_default(),
+            version: entry.get("version").unwrap_or_default(),
+            mark: entry.get("mark").unwrap_or_default(),
+        }
+    }
+}
+
+/// How far a mirror has applied the change stream.
+struct Position {
+    /// ID of the last applied entry.
+    last_id: String,
+    /// Last applied version per family.
+    versions: HashMap<String, i64>,
+}
+
+async fn connect(client: &redis::Client) -> redis::RedisResult<MultiplexedConnection> {
+    let config = redis::AsyncConnectionConfig::new().set_response_timeout(RESPONSE_TIMEOUT);
+    client
+        .get_multiplexed_async_connection_with_config(&config)
+        .await
+}
+
+/// Keeps the Redis of `local` a copy of the `inmor:*` keys of `source`. Runs
+/// for the life of the server, starting over with a new snapshot a second
+/// after any error.
+pub async fn run_mirror(source: redis::Client, local: redis::Client) {
+    ENABLED.store(true, Ordering::Relaxed);
+    loop {
+        if let Err(e) = mirror(&source, &local).await {
+            warn!("Mirroring the source Redis failed: {e}");
+        }
+        tokio::time::sleep(Duration::from_secs(1)).await;
+    }
+}
+
+async fn mirror(source: &redis::Client, local: &redis::Client) -> Result<()> {
+    let mut src = connect(source).await?;
+    let mut dst = connect(local).await?;
+    let mut position = snapshot(&mut src, &mut dst).await?;
+    loop {
+        let started = now_ms();
+        let reply: Option<StreamReadReply> = redis::cmd("XREAD")
+            .arg("COUNT")
+            .arg(READ_COUNT)
+            .arg("BLOCK")
+            .arg(BLOCK_MS)
+            .arg("STREAMS")
+            .arg(CHANGES_STREAM)
+            .arg(&position.last_id)
+            .query_async(&mut src)
+            .await?;
+        let entries: Vec<StreamId> = reply
+            .map(|r| r.keys.into_iter().flat_map(|k| k.ids).collect())
+            .unwrap_or_default();
+        if entries.is_empty() {
+            // Nothing was recorded since the XREAD started.
+            SYNCED_UNTIL_MS.store(started, Ordering::Relaxed);
+            continue;
+        }
+        if lost_position(&mut src, &position.last_id).await? {
+            warn!("Changes were trimmed from {CHANGES_STREAM} before the mirror read them");
+            position = snapshot(&mut src, &mut dst).await?;
+            continue;
+        }
+        for entry in &entries {
+            apply(
+                &mut src,
+                &mut dst,
+                &mut position,
+                &Change::from_entry(entry),
+            )
+            .await?;
+            position.last_id = entry.id.clone();
+            if let Some((ms, _)) = parse_stream_id(&entry.id) {
+                SYNCED_UNTIL_MS.store(ms, Ordering::Relaxed);
+            }
+        }
+    }
+}
+
+/// Whether entries after `last_id` may have been trimmed from the stream
+/// before they were read, that is, whether its oldest entry is newer.
+async fn lost_position(src: &mut MultiplexedConnection, last_id: &str) -> Result<bool> {
+    if last_id == FIRST {
+        return Ok(false);
+    }
+    let oldest: StreamRangeReply = redis::cmd("XRANGE")
+        .arg(CHANGES_STREAM)
+        .arg("-")
+        .arg("+")
+        .arg("COUNT")
+        .arg(1)
+        .query_async(src)
+        .await?;
+    Ok(match oldest.ids.first() {
+        Some(entry) => parse_stream_id(&entry.id) > parse_stream_id(last_id),
+        None => false,
+    })
+}
+
+/// Copies all mirrored keys, and returns the stream position the copy is at
+/// least as new as.
+async fn snapshot(
+    src: &mut MultiplexedConnection,
+    dst: &mut MultiplexedConnection,
+) -> Result<Position> {
+    let start = Instant::now();
+    let started = now_ms();
+    let (versions, newest): (HashMap<String, i64>, StreamRangeReply) = redis::pipe()
+        .atomic()
+        .hgetall(LISTING_VERSIONS)
+        .cmd("XREVRANGE")
+        .arg(CHANGES_STREAM)
+        .arg("+")
+        .arg("-")
+        .arg("COUNT")
+        .arg(1)
+        .query_async(src)
+        .await?;
+    let last_id = newest
+        .ids
+        .first()
+        .map_or(FIRST.to_string(), |entry| entry.id.clone());
+
+    let copied = copy_matching(src, dst, &["inmor:*"]).await?;
+
+    // The versions read before the copy, which the copied data is at least
+    // as new as, so that no ETag is newer than its data.
+    let mut pipe = redis::pipe();
+    pipe.atomic().del(LISTING_VERSIONS).ignore();
+    if !versions.is_empty() {
+        let fields: Vec<(&String, &i64)> = versions.iter().collect();
+        pipe.hset_multiple(LISTING_VERSIONS, &fields).ignore();
+    }
+    pipe.query_async::<()>(dst).await?;
+    clear_resolve_cache(dst).await?;
+    redis::Cmd::publish(RESPONSE_CACHE_CHANNEL, "*")
+        .query_async::<()>(dst)
+        .await?;
+
+    metrics::MIRROR_SNAPSHOTS.inc(&["full"]);
+    if SYNCED_UNTIL_MS.load(Ordering::Relaxed) == 0 {
+        SYNCED_UNTIL_MS.store(started, Ordering::Relaxed);
+    }
+    info!(
+        "Mirrored {copied} keys in {:.1}s, continuing after change {last_id}",
+        start.elapsed().as_secs_f64()
+    );
+    Ok(Position { last_id, versions })
+}
+
+/// Returns all keys matching `pattern`.
+async fn scan_keys(conn: &mut MultiplexedConnection, pattern: &str) -> Result<Vec<String>> {
+    let mut keys = Vec::new();
+    let mut cursor: u64 = 0;
+    loop {
+        let (next, batch): (u64, Vec<String>) = redis::cmd("SCAN")
+            .arg(cursor)
+            .arg("MATCH")
+            .arg(pattern)
+            .arg("COUNT")
+            .arg(SCAN_COUNT)
+            .query_async(conn)
+            .await?;
+        keys.extend(batch);
+        if next == 0 {
+            return Ok(keys);
+        }
+        cursor = next;
+    }
+}
+
+/// Copies the mirrored keys matching `patterns` from the source, and deletes
+/// the local ones that no longer exist there. Returns the number of keys
+/// copied.
+async fn copy_matching(
+    src: &mut MultiplexedConnection,
+    dst: &mut MultiplexedConnection,
+    patterns: &[&str],
+) -> Result<usize> {
+    let mut copied: HashSet<String> = HashSet::new();
+    for pattern in patterns {
+        let keys: Vec<String> = scan_keys(src, pattern)
+            .await?
+            .into_iter()
+            .filter(|key| is_mirrored(key) && !copied.contains(key))
+            .collect();
+        for chunk in keys.chunks(SCAN_COUNT) {
+            copy_keys(src, dst, chunk).await?;
+        }
+        copied.extend(keys);
+    }
+    for pattern in patterns {
+        let stale: Vec<String> = scan_keys(dst, pattern)
+            .await?
+            .into_iter()
+            .filter(|key| is_mirrored(key) && !copied.contains(key))
+            .collect();
+        for chunk in stale.chunks(SCAN_COUNT) {
+            redis::Cmd::del(chunk).query_async::<()>(dst).await?;
+        }
+    }
+    Ok(copied.len())
+}
+
+/// Copies keys with DUMP and RESTORE, keeping their time to live. Keys that
+/// are gone from the source by now are deleted.
+async fn copy_keys(
+    src: &mut MultiplexedConnection,
+    dst: &mut MultiplexedConnection,
+    keys: &[String],
+) -> Result<()> {
+    if keys.is_empty() {
+        return Ok(());
+    }
+    let mut pipe = redis::pipe();
+    for key in keys {
+        pipe.cmd("DUMP").arg(key).cmd("PTTL").arg(key);
+    }
+    let replies: Vec<redis::Value> = pipe.query_async(src).await?;
+
+    let mut restore = redis::pipe();
+    for (key, reply) in keys.iter().zip(replies.chunks(2)) {
+        let payload: Option<Vec<u8>> = redis::from_redis_value(&reply[0])?;
+        let pttl: i64 = redis::from_redis_value(&reply[1])?;
+        match payload {
+            // PTTL is -1 for keys without a time to live, which RESTORE takes as 0,
+            // and -2 for keys that expired after the DUMP.
+            Some(payload) if pttl != -2 => restore
+                .cmd("RESTORE")
+                .arg(key)
+                .arg(pttl.max(0))
+                .arg(payload)
+                .arg("REPLACE")
+                .ignore(),
+            _ => restore.del(key).ignore(),
+        };
+    }
+    restore.query_async::<()>(dst).await?;
+    Ok(())
+}
+
+/// Applies one change, then stores its version and publishes the matching
+/// response cache invalidation.
+async fn apply(
+    src: &mut MultiplexedConnection,
+    dst: &mut MultiplexedConnection,
+    position: &mut Position,
+    change: &Change,
+) -> Result<()> {
+    let known = position.versions.get(&change.family).copied().unwrap_or(0);
+    if change.version <= known {
+        // Already contained in the snapshot.
+        metrics::MIRROR_CHANGES.inc(&["skipped"]);
+        return Ok(());
+    }
+    let Some(patterns) = family_patterns(&change.family) else {
+        warn!(
+            "Ignoring a change of the unknown key family {}",
+            change.family
+        );
+        metrics::MIRROR_CHANGES.inc(&["skipped"]);
+        return Ok(());
+    };
+
+    let entity = change.entity.as_str();
+    let incremental = change.version == known + 1 && !entity.is_empty();
+    let mut result = "applied";
+    let message = if incremental && change.family == VERSION_SUBORDINATES {
+        copy_subordinate(src, dst, entity).await?;
+        invalidate_resolve_cache(dst, entity).await?;
+        Some(format!("fetch:{entity}"))
+    } else if incremental && change.family == VERSION_TRUST_MARKS {
+        copy_trust_marks(src, dst, entity, &change.mark).await?;
+        invalidate_resolve_cache(dst, entity).await?;
+        Some(format!("trust_mark:{entity}"))
+    } else if change.family == VERSION_ENTITY_CONFIGURATION {
+        copy_matching(src, dst, patterns).await?;
+        clear_resolve_cache(dst).await?;
+        Some(VERSION_ENTITY_CONFIGURATION.to_string())
+    } else if change.family == VERSION_HISTORICAL_KEYS {
+        copy_matching(src, dst, patterns).await?;
+        Some(VERSION_HISTORICAL_KEYS.to_string())
+    } else if change.family == VERSION_COLLECTION {
+        copy_matching(src, dst, patterns).await?;
+        None
+    } else {
+        // A change of the whole family, or changes missing from the stream.
+        if change.version != known + 1 {
+            info!(
+                "Copying {} again, versions {}..{} are missing from {CHANGES_STREAM}",
+                change.family,
+                known + 1,
+                change.version - 1
+            );
+        }
+        copy_matching(src, dst, patterns).await?;
+        clear_resolve_cache(dst).await?;
+        metrics::MIRROR_SNAPSHOTS.inc(&["family"]);
+        result = "resynced";
+        Some("*".to_string())
+    };
+
+    let mut pipe = redis::pipe();
+    pipe.hset(LISTING_VERSIONS, &change.family, change.version)
+        .ignore();
+    if let Some(message) = message {
+        pipe.publish(RESPONSE_CACHE_CHANNEL, message).ignore();
+    }
+    pipe.query_async::<()>(dst).await?;
+    position
+        .versions
+        .insert(change.family.clone(), change.version);
+    metrics::MIRROR_CHANGES.inc(&[result]);
+    debug!(
+        "Mirrored {} {} of {} (version {})",
+        change.family, change.op, entity, change.version
+    );
+    Ok(())
+}
+
+/// Copies the statements, entity configuration, chain bundle and `/list`
+/// index memberships of one subordinate.
+async fn copy_subordinate(
+    src: &mut MultiplexedConnection,
+    dst: &mut MultiplexedConnection,
+    entity: &str,
+) -> Result<()> {
+    let old_jwt: Option<String> = redis::Cmd::hget("inmor:subordinates:jwt", entity)
+        .query_async(dst)
+        .await?;
+    let (statement, jwt, bundle, score): (
+        Option<String>,
+        Option<String>,
+        Option<String>,
+        Option<f64>,
+    ) = redis::pipe()
+        .hget(SUBORDINATE_HASHES[0], entity)
+        .hget(SUBORDINATE_HASHES[1], entity)
+        .hget(SUBORDINATE_HASHES[2], entity)
+        .zscore(SUBORDINATE_INDEX, entity)
+        .query_async(src)
+        .await?;
+
+    // The entity type sets of the subordinate before and after the change.
+    let mut sets: Vec<String> = SUBORDINATE_SETS.iter().map(|s| s.to_string()).collect();
+    sets.extend(entity_type_keys(old_jwt.as_deref()));
+    sets.extend(entity_type_keys(jwt.as_deref()));
+    sets.sort_unstable();
+    sets.dedup();
+    let mut pipe = redis::pipe();
+    for set in &sets {
+        pipe.sismember(set, entity);
+    }
+    let members: Vec<bool> = pipe.query_async(src).await?;
+
+    let mut pipe = redis::pipe();
+    pipe.atomic();
+    for (hash, value) in SUBORDINATE_HASHES.iter().zip([statement, jwt, bundle]) {
+        match value {
+            Some(value) => pipe.hset(hash, entity, value).ignore(),
+            None => pipe.hdel(hash, entity).ignore(),
+        };
+    }
+    match score {
+        Some(score) => pipe.zadd(SUBORDINATE_INDEX, entity, score).ignore(),
+        None => pipe.zrem(SUBORDINATE_INDEX, entity).ignore(),
+    };
+    for (set, member) in sets.iter().zip(members) {
+        if member {
+            pipe.sadd(set, entity).ignore();
+        } else {
+            pipe.srem(set, entity).ignore();
+        }
+    }
+    pipe.query_async::<()>(dst).await?;
+    Ok(())
+}
+
+/// Copies the trust marks of one entity and its memberships in the holder
+/// sets of their types, and adds the hash of an issued mark to
+/// `inmor:tm:alltime`.
+async fn copy_trust_marks(
+    src: &mut MultiplexedConnection,
+    dst: &mut MultiplexedConnection,
+    entity: &str,
+    mark: &str,
+) -> Result<()> {
+    let key = format!("inmor:tm:{entity}");
+    let mut types: Vec<String> = redis::Cmd::hkeys(&key).query_async(dst).await?;
+    let (marks, tmtypes): (HashMap<String, String>, Vec<String>) = redis::pipe()
+        .hgetall(&key)
+        .smembers("inmor:tmtypes")
+        .query_async(src)
+        .await?;
+    types.extend(marks.keys().cloned());
+    types.sort_unstable();
+    types.dedup();
+
+    let mut pipe = redis::pipe();
+    for tmtype in &types {
+        pipe.sismember(format!("inmor:tmtype:{tmtype}"), entity)
+            .zscore(format!("inmor:tmtype_sorted:{tmtype}"), entity);
+    }
+    let replies: Vec<redis::Value> = pipe.query_async(src).await?;
+
+    let mut pipe = redis::pipe();
+    pipe.atomic().del(&key).ignore();
+    if !marks.is_empty() {
+        let fields: Vec<(&String, &String)> = marks.iter().collect();
+        pipe.hset_multiple(&key, &fields).ignore();
+    }
+    for (tmtype, reply) in types.iter().zip(replies.chunks(2)) {
+        let holders = format!("inmor:tmtype:{tmtype}");
+        let sorted = format!("inmor:tmtype_sorted:{tmtype}");
+        if redis::from_redis_value::<bool>(&reply[0])? {
+            pipe.sadd(&holders, entity).ignore();
+        } else {
+            pipe.srem(&holders, entity).ignore();
+        }
+        match redis::from_redis_value::<Option<f64>>(&reply[1])? {
+            Some(score) => pipe.zadd(&sorted, entity, score).ignore(),
+            None => pipe.zrem(&sorted, entity).ignore(),
+        };
+    }
+    pipe.del("inmor:tmtypes").ignore();
+    if !tmtypes.is_empty() {
+        pipe.sadd("inmor:tmtypes", &tmtypes).ignore();
+    }
+    // The issued mark is known to /trust_mark_status as issued by us, even
+    // if the entity has been issued a newer one since.
+    if !mark.is_empty() {
+        pipe.sadd("inmor:tm:alltime", mark).ignore();
+    }
+    pipe.query_async::<()>(dst).await?;
+    Ok(())
+}
+
+/// Drops the cached `/resolve` responses that depend on an entity, like the
+/// admin's `invalidate_resolve_cache`.
+async fn invalidate_resolve_cache(dst: &mut MultiplexedConnection, entity: &str) -> Result<()> {
+    let chain_key = format!("{RESOLVE_CACHE_CHAIN}{entity}");
+    let subjects: Vec<String> = redis::Cmd::smembers(&chain_key).query_async(dst).await?;
+    let mut keys: Vec<String> = subjects
+        .iter()
+        .map(|sub| format!("{RESOLVE_CACHE}{sub}"))
+        .collect();
+    keys.push(format!("{RESOLVE_CACHE}{entity}"));
+    keys.push(chain_key);
+    redis::Cmd::del(&keys).query_async::<()>(dst).await?;
+    Ok(())
+}
+
+/// Drops all cached `/resolve` responses.
+async fn clear_resolve_cache(dst: &mut MultiplexedConnection) -> Result<()> {
+    let keys = scan_keys(dst, "inmor:resolve:*").await?;
+    for chunk in keys.chunks(SCAN_COUNT) {
+        redis::Cmd::del(chunk).query_async::<()>(dst).await?;
+    }
+    Ok(())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use base64::Engine;
+    use serde_json::json;
+
+    #[test]
+    fn test_is_mirrored() {
+        assert!(is_mirrored("inmor:subordinates:jwt"));
+        assert!(is_mirrored("inmor:tm:https://rp.example.com"));
+        assert!(is_mirrored("inmor:collection:entities"));
+        assert!(!is_mirrored("inmor:resolve:sub:https://rp.example.com"));
+        assert!(!is_mirrored("inmor:jwks_cache:abc"));
+        assert!(!is_mirrored("inmor:collection:staging:entities"));
+        assert!(!is_mirrored("inmor:snapshot:staging:inmor:subordinates"));
+        assert!(!is_mirrored(CHANGES_STREAM));
+        assert!(!is_mirrored(LISTING_VERSIONS));
+        assert!(!is_mirrored("other:key"));
+    }
+
+    #[test]
+    fn test_parse_stream_id() {
+        assert_eq!(parse_stream_id("1792380377744-3"), Some((1792380377744, 3)));
+        assert_eq!(parse_stream_id(FIRST), Some((0, 0)));
+        assert_eq!(parse_stream_id("$"), None);
+        // Ordered by time, then sequence.
+        assert!(parse_stream_id("10-2") > parse_stream_id("10-1"));
+        assert!(parse_stream_id("11-0") > parse_stream_id("10-9"));
+    }
+
+    #[test]
+    fn test_family_patterns_cover_the_served_keys() {
+        for family in [
+            VERSION_SUBORDINATES,
+            VERSION_TRUST_MARKS,
+            VERSION_COLLECTION,
+            VERSION_ENTITY_CONFIGURATION,
+            VERSION_HISTORICAL_KEYS,
+        ] {
+            assert!(family_patterns(family).is_some(), "{family}");
+        }
+        assert!(family_patterns("unknown").is_none());
+        assert!(
+            family_patterns(VERSION_SUBORDINATES)
+                .unwrap()
+                .contains(&CHAIN_BUNDLES)
+        );
+    }
+
+    #[test]
+    fn test_entity_type_keys() {
+        let encode = |value: serde_json::Value| {
+            base64::engine::general_purpose::URL_SAFE_NO_PAD.encode(value.to_string())
+        };
+        let jwt = format!(
+            "{}.{}.sig",
+            encode(json!({"alg": "ES256"})),
+            encode(json!({"metadata": {"openid_provider": {}, "federation_entity": {}}}))
+        );
+
+        let mut keys = entity_type_keys(Some(&jwt));
+        keys.sort();
+        assert_eq!(
+            keys,
+            vec![
+                "inmor:subordinates:by_type:federation_entity",
+                "inmor:subordinates:by_type:openid_provider",
+            ]
+        );
+        assert!(entity_type_keys(None).is_empty());
+        assert!(entity_type_keys(Some("not a jwt")).is_empty());
+    }
+}
@@ -2,23 +2,38 @@
 //!
 //! Walks a federation tree starting from a trust anchor, discovering all
 //! subordinate entities and storing their collection data in Redis.
+//!
+//! Entities are walked concurrently, bounded both overall and per host. In
+//! incremental mode, entities whose entity configuration did not change since
+//! the previous walk reuse their stored collection entry instead of being
+//! verified and processed again.
 
 use anyhow::Result;
+use futures_util::{StreamExt, stream::FuturesUnordered};
+use josekit::jwt::JwtPayload;
 use log::{debug, error, info};
 use serde_json::Value;
+use sha2::{Digest, Sha256};
 use std::collections::{HashMap, HashSet};
-use std::time::{SystemTime, UNIX_EPOCH};
+use std::future::Future;
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant, SystemTime, UNIX_EPOCH};
+use tokio::sync::Semaphore;
 
 use crate::{
-    EntityCollectionResponse, UiInfo, get_entity_configruation_as_jwt,
-    get_jwks_from_payload_or_uri, get_query, get_unverified_payload_header, self_verify_jwt,
-    verify_jwt_with_jwks,
+    CHANGE_REBUILD, EntityCollectionResponse, RedisConnection, UiInfo, VERSION_COLLECTION,
+    get_entity_configruation_as_jwt, get_jwks_from_payload_or_uri, get_query,
+    get_unverified_payload_header, record_change, self_verify_jwt, verify_jwt_with_jwks,
 };
 
 /// Prefix for staging keys used during tree walk.
 /// Data is written here first, then atomically swapped to live keys.
 const STAGING_PREFIX: &str = "inmor:collection:staging";
 
+/// Hash of entity_id → SHA-256 of the entity configuration seen by the last walk.
+/// Used by incremental walks to detect unchanged entities.
+const HASHES_KEY: &str = "inmor:collection:hashes";
+
 /// Known entity type keys we look for in metadata.
 const KNOWN_ENTITY_TYPES: &[&str] = &[
     "openid_provider",
@@ -29,11 +44,139 @@ const KNOWN_ENTITY_TYPES: &[&str] = &[
     "oauth_resource",
 ];
 
+/// Options of a collection walk.
+#[derive(Debug, Clone)]
+pub struct WalkOptions {
+    /// Maximum number of entities processed at the same time.
+    pub concurrency: usize,
+    /// Maximum number of requests in flight to a single host.
+    pub per_host: usize,
+    /// Reuse the previous walk's entries of entities whose entity
+    /// configuration did not change.
+    pub incremental: bool,
+}
+
+impl Default for WalkOptions {
+    fn default() -> Self {
+        WalkOptions {
+            concurrency: 8,
+            per_host: 2,
+            incremental: false,
+        }
+    }
+}
+
+/// Counters of a finished collection walk.
+#[derive(Debug, Default, Clone)]
+pub struct WalkStats {
+    /// Entities stored in the collection.
+    pub entities: usize,
+    /// Entities that were verified and processed again.
+    pub refreshed: usize,
+    /// Entities whose unchanged entry was reused from the previous walk.
+    pub skipped: usize,
+    /// Entities that could not be fetched or verified.
+    pub failed: usize,
+    pub elapsed: Duration,
+}
+
+impl WalkStats {
+    pub fn entities_per_sec(&self) -> f64 {
+        let secs = self.elapsed.as_secs_f64();
+        if secs > 0.0 {
+            self.entities as f64 / secs
+        } else {
+            0.0
+        }
+    }
+}
+
+/// Limits the number of concurrent requests per host.
+struct HostLimiter {
+    per_host: usize,
+    hosts: Mutex<HashMap<String, Arc<Semaphore>>>,
+}
+
+impl HostLimiter {
+    fn new(per_host: usize) -> Self {
+        HostLimiter {
+            per_host: per_host.max(1),
+            hosts: Mutex::new(HashMap::new()),
+        }
+    }
+
+    /// Runs `fetch` once fewer than `per_host` requests to the host of `url`
+    /// are in flight.
+    async fn run<T>(&self, url: &str, fetch: impl Future<Output = T>) -> T {
+        let host = url::Url::parse(url)
+            .ok()
+            .and_then(|u| u.host_str().map(String::from))
+            .unwrap_or_default();
+        let semaphore = self
+            .hosts
+            .lock()
+            .unwrap()
+            .entry(host)
+            .or_insert_with(|| Arc::new(Semaphore::new(self.per_host)))
+            .clone();
+        let _permit = semaphore.acquire().await;
+        fetch.await
+    }
+}
+
+/// What processing one entity produced.
+enum EntityOutcome {
+    Refreshed(Vec<String>),
+    Skipped(Vec<String>),
+    Failed,
+}
+
+/// Verifies an entity configuration, falling back to its `jwks_uri` or
+/// `signed_jwks_uri` when the embedded keys do not verify it.
+async fn verify_entity_configuration(
+    entity_id: &str,
+    jwt_net: &str,
+    conn: &mut RedisConnection,
+) -> Option<JwtPayload> {
+    if let Ok((payload, _)) = self_verify_jwt(jwt_net) {
+        debug!("JWT verification successful for {entity_id}");
+        return Some(payload);
+    }
+    // Self-verification failed — try fetching JWKS from jwks_uri
+    debug!("Self-verification failed for {entity_id}, trying jwks_uri fallback");
+    let (unverified_payload, _) = match get_unverified_payload_header(jwt_net) {
+        Ok(data) => data,
+        Err(e) => {
+            error!("Failed to parse entity configuration JWT for {entity_id}: {e}");
+            return None;
+        }
+    };
+    match get_jwks_from_payload_or_uri(&unverified_payload, conn).await {
+        Ok(keyset) => match verify_jwt_with_jwks(jwt_net, Some(keyset)) {
+            Ok((payload, _)) => {
+                debug!("JWT verification successful for {entity_id} via jwks_uri");
+                Some(payload)
+            }
+            Err(e) => {
+                error!(
+                    "Failed to verify entity configuration for {entity_id} with fetched JWKS: {e}"
+                );
+                None
+            }
+        },
+        Err(e) => {
+            error!("Failed to get JWKS for entity {entity_id}: {e}");
+            None
+        }
+    }
+}
+
 /// Fetches authority subordinate statements and stores them in Redis.
 async fn fetch_all_subordinate_statements(
     authority_hints: &Value,
     entity_id: &str,
-    conn: &mut redis::aio::ConnectionManager,
+    conn: &mut RedisConnection,
+    limiter: &HostLimiter,
 ) {
     let Some(ahints) = authority_hints.as_array() else {
         return;
@@ -43,7 +186,10 @@ async fn fetch_all_subordinate_statements(
             continue;
         };
         debug!("Fetching authority hint: {ahint_str}");
-        let jwt_net = match get_entity_configruation_as_jwt(ahint_str).await {
+        let jwt_net = match limiter
+            .run(ahint_str, get_entity_configruation_as_jwt(ahint_str))
+            .await
+        {
             Ok(res) => res,
             Err(e) => {
                 error!("Failed to fetch authority hint {ahint_str}: {e}");
@@ -51,33 +197,9 @@ async fn fetch_all_subordinate_statements(
             }
         };
 
-        let (entity_payload, _) = match self_verify_jwt(&jwt_net) {
-            Ok(data) => data,
-            Err(_) => {
-                // Self-verification failed — try fetching JWKS from jwks_uri
-                let (unverified_payload, _) = match get_unverified_payload_header(&jwt_net) {
-                    Ok(data) => data,
-                    Err(e) => {
-                        error!("Failed to parse authority hint JWT for {ahint_str}: {e}");
-                        continue;
-                    }
-                };
-                match get_jwks_from_payload_or_uri(&unverified_payload, conn).await {
-                    Ok(keyset) => match verify_jwt_with_jwks(&jwt_net, Some(keyset)) {
-                        Ok(data) => data,
-                        Err(e) => {
-                            error!(
-                                "Failed to verify authority hint JWT for {ahint_str} with fetched JWKS: {e}"
-                            );
-                            continue;
-                        }
-                    },
-                    Err(e) => {
-                        error!("Failed to get JWKS for authority hint {ahint_str}: {e}");
-                        continue;
-                    }
-                }
-            }
+        let Some(entity_payload) = verify_entity_configuration(ahint_str, &jwt_net, conn).await
+        else {
+            continue;
         };
 
         let metadata = match entity_payload.claim("metadata") {
@@ -114,7 +236,7 @@ async fn fetch_all_subordinate_statements(
         {
             let url = format!("{fetch_url}?sub={entity_id}");
             debug!("Fetching subordinate statement from {url}");
-            match get_query(&url).await {
+            match limiter.run(&url, get_query(&url)).await {
                 Ok(jwt_str) => {
                     let _: Result<(), _> =
                         redis::Cmd::hset("inmor:subordinate_query", &url, jwt_str.as_bytes())
@@ -177,31 +299,153 @@ fn detect_entity_types(metadata: &serde_json::Map<String, Value>) -> Vec<String>
 /// Maximum recursion depth for collection tree walking.
 const MAX_COLLECTION_DEPTH: u8 = 20;
 
-/// Walks a single entity: fetches config, classifies, stores collection data,
-/// then recurses into subordinates if the entity is a TA/IA.
-async fn collection_tree_walking(
+/// Returns the collection entry stored by the previous walk, if the entity
+/// configuration is byte for byte the one that walk verified and it has not
+/// expired since.
+async fn previous_entry(
     entity_id: &str,
-    conn: &mut redis::aio::ConnectionManager,
-    visited: &mut HashSet<String>,
-    depth: u8,
+    hash: &str,
+    payload: &JwtPayload,
+    conn: &mut RedisConnection,
+) -> Option<EntityCollectionResponse> {
+    let (old_hash, entry): (Option<String>, Option<String>) = redis::pipe()
+        .hget(HASHES_KEY, entity_id)
+        .hget("inmor:collection:entities", entity_id)
+        .query_async(conn)
+        .await
+        .ok()?;
+    if old_hash.as_deref() != Some(hash) {
+        return None;
+    }
+    if payload
+        .expires_at()
+        .is_some_and(|exp| exp <= SystemTime::now())
+    {
+        return None;
+    }
+    serde_json::from_str(&entry?).ok()
+}
+
+/// Writes one entity's collection data to the staging keys.
+async fn store_entity(
+    response: &EntityCollectionResponse,
+    hash: &str,
+    metadata: &serde_json::Map<String, Value>,
+    conn: &mut RedisConnection,
 ) {
-    if depth > MAX_COLLECTION_DEPTH {
-        error!(
-            "Collection tree walking exceeded maximum depth of {} at {entity_id}",
-            MAX_COLLECTION_DEPTH
-        );
-        return;
+    let entity_id = response.entity_id.as_str();
+    debug!("Storing collection data in staging for {entity_id}");
+    let response_json = serde_json::to_string(response).unwrap_or_default();
+    let mut pipe = redis::pipe();
+    pipe.hset(
+        format!("{STAGING_PREFIX}:entities"),
+        entity_id,
+        &response_json,
+    )
+    .ignore()
+    .hset(format!("{STAGING_PREFIX}:hashes"), entity_id, hash)
+    .ignore();
+
+    for etype in &response.entity_types {
+        pipe.sadd(format!("{STAGING_PREFIX}:by_type:{etype}"), entity_id)
+            .ignore();
+        // Sorted per-type index, so `/collection?entity_type=...` can page by entity_id
+        pipe.zadd(
+            format!("{STAGING_PREFIX}:by_type_sorted:{etype}"),
+            entity_id,
+            0i64,
+        )
+        .ignore();
     }
-    if visited.contains(entity_id) {
-        debug!("Already visited {entity_id}, skipping");
-        return;
+
+    // ZADD with score 0 for lexicographic ordering
+    pipe.zadd(format!("{STAGING_PREFIX}:all_sorted"), entity_id, 0i64)
+        .ignore();
+
+    // Inverted search index over ui_infos, token → entity_ids. The tokens are
+    // recorded so the swap can find the keys without KEYS/SCAN.
+    for token in response.search_tokens() {
+        pipe.sadd(format!("{STAGING_PREFIX}:search:{token}"), entity_id)
+            .ignore()
+            .sadd(format!("{STAGING_PREFIX}:search_tokens"), token)
+            .ignore();
+    }
+
+    // Also populate the existing inmor:op/rp/taia sets for backward compat
+    if metadata.contains_key("openid_relying_party") {
+        pipe.sadd("inmor:rp", entity_id).ignore();
+    } else if metadata.contains_key("openid_provider") {
+        pipe.sadd("inmor:op", entity_id).ignore();
+    } else {
+        pipe.sadd("inmor:taia", entity_id).ignore();
     }
-    visited.insert(entity_id.to_string());
-    debug!("Processing entity #{}: {entity_id}", visited.len());
+    let _: Result<(), _> = pipe.query_async(conn).await;
+}
+
+/// Fetches the subordinates listed by an entity's `federation_list_endpoint`.
+async fn list_subordinates(
+    entity_id: &str,
+    metadata: &serde_json::Map<String, Value>,
+    limiter: &HostLimiter,
+) -> Vec<String> {
+    let Some(list_endpoint) = metadata
+        .get("federation_entity")
+        .and_then(|v| v.as_object())
+        .and_then(|fed_entity| fed_entity.get("federation_list_endpoint"))
+        .and_then(|v| v.as_str())
+    else {
+        debug!("Entity {entity_id} is a leaf (no list endpoint)");
+        return Vec::new();
+    };
+    debug!("Entity {entity_id} has list endpoint: {list_endpoint}");
+    debug!("Fetching subordinate list from {list_endpoint}");
+    match limiter.run(list_endpoint, get_query(list_endpoint)).await {
+        Ok(resp) => {
+            let subs: Vec<String> = serde_json::from_str::<Value>(&resp)
+                .ok()
+                .and_then(|subs| {
+                    subs.as_array().map(|arr| {
+                        arr.iter()
+                            .filter_map(|sub| sub.as_str().map(String::from))
+                            .collect()
+                    })
+                })
+                .unwrap_or_default();
+            debug!(
+                "List endpoint returned {} subordinate(s) for {entity_id}",
+                subs.len()
+            );
+            subs
+        }
+        Err(e) => {
+            error!("Failed to fetch list from {list_endpoint}: {e}");
+            Vec::new()
+        }
+    }
+}
+
+/// Walks a single entity: fetches config, classifies and stores collection
+/// data. Returns the subordinates to walk next if the entity is a TA/IA.
+///
+/// In incremental mode an entity whose configuration is unchanged since the
+/// previous walk keeps its stored entry; it skips verification and the
+/// subordinate statement fetches from its authorities. Its list endpoint is
+/// still read, as subordinates change independently of their superior.
+async fn collection_tree_walking(
+    entity_id: String,
+    mut conn: RedisConnection,
+    limiter: Arc<HostLimiter>,
+    incremental: bool,
+) -> EntityOutcome {
+    let entity_id = entity_id.as_str();
+    let conn = &mut conn;
 
     // Fetch entity configuration
     debug!("Fetching entity configuration from {entity_id}/.well-known/openid-federation");
-    let jwt_net = match get_entity_configruation_as_jwt(entity_id).await {
+    let jwt_net = match limiter
+        .run(entity_id, get_entity_configruation_as_jwt(entity_id))
+        .await
+    {
         Ok(res) => {
             debug!(
                 "Fetched entity configuration for {entity_id} ({} bytes)",
@@ -211,46 +455,25 @@ async fn collection_tree_walking(
         }
         Err(e) => {
             error!("Failed to fetch entity configuration for {entity_id}: {e}");
-            return;
+            return EntityOutcome::Failed;
         }
     };
+    let hash = format!("{:x}", Sha256::digest(jwt_net.as_bytes()));
+
+    if incremental
+        && let Ok((unverified, _)) = get_unverified_payload_header(&jwt_net)
+        && let Some(entry) = previous_entry(entity_id, &hash, &unverified, conn).await
+        && let Some(metadata) = unverified.claim("metadata").and_then(|v| v.as_object())
+    {
+        debug!("Entity configuration of {entity_id} is unchanged, reusing its entry");
+        store_entity(&entry, &hash, metadata, conn).await;
+        return EntityOutcome::Skipped(list_subordinates(entity_id, metadata, &limiter).await);
+    }
 
     // Verify
     debug!("Verifying entity configuration JWT for {entity_id}");
-    let (payload, _) = match self_verify_jwt(&jwt_net) {
-        Ok(data) => {
-            debug!("JWT verification successful for {entity_id}");
-            data
-        }
-        Err(_) => {
-            // Self-verification failed — try fetching JWKS from jwks_uri
-            debug!("Self-verification failed for {entity_id}, trying jwks_uri fallback");
-            let (unverified_payload, _) = match get_unverified_payload_header(&jwt_net) {
-                Ok(data) => data,
-                Err(e) => {
-                    error!("Failed to parse entity configuration JWT for {entity_id}: {e}");
-                    return;
-                }
-            };
-            match get_jwks_from_payload_or_uri(&unverified_payload, conn).await {
-                Ok(keyset) => match verify_jwt_with_jwks(&jwt_net, Some(keyset)) {
-                    Ok(data) => {
-                        debug!("JWT verification successful for {entity_id} via jwks_uri");
-                        data
-                    }
-                    Err(e) => {
-                        error!(
-                            "Failed to verify entity configuration for {entity_id} with fetched JWKS: {e}"
-                        );
-                        return;
-                    }
-                },
-                Err(e) => {
-                    error!("Failed to get JWKS for entity {entity_id}: {e}");
-                    return;
-                }
-            }
-        }
+    let Some(payload) = verify_entity_configuration(entity_id, &jwt_net, conn).await else {
+        return EntityOutcome::Failed;
     };
 
     // Store entity JWT
@@ -263,7 +486,7 @@ async fn collection_tree_walking(
     if let Some(authority_hints) = payload.claim("authority_hints") {
         let hint_count = authority_hints.as_array().map(|a| a.len()).unwrap_or(0);
         debug!("Entity {entity_id} has {hint_count} authority hint(s)");
-        fetch_all_subordinate_statements(authority_hints, entity_id, conn).await;
+        fetch_all_subordinate_statements(authority_hints, entity_id, conn, &limiter).await;
     } else {
         debug!("Entity {entity_id} has no authority hints (likely a trust anchor)");
     }
@@ -274,12 +497,12 @@ async fn collection_tree_walking(
             Some(obj) => obj,
             None => {
                 error!("Metadata is not an object for {entity_id}");
-                return;
+                return EntityOutcome::Failed;
             }
         },
         None => {
             error!("Missing metadata claim for {entity_id}");
-            return;
+            return EntityOutcome::Failed;
         }
     };
 
@@ -315,7 +538,7 @@ async fn collection_tree_walking(
     // Build collection response
     let response = EntityCollectionResponse {
         entity_id: entity_id.to_string(),
-        entity_types: entity_types.clone(),
+        entity_types,
         ui_infos: if ui_infos.is_empty() {
             None
         } else {
@@ -323,109 +546,121 @@ async fn collection_tree_walking(
         },
         trust_marks,
     };
+    store_entity(&response, &hash, metadata, conn).await;
 
-    // Store in staging Redis keys
-    debug!("Storing collection data in staging for {entity_id}");
-    let response_json = serde_json::to_string(&response).unwrap_or_default();
-    let _: Result<(), _> = redis::Cmd::hset(
-        format!("{STAGING_PREFIX}:entities"),
-        entity_id,
-        &response_json,
-    )
-    .query_async(conn)
-    .await;
-
-    for etype in &entity_types {
-        let _: Result<(), _> =
-            redis::Cmd::sadd(format!("{STAGING_PREFIX}:by_type:{etype}"), entity_id)
-                .query_async(conn)
-                .await;
-    }
-
-    // ZADD with score 0 for lexicographic ordering
-    let _: Result<(), _> =
-        redis::Cmd::zadd(format!("{STAGING_PREFIX}:all_sorted"), entity_id, 0i64)
-            .query_async(conn)
-            .await;
+    // If TA/IA, discover subordinates via list endpoint
+    EntityOutcome::Refreshed(list_subordinates(entity_id, metadata, &limiter).await)
+}
 
-    // Also populate the existing inmor:op/rp/taia sets for backward compat
-    if metadata.contains_key("openid_relying_party") {
-        let _: Result<(), _> = redis::Cmd::sadd("inmor:rp", entity_id)
-            .query_async(conn)
-            .await;
-    } else if metadata.contains_key("openid_provider") {
-        let _: Result<(), _> = redis::Cmd::sadd("inmor:op", entity_id)
-            .query_async(conn)
-            .await;
-    } else {
-        let _: Result<(), _> = redis::Cmd::sadd("inmor:taia", entity_id)
-            .query_async(conn)
-            .await;
-    }
+/// Walks the whole tree below `trust_anchor`, processing up to
+/// `options.concurrency` entities at a time.
+async fn walk_tree(
+    trust_anchor: &str,
+    conn: &RedisConnection,
+    options: &WalkOptions,
+    stats: &mut WalkStats,
+) {
+    let limiter = Arc::new(HostLimiter::new(options.per_host));
+    let concurrency = options.concurrency.max(1);
+    let mut visited: HashSet<String> = HashSet::new();
+    let mut pending: Vec<(String, u8)> = vec![(trust_anchor.to_string(), 0)];
+    let mut in_flight = FuturesUnordered::new();
+
+    loop {
+        while in_flight.len() < concurrency
+            && let Some((entity_id, depth)) = pending.pop()
+        {
+            if depth > MAX_COLLECTION_DEPTH {
+                error!(
+                    "Collection tree walking exceeded maximum depth of {} at {entity_id}",
+                    MAX_COLLECTION_DEPTH
+                );
+                continue;
+            }
+            if !visited.insert(entity_id.clone()) {
+                debug!("Skipping {entity_id} (already visited)");
+                continue;
+            }
+            debug!("Processing entity #{}: {entity_id}", visited.len());
+            let walk = collection_tree_walking(
+                entity_id,
+                conn.clone(),
+                limiter.clone(),
+                options.incremental,
+            );
+            in_flight.push(async move { (depth, walk.await) });
+        }
 
-    // If TA/IA, discover subordinates via list endpoint and recurse
-    if let Some(fed_entity) = metadata
-        .get("federation_entity")
-        .and_then(|v| v.as_object())
-        && let Some(list_endpoint) = fed_entity
-            .get("federation_list_endpoint")
-            .and_then(|v| v.as_str())
-    {
-        debug!("Entity {entity_id} has list endpoint: {list_endpoint}");
-        debug!("Fetching subordinate list from {list_endpoint}");
-        match get_query(list_endpoint).await {
-            Ok(resp) => {
-                if let Ok(subs) = serde_json::from_str::<Value>(&resp)
-                    && let Some(sub_array) = subs.as_array()
-                {
-                    debug!(
-                        "List endpoint returned {} subordinate(s) for {entity_id}",
-                        sub_array.len()
-                    );
-                    for sub in sub_array {
-                        if let Some(sub_str) = sub.as_str() {
-                            if visited.contains(sub_str) {
-                                debug!("Skipping {sub_str} (already visited)");
-                                continue;
-                            }
-                            info!("Found subordinate: {sub_str}");
-                            Box::pin(collection_tree_walking(sub_str, conn, visited, depth + 1))
-                                .await;
-                        }
-                    }
-                }
+        let Some((depth, outcome)) = in_flight.next().await else {
+            break;
+        };
+        let subordinates = match outcome {
+            EntityOutcome::Refreshed(subs) => {
+                stats.refreshed += 1;
+                subs
             }
-            Err(e) => {
-                error!("Failed to fetch list from {list_endpoint}: {e}");
+            EntityOutcome::Skipped(subs) => {
+                stats.skipped += 1;
+                subs
+            }
+            EntityOutcome::Failed => {
+                stats.failed += 1;
+                continue;
+            }
+        };
+        for sub in subordinates {
+            if !visited.contains(&sub) {
+                info!("Found subordinate: {sub}");
+                pending.push((sub, depth + 1));
             }
         }
-    } else {
-        debug!("Entity {entity_id} is a leaf (no list endpoint)");
     }
+    stats.entities = stats.refreshed + stats.skipped;
 }
 
 /// Returns the list of known collection Redis keys for a given prefix.
 /// This avoids using the KEYS command which blocks the Redis event loop.
 fn known_collection_keys(prefix: &str) -> Vec<String> {
-    let mut keys = vec![format!("{prefix}:entities"), format!("{prefix}:all_sorted")];
+    let mut keys = vec![
+        format!("{prefix}:entities"),
+        format!("{prefix}:all_sorted"),
+        format!("{prefix}:hashes"),
+        format!("{prefix}:search_tokens"),
+    ];
     for etype in KNOWN_ENTITY_TYPES {
         keys.push(format!("{prefix}:by_type:{etype}"));
+        keys.push(format!("{prefix}:by_type_sorted:{etype}"));
     }
     keys
 }
 
+/// Returns the search index keys listed in `{prefix}:search_tokens`.
+async fn search_index_keys(prefix: &str, conn: &mut RedisConnection) -> Vec<String> {
+    let tokens: Vec<String> = redis::Cmd::smembers(format!("{prefix}:search_tokens"))
+        .query_async(conn)
+        .await
+        .unwrap_or_default();
+    tokens
+        .into_iter()
+        .map(|token| format!("{prefix}:search:{token}"))
+        .collect()
+}
+
 /// Runs a full collection walk starting from the given trust anchor.
 ///
 /// Writes to staging Redis keys during the walk, then atomically swaps
 /// them to live keys so `/collection` never sees partial data.
 pub async fn run_collection_walk(
     trust_anchor: &str,
-    conn: &mut redis::aio::ConnectionManager,
-) -> Result<usize> {
+    conn: &mut RedisConnection,
+    options: &WalkOptions,
+) -> Result<WalkStats> {
     info!("Starting collection walk from {trust_anchor}");
+    let start = Instant::now();
 
     // Clean any leftover staging data
-    let staging_keys = known_collection_keys(STAGING_PREFIX);
+    let mut staging_keys = known_collection_keys(STAGING_PREFIX);
+    staging_keys.extend(search_index_keys(STAGING_PREFIX, conn).await);
     debug!(
         "Cleaning {} possible leftover staging key(s)",
         staging_keys.len()
@@ -433,12 +668,18 @@ pub async fn run_collection_walk(
     let _: Result<(), _> = redis::cmd("DEL").arg(&staging_keys).query_async(conn).await;
 
     // Walk the tree
-    debug!("Beginning recursive tree walk from {trust_anchor}");
-    let mut visited = HashSet::new();
-    collection_tree_walking(trust_anchor, conn, &mut visited, 0).await;
+    debug!(
+        "Beginning tree walk from {trust_anchor} (concurrency {}, {} per host, incremental {})",
+        options.concurrency, options.per_host, options.incremental
+    );
+    let mut stats = WalkStats::default();
+    walk_tree(trust_anchor, conn, options, &mut stats).await;
 
-    let entity_count = visited.len();
-    info!("Walk complete: {entity_count} entities discovered");
+    let entity_count = stats.entities;
+    info!(
+        "Walk complete: {entity_count} entities discovered ({} refreshed, {} unchanged, {} failed)",
+        stats.refreshed, stats.skipped, stats.failed
+    );
 
     // Atomic swap: delete old live keys, rename staging → live
     debug!("Preparing atomic swap of staging → live keys");
@@ -446,12 +687,14 @@ pub async fn run_collection_walk(
 
     // Delete old live collection keys
     let mut live_keys = known_collection_keys("inmor:collection");
+    live_keys.extend(search_index_keys("inmor:collection", conn).await);
     live_keys.push("inmor:collection:last_updated".to_string());
     debug!("Deleting {} old live key(s)", live_keys.len());
     pipe.cmd("DEL").arg(&live_keys).ignore();
 
     // Rename staging keys to live
-    let staging_keys = known_collection_keys(STAGING_PREFIX);
+    let mut staging_keys = known_collection_keys(STAGING_PREFIX);
+    staging_keys.extend(search_index_keys(STAGING_PREFIX, conn).await);
     debug!("Renaming {} staging key(s) to live", staging_keys.len());
     for staging_key in &staging_keys {
         let live_key = staging_key.replace("inmor:collection:staging:", "inmor:collection:");
@@ -468,10 +711,84 @@ pub async fn run_collection_walk(
         .arg("inmor:collection:last_updated")
         .arg(now)
         .ignore();
+    // New ETag for /collection, and an entry on the change stream for mirrors
+    record_change(&mut pipe, VERSION_COLLECTION, CHANGE_REBUILD, "");
 
     debug!("Executing atomic swap pipeline");
     pipe.query_async::<()>(conn).await?;
 
     info!("Collection data swapped to live keys (last_updated={now})");
-    Ok(entity_count)
+    stats.elapsed = start.elapsed();
+    Ok(stats)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::sync::atomic::{AtomicUsize, Ordering};
+
+    /// Counts the requests in flight, and the most that were at once.
+    #[derive(Default)]
+    struct InFlight {
+        now: AtomicUsize,
+        peak: AtomicUsize,
+    }
+
+    impl InFlight {
+        async fn request(&self) {
+            let now = self.now.fetch_add(1, Ordering::SeqCst) + 1;
+            self.peak.fetch_max(now, Ordering::SeqCst);
+            tokio::time::sleep(Duration::from_millis(20)).await;
+            self.now.fetch_sub(1, Ordering::SeqCst);
+        }
+    }
+
+    #[tokio::test]
+    async fn test_host_limiter_caps_requests_per_host() {
+        let limiter = HostLimiter::new(2);
+        let (a, b, all) = (
+            InFlight::default(),
+            InFlight::default(),
+            InFlight::default(),
+        );
+        // The port and the path do not matter, only the host.
+        let requests: Vec<(String, &InFlight)> = (0..6)
+            .flat_map(|i| {
+                [
+                    (format!("https://a.example.com:{}/x", 8000 + i), &a),
+                    (format!("https://b.example.com/{i}"), &b),
+                ]
+            })
+            .collect();
+        let (limiter, all) = (&limiter, &all);
+        futures_util::future::join_all(requests.iter().map(move |(url, host)| {
+            limiter.run(url, async move {
+                tokio::join!(host.request(), all.request());
+            })
+        }))
+        .await;
+
+        assert_eq!(a.peak.load(Ordering::SeqCst), 2);
+        assert_eq!(b.peak.load(Ordering::SeqCst), 2);
+        // The hosts do not wait for each other.
+        assert_eq!(all.peak.load(Ordering::SeqCst), 4);
+    }
+
+    #[test]
+    fn test_host_limiter_allows_at_least_one_request() {
+        assert_eq!(HostLimiter::new(0).per_host, 1);
+    }
+
+    #[test]
+    fn test_walk_stats_rate() {
+        let mut stats = WalkStats {
+            entities: 30,
+            refreshed: 10,
+            skipped: 20,
+            ..Default::default()
+        };
+        assert_eq!(stats.entities_per_sec(), 0.0);
+        stats.elapsed = Duration::from_secs(2);
+        assert_eq!(stats.entities_per_sec(), 15.0);
+    }
 }
@@ -1,9 +1,12 @@
 import http.server
+import json
 import os
+import re
 import subprocess
 import tempfile
 import threading
 import time
+import urllib.parse
 
 import httpx
 import pytest
@@ -13,6 +16,7 @@ from redis.client import Redis
 file_dir = os.path.dirname(os.path.abspath(__file__))
 dbpath = os.path.join(file_dir, "redisdata")
 inmor_path = os.path.join(os.path.dirname(file_dir), "target/debug/inmor")
+collection_path = os.path.join(os.path.dirname(file_dir), "target/debug/inmor-collection")
 
 # mkcert CA root certificate for TLS verification
 MKCERT_CA = os.path.expanduser("./dev/rootCA.pem")
@@ -22,6 +26,11 @@ trdb = factories.redis_proc(port=6088, datadir=dbpath)
 
 rdb = factories.redisdb("trdb")
 
+# The local Redis of a mirror TA, see start_mirror_server.
+tmirrordb = factories.redis_proc(port=6089)
+
+mirrordb = factories.redisdb("tmirrordb")
+
 
 @pytest.fixture(scope="session")
 def http_client():
@@ -38,6 +47,8 @@ def loaddata(rdb: Redis) -> Redis:
         data = f.read()
         # Now redis-cli against this
         _ = subprocess.run(["redis-cli", "-p", "6088", "--pipe"], input=data)
+    # Like the admin does on every change, tell the TA to drop its cached responses.
+    _ = redis.publish("inmor:response_cache", "*")
     return redis
 
 
@@ -47,17 +58,42 @@ class _FakeSubject:
     Listens on a loopback HTTP port and serves whatever JWT body has been
     registered via `set_entity_configuration()`. Used to test /resolve
     trust-mark behaviour: the resolver fetches `<entity_id>/.well-known/openid-federation`
-    and we control the response.
+    and we control the response. As an intermediate it also serves the
+    subordinate statements registered via `set_subordinate_statement()` at
+    `<entity_id>/fetch?sub=...`, and the subordinates added with
+    `add_subordinate()` at `<entity_id>/list`.
     """
 
     def __init__(self, port: int, server: http.server.HTTPServer):
         self.port = port
         self.entity_id = f"http://127.0.0.1:{port}"
+        self.fetch_endpoint = f"{self.entity_id}/fetch"
+        self.list_endpoint = f"{self.entity_id}/list"
         self._server = server
 
     def set_entity_configuration(self, jwt_body: str) -> None:
         self._server.entity_config = jwt_body.encode()  # type: ignore[attr-defined]
 
+    def set_subordinate_statement(self, sub: str, jwt_body: str) -> None:
+        self._server.statements[sub] = jwt_body.encode()  # type: ignore[attr-defined]
+
+    def add_subordinate(self, sub: str) -> None:
+        self._server.subordinates.append(sub)  # type: ignore[attr-defined]
+
+    def set_delay(self, seconds: float) -> None:
+        """Waits this long before answering each request."""
+        self._server.delay = seconds  # type: ignore[attr-defined]
+
+    @property
+    def requests(self) -> list[str]:
+        """The paths requested so far, in order."""
+        return self._server.requests  # type: ignore[attr-defined]
+
+    @property
+    def max_in_flight(self) -> int:
+        """The largest number of requests that were answered at the same time."""
+        return self._server.max_in_flight  # type: ignore[attr-defined]
+
     def shutdown(self) -> None:
         self._server.shutdown()
         self._server.server_close()
@@ -65,38 +101,71 @@ class _FakeSubject:
 
 class _SubjectHandler(http.server.BaseHTTPRequestHandler):
     def do_GET(self):  # noqa: N802 — required by stdlib API
-        if self.path == "/.well-known/openid-federation":
+        server = self.server
+        with server.lock:  # type: ignore[attr-defined]
+            server.requests.append(self.path)  # type: ignore[attr-defined]
+            server.in_flight += 1  # type: ignore[attr-defined]
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)  # type: ignore[attr-defined]
+        try:
+            time.sleep(server.delay)  # type: ignore[attr-defined]
+            self._respond()
+        finally:
+            with server.lock:  # type: ignore[attr-defined]
+                server.in_flight -= 1  # type: ignore[attr-defined]
+
+    def _respond(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/.well-known/openid-federation":
             body = getattr(self.server, "entity_config", None)
-            if not body:
-                self.send_response(503)
+        elif url.path == "/fetch":
+            sub = urllib.parse.parse_qs(url.query).get("sub", [""])[0]
+            body = self.server.statements.get(sub)  # type: ignore[attr-defined]
+            if body is None:
+                self.send_response(404)
                 self.end_headers()
                 return
-            self.send_response(200)
-            self.send_header("Content-Type", "application/entity-statement+jwt")
-            self.send_header("Content-Length", str(len(body)))
+        elif url.path == "/list":
+            body = json.dumps(self.server.subordinates).encode()  # type: ignore[attr-defined]
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if not body:
+            self.send_response(503)
             self.end_headers()
-            self.wfile.write(body)
             return
-        self.send_response(404)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/entity-statement+jwt")
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
+        self.wfile.write(body)
 
     def log_message(self, *_):  # silence stderr spam
         return
 
 
-@pytest.fixture(scope="function")
-def fake_subject():
-    """A loopback HTTP server that the TA can `GET` as a federation subject.
-
-    Binds to port 0 and reads back the OS-assigned port from `server_address`
-    after bind — no race window between port discovery and listener creation.
-    """
-    server = http.server.HTTPServer(("127.0.0.1", 0), _SubjectHandler)
+def _start_fake_subject() -> tuple[_FakeSubject, threading.Thread]:
+    # Binds to port 0 and reads back the OS-assigned port from `server_address`
+    # after bind — no race window between port discovery and listener creation.
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _SubjectHandler)
     port = server.server_address[1]
     server.entity_config = None  # type: ignore[attr-defined]
+    server.statements = {}  # type: ignore[attr-defined]
+    server.delay = 0.0  # type: ignore[attr-defined]
+    server.subordinates = []  # type: ignore[attr-defined]
+    server.requests = []  # type: ignore[attr-defined]
+    server.lock = threading.Lock()  # type: ignore[attr-defined]
+    server.in_flight = 0  # type: ignore[attr-defined]
+    server.max_in_flight = 0  # type: ignore[attr-defined]
     thread = threading.Thread(target=server.serve_forever, daemon=True)
     thread.start()
-    fs = _FakeSubject(port, server)
+    return _FakeSubject(port, server), thread
+
+
+@pytest.fixture(scope="function")
+def fake_subject():
+    """A loopback HTTP server that the TA can `GET` as a federation subject."""
+    fs, thread = _start_fake_subject()
     try:
         yield fs
     finally:
@@ -104,6 +173,23 @@ def fake_subject():
         thread.join(timeout=2)
 
 
+@pytest.fixture(scope="function")
+def fake_entities():
+    """Starts any number of fake federation entities: `fake_entities()` returns a new one."""
+    started: list[tuple[_FakeSubject, threading.Thread]] = []
+
+    def start() -> _FakeSubject:
+        started.append(_start_fake_subject())
+        return started[-1][0]
+
+    try:
+        yield start
+    finally:
+        for fs, thread in started:
+            fs.shutdown()
+            thread.join(timeout=2)
+
+
 @pytest.fixture(scope="session")
 def start_server(trdb):
     """Starts the inmor rust application on a port and returns it."""
@@ -125,3 +211,57 @@ def start_server(trdb):
         time.sleep(1)  # Wait for server to start
         yield port
         inmor_proc.terminate()
+
+
+@pytest.fixture(scope="function")
+def start_mirror_server(loaddata, mirrordb):
+    """Starts a second inmor as a mirror of the loaded Redis and returns its port."""
+    port = 8081
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tconfig = os.path.join(tmpdir, "mirrorconfig.toml")
+        with open(tconfig, "w") as f:
+            f.write('domain = "https://localhost:8080"\n')
+            f.write('redis_uri = "redis://localhost:6089"\n')
+            f.write('mirror_redis_uri = "redis://localhost:6088"\n')
+            f.write('tls_cert = "dev/localhost+2.pem"\n')
+            f.write('tls_key = "dev/localhost+2-key.pem"\n')
+            f.write("allow_http = true\n")
+        inmor_proc = subprocess.Popen([inmor_path, "-p", str(port), "-c", tconfig])
+        assert not inmor_proc.poll()
+        time.sleep(1)  # Wait for server to start
+        yield port
+        inmor_proc.terminate()
+        _ = inmor_proc.wait()
+
+
+@pytest.fixture(scope="function")
+def collection_walk(loaddata, tmp_path):
+    """Runs inmor-collection against the loaded Redis.
+
+    `collection_walk(entity_id, *options)` walks the tree below entity_id and
+    returns the refreshed, skipped and failed counts the walk reported.
+    """
+    tconfig = tmp_path / "collectionconfig.toml"
+    _ = tconfig.write_text(
+        'domain = "https://localhost:8080"\n'
+        'redis_uri = "redis://localhost:6088"\n'
+        'tls_cert = "dev/localhost+2.pem"\n'
+        'tls_key = "dev/localhost+2-key.pem"\n'
+        "allow_http = true\n"
+    )
+
+    def walk(entity_id: str, *options: str) -> dict[str, int]:
+        proc = subprocess.run(
+            [collection_path, "-c", str(tconfig), entity_id, *options],
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        assert proc.returncode == 0, proc.stderr
+        counts = re.search(
+            r"Refreshed: (\d+), unchanged \(skipped\): (\d+), failed: (\d+)", proc.stderr
+        )
+        assert counts is not None, proc.stderr
+        return dict(zip(("refreshed", "skipped", "failed"), map(int, counts.groups())))
+
+    return walk
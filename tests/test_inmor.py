@@ -81,6 +81,7 @@ def _repatch_ta_ec(rdb: Redis, **payload_changes):
         else:
             payload[k] = v
     rdb.set("inmor:entity_id", _resign_payload(payload, header))
+    rdb.publish("inmor:response_cache", "entity_configuration")
 
 
 def _set_trust_mark_issuers(rdb: Redis, mapping):
@@ -175,6 +176,7 @@ def _build_subject(
     # The /fetch endpoint reads `inmor:subordinates` (the signed sub statement);
     # `inmor:subordinates:jwt` is a separate hash used by /list (subject's own EC).
     rdb.hset("inmor:subordinates", subject_id, sub_statement)
+    rdb.publish("inmor:response_cache", f"fetch:{subject_id}")
 
     return subject_id
 
@@ -260,6 +262,39 @@ def test_trust_mark_list_with_unknown_sub_returns_empty(
     assert data == []
 
 
+def test_trust_mark_list_pagination(loaddata: Redis, start_server: int, http_client: Client):
+    "Tests /trust_mark_list pages with limit and the Link header, with and without the index"
+    rdb = loaddata
+    port = start_server
+    tm_type = "https://sunet.se/does_not_exist_trustmark"
+    holders = sorted(m.decode() for m in rdb.smembers(f"inmor:tmtype:{tm_type}"))
+    assert len(holders) == 4
+
+    def pages() -> list[list[str]]:
+        result = []
+        url = f"https://localhost:{port}/trust_mark_list?trust_mark_type={tm_type}&limit=3"
+        while url:
+            resp = http_client.get(url)
+            assert resp.status_code == 200
+            result.append(resp.json())
+            link = resp.headers.get("link")
+            url = f"https://localhost:{port}{link[1 : link.index('>')]}" if link else ""
+        return result
+
+    # Read from the inmor:tmtype set until the sorted index exists.
+    assert pages() == [holders[:3], holders[3:]]
+    _ = rdb.zadd(f"inmor:tmtype_sorted:{tm_type}", {holder: 0 for holder in holders})
+    assert pages() == [holders[:3], holders[3:]]
+
+    url = f"https://localhost:{port}/trust_mark_list?trust_mark_type={tm_type}&from={holders[2]}"
+    resp = http_client.get(url)
+    assert resp.json() == holders[2:]
+    assert "link" not in resp.headers
+
+    url = f"https://localhost:{port}/trust_mark_list?trust_mark_type={tm_type}&limit=0"
+    assert http_client.get(url).status_code == 400
+
+
 def test_trust_mark_for_entity(loaddata: Redis, start_server: int, http_client: Client):
     "Tests /trust_mark"
     _rdb = loaddata
@@ -310,6 +345,30 @@ def test_trust_mark_status(loaddata: Redis, start_server: int, http_client: Clie
     assert payload.get("trust_mark") == original_trust_mark
 
 
+def test_trust_mark_status_follows_revocation(
+    loaddata: Redis, start_server: int, http_client: Client
+):
+    "Tests memoized /trust_mark_status verdicts are dropped when the admin revokes the mark"
+    rdb = loaddata
+    port = start_server
+    tm_type = "https://sunet.se/does_not_exist_trustmark"
+    sub = "https://fakerp0.labb.sunet.se"
+    url = f"https://localhost:{port}/trust_mark?trust_mark_type={tm_type}&sub={sub}"
+    trust_mark = http_client.get(url).text
+    url = f"https://localhost:{port}/trust_mark_status"
+
+    def status() -> str:
+        resp = http_client.post(url, data={"trust_mark": trust_mark})
+        assert resp.status_code == 200
+        return _decode_jwt_payload(resp.text)["status"]
+
+    assert status() == "active"
+    assert status() == "active"
+    rdb.hset(f"inmor:tm:{sub}", tm_type, "revoked")
+    rdb.publish("inmor:response_cache", f"trust_mark:{sub}")
+    assert status() == "revoked"
+
+
 def test_trust_mark_status_invalid(loaddata: Redis, start_server: int, http_client: Client):
     "Tests /trust_mark_status for invalid input"
     rdb = loaddata
@@ -411,6 +470,234 @@ def test_ta_list_subordinates_bytrustmark(loaddata: Redis, start_server: int, ht
     assert set(data) == subs
 
 
+def test_ta_list_subordinates_by_entity_type(
+    loaddata: Redis, start_server: int, http_client: Client
+):
+    "Tests /list filters answered from the index sets"
+    _rdb = loaddata
+    port = start_server
+    base = f"https://localhost:{port}/list"
+
+    resp = http_client.get(f"{base}?entity_type=openid_provider")
+    assert resp.status_code == 200
+    assert resp.json() == ["https://fakeop0.labb.sunet.se"]
+
+    # Multiple entity types are ORed, the result is ordered by entity_id.
+    resp = http_client.get(
+        f"{base}?entity_type=openid_provider&entity_type=openid_relying_party"
+    )
+    assert resp.json() == [
+        "https://fakeop0.labb.sunet.se",
+        "https://fakerp0.labb.sunet.se",
+        "https://fakerp1.labb.sunet.se",
+    ]
+
+    resp = http_client.get(f"{base}?intermediate=true")
+    assert resp.json() == []
+
+    resp = http_client.get(
+        f"{base}?entity_type=openid_relying_party"
+        "&trust_mark_type=https://example.com/trust_mark_type"
+    )
+    assert resp.json() == [
+        "https://fakerp0.labb.sunet.se",
+        "https://fakerp1.labb.sunet.se",
+    ]
+
+
+def test_ta_list_subordinates_pagination(loaddata: Redis, start_server: int, http_client: Client):
+    "Tests /list pages with limit and from, unfiltered and filtered"
+    _rdb = loaddata
+    port = start_server
+    base = f"https://localhost:{port}/list"
+
+    resp = http_client.get(f"{base}?limit=2")
+    assert resp.json() == ["https://fakeop0.labb.sunet.se", "https://fakerp0.labb.sunet.se"]
+    link = resp.headers["link"]
+    assert link == '</list?limit=2&from=https%3A%2F%2Ffakerp1.labb.sunet.se>; rel="next"'
+    resp = http_client.get(f"https://localhost:{port}{link[1 : link.index('>')]}")
+    assert resp.json() == ["https://fakerp1.labb.sunet.se"]
+    assert "link" not in resp.headers
+
+    resp = http_client.get(f"{base}?entity_type=openid_relying_party&limit=1")
+    assert resp.json() == ["https://fakerp0.labb.sunet.se"]
+    assert "from=https%3A%2F%2Ffakerp1.labb.sunet.se" in resp.headers["link"]
+    assert "entity_type=openid_relying_party" in resp.headers["link"]
+
+    assert http_client.get(f"{base}?limit=0").status_code == 400
+
+
+def test_ta_list_subordinates_without_index(
+    loaddata: Redis, start_server: int, http_client: Client
+):
+    "Tests /list falls back to decoding the entity configurations without the index"
+    rdb = loaddata
+    _ = rdb.delete("inmor:subordinates:index")
+    port = start_server
+    url = f"https://localhost:{port}/list?entity_type=openid_provider"
+    resp = http_client.get(url)
+    assert resp.status_code == 200
+    assert resp.json() == ["https://fakeop0.labb.sunet.se"]
+
+
+def _store_collection(rdb: Redis, entities: dict[str, list[str]]) -> None:
+    "Writes collection data the way the inmor-collection walk does"
+    for entity_id, entity_types in entities.items():
+        entry = {"entity_id": entity_id, "entity_types": entity_types}
+        _ = rdb.hset("inmor:collection:entities", entity_id, json.dumps(entry))
+        _ = rdb.zadd("inmor:collection:all_sorted", {entity_id: 0})
+        for etype in entity_types:
+            _ = rdb.sadd(f"inmor:collection:by_type:{etype}", entity_id)
+            _ = rdb.zadd(f"inmor:collection:by_type_sorted:{etype}", {entity_id: 0})
+
+
+def test_ta_collection_pagination(loaddata: Redis, start_server: int, http_client: Client):
+    "Tests /collection pages through the sorted indexes with limit and from"
+    rdb = loaddata
+    _store_collection(
+        rdb,
+        {
+            "https://a.example.com": ["openid_provider"],
+            "https://b.example.com": ["openid_relying_party"],
+            "https://c.example.com": ["openid_provider"],
+            "https://d.example.com": ["federation_entity"],
+        },
+    )
+    base = f"https://localhost:{start_server}/collection"
+
+    data = http_client.get(base).json()
+    assert [e["entity_id"] for e in data["entities"]] == [
+        "https://a.example.com",
+        "https://b.example.com",
+        "https://c.example.com",
+        "https://d.example.com",
+    ]
+    assert "next" not in data
+
+    data = http_client.get(f"{base}?limit=3").json()
+    assert len(data["entities"]) == 3
+    assert data["next"] == "https://d.example.com"
+    data = http_client.get(f"{base}?limit=3&from={data['next']}").json()
+    assert [e["entity_id"] for e in data["entities"]] == ["https://d.example.com"]
+    assert "next" not in data
+
+    url = f"{base}?entity_type=openid_provider&entity_type=openid_relying_party&limit=2"
+    data = http_client.get(url).json()
+    assert [e["entity_id"] for e in data["entities"]] == [
+        "https://a.example.com",
+        "https://b.example.com",
+    ]
+    assert data["next"] == "https://c.example.com"
+
+    # Collection data without the per-type indexes is still filtered.
+    _ = rdb.delete("inmor:collection:by_type_sorted:openid_provider")
+    data = http_client.get(f"{base}?entity_type=openid_provider&from=https://b.example.com").json()
+    assert [e["entity_id"] for e in data["entities"]] == ["https://c.example.com"]
+
+    resp = http_client.get(f"{base}?limit=0")
+    assert resp.status_code == 400
+    assert resp.json()["error"] == "invalid_request"
+
+
+def test_ta_collection_query(loaddata: Redis, start_server: int, http_client: Client):
+    "Tests /collection?query= answers from the search index"
+    rdb = loaddata
+    names = {
+        "https://op.example.com": "Sunet Login",
+        "https://rp1.example.com": "Sunet Wiki",
+        "https://rp2.example.com": "Example Wiki",
+    }
+    for entity_id, name in names.items():
+        etype = "openid_provider" if "op." in entity_id else "openid_relying_party"
+        entry = {
+            "entity_id": entity_id,
+            "entity_types": [etype],
+            "ui_infos": {etype: {"display_name": name}},
+        }
+        _ = rdb.hset("inmor:collection:entities", entity_id, json.dumps(entry))
+        _ = rdb.sadd(f"inmor:collection:by_type:{etype}", entity_id)
+        for token in name.lower().split():
+            _ = rdb.sadd(f"inmor:collection:search:{token}", entity_id)
+    base = f"https://localhost:{start_server}/collection"
+
+    data = http_client.get(f"{base}?query=WIKI").json()
+    assert [e["entity_id"] for e in data["entities"]] == [
+        "https://rp1.example.com",
+        "https://rp2.example.com",
+    ]
+    # All words must match.
+    data = http_client.get(f"{base}?query=sunet%20wiki").json()
+    assert [e["entity_id"] for e in data["entities"]] == ["https://rp1.example.com"]
+    data = http_client.get(f"{base}?query=sunet&entity_type=openid_provider").json()
+    assert [e["entity_id"] for e in data["entities"]] == ["https://op.example.com"]
+    data = http_client.get(f"{base}?query=sunet&limit=1").json()
+    assert data["next"] == "https://rp1.example.com"
+    data = http_client.get(f"{base}?query=nothing").json()
+    assert data["entities"] == []
+
+    resp = http_client.get(f"{base}?query=%20-")
+    assert resp.status_code == 400
+
+
+def test_ta_listing_etags(loaddata: Redis, start_server: int, http_client: Client):
+    "Tests /list, /trust_mark_list and /collection ETags follow the inmor:versions counters"
+    rdb = loaddata
+    port = start_server
+    list_url = f"https://localhost:{port}/list"
+
+    # Without the counters there is nothing to validate against.
+    assert "etag" not in http_client.get(list_url).headers
+
+    _ = rdb.hset("inmor:versions", mapping={"subordinates": 3, "trust_marks": 7, "collection": 1})
+    resp = http_client.get(list_url)
+    assert resp.headers["etag"] == 'W/"list-3-7"'
+    assert resp.headers["cache-control"] == "no-cache"
+    # Every content coding of the listing has the same weak ETag.
+    resp = http_client.get(list_url, headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["etag"] == 'W/"list-3-7"'
+    resp = http_client.get(list_url, headers={"If-None-Match": 'W/"list-3-7"'})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+    # A trust mark change gives /list a new version too.
+    _ = rdb.hincrby("inmor:versions", "trust_marks", 1)
+    resp = http_client.get(list_url, headers={"If-None-Match": 'W/"list-3-7"'})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] == 'W/"list-3-8"'
+
+    url = f"https://localhost:{port}/trust_mark_list?trust_mark_type={_TM_TYPE}"
+    assert http_client.get(url).headers["etag"] == 'W/"trust_mark_list-8"'
+    resp = http_client.get(url, headers={"If-None-Match": 'W/"trust_mark_list-8"'})
+    assert resp.status_code == 304
+
+    url = f"https://localhost:{port}/collection"
+    assert http_client.get(url).headers["etag"] == 'W/"collection-1"'
+    resp = http_client.get(url, headers={"If-None-Match": 'W/"collection-1"'})
+    assert resp.status_code == 304
+
+
+def test_ta_compresses_large_responses(loaddata: Redis, start_server: int, http_client: Client):
+    "Tests large responses are compressed as negotiated, small ones are not"
+    rdb = loaddata
+    _store_collection(
+        rdb, {f"https://rp{i:03}.example.com": ["openid_relying_party"] for i in range(100)}
+    )
+    port = start_server
+
+    url = f"https://localhost:{port}/collection"
+    resp = http_client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in resp.headers["vary"].lower()
+    assert len(resp.json()["entities"]) == 100
+
+    resp = http_client.get(url, headers={"Accept-Encoding": "identity"})
+    assert resp.headers.get("content-encoding", "identity") == "identity"
+
+    resp = http_client.get(f"{url}?limit=1", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert len(resp.json()["entities"]) == 1
+
+
 def test_ta_fetch_missing_sub_returns_400(loaddata: Redis, start_server: int, http_client: Client):
     "Tests /fetch without sub parameter returns 400, not 500 (spec 8.9)"
     _rdb = loaddata
@@ -621,6 +908,30 @@ def test_ta_entity_configuration(loaddata: Redis, start_server: int, http_client
     assert federation_entity.get("federation_trust_mark_endpoint") == f"{base_url}/trust_mark"
 
 
+def test_entity_configuration_conditional_get(
+    loaddata: Redis, start_server: int, http_client: Client
+):
+    "Tests /.well-known/openid-federation answers with ETag, 304 and follows admin changes"
+    rdb = loaddata
+    url = f"https://localhost:{start_server}/.well-known/openid-federation"
+    resp = http_client.get(url)
+    assert resp.status_code == 200
+    etag = resp.headers["etag"]
+    assert resp.headers["cache-control"].startswith("max-age=")
+    assert int(resp.headers["content-length"]) == len(resp.content)
+
+    resp = http_client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+
+    # The change notification published by the admin drops the cached copy.
+    _repatch_ta_ec(rdb, organization_name="Changed")
+    resp = http_client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    assert _decode_jwt_payload(resp.text)["organization_name"] == "Changed"
+
+
 def test_historical_keys_endpoint(loaddata: Redis, start_server: int, http_client: Client):
     "Tests /historical_keys endpoint returns signed JWT with historical keys"
     _rdb = loaddata
@@ -819,6 +1130,220 @@ def test_resolve_timeout_on_unreachable(loaddata: Redis, start_server: int, http
     assert "Retry-After" in resp.headers, "503 transient response must include Retry-After"
 
 
+# ---------------------------------------------------------------------------
+# /resolve through fake intermediates
+# ---------------------------------------------------------------------------
+#
+# Each entity is a `fake_entities()` server that serves its own entity
+# configuration and, for intermediates, the subordinate statements it issued at
+# its /fetch endpoint. Only the statement about the topmost intermediate is
+# registered with the TA.
+
+
+def _sign_statement(payload: dict, key: jwk.JWK) -> str:
+    header = {"alg": "RS256", "kid": key.kid, "typ": "entity-statement+jwt"}
+    token = jwt.JWT(header=header, claims=payload)
+    token.make_signed_token(key)
+    return token.serialize()
+
+
+def _statement_payload(issuer: str, sub: str, key: jwk.JWK, **claims) -> dict:
+    now = int(time.time())
+    return {
+        "iss": issuer,
+        "sub": sub,
+        "iat": now,
+        "exp": now + 3600,
+        "jwks": {"keys": [json.loads(key.export(private_key=False))]},
+        **claims,
+    }
+
+
+def _serve_configuration(entity, key: jwk.JWK, authority_hints: list[str], **claims) -> None:
+    """Signs and serves the entity configuration of a fake entity."""
+    claims = {
+        "metadata": {
+            "federation_entity": {
+                "federation_fetch_endpoint": entity.fetch_endpoint,
+                "federation_list_endpoint": entity.list_endpoint,
+            }
+        },
+        **claims,
+    }
+    if authority_hints:
+        claims["authority_hints"] = authority_hints
+    configuration = _statement_payload(entity.entity_id, entity.entity_id, key, **claims)
+    entity.set_entity_configuration(_sign_statement(configuration, key))
+
+
+def _build_federation(
+    rdb: Redis,
+    fake_entities,
+    hints: dict[str, list[str]],
+    withheld: tuple[tuple[str, str], ...] = (),
+) -> tuple[dict, dict[str, jwk.JWK]]:
+    """Builds a federation below the TA from `{name: [names of authority hints]}`.
+
+    The name "ta" stands for the TA. Every authority issues a statement about
+    each entity that names it, except for the `(authority, entity)` pairs in
+    `withheld`, and lists it at its list endpoint. Returns the fake entities
+    and their keys by name.
+    """
+    entities = {name: fake_entities() for name in hints}
+    keys = {}
+    for name in hints:
+        keys[name] = jwk.JWK.generate(kty="RSA", size=2048, alg="RS256", use="sig")
+        keys[name].kid = keys[name].thumbprint()
+
+    def entity_id(name: str) -> str:
+        return _TA_ENTITY_ID if name == "ta" else entities[name].entity_id
+
+    for name, authorities in hints.items():
+        entity = entities[name]
+        _serve_configuration(entity, keys[name], [entity_id(a) for a in authorities])
+        for authority in authorities:
+            if (authority, name) in withheld:
+                continue
+            statement = _statement_payload(entity_id(authority), entity.entity_id, keys[name])
+            if authority == "ta":
+                rdb.hset(
+                    "inmor:subordinates",
+                    entity.entity_id,
+                    _sign_with_ta(statement, "entity-statement+jwt"),
+                )
+                rdb.publish("inmor:response_cache", f"fetch:{entity.entity_id}")
+            else:
+                entities[authority].add_subordinate(entity.entity_id)
+                entities[authority].set_subordinate_statement(
+                    entity.entity_id, _sign_statement(statement, keys[authority])
+                )
+    return entities, keys
+
+
+def _chain_issuers(payload: dict) -> list[str]:
+    return [_decode_jwt_payload(statement)["iss"] for statement in payload["trust_chain"]]
+
+
+def test_resolve_diamond_of_intermediates(
+    loaddata: Redis, start_server: int, http_client: Client, fake_entities
+):
+    """A branch that fails at a shared intermediate does not block its siblings.
+
+    The leaf has the authority hints A and B, which both have the hint I, but I
+    only issued a statement about B. B answers slowly, so the branch through A
+    reaches I first and fails there.
+    """
+    entities, _ = _build_federation(
+        loaddata,
+        fake_entities,
+        {"leaf": ["a", "b"], "a": ["i"], "b": ["i"], "i": ["ta"]},
+        withheld=(("i", "a"),),
+    )
+    a, b, i = entities["a"], entities["b"], entities["i"]
+    b.set_delay(0.5)
+
+    payload = _resolve_payload(http_client, start_server, entities["leaf"].entity_id)
+    assert _chain_issuers(payload)[1:4] == [b.entity_id, i.entity_id, _TA_ENTITY_ID]
+    assert f"/fetch?sub={a.entity_id}" in i.requests
+
+
+def test_resolve_cancels_slow_authority_hints(
+    loaddata: Redis, start_server: int, http_client: Client, fake_entities
+):
+    """Once one authority hint reaches the TA, the fetches of the others are cancelled."""
+    entities, _ = _build_federation(
+        loaddata, fake_entities, {"leaf": ["slow", "ta"], "slow": ["ta"]}
+    )
+    slow = entities["slow"]
+    delay = 3.0
+    slow.set_delay(delay)
+
+    started = time.monotonic()
+    payload = _resolve_payload(http_client, start_server, entities["leaf"].entity_id)
+    assert time.monotonic() - started < delay
+    assert _chain_issuers(payload)[1] == _TA_ENTITY_ID
+
+    # The slow authority is never asked for its statement about the leaf, and
+    # its entity configuration is not fetched again.
+    time.sleep(delay + 0.5)
+    assert slow.requests == ["/.well-known/openid-federation"]
+
+
+# ---------------------------------------------------------------------------
+# inmor-collection walks
+# ---------------------------------------------------------------------------
+#
+# The walks start at the fake entity "root", which lists the entities that
+# name it as authority hint like a TA does. All fake entities listen on
+# 127.0.0.1, so they count as one host for --per-host.
+
+_COLLECTION_TREE = {"root": [], "ia": ["root"], "leaf1": ["ia"], "leaf2": ["ia"]}
+
+
+def _collected(rdb: Redis) -> set[str]:
+    return {entity_id.decode() for entity_id in rdb.hkeys("inmor:collection:entities")}
+
+
+def test_collection_walk_reuses_unchanged_entities(loaddata: Redis, fake_entities, collection_walk):
+    """An incremental walk reuses unchanged entities and refreshes changed ones."""
+    entities, keys = _build_federation(loaddata, fake_entities, _COLLECTION_TREE)
+    root, ia, leaf1, leaf2 = (entities[name] for name in _COLLECTION_TREE)
+    everyone = {entity.entity_id for entity in entities.values()}
+
+    assert collection_walk(root.entity_id) == {"refreshed": 4, "skipped": 0, "failed": 0}
+    assert _collected(loaddata) == everyone
+
+    _serve_configuration(
+        leaf2,
+        keys["leaf2"],
+        [ia.entity_id],
+        metadata={"federation_entity": {"organization_name": "Changed"}},
+    )
+    assert collection_walk(root.entity_id, "--incremental") == {
+        "refreshed": 1,
+        "skipped": 3,
+        "failed": 0,
+    }
+    assert _collected(loaddata) == everyone
+    # Only the changed entity is verified again, which fetches its statement.
+    assert ia.requests.count(f"/fetch?sub={leaf1.entity_id}") == 1
+    assert ia.requests.count(f"/fetch?sub={leaf2.entity_id}") == 2
+    entry = json.loads(loaddata.hget("inmor:collection:entities", leaf2.entity_id))
+    assert entry["ui_infos"]["federation_entity"]["display_name"] == "Changed"
+
+
+def test_collection_walk_does_not_reuse_expired_configurations(
+    loaddata: Redis, fake_entities, collection_walk
+):
+    """An unchanged entity configuration that has expired is verified again, and fails."""
+    entities, keys = _build_federation(loaddata, fake_entities, {"root": [], "leaf": ["root"]})
+    root, leaf = entities["root"], entities["leaf"]
+    _serve_configuration(leaf, keys["leaf"], [root.entity_id], exp=int(time.time()) + 2)
+
+    assert collection_walk(root.entity_id) == {"refreshed": 2, "skipped": 0, "failed": 0}
+    time.sleep(3)
+    assert collection_walk(root.entity_id, "--incremental") == {
+        "refreshed": 0,
+        "skipped": 1,
+        "failed": 1,
+    }
+    assert _collected(loaddata) == {root.entity_id}
+
+
+def test_collection_walk_limits_requests_per_host(loaddata: Redis, fake_entities, collection_walk):
+    """--per-host caps the concurrent requests to one host, whatever --concurrency is."""
+    hints = {"root": [], **{f"leaf{n}": ["root"] for n in range(6)}}
+    entities, _ = _build_federation(loaddata, fake_entities, hints)
+    root = entities["root"]
+    root.set_delay(0.1)
+
+    stats = collection_walk(root.entity_id, "--concurrency", "8", "--per-host", "1")
+    assert stats == {"refreshed": 7, "skipped": 0, "failed": 0}
+    assert max(entity.max_in_flight for entity in entities.values()) == 1
+    # Every leaf fetched the root's configuration and its statement about the leaf.
+    assert len(root.requests) >= 1 + 1 + 2 * 6
+
+
 # ---------------------------------------------------------------------------
 # /resolve trust mark verification (spec §8.3, §8.3.2)
 # ---------------------------------------------------------------------------
@@ -1399,3 +1924,192 @@ def test_resolve_falls_through_when_delegation_present_but_owner_unpinned(
     assert marks is not None and len(marks) == 1, (
         "unpinned-owner + delegation must fall through to the issuers gate"
     )
+
+
+def test_resolve_is_cached_until_invalidated(
+    loaddata: Redis, start_server: int, http_client: Client, fake_subject
+):
+    "Repeated /resolve calls are served from the cache until the admin drops it."
+    rdb = loaddata
+    port = start_server
+
+    subject_id = fake_subject.entity_id
+    tm_obj = _build_trust_mark(subject_id)
+    _build_subject(rdb, fake_subject, trust_marks=[tm_obj])
+    _set_trust_mark_issuers(rdb, {_TM_TYPE: [_TA_ENTITY_ID]})
+    _accept_trust_mark(rdb, subject_id, tm_obj)
+
+    status = http_client.get(f"https://localhost:{port}/status").json()
+    hits = status["resolve_cache"]["hits"]
+
+    first = _resolve_payload(http_client, port, subject_id)
+    assert len(first["trust_marks"]) == 1
+    assert rdb.exists(f"inmor:resolve:sub:{subject_id}")
+    assert rdb.sismember(f"inmor:resolve:chain:{_TA_ENTITY_ID}", subject_id)
+
+    # Revoked in Redis only, the cached response is still served.
+    rdb.hset(f"inmor:tm:{subject_id}", _TM_TYPE, "revoked")
+    second = _resolve_payload(http_client, port, subject_id)
+    assert second == first
+    status = http_client.get(f"https://localhost:{port}/status").json()
+    assert status["resolve_cache"]["hits"] == hits + 1
+
+    # The admin drops the subject's cached responses when it revokes the mark.
+    rdb.delete(f"inmor:resolve:sub:{subject_id}")
+    third = _resolve_payload(http_client, port, subject_id)
+    assert "trust_marks" not in third
+
+
+def test_resolve_direct_subordinate_from_chain_bundle(
+    loaddata: Redis, start_server: int, http_client: Client, fake_subject
+):
+    "/resolve builds the chain of a direct subordinate from its bundle until it expires"
+    rdb = loaddata
+    port = start_server
+
+    subject_id = _build_subject(rdb, fake_subject, trust_marks=None)
+    subject_ec = fake_subject._server.entity_config.decode()
+    bundle = {
+        "entity_configuration": subject_ec,
+        "subordinate_statement": rdb.hget("inmor:subordinates", subject_id).decode(),
+        "exp": int(time.time()) + 3600,
+    }
+    _ = rdb.hset("inmor:chain_bundles", subject_id, json.dumps(bundle))
+    # The subject is unreachable, a remote walk would fail.
+    fake_subject.set_entity_configuration("")
+
+    before = http_client.get(f"https://localhost:{port}/metrics").text
+    payload = _resolve_payload(http_client, port, subject_id)
+    assert payload["sub"] == subject_id
+    assert len(payload["trust_chain"]) == 3
+    assert payload["trust_chain"][0] == subject_ec
+    body = http_client.get(f"https://localhost:{port}/metrics").text
+    series = 'inmor_ta_resolve_chain_bundles_total{result="used"}'
+    assert _metric(body, series) == _metric(before, series) + 1
+
+    # An expired bundle is not used, the chain is walked remotely again.
+    bundle["exp"] = int(time.time()) - 1
+    _ = rdb.hset("inmor:chain_bundles", subject_id, json.dumps(bundle))
+    _ = rdb.delete(f"inmor:resolve:sub:{subject_id}")
+    url = f"https://localhost:{port}/resolve?sub={subject_id}&trust_anchor={_TA_ENTITY_ID}"
+    assert http_client.get(url).status_code != 200
+
+
+def _metric(body: str, series: str) -> float:
+    "Returns the value of one series from a text exposition body, 0 if absent"
+    for line in body.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_endpoint(loaddata: Redis, start_server: int, http_client: Client, fake_subject):
+    "Tests /metrics counts requests, resolve chains, trust marks and Redis commands"
+    rdb = loaddata
+    port = start_server
+
+    subject_id = fake_subject.entity_id
+    tm_obj = _build_trust_mark(subject_id)
+    _build_subject(rdb, fake_subject, trust_marks=[tm_obj])
+    _set_trust_mark_issuers(rdb, {_TM_TYPE: [_TA_ENTITY_ID]})
+    _accept_trust_mark(rdb, subject_id, tm_obj)
+
+    before = http_client.get(f"https://localhost:{port}/metrics").text
+    payload = _resolve_payload(http_client, port, subject_id)
+    assert len(payload["trust_marks"]) == 1
+
+    resp = http_client.get(f"https://localhost:{port}/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = resp.text
+
+    route = 'method="GET",route="/resolve",status="200"'
+    series = f"inmor_ta_requests_total{{{route}}}"
+    assert _metric(body, series) == _metric(before, series) + 1
+    series = "inmor_ta_resolve_chain_length_count"
+    assert _metric(body, series) == _metric(before, series) + 1
+    series = 'inmor_ta_trust_mark_verifications_total{outcome="verified"}'
+    assert _metric(body, series) == _metric(before, series) + 1
+    assert _metric(body, 'inmor_ta_redis_command_duration_seconds_count{command="GET"}') > 0
+    assert _metric(body, 'inmor_ta_lane_limit{lane="resolve"}') == 16
+    assert "# TYPE inmor_ta_fetch_duration_seconds histogram" in body
+
+
+def _eventually(check, timeout: float = 10.0):
+    "Retries check until it returns a truthy value, returns that value"
+    deadline = time.monotonic() + timeout
+    while True:
+        result = check()
+        if result or time.monotonic() > deadline:
+            return result
+        time.sleep(0.1)
+
+
+def test_mirror_follows_the_change_stream(
+    loaddata: Redis, start_mirror_server: int, mirrordb: Redis, http_client: Client
+):
+    "Tests a mirror TA copies the admin's Redis and then applies the changes on inmor:changes"
+    rdb = loaddata
+    mirror = f"https://localhost:{start_mirror_server}"
+
+    health = _eventually(lambda: http_client.get(f"{mirror}/health").status_code == 200)
+    assert health
+    assert mirrordb.get("inmor:entity_id") == rdb.get("inmor:entity_id")
+    assert mirrordb.hgetall("inmor:subordinates") == rdb.hgetall("inmor:subordinates")
+
+    # A subordinate added by the admin after the snapshot.
+    entity_id = "https://op.mirror.example.com"
+    _ = rdb.hset("inmor:subordinates", entity_id, "mirrored-statement")
+    _ = rdb.zadd("inmor:subordinates:index", {entity_id: 0})
+    version = rdb.hincrby("inmor:versions", "subordinates", 1)
+    _ = rdb.xadd(
+        "inmor:changes",
+        {"family": "subordinates", "op": "update", "entity": entity_id, "version": version},
+    )
+
+    def fetched():
+        resp = http_client.get(f"{mirror}/fetch", params={"sub": entity_id})
+        return resp.status_code == 200 and resp.text == "mirrored-statement"
+
+    assert _eventually(fetched)
+    assert mirrordb.zscore("inmor:subordinates:index", entity_id) == 0
+    assert mirrordb.hget("inmor:versions", "subordinates") == str(version).encode()
+
+    body = http_client.get(f"{mirror}/metrics").text
+    assert _metric(body, 'inmor_ta_mirror_changes_total{result="applied"}') == 1
+    assert _metric(body, 'inmor_ta_mirror_snapshots_total{scope="full"}') == 1
+    assert "inmor_ta_mirror_lag_seconds " in body
+
+
+def test_mirror_keeps_hashes_of_reissued_trust_marks(
+    loaddata: Redis, start_mirror_server: int, mirrordb: Redis, http_client: Client
+):
+    "Tests a mirror adds the hash of every issued mark, also of one re-issued before it caught up"
+    rdb = loaddata
+    mirror = f"https://localhost:{start_mirror_server}"
+    assert _eventually(lambda: http_client.get(f"{mirror}/health").status_code == 200)
+
+    entity_id = "https://rp.mirror.example.com"
+    hashes = []
+    # Both issues happen before the mirror reads the first change.
+    for mark in ("first-mark", "reissued-mark"):
+        hashes.append(hashlib.sha256(mark.encode("utf-8")).hexdigest())
+        _ = rdb.hset(f"inmor:tm:{entity_id}", _TM_TYPE, mark)
+        _ = rdb.sadd("inmor:tm:alltime", hashes[-1])
+    for mark_hash in hashes:
+        version = rdb.hincrby("inmor:versions", "trust_marks", 1)
+        _ = rdb.xadd(
+            "inmor:changes",
+            {
+                "family": "trust_marks",
+                "op": "issue",
+                "entity": entity_id,
+                "version": version,
+                "mark": mark_hash,
+            },
+        )
+
+    assert _eventually(lambda: all(mirrordb.smismember("inmor:tm:alltime", hashes)))
+    assert mirrordb.hget(f"inmor:tm:{entity_id}", _TM_TYPE) == b"reissued-mark"
+    body = http_client.get(f"{mirror}/metrics").text
+    assert _metric(body, 'inmor_ta_mirror_changes_total{result="applied"}') == 2